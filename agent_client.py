@@ -0,0 +1,185 @@
+"""
+研究代理守护进程的命令行客户端
+只依赖标准库，启动开销远小于直接运行 claude_agent.py；服务端见 agent_server.py
+
+用法：
+    python agent_client.py submit "请为我生成一份关于 Diffusion Models 的综述" --wait -o report.md
+    python agent_client.py submit --resume 3f2a9c1b7d4e --wait
+    python agent_client.py status <job_id>
+    python agent_client.py events <job_id>
+    python agent_client.py health
+连接 Unix socket：加 --unix /tmp/agent.sock
+"""
+import argparse
+import http.client
+import json
+import socket
+import sys
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class AgentClient:
+    """
+    :param url: 服务地址，如 http://127.0.0.1:8765
+    :param unix_socket: Unix socket 路径，提供时忽略 url
+    """
+
+    def __init__(self, url: str = "http://127.0.0.1:8765", unix_socket: Optional[str] = None,
+                 timeout: Optional[float] = 30.0):
+        self.url = url
+        self.unix_socket = unix_socket
+        self.timeout = timeout
+
+    def _connect(self, timeout: Optional[float]) -> http.client.HTTPConnection:
+        if self.unix_socket:
+            return _UnixHTTPConnection(self.unix_socket, timeout=timeout)
+        host = self.url.split("://", 1)[-1].rstrip("/")
+        return http.client.HTTPConnection(host, timeout=timeout)
+
+    def _request(self, method: str, path: str, payload: Dict[str, Any] = None,
+                 timeout: Optional[float] = None) -> Tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        conn = self._connect(self.timeout if timeout is None else timeout)
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        conn.request(method, path, body=body, headers=headers)
+        return conn, conn.getresponse()
+
+    def _json(self, method: str, path: str, payload: Dict[str, Any] = None) -> Tuple[int, Dict[str, Any]]:
+        conn, resp = self._request(method, path, payload)
+        try:
+            return resp.status, json.loads(resp.read() or b"{}")
+        finally:
+            conn.close()
+
+    def submit(self, instruction: str = None, max_iterations: int = 15, resume: str = None,
+               retries: int = 0) -> Dict[str, Any]:
+        """
+        提交任务；服务端繁忙（503）时按 Retry-After 等待后重试 retries 次
+        :return: {"job_id", "run_id", "status"}
+        """
+        payload = {"resume": resume} if resume else {"instruction": instruction, "max_iterations": max_iterations}
+        for attempt in range(retries + 1):
+            conn, resp = self._request("POST", "/jobs", payload)
+            try:
+                data = json.loads(resp.read() or b"{}")
+                if resp.status == 503 and attempt < retries:
+                    wait = int(resp.getheader("Retry-After", "5"))
+                    print(f"🚦 服务繁忙，{wait}s 后重试 ({attempt + 1}/{retries})", file=sys.stderr)
+                    time.sleep(wait)
+                    continue
+                if resp.status != 202:
+                    raise RuntimeError(f"提交失败 ({resp.status}): {data.get('error')}")
+                return data
+            finally:
+                conn.close()
+        raise RuntimeError("提交失败：服务持续繁忙")
+
+    def status(self, job_id: str) -> Dict[str, Any]:
+        status, data = self._json("GET", f"/jobs/{job_id}")
+        if status != 200:
+            raise RuntimeError(data.get("error"))
+        return data
+
+    def health(self) -> Dict[str, Any]:
+        return self._json("GET", "/health")[1]
+
+    def events(self, job_id: str) -> Iterator[Dict[str, Any]]:
+        """逐条读取任务事件，直到任务结束"""
+        conn, resp = self._request("GET", f"/jobs/{job_id}/events", timeout=None)
+        try:
+            if resp.status != 200:
+                raise RuntimeError(json.loads(resp.read() or b"{}").get("error"))
+            for line in resp:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+
+def _print_event(event: Dict[str, Any]):
+    kind = event["type"]
+    if kind == "status":
+        print(f"⏳ {event['status']}", file=sys.stderr)
+    elif kind == "iteration_started":
+        print(f"🔄 第 {event['iteration']} 轮 {event['model']}", file=sys.stderr)
+    elif kind == "text_delta":
+        print(event["text"], end="", file=sys.stderr, flush=True)
+    elif kind == "model_usage":
+        note = "，已升级，丢弃" if event["discarded"] else ""
+        print(f"\n   {event['stop_reason']} ({event['latency_s']}s, 输出 {event['output_tokens']} token, "
+              f"${event['cost_usd']}{note})", file=sys.stderr)
+    elif kind == "tool_dispatched":
+        print(f"   🎯 {event['name']}", file=sys.stderr)
+    elif kind == "tool_completed":
+        print(f"   ✅ {event['name']} ({event['elapsed_s']}s, {event['chars']} 字符)", file=sys.stderr)
+    elif kind == "final":
+        icon = "✅" if event["status"] == "completed" else "❌"
+        print(f"{icon} {event['status']}" + (f": {event['error']}" if event.get("error") else ""), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="研究代理守护进程客户端")
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="服务地址，默认 http://127.0.0.1:8765")
+    parser.add_argument("--unix", metavar="PATH", help="通过 Unix socket 连接")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_submit = sub.add_parser("submit", help="提交研究任务")
+    p_submit.add_argument("instruction", nargs="?", help="研究指令")
+    p_submit.add_argument("--resume", metavar="RUN_ID", help="改为恢复一个中断的 run")
+    p_submit.add_argument("--max-iterations", type=int, default=15)
+    p_submit.add_argument("--retries", type=int, default=3, help="服务繁忙时的重试次数，默认 3")
+    p_submit.add_argument("--wait", action="store_true", help="流式输出进度并等待结果")
+    p_submit.add_argument("-o", "--output", help="--wait 时把最终结果写入文件，否则打印到标准输出")
+
+    p_status = sub.add_parser("status", help="查看任务状态")
+    p_status.add_argument("job_id")
+    p_events = sub.add_parser("events", help="流式输出任务事件（NDJSON）")
+    p_events.add_argument("job_id")
+    sub.add_parser("health", help="查看服务负载")
+    opts = parser.parse_args()
+
+    client = AgentClient(opts.url, opts.unix)
+    if opts.command == "submit":
+        if not opts.instruction and not opts.resume:
+            parser.error("需要提供 instruction 或 --resume")
+        job = client.submit(opts.instruction, opts.max_iterations, resume=opts.resume, retries=opts.retries)
+        print(f"📥 已提交任务 {job['job_id']}", file=sys.stderr)
+        if not opts.wait:
+            print(job["job_id"])
+            return
+        final = None
+        for event in client.events(job["job_id"]):
+            _print_event(event)
+            if event["type"] == "final":
+                final = event
+        if final is None or final["status"] != "completed":
+            sys.exit(1)
+        if opts.output:
+            with open(opts.output, "w", encoding="utf-8") as f:
+                f.write(final["result"] or "")
+            print(f"📄 报告已保存到: {opts.output}", file=sys.stderr)
+        else:
+            print(final["result"])
+    elif opts.command == "status":
+        print(json.dumps(client.status(opts.job_id), ensure_ascii=False, indent=2))
+    elif opts.command == "events":
+        for event in client.events(opts.job_id):
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+    elif opts.command == "health":
+        print(json.dumps(client.health(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
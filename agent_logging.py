@@ -0,0 +1,118 @@
+"""
+异步友好的日志管道
+作用：代替各处的 print —— 业务代码只把日志记录放进队列，真正的格式化和 stdout 写入在后台线程完成，
+高并发时不会因为控制台 I/O 卡住事件循环；级别过滤在入队前完成，被过滤掉的日志几乎零开销
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Any, Optional
+
+# 所有模块的 logger 都挂在这个命名空间下，方便统一调级别
+ROOT_LOGGER_NAME = "giiisp"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """获取 giiisp.<name> logger"""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+class LazyJSON:
+    """
+    延迟序列化：只有日志真正被输出时才执行 json.dumps
+    用法：logger.debug("参数: %s", LazyJSON(tool_input))
+    """
+    __slots__ = ("obj", "indent")
+
+    def __init__(self, obj: Any, indent: Optional[int] = None):
+        self.obj = obj
+        self.indent = indent
+
+    def __str__(self) -> str:
+        try:
+            return json.dumps(self.obj, ensure_ascii=False, indent=self.indent, default=str)
+        except Exception:
+            # 包括其他线程同时修改 obj 时的 RuntimeError（dictionary changed size during iteration）
+            return repr(self.obj)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """人类友好的控制台格式：只输出消息本身，保持原来 print 的 emoji 风格"""
+
+    def __init__(self):
+        super().__init__("%(message)s")
+
+
+class PlainFormatter(logging.Formatter):
+    """带时间、级别和模块名的格式，适合写文件或被日志系统采集"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s | %(message)s")
+
+
+# 入队后不会再变的参数类型；其余参数（dict、list、LazyJSON 等）可能在监听线程格式化之前被调用方修改
+_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    标准 QueueHandler.prepare() 会在调用线程里先把消息格式化好再入队，
+    这里改为参数都是不可变的标量时原样入队，让 %s 参数的拼接在监听线程中执行；
+    参数中有可变对象（如 LazyJSON(tool_input)）时在调用线程格式化，日志反映调用时的状态
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        # 只传一个 dict 参数时 LogRecord 把它本身作为 args（"%(key)s" 写法），同样是可变的
+        if args and (isinstance(args, dict) or not all(isinstance(value, _IMMUTABLE_ARGS) for value in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+def setup_logging(level: Optional[str] = None, human: Optional[bool] = None, stream=None) -> logging.Logger:
+    """
+    初始化日志管道（可重复调用，后一次覆盖前一次）
+    :param level: 日志级别，默认读取环境变量 AGENT_LOG_LEVEL，再默认 INFO
+    :param human: True 使用 emoji 控制台格式，False 使用带时间戳的纯文本格式；
+                  默认读取环境变量 AGENT_LOG_FORMAT（设为 plain 时为 False）
+    :param stream: 输出流，默认 sys.stdout
+    :return: giiisp 根 logger
+    """
+    global _listener
+    shutdown_logging()
+
+    level = (level or os.environ.get("AGENT_LOG_LEVEL") or "INFO").upper()
+    if human is None:
+        human = os.environ.get("AGENT_LOG_FORMAT", "human").lower() != "plain"
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(level)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(ConsoleFormatter() if human else PlainFormatter())
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return root
+
+
+def shutdown_logging():
+    """停止后台监听线程，并把队列中剩余的日志全部写出"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
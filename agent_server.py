@@ -0,0 +1,463 @@
+"""
+研究代理守护进程
+作用：常驻一个 ClaudeAcademicAgent（连同 API 客户端、预热好的 MCP 连接池、工具结果缓存），
+通过本地 HTTP（TCP 或 Unix socket）接收研究任务，省去每次启动解释器、导入 anthropic/mcp、
+新建客户端和 8 个端口冷握手的开销
+
+接口（请求/响应体均为 JSON）：
+    POST /jobs                {"instruction": "...", "max_iterations": 15}  或  {"resume": "<run_id>"}
+                              -> 202 {"job_id", "run_id", "status"}；超过并发与排队上限时 503 + Retry-After，
+                              要恢复的 run 正在排队或运行时 409
+    GET  /jobs/<job_id>       -> 任务状态、结果、用量
+    GET  /jobs/<job_id>/events -> NDJSON 流：run_events 中的事件（迭代开始、模型文本增量、用量、工具开始/结束）
+                              及任务状态和最终结果，任务结束后关闭连接
+    GET  /health              -> 运行中 / 排队中的任务数和上限
+    GET  /metrics             -> Prometheus 文本格式指标
+
+客户端见 agent_client.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent_logging import get_logger, setup_logging
+from metrics import REGISTRY, SERVER_JOBS, SERVER_REJECTED
+from run_checkpoint import CheckpointStore
+from run_context import RunContext, new_run_id
+from run_events import RunFinished
+
+logger = get_logger("server")
+
+# 单个请求体上限，防止误传大文件占满内存
+MAX_BODY_BYTES = 1 << 20
+# 内存中保留的已结束任务数，更早的任务只能通过检查点恢复
+MAX_FINISHED_JOBS = 1000
+
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class Job:
+    """守护进程中的一个研究任务"""
+
+    def __init__(self, instruction: Optional[str], max_iterations: int, resume: Optional[str] = None):
+        self.job_id = new_run_id()
+        self.instruction = instruction
+        self.max_iterations = max_iterations
+        self.resume = resume
+        # 新任务预先分配 run_id，提交时即可返回给客户端
+        self.run_id: str = resume or new_run_id()
+        self.ctx: Optional[RunContext] = None
+        # queued / running / completed / failed
+        self.status = "queued"
+        self.result: Optional[str] = None
+        self.error: Optional[str] = None
+        # 预算用量（守护进程配置了 --budget 时）
+        self.budget: Dict[str, Any] = {}
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # 任务结束后合并其中的 text_delta，只在内存中保留紧凑的事件列表
+        self.events: List[Dict[str, Any]] = []
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def publish(self, event: Dict[str, Any]):
+        """追加一条事件并唤醒所有正在流式读取的连接"""
+        event.setdefault("ts", round(time.time(), 3))
+        self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def compact_events(self):
+        """任务结束后把同一轮连续的 text_delta 合并为一条；正在流式读取的连接继续读原来的列表"""
+        compact: List[Dict[str, Any]] = []
+        for event in self.events:
+            last = compact[-1] if compact else None
+            if (event["type"] == "text_delta" and last is not None and last["type"] == "text_delta"
+                    and last["iteration"] == event["iteration"]):
+                compact[-1] = {**last, "text": last["text"] + event["text"]}
+            else:
+                compact.append(event)
+        self.events = compact
+
+    async def wait_events(self, since: int):
+        """等待 events 中出现下标 >= since 的事件，或任务结束"""
+        while len(self.events) <= since and not self.done:
+            await self._changed.wait()
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "job_id": self.job_id,
+            "run_id": self.run_id,
+            "status": self.status,
+            "submitted_at": round(self.submitted_at, 3),
+            "started_at": self.started_at and round(self.started_at, 3),
+            "finished_at": self.finished_at and round(self.finished_at, 3),
+        }
+        if self.ctx is not None:
+            data["run_status"] = self.ctx.status
+            data["iteration"] = self.ctx.iteration
+            data["usage"] = self.ctx.usage.summary.to_dict()
+        if self.result is not None:
+            data["result"] = self.result
+        if self.error is not None:
+            data["error"] = self.error
+        if self.budget:
+            data["budget"] = self.budget
+        return data
+
+
+class AgentServer:
+    """
+    :param max_in_flight: 同时运行的 run 数上限
+    :param max_queue: 排队等待的任务数上限；运行和排队都满时新任务直接以 503 拒绝（负载削减）
+    """
+
+    def __init__(self, agent, max_in_flight: int = 8, max_queue: int = 32):
+        self.agent = agent
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=max_queue)
+        self.running = 0
+        self._workers: List[asyncio.Task] = []
+        self._avg_run_s = 60.0
+
+    # ========== 任务调度 ==========
+    def start(self):
+        for i in range(self.max_in_flight):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"agent-worker-{i}"))
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def submit(self, job: Job) -> bool:
+        """加入队列；队列已满返回 False"""
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            SERVER_REJECTED.inc()
+            return False
+        self.jobs[job.job_id] = job
+        SERVER_JOBS.labels("queued").set(self.queue.qsize())
+        job.publish({"type": "status", "status": "queued"})
+        self._evict_finished()
+        return True
+
+    def retry_after(self) -> int:
+        """按平均 run 耗时估算排队腾出位置需要的秒数"""
+        return max(1, int(self._avg_run_s * (self.queue.qsize() + 1) / max(1, self.max_in_flight)))
+
+    def _evict_finished(self):
+        finished = [jid for jid, job in self.jobs.items() if job.done]
+        for jid in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self.jobs.pop(jid)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            SERVER_JOBS.labels("queued").set(self.queue.qsize())
+            self.running += 1
+            SERVER_JOBS.labels("running").set(self.running)
+            try:
+                await self._run_job(job)
+            finally:
+                self.running -= 1
+                SERVER_JOBS.labels("running").set(self.running)
+
+    async def _run_job(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        job.publish({"type": "status", "status": "running"})
+        try:
+            if job.resume:
+                job.ctx = await self.agent.checkpoint_store.aload(job.resume)
+                if job.ctx.status == "completed":
+                    job.result = job.ctx.final_text
+                else:
+                    job.ctx.max_iterations = max(job.ctx.max_iterations, job.max_iterations)
+                    job.result = await self._publish_events(job)
+            else:
+                job.ctx = self.agent.new_run(job.instruction, max_iterations=job.max_iterations, run_id=job.run_id)
+                job.result = await self._publish_events(job)
+            job.status = "completed"
+        except Exception as e:
+            job.status = "failed"
+            job.error = f"{type(e).__name__}: {e}"
+            logger.error("❌ 任务 %s 失败: %s", job.job_id, job.error)
+        job.finished_at = time.time()
+        self._avg_run_s = 0.8 * self._avg_run_s + 0.2 * (job.finished_at - job.started_at)
+        job.publish({"type": "final", "status": job.status, "run_status": job.ctx and job.ctx.status,
+                     "result": job.result, "error": job.error})
+        job.compact_events()
+
+    async def _publish_events(self, job: Job) -> Optional[str]:
+        """执行 run，把每个事件（模型文本增量、工具开始/结束、用量）推送给流式连接，返回最终回复"""
+        result = None
+        async for event in self.agent.context_events(job.ctx, stream_text=True):
+            if isinstance(event, RunFinished):
+                # 最终结果随任务级的 final 事件一起发送
+                result, job.budget = event.text, event.budget
+            else:
+                job.publish(event.to_dict())
+        return result
+
+    # ========== HTTP ==========
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await _read_request(reader)
+            if request is None:
+                return
+            method, path, body = request
+            await self._dispatch(method, path, body, writer)
+        except _HTTPError as e:
+            await _send_json(writer, e.status, {"error": e.message})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error("❌ 请求处理异常: %s", e)
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter):
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+
+        if parts == ["health"] and method == "GET":
+            await _send_json(writer, 200, {
+                "running": self.running, "queued": self.queue.qsize(),
+                "max_in_flight": self.max_in_flight, "max_queue": self.max_queue,
+                "jobs": len(self.jobs), "usage_totals": self.agent.usage_totals.to_dict(),
+            })
+        elif parts == ["metrics"] and method == "GET":
+            await _send(writer, 200, REGISTRY.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        elif parts == ["jobs"] and method == "POST":
+            await self._post_job(body, writer)
+        elif len(parts) in (2, 3) and parts[0] == "jobs" and method == "GET":
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise _HTTPError(404, f"任务 {parts[1]} 不存在")
+            if len(parts) == 2:
+                await _send_json(writer, 200, job.to_dict())
+            elif parts[2] == "events":
+                await self._stream_events(job, writer)
+            else:
+                raise _HTTPError(404, "未知路径")
+        elif parts and parts[0] in ("jobs", "health", "metrics"):
+            raise _HTTPError(405, f"不支持 {method} {path}")
+        else:
+            raise _HTTPError(404, "未知路径")
+
+    async def _post_job(self, body: bytes, writer: asyncio.StreamWriter):
+        try:
+            payload = json.loads(body or b"{}")
+        except json.JSONDecodeError as e:
+            raise _HTTPError(400, f"请求体不是合法 JSON: {e}")
+        resume = payload.get("resume")
+        instruction = payload.get("instruction")
+        if not resume and not instruction:
+            raise _HTTPError(400, "需要 instruction 或 resume")
+        max_iterations = payload.get("max_iterations", 15)
+        if isinstance(max_iterations, bool) or not isinstance(max_iterations, int) or max_iterations < 1:
+            raise _HTTPError(400, f"max_iterations 应为正整数: {max_iterations!r}")
+        if resume and (self.agent.checkpoint_store is None or not self.agent.checkpoint_store.exists(resume)):
+            raise _HTTPError(404, f"run {resume} 没有检查点")
+        if resume and any(job.run_id == resume and not job.done for job in self.jobs.values()):
+            # 两个任务同时恢复同一个 run 会交错写入同一个检查点文件
+            raise _HTTPError(409, f"run {resume} 正在排队或运行中")
+
+        job = Job(instruction, max_iterations, resume=resume)
+        if not self.submit(job):
+            logger.warning("🚦 运行 %d / 排队 %d 已满，拒绝新任务", self.running, self.queue.qsize())
+            await _send_json(writer, 503, {"error": "服务繁忙，请稍后重试", "running": self.running,
+                                           "queued": self.queue.qsize()},
+                             headers=[("Retry-After", str(self.retry_after()))])
+            return
+        logger.info("📥 收到任务 %s（排队 %d）", job.job_id, self.queue.qsize())
+        await _send_json(writer, 202, {"job_id": job.job_id, "run_id": job.run_id, "status": job.status})
+
+    async def _stream_events(self, job: Job, writer: asyncio.StreamWriter):
+        """按 NDJSON 逐行推送事件；不带 Content-Length，任务结束后关闭连接表示流结束"""
+        writer.write(_head(200, "application/x-ndjson; charset=utf-8"))
+        # 任务结束时 job.events 会被替换为合并后的列表，已开始的流读完原来的列表
+        events = job.events
+        sent = 0
+        while True:
+            await job.wait_events(sent)
+            while sent < len(events):
+                writer.write(json.dumps(events[sent], ensure_ascii=False).encode("utf-8") + b"\n")
+                sent += 1
+            await writer.drain()
+            if job.done and sent >= len(events):
+                return
+
+
+class _HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+async def _read_request(reader: asyncio.StreamReader,
+                        max_body: int = MAX_BODY_BYTES) -> Optional[Tuple[str, str, bytes]]:
+    """读取一个 HTTP/1.1 请求（只支持 Content-Length 请求体），连接直接关闭时返回 None"""
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise _HTTPError(400, "请求行格式错误")
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = header.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            try:
+                length = int(value.strip() or 0)
+            except ValueError:
+                raise _HTTPError(400, "Content-Length 不是整数")
+            if length < 0:
+                raise _HTTPError(400, "Content-Length 不能为负数")
+    if length > max_body:
+        raise _HTTPError(413, "请求体过大")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, body
+
+
+def _head(status: int, content_type: str, length: Optional[int] = None,
+          headers: List[Tuple[str, str]] = ()) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {content_type}", "Connection: close"]
+    if length is not None:
+        lines.append(f"Content-Length: {length}")
+    lines.extend(f"{k}: {v}" for k, v in headers)
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send(writer: asyncio.StreamWriter, status: int, body: bytes, content_type: str,
+                headers: List[Tuple[str, str]] = ()):
+    writer.write(_head(status, content_type, len(body), headers) + body)
+    await writer.drain()
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                     headers: List[Tuple[str, str]] = ()):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await _send(writer, status, body, "application/json; charset=utf-8", headers)
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8765, unix_socket: str = None,
+                max_in_flight: int = 8, max_queue: int = 32, pool_size: int = 2,
+                cache_path: str = ".cache/tool_results.sqlite", checkpoint_dir: str = ".cache/checkpoints",
+                prefetch_budget: int = 0, blob_dir: str = None,
+                paper_index_path: str = None, local_first: bool = False,
+                export_dir: str = None, model_policy: str = "strong", budget: str = None):
+    """启动守护进程并一直运行到被取消"""
+    from blob_store import BlobStore
+    from claude_agent import ClaudeAcademicAgent
+    from corpus_export import CorpusWriter
+    from cpu_offload import LoopLagMonitor
+    from model_router import load_policy
+    from paper_index import PaperIndex
+    from prefetch import SpeculativePrefetcher
+    from result_cache import ResultCache
+    from run_budget import BudgetGovernor, load_budget
+
+    cache = ResultCache(cache_path) if cache_path else None
+    paper_index = PaperIndex(paper_index_path) if paper_index_path else None
+    prefetcher = SpeculativePrefetcher(cache, budget_per_run=prefetch_budget) if cache and prefetch_budget > 0 else None
+    agent = ClaudeAcademicAgent(result_cache=cache, prefetcher=prefetcher,
+                                blob_store=BlobStore(blob_dir) if blob_dir else None,
+                                paper_index=paper_index, local_first=local_first,
+                                corpus_writer=CorpusWriter(export_dir) if export_dir else None,
+                                router=load_policy(model_policy),
+                                governor=BudgetGovernor(load_budget(budget)) if budget else None,
+                                checkpoint_store=CheckpointStore(checkpoint_dir))
+    app = AgentServer(agent, max_in_flight=max_in_flight, max_queue=max_queue)
+
+    if pool_size > 0:
+        await agent.start_mcp_pools(pool_size)
+    app.start()
+    # 事件循环延迟写入 agent_event_loop_lag_seconds，大结果的后处理卸载效果可在 /metrics 中观察
+    lag_monitor = LoopLagMonitor(interval=0.05)
+    lag_monitor.start()
+    await agent.offloader.warm()
+
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server = await asyncio.start_unix_server(app.handle, path=unix_socket)
+        logger.info("🚀 研究代理守护进程已启动: unix:%s", unix_socket)
+    else:
+        server = await asyncio.start_server(app.handle, host, port)
+        logger.info("🚀 研究代理守护进程已启动: http://%s:%d", host, port)
+    logger.info("   并发上限 %d，排队上限 %d", max_in_flight, max_queue)
+
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await app.stop()
+        await lag_monitor.stop()
+        await agent.aclose()
+        if cache is not None:
+            cache.close()
+        if paper_index is not None:
+            paper_index.close()
+        if unix_socket and os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Claude 学术研究代理守护进程")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址，默认 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口，默认 8765")
+    parser.add_argument("--unix", metavar="PATH", help="改为监听 Unix socket")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="同时运行的 run 数上限，默认 8")
+    parser.add_argument("--max-queue", type=int, default=32, help="排队任务数上限，超过后返回 503，默认 32")
+    parser.add_argument("--pool-size", type=int, default=2, help="每个 MCP 服务预热的会话数，0 表示不预热")
+    parser.add_argument("--cache", default=".cache/tool_results.sqlite", help="工具结果缓存路径，传空字符串禁用")
+    parser.add_argument("--checkpoint-dir", default=".cache/checkpoints", help="检查点目录")
+    parser.add_argument("--prefetch-budget", type=int, default=0,
+                        help="每个 run 的推测预取次数上限，0 表示不预取（需要启用缓存）")
+    parser.add_argument("--blob-dir", metavar="DIR", help="转存大工具结果的目录（如 .cache/blobs），不提供则不转存")
+    parser.add_argument("--paper-index", metavar="PATH", help="本地论文索引路径（如 .cache/papers.sqlite），不提供则不建索引")
+    parser.add_argument("--local-first", action="store_true", help="检索类工具先查本地索引，结果足够时不联网（需要 --paper-index）")
+    parser.add_argument("--export-dir", metavar="DIR", help="把工具返回的论文记录导出为按来源 / 日期分区的列式数据集")
+    parser.add_argument("--model-policy", default="strong",
+                        help="模型路由策略：strong / fast-plan / plan-strong 或 JSON 文件路径，默认 strong")
+    parser.add_argument("--budget", metavar="SPEC", help="每个 run 的预算：key=value,... 或 JSON 文件（见 run_budget.py）")
+    opts = parser.parse_args()
+    if opts.local_first and not opts.paper_index:
+        parser.error("--local-first 需要同时指定 --paper-index")
+
+    from claude_agent import _load_env_file
+    setup_logging()
+    _load_env_file()
+
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    try:
+        asyncio.run(serve(opts.host, opts.port, opts.unix, opts.max_in_flight, opts.max_queue,
+                          opts.pool_size, opts.cache, opts.checkpoint_dir, opts.prefetch_budget,
+                          opts.blob_dir, opts.paper_index, opts.local_first, opts.export_dir,
+                          opts.model_policy, opts.budget))
+    except KeyboardInterrupt:
+        logger.info("👋 守护进程已退出")
+
+
+if __name__ == "__main__":
+    main()
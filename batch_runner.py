@@ -0,0 +1,235 @@
+"""
+批量研究任务运行器
+作用：从 JSONL 读取大量研究指令，用多进程 + 每进程多个并发 run 的方式批量生成综述，
+所有进程共享同一个本地工具结果缓存，结果逐条流式写入输出 JSONL，中断后重跑会自动跳过已完成的任务
+（run 以 completed 结束才算完成；达到迭代上限、被截断或预算用尽的任务记为 incomplete，重跑时重试）
+
+输入文件每行一个任务：
+    {"id": "llm-survey", "instruction": "请为我生成一份关于 ... 的综述", "max_iterations": 15}
+id 缺省时使用行号；max_iterations 缺省时使用命令行参数；不是 JSON 对象、缺少 instruction 或
+max_iterations 不是正整数的行记录错误日志后跳过
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Set
+
+from agent_logging import get_logger, setup_logging
+
+logger = get_logger("batch")
+
+# 工作进程之间传递的结束标记
+_DONE = None
+_STATUS_ICONS = {"ok": "✅", "incomplete": "⚠️", "error": "❌"}
+
+
+def load_jobs(path: str, default_max_iterations: int) -> List[Dict[str, Any]]:
+    """读取 JSONL 任务文件，跳过空行和无效的行"""
+    jobs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = _parse_job(line, lineno, default_max_iterations)
+            except ValueError as e:
+                logger.error("❌ %s 第 %d 行无效，已跳过: %s", path, lineno, e)
+                continue
+            jobs.append(job)
+    return jobs
+
+
+def _parse_job(line: str, lineno: int, default_max_iterations: int) -> Dict[str, Any]:
+    """解析并校验一行任务，无效时抛 ValueError"""
+    job = json.loads(line)  # JSONDecodeError 是 ValueError 的子类
+    if not isinstance(job, dict):
+        raise ValueError("不是 JSON 对象")
+    if not isinstance(job.get("instruction"), str) or not job["instruction"].strip():
+        raise ValueError("缺少 instruction")
+    job.setdefault("id", str(lineno))
+    job["id"] = str(job["id"])
+    job.setdefault("max_iterations", default_max_iterations)
+    max_iterations = job["max_iterations"]
+    if isinstance(max_iterations, str) and max_iterations.strip().isdigit():
+        max_iterations = int(max_iterations)
+    if isinstance(max_iterations, bool) or not isinstance(max_iterations, int) or max_iterations < 1:
+        raise ValueError(f"max_iterations 必须是正整数: {job['max_iterations']!r}")
+    job["max_iterations"] = max_iterations
+    return job
+
+
+def completed_job_ids(output_path: str) -> Set[str]:
+    """读取已有输出文件中成功完成的任务 id，用于断点续跑（失败和未完成的任务会重跑）"""
+    done = set()
+    if not os.path.isfile(output_path):
+        return done
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次被强制中断时可能留下半行
+                continue
+            if record.get("status") == "ok" and record.get("run_status", "completed") == "completed":
+                done.add(str(record.get("id")))
+    return done
+
+
+def job_status(run_status: str) -> str:
+    """输出记录的 status：run 以 completed 结束为 ok，max_iterations / stopped / budget_exhausted 为 incomplete"""
+    return "ok" if run_status == "completed" else "incomplete"
+
+
+async def _run_job(agent, job: Dict[str, Any]) -> Dict[str, Any]:
+    """运行一个任务；任何异常（包括任务本身不合法）都记为 error，不影响同一进程中的其他任务"""
+    started_at = time.time()
+    started = time.perf_counter()
+    record: Dict[str, Any] = {"id": job.get("id"), "started_at": round(started_at, 3), "pid": os.getpid()}
+    ctx = None
+    try:
+        ctx = agent.new_run(job["instruction"], max_iterations=int(job["max_iterations"]))
+        result = await agent.run_context(ctx)
+        record.update(status=job_status(ctx.status), result=result, run_status=ctx.status)
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["elapsed_s"] = round(time.perf_counter() - started, 3)
+    if ctx is not None:
+        record["usage"] = ctx.usage.summary.to_dict()
+        if agent.governor is not None:
+            record["budget"] = agent.governor.report(ctx)
+    return record
+
+
+async def _worker_main(job_queue, result_queue, concurrency: int, cache_path: str, model_policy: str = "strong",
+                       budget: str = None):
+    from claude_agent import ClaudeAcademicAgent
+    from model_router import load_policy
+    from result_cache import ResultCache
+    from run_budget import BudgetGovernor, load_budget
+
+    cache = ResultCache(cache_path) if cache_path else None
+    # 一个进程一个代理实例：API 客户端、MCP 客户端和缓存由该进程内的所有并发 run 共享
+    agent = ClaudeAcademicAgent(result_cache=cache, router=load_policy(model_policy),
+                                governor=BudgetGovernor(load_budget(budget)) if budget else None)
+
+    async def consumer():
+        while True:
+            job = await asyncio.to_thread(job_queue.get)
+            if job is _DONE:
+                return
+            record = await _run_job(agent, job)
+            await asyncio.to_thread(result_queue.put, record)
+
+    try:
+        await asyncio.gather(*(consumer() for _ in range(concurrency)))
+    finally:
+        # 关闭 MCP 会话池和 API 客户端
+        await agent.aclose()
+        if cache is not None:
+            cache.close()
+
+
+def _worker_entry(job_queue, result_queue, concurrency: int, cache_path: str, log_level: str,
+                  model_policy: str = "strong", budget: str = None):
+    """工作进程入口：一个事件循环上并发跑 concurrency 个 run"""
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    setup_logging(log_level, human=False)
+    asyncio.run(_worker_main(job_queue, result_queue, concurrency, cache_path, model_policy, budget))
+
+
+def _next_result(result_queue, futures) -> Dict[str, Any]:
+    """等待下一条结果；若有工作进程异常退出则直接抛出，避免主进程永远阻塞"""
+    while True:
+        try:
+            return result_queue.get(timeout=1.0)
+        except queue.Empty:
+            for future in futures:
+                if future.done() and future.exception() is not None:
+                    raise future.exception()
+
+
+def run_batch(input_path: str, output_path: str, workers: int = 2, concurrency: int = 4,
+              cache_path: str = ".cache/tool_results.sqlite", max_iterations: int = 15,
+              log_level: str = "WARNING", model_policy: str = "strong", budget: str = None) -> Dict[str, Any]:
+    """
+    批量运行并把结果追加写入 output_path
+    :param workers: 进程数
+    :param concurrency: 每个进程内同时进行的 run 数
+    :param cache_path: 共享工具结果缓存文件，传空字符串表示不使用缓存
+    :param model_policy: 模型路由策略名或 JSON 文件路径
+    :param budget: 每个 run 的预算，"key=value,..." 或 JSON 文件
+    :return: 本次运行的统计信息
+    """
+    jobs = load_jobs(input_path, max_iterations)
+    done = completed_job_ids(output_path)
+    pending = [job for job in jobs if job["id"] not in done]
+    logger.info("📋 共 %d 个任务，已完成 %d 个，本次运行 %d 个", len(jobs), len(jobs) - len(pending), len(pending))
+    stats = {"total": len(jobs), "skipped": len(jobs) - len(pending), "ok": 0, "incomplete": 0, "error": 0,
+             "elapsed_s": 0.0}
+    if not pending:
+        return stats
+
+    workers = max(1, min(workers, len(pending)))
+    started = time.perf_counter()
+    with multiprocessing.Manager() as manager:
+        job_queue = manager.Queue()
+        result_queue = manager.Queue()
+        for job in pending:
+            job_queue.put(job)
+        for _ in range(workers * concurrency):
+            job_queue.put(_DONE)
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_worker_entry, job_queue, result_queue, concurrency, cache_path, log_level,
+                                   model_policy, budget)
+                       for _ in range(workers)]
+            with open(output_path, "a", encoding="utf-8") as out:
+                for received in range(1, len(pending) + 1):
+                    record = _next_result(result_queue, futures)
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    out.flush()
+                    stats[record["status"]] += 1
+                    logger.info("  [%d/%d] %s %s (%.1fs)", received, len(pending), record["id"],
+                                _STATUS_ICONS[record["status"]], record["elapsed_s"])
+            for future in futures:
+                future.result()
+
+    stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量运行 Claude 学术研究任务")
+    parser.add_argument("input", help="任务 JSONL 文件")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="结果 JSONL 文件（追加写入，可断点续跑）")
+    parser.add_argument("--workers", type=int, default=2, help="进程数，默认 2")
+    parser.add_argument("--concurrency", type=int, default=4, help="每个进程内的并发 run 数，默认 4")
+    parser.add_argument("--cache", default=".cache/tool_results.sqlite", help="共享工具结果缓存路径，传空字符串禁用")
+    parser.add_argument("--max-iterations", type=int, default=15, help="任务未指定时的最大迭代次数")
+    parser.add_argument("--log-level", default="WARNING", help="工作进程日志级别，默认 WARNING")
+    parser.add_argument("--model-policy", default="strong",
+                        help="模型路由策略：strong / fast-plan / plan-strong 或 JSON 文件路径，默认 strong")
+    parser.add_argument("--budget", metavar="SPEC", help="每个 run 的预算：key=value,... 或 JSON 文件（见 run_budget.py）")
+    opts = parser.parse_args()
+
+    from claude_agent import _load_env_file
+    setup_logging()
+    _load_env_file()
+
+    stats = run_batch(opts.input, opts.output, workers=opts.workers, concurrency=opts.concurrency,
+                      cache_path=opts.cache, max_iterations=opts.max_iterations, log_level=opts.log_level,
+                      model_policy=opts.model_policy, budget=opts.budget)
+    logger.info("🏁 完成：成功 %d，未完成 %d，失败 %d，跳过 %d，耗时 %.1fs",
+                stats["ok"], stats["incomplete"], stats["error"], stats["skipped"], stats["elapsed_s"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Message Batches 接口本地替身（stand-in）
+作用：在本地 HTTP 端口上实现 /v1/messages/batches 的创建、查询、取结果和取消，
+AsyncAnthropic(base_url=替身地址) 可以原样调用 client.messages.batches.*，用于离线测试批量模式。
+每个请求由 responder(params) 生成 Message；默认的 standin_message 模拟一个按轮次检索后写综述的模型
+
+用法：
+    server = StandInBatchServer(processing_delay=0.5)
+    base_url = await server.start()
+    client = AsyncAnthropic(api_key="standin", base_url=base_url)
+"""
+import asyncio
+import datetime
+import json
+import random
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from agent_logging import get_logger
+from agent_server import _HTTPError, _read_request, _send, _send_json
+
+logger = get_logger("batch_standin")
+
+# 单个批次请求体上限（与线上接口一致）
+MAX_BATCH_BYTES = 256 << 20
+# 默认模型的输出 token：检索轮和综述轮
+PLAN_OUTPUT_TOKENS = 120
+REPORT_OUTPUT_TOKENS = 1500
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def _tool_result_payloads(messages: List[Dict[str, Any]]) -> List[Any]:
+    """对话历史中所有能解析为 JSON 的 tool_result 内容"""
+    payloads = []
+    for m in messages:
+        if m["role"] != "user" or not isinstance(m["content"], list):
+            continue
+        for block in m["content"]:
+            if block.get("type") != "tool_result":
+                continue
+            try:
+                payloads.append(json.loads(block["content"]))
+            except (TypeError, ValueError):
+                pass
+    return payloads
+
+
+def _papers(payload: Any) -> List[Dict[str, Any]]:
+    data = payload.get("data") if isinstance(payload, dict) else None
+    items = data.get("data") if isinstance(data, dict) else None
+    return [p for p in items or [] if isinstance(p, dict)]
+
+
+def standin_message(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    默认的模拟模型：第一轮 deep_research 检索指令主题，第二轮按 ID 追查前两篇论文，第三轮写综述（列出看到的论文标题）。
+    输出超过 max_tokens 时以 max_tokens 停止；相同输入返回相同结果
+    """
+    messages = params["messages"]
+    instruction = messages[0]["content"] if isinstance(messages[0]["content"], str) else "research"
+    done = sum(1 for m in messages if m["role"] == "assistant")
+    prompt_tokens = 2000 + len(json.dumps(messages, ensure_ascii=False)) // 4
+    payloads = _tool_result_payloads(messages)
+    content: List[Dict[str, Any]] = []
+    if done == 0:
+        wanted, stop_reason = PLAN_OUTPUT_TOKENS, "tool_use"
+        content.append({"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:20]}", "name": "deep_research",
+                        "input": {"searchQuery": instruction[:60], "count": 3}})
+    elif done == 1 and payloads and _papers(payloads[-1]):
+        wanted, stop_reason = PLAN_OUTPUT_TOKENS, "tool_use"
+        for paper in _papers(payloads[-1])[:2]:
+            content.append({"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex[:20]}", "name": "arxiv_search_by_id",
+                            "input": {"key": paper.get("arxivNo", "")}})
+    else:
+        wanted, stop_reason = REPORT_OUTPUT_TOKENS, "end_turn"
+        titles = [p.get("title", "") for payload in payloads for p in _papers(payload)]
+        content.append({"type": "text", "text": f"# {instruction} 综述\n" + "".join(f"- {t}\n" for t in titles)})
+    if params.get("max_tokens", 4096) < wanted:
+        wanted, stop_reason = params["max_tokens"], "max_tokens"
+        content = [{"type": "text", "text": f"# {instruction} 综述（未完）"}]
+    return {"id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant",
+            "model": params["model"], "content": content, "stop_reason": stop_reason, "stop_sequence": None,
+            "usage": {"input_tokens": prompt_tokens, "output_tokens": wanted,
+                      "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}}
+
+
+class StandInBatchServer:
+    """
+    Message Batches 接口的本地替身
+    :param responder: params -> Message 字典（可以是协程函数），默认 standin_message
+    :param processing_delay: 批次从创建到结束的时间（秒）
+    :param error_rate: 单个请求以 errored 结束的概率
+    :param expire_rate: 单个请求以 expired 结束的概率
+    """
+
+    def __init__(self, responder: Callable[[Dict[str, Any]], Union[Dict[str, Any], Awaitable[Dict[str, Any]]]] = None,
+                 processing_delay: float = 0.05, error_rate: float = 0.0, expire_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.responder = responder or standin_message
+        self.processing_delay = processing_delay
+        self.error_rate = error_rate
+        self.expire_rate = expire_rate
+        self._rng = random.Random(seed)
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self._results: Dict[str, List[Dict[str, Any]]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # 每个批次的请求数，用于断言“每轮一个批次”
+        self.batch_sizes: List[int] = []
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.base_url = ""
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """开始监听（port=0 随机端口），返回 base_url"""
+        self._server = await asyncio.start_server(self.handle, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        for task in self._tasks.values():
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await _read_request(reader, MAX_BATCH_BYTES)
+            if request is None:
+                return
+            method, path, body = request
+            await self._dispatch(method, path, body, writer)
+        except _HTTPError as e:
+            await _send_json(writer, e.status, {"type": "error", "error": {"type": "invalid_request_error",
+                                                                           "message": e.message}})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error("❌ 替身请求处理异常: %s", e)
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter):
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+        if parts[:3] != ["v1", "messages", "batches"]:
+            raise _HTTPError(404, "未知路径")
+        rest = parts[3:]
+        if not rest and method == "POST":
+            await _send_json(writer, 200, self._create(json.loads(body or b"{}")))
+            return
+        batch = self.batches.get(rest[0]) if rest else None
+        if batch is None:
+            raise _HTTPError(404, "批次不存在")
+        if len(rest) == 1 and method == "GET":
+            await _send_json(writer, 200, batch)
+        elif rest[1:] == ["results"] and method == "GET":
+            if batch["processing_status"] != "ended":
+                raise _HTTPError(400, "批次尚未结束")
+            lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in self._results[batch["id"]])
+            await _send(writer, 200, lines.encode("utf-8"), "application/binary")
+        elif rest[1:] == ["cancel"] and method == "POST":
+            if batch["processing_status"] == "in_progress":
+                batch["processing_status"] = "canceling"
+                batch["cancel_initiated_at"] = _now()
+            await _send_json(writer, 200, batch)
+        else:
+            raise _HTTPError(405, f"不支持 {method} {path}")
+
+    def _create(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        requests = payload.get("requests") or []
+        if not requests:
+            raise _HTTPError(400, "requests 不能为空")
+        ids = [r["custom_id"] for r in requests]
+        if len(set(ids)) != len(ids):
+            raise _HTTPError(400, "custom_id 重复")
+        batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+        created = datetime.datetime.now(datetime.timezone.utc)
+        batch = {"id": batch_id, "type": "message_batch", "processing_status": "in_progress",
+                 "request_counts": {"processing": len(requests), "succeeded": 0, "errored": 0,
+                                    "canceled": 0, "expired": 0},
+                 "created_at": created.isoformat(),
+                 "expires_at": (created + datetime.timedelta(hours=24)).isoformat(),
+                 "ended_at": None, "archived_at": None, "cancel_initiated_at": None, "results_url": None}
+        self.batches[batch_id] = batch
+        self.batch_sizes.append(len(requests))
+        self._tasks[batch_id] = asyncio.create_task(self._process(batch, requests))
+        return batch
+
+    async def _process(self, batch: Dict[str, Any], requests: List[Dict[str, Any]]):
+        await asyncio.sleep(self.processing_delay)
+        results = []
+        for request in requests:
+            roll = self._rng.random()
+            if batch["processing_status"] == "canceling":
+                result = {"type": "canceled"}
+            elif roll < self.error_rate:
+                result = {"type": "errored", "error": {"type": "error", "error": {
+                    "type": "overloaded_error", "message": "stand-in overloaded"}}}
+            elif roll < self.error_rate + self.expire_rate:
+                result = {"type": "expired"}
+            else:
+                message = self.responder(request["params"])
+                if asyncio.iscoroutine(message):
+                    message = await message
+                result = {"type": "succeeded", "message": message}
+            results.append({"custom_id": request["custom_id"], "result": result})
+            batch["request_counts"]["processing"] -= 1
+            batch["request_counts"][result["type"]] += 1
+        # 与线上接口一样：结果顺序不保证与请求一致
+        self._rng.shuffle(results)
+        self._results[batch["id"]] = results
+        batch.update(processing_status="ended", ended_at=_now(),
+                     results_url=f"{self.base_url}/v1/messages/batches/{batch['id']}/results")
+        self._tasks.pop(batch["id"], None)
@@ -0,0 +1,99 @@
+"""
+批量查询工具的公共逻辑
+作用：arxiv_search_by_ids / bioc_get_articles 把一组 ID 拆成单个查询、有界并发执行（每个 ID 仍走工具结果缓存），
+entrez_summary 把 ESearch 返回的 ID 按块交给 ESummary 一次查询；
+结果都按输入顺序返回，每个 ID 单独给出成功数据或错误原因
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Sequence
+
+# 单次批量调用最多接受的 ID 数，避免一次工具结果撑爆上下文
+MAX_IDS = {"arxiv_search_by_ids": 50, "bioc_get_articles": 50, "entrez_summary": 500}
+# 逐个查询时的并发数（同一个 MCP 服务）
+ITEM_CONCURRENCY = 5
+# ESummary 每块的 ID 数；NCBI 建议单次 GET 不超过 200 个
+ENTREZ_CHUNK = 100
+# 同时进行的 ESummary 块数
+ENTREZ_CONCURRENCY = 2
+
+
+def chunked(items: Sequence[Any], size: int) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield list(items[start:start + size])
+
+
+def normalize_ids(tool_name: str, ids: Any) -> List[str]:
+    """校验并整理 ID 列表；不合法时抛 ValueError，由 execute_tool 转成错误结果返回给 Claude"""
+    if isinstance(ids, str):
+        # Claude 偶尔会传逗号分隔的字符串
+        ids = [part for part in ids.replace(" ", ",").split(",")]
+    if not isinstance(ids, list):
+        raise ValueError("ID 列表必须是数组")
+    ids = [str(i).strip() for i in ids if str(i).strip()]
+    if not ids:
+        raise ValueError("ID 列表为空")
+    limit = MAX_IDS[tool_name]
+    if len(ids) > limit:
+        raise ValueError(f"{tool_name} 单次最多 {limit} 个 ID，实际 {len(ids)} 个，请分批调用")
+    return ids
+
+
+async def gather_ordered(ids: List[str], fetch: Callable[[str], Awaitable[Any]],
+                         concurrency: int = ITEM_CONCURRENCY) -> List[Dict[str, Any]]:
+    """
+    对每个不同的 ID 调用一次 fetch（重复 ID 只查一次），按输入顺序返回
+    [{"id", "ok": True, "data"} | {"id", "ok": False, "error"}]
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(item_id: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                value = await fetch(item_id)
+            except Exception as e:
+                return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        if not value:
+            return {"ok": False, "error": "未获取到数据"}
+        return {"ok": True, "data": value}
+
+    unique = list(dict.fromkeys(ids))
+    outcomes = dict(zip(unique, await asyncio.gather(*(one(i) for i in unique))))
+    return [{"id": i, **outcomes[i]} for i in ids]
+
+
+def split_esummary(ids: List[str], response: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    把一次 ESummary 的返回拆成 ID -> {"ok", "data" | "error"}
+    NCBI 对无效 ID 会在对应条目里给出 error 字段；返回里缺失的 ID 同样记为错误
+    """
+    if not response:
+        return {i: {"ok": False, "error": "ESummary 未返回数据"} for i in ids}
+    result = response.get("result") if isinstance(response, dict) else None
+    if not isinstance(result, dict):
+        error = response.get("error") if isinstance(response, dict) else None
+        return {i: {"ok": False, "error": error or "无法解析 ESummary 返回"} for i in ids}
+    out = {}
+    for i in ids:
+        entry = result.get(i)
+        if not isinstance(entry, dict):
+            out[i] = {"ok": False, "error": "返回中没有该 ID"}
+        elif entry.get("error"):
+            out[i] = {"ok": False, "error": entry["error"]}
+        else:
+            out[i] = {"ok": True, "data": entry}
+    return out
+
+
+async def require_esummary(client) -> None:
+    """
+    仓库中的 6005 服务文档只列出 ESearch：用 list_tools 确认服务端提供 ESummary，不提供时抛 RuntimeError，
+    避免每个 ID 都以"未返回数据"失败、看起来像是没有结果
+    """
+    available = await client.list_tools()
+    if "ESummary" not in available:
+        raise RuntimeError(f"Entrez 服务（端口 6005）不提供 ESummary 工具；该服务可用工具: {available}")
+
+
+def batch_result(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    succeeded = sum(1 for item in items if item["ok"])
+    return {"succeeded": succeeded, "failed": len(items) - succeeded, "results": items}
@@ -0,0 +1,109 @@
+"""
+事件循环延迟基准
+用途：在并发负载下对比工具结果后处理全部在循环线程执行（before）与按大小卸载到线程池 / 进程池（after）时，
+事件循环的唤醒延迟和小工具调用的响应时间。
+负载：若干个并发的大返回工具调用（Crossref 形状的返回文本，经过 MCP 客户端解码 + execute_tool 后处理），
+同时每 10ms 发起一次小返回的工具调用；LoopLagMonitor 每 5ms 采样一次循环延迟
+
+运行：python bench_event_loop.py --sizes 0.5 3 20 --heavy 6 > bench_loop_output.txt
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from bench_payload import make_payload
+from claude_agent import ClaudeAcademicAgent
+from cpu_offload import CPUOffloader, LoopLagMonitor
+from mcp_sdk import GiiispMCPClient
+
+SMALL_PAYLOAD = '{"status":"ok","message":{"items":[{"DOI":"10.1/small","title":["Small"]}]}}'
+
+
+class _CannedSession:
+    """只实现 call_tool 的 MCP 会话替身：返回固定文本"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    async def call_tool(self, name, arguments):
+        await asyncio.sleep(0.001)
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text=self.text)])
+
+
+class _CannedClient(GiiispMCPClient):
+    """走真实的 _invoke 解码路径，但不联网：query 为 big 时返回大文本"""
+
+    def __init__(self, big: str, offloader: CPUOffloader):
+        super().__init__(6000, "Crossref", offloader=offloader)
+        self.big = big
+
+    async def call_tool(self, tool_name, args):
+        text = self.big if args.get("query") == "big" else SMALL_PAYLOAD
+        return await self._invoke(_CannedSession(text), ["search_works"], tool_name, args, {"status": "error"})
+
+
+async def _scenario(big: str, offloader: CPUOffloader, heavy: int) -> dict:
+    agent = ClaudeAcademicAgent(api_key="bench-key", offloader=offloader)
+    agent.mcp_clients["crossref"] = _CannedClient(big, offloader)
+    await offloader.warm()
+
+    monitor = LoopLagMonitor(interval=0.005)
+    monitor.start()
+    light_latency = []
+    stop = asyncio.Event()
+
+    async def light():
+        while not stop.is_set():
+            started = time.perf_counter()
+            await agent.execute_tool("crossref_search", {"query": "small", "rows": 1})
+            light_latency.append(time.perf_counter() - started)
+            await asyncio.sleep(0.01)
+
+    light_task = asyncio.create_task(light())
+    started = time.perf_counter()
+    await asyncio.gather(*(agent.execute_tool("crossref_search", {"query": "big", "rows": 1000})
+                           for _ in range(heavy)))
+    heavy_s = time.perf_counter() - started
+    stop.set()
+    await light_task
+    lag = await monitor.stop()
+    offloader.shutdown()
+    await agent.client.close()
+    light_latency.sort()
+    return {"heavy_s": round(heavy_s, 2), "lag_p50_ms": lag["p50_ms"], "lag_p99_ms": lag["p99_ms"],
+            "lag_max_ms": lag["max_ms"],
+            "light_p50_ms": round(statistics.median(light_latency) * 1000, 1) if light_latency else "-",
+            "light_max_ms": round(light_latency[-1] * 1000, 1) if light_latency else "-",
+            "modes": offloader.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发负载下的事件循环延迟：后处理卸载前后对比")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.5, 3, 20], help="大返回大小（MB），默认 0.5 3 20")
+    parser.add_argument("--heavy", type=int, default=6, help="并发的大返回调用数，默认 6")
+    opts = parser.parse_args()
+
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    print(f"{'大小':>7} {'路径':>7} {'大调用总耗时s':>12} {'延迟p50ms':>10} {'延迟p99ms':>10} {'延迟maxms':>10} "
+          f"{'小调用p50ms':>11} {'小调用maxms':>11}  执行位置")
+    with tempfile.TemporaryDirectory() as tmp:
+        for megabytes in opts.sizes:
+            path = os.path.join(tmp, f"payload_{megabytes}.json")
+            make_payload(path, megabytes)
+            with open(path, "r", encoding="utf-8") as f:
+                big = f.read()
+            for mode, offloader in (("before", CPUOffloader(None, None)), ("after", CPUOffloader())):
+                r = asyncio.run(_scenario(big, offloader, opts.heavy))
+                print(f"{megabytes:>5}MB {mode:>7} {r['heavy_s']:>12} {r['lag_p50_ms']:>10} {r['lag_p99_ms']:>10} "
+                      f"{r['lag_max_ms']:>10} {r['light_p50_ms']:>11} {r['light_max_ms']:>11}  {r['modes']}")
+
+
+if __name__ == "__main__":
+    main()
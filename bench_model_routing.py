@@ -0,0 +1,132 @@
+"""
+模型路由基准
+用途：用模拟的模型客户端（快 / 强两档的首 token 延迟和输出速度不同）和 MCP 替身跑一批研究任务，
+对比各路由策略的模型耗时、按模型的 token 用量、成本和升级次数，以及相对 strong（每轮强模型）的节省
+负载：每个任务先做若干轮检索（每轮输出两个 tool_use，约 150 个输出 token），最后一轮写约 2500 token 的综述；
+快模型在综述轮会因 max_tokens 不够而被升级。模拟耗时按 --scale 缩短后实际等待，表中报告的是缩放前的耗时
+
+运行：python bench_model_routing.py --runs 12 > bench_routing_output.txt
+"""
+import argparse
+import asyncio
+import json
+import sys
+from types import SimpleNamespace
+from typing import Dict, List
+
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from model_router import POLICIES, RouteRule, RoutingPolicy
+from usage_tracker import DEFAULT_PRICING
+
+# 模型名前缀 -> (首 token 延迟 s, 输出 token/s)
+SPEEDS = {"claude-3-5-haiku": (0.4, 150.0), "claude-3-5-sonnet": (0.9, 60.0)}
+# 工具定义和系统提示折算的固定输入 token
+BASE_INPUT_TOKENS = 2500
+PLAN_OUTPUT_TOKENS = 150
+REPORT_OUTPUT_TOKENS = 2500
+
+
+class SimulatedMessages:
+    """
+    模拟 messages.create：指令形如 "topic:rounds"，前 rounds 轮输出检索用的 tool_use，之后写综述；
+    输出超过 max_tokens 时以 max_tokens 停止。输入 token 按对话历史的字符数估算
+    """
+
+    def __init__(self, scale: float):
+        self.scale = scale
+        self.final_models: List[str] = []
+
+    async def create(self, model, max_tokens, tools, messages):
+        topic, rounds = messages[0]["content"].split(":")
+        done = sum(1 for m in messages if m["role"] == "assistant")
+        prompt = BASE_INPUT_TOKENS + len(json.dumps(messages, ensure_ascii=False, default=str)) // 4
+        wanted = PLAN_OUTPUT_TOKENS if done < int(rounds) else REPORT_OUTPUT_TOKENS
+        output = min(wanted, max_tokens)
+        first_token, speed = next(v for k, v in SPEEDS.items() if model.startswith(k))
+        await asyncio.sleep((first_token + output / speed) * self.scale)
+        usage = SimpleNamespace(input_tokens=prompt, output_tokens=output,
+                                cache_creation_input_tokens=0, cache_read_input_tokens=0)
+        if output < wanted:
+            return SimpleNamespace(stop_reason="max_tokens", usage=usage,
+                                   content=[SimpleNamespace(type="text", text="# 综述（未完）")])
+        if done < int(rounds):
+            blocks = [SimpleNamespace(type="tool_use", name="deep_research", id=f"{topic}-{done}-0",
+                                      input={"searchQuery": f"{topic} {done}", "count": 5}),
+                      SimpleNamespace(type="tool_use", name="arxiv_search_by_abstract", id=f"{topic}-{done}-1",
+                                      input={"key": f"{topic} {done}", "pageSize": 5})]
+            return SimpleNamespace(stop_reason="tool_use", content=blocks, usage=usage)
+        self.final_models.append(model)
+        return SimpleNamespace(stop_reason="end_turn", usage=usage,
+                               content=[SimpleNamespace(type="text", text=f"# {topic} 综述")])
+
+
+async def _run_policy(policy: RoutingPolicy, runs: int, scale: float) -> Dict[str, object]:
+    agent = ClaudeAcademicAgent(api_key="bench-key", router=policy)
+    messages = SimulatedMessages(scale)
+    agent.client = SimpleNamespace(messages=messages)
+    for name, client in list(agent.mcp_clients.items()):
+        agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name, latency=0.001, seed=1)
+    # 检索轮数 3~5 轮不等，max_iterations 固定为 10
+    contexts = [agent.new_run(f"topic{i}:{3 + i % 3}", max_iterations=10) for i in range(runs)]
+    # 逐个运行：并发时其他 run 的工具后处理会推迟模拟模型的唤醒，缩放后放大成噪声
+    for ctx in contexts:
+        await agent.run_context(ctx)
+    summaries = [ctx.usage.summary for ctx in contexts]
+    by_tier: Dict[str, Dict[str, int]] = {"fast": {"in": 0, "out": 0}, "strong": {"in": 0, "out": 0}}
+    plan_s = 0.0
+    for summary in summaries:
+        for u in summary.iterations:
+            by_tier[u.tier]["in"] += u.prompt_tokens
+            by_tier[u.tier]["out"] += u.output_tokens
+            if u.stop_reason == "tool_use":
+                plan_s += u.latency_s
+    return {
+        "policy": policy.name,
+        "model_s": sum(s.model_latency_s for s in summaries) / scale,
+        "per_run_s": sum(s.model_latency_s for s in summaries) / scale / runs,
+        # 被采用的检索轮（以 tool_use 结束）的模型耗时
+        "plan_s": plan_s / scale / runs,
+        "fast_in": by_tier["fast"]["in"], "fast_out": by_tier["fast"]["out"],
+        "strong_in": by_tier["strong"]["in"], "strong_out": by_tier["strong"]["out"],
+        "cost": sum(s.cost_usd for s in summaries),
+        "escalations": sum(s.escalations for s in summaries),
+        "final_strong": sum(1 for m in messages.final_models if m == policy.strong_model),
+        "completed": sum(1 for ctx in contexts if ctx.status == "completed"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比各模型路由策略的耗时、token 和成本")
+    parser.add_argument("--runs", type=int, default=12, help="每个策略运行的任务数，默认 12")
+    parser.add_argument("--scale", type=float, default=0.01, help="模拟耗时的缩放比例，默认 0.01")
+    opts = parser.parse_args()
+
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    policies = list(POLICIES.values()) + [
+        # 已知检索大约做 4 轮：连续 4 轮 tool_use 之后直接用强模型，减少升级时重复发送的输入
+        RoutingPolicy("fast-plan+after4", rules=(
+            RouteRule("strong", "after_tool_turns", after_tool_turns=4),
+            RouteRule("strong", "last_iteration", iterations=(-1,)),
+        )),
+    ]
+    print(f"模拟速度: {SPEEDS}，价格: haiku {DEFAULT_PRICING['claude-3-5-haiku'][:2]} / "
+          f"sonnet {DEFAULT_PRICING['claude-3-5-sonnet'][:2]} 美元每百万 token（输入, 输出）")
+    print(f"{'策略':<18} {'模型耗时s/run':>13} {'其中检索轮s':>10} {'快 in':>8} {'快 out':>7} {'强 in':>8} {'强 out':>7} "
+          f"{'成本$':>8} {'升级':>4} {'强模型写综述':>10}  相对 strong")
+    baseline = None
+    for policy in policies:
+        r = asyncio.run(_run_policy(policy, opts.runs, opts.scale))
+        baseline = baseline or r
+        saving = (f"耗时 {(r['model_s'] / baseline['model_s'] - 1) * 100:+.0f}%，"
+                  f"检索轮 {(r['plan_s'] / baseline['plan_s'] - 1) * 100:+.0f}%，"
+                  f"成本 {(r['cost'] / baseline['cost'] - 1) * 100:+.0f}%") if r is not baseline else "-"
+        print(f"{r['policy']:<18} {r['per_run_s']:>13.1f} {r['plan_s']:>10.1f} {r['fast_in']:>8} {r['fast_out']:>7} {r['strong_in']:>8} "
+              f"{r['strong_out']:>7} {r['cost']:>8.4f} {r['escalations']:>4} "
+              f"{r['final_strong']:>6}/{r['completed']:<5}  {saving}")
+
+
+if __name__ == "__main__":
+    main()
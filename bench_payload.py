@@ -0,0 +1,114 @@
+"""
+MCP 返回解码基准
+用途：对比旧路径（json.loads 整体解析 + execute_tool 里 indent=2 重新序列化）与新路径
+（json_payload.decode_payload 按路径逐成员解码 + 紧凑序列化）的耗时和峰值内存。
+每个组合在独立子进程中运行：先计时跑一次，再在 tracemalloc 下跑一次得到解码 + 序列化期间新分配内存的峰值；
+同时给出子进程整体的峰值 RSS（包含读入返回文本本身）
+
+运行：python bench_payload.py --sizes 2 10 40 > bench_output.txt
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不报告 RSS
+    resource = None
+
+MODES = ("before", "after")
+
+
+def make_payload(path: str, megabytes: float, seed: int = 0):
+    """生成 Crossref search_works 形状的返回：message.items 为论文列表，另带一个较大的 facets"""
+    rng = random.Random(seed)
+    items, size = [], 0
+    while size < megabytes * 1_000_000 * 0.9:
+        item = {
+            "DOI": f"10.{rng.randint(1000, 9999)}/{rng.randint(1, 10 ** 8)}",
+            "title": [f"Synthetic paper {len(items)} on large language models"],
+            "author": [{"given": f"A{j}", "family": f"Author {rng.randint(1, 999)}"} for j in range(5)],
+            "abstract": "大语言模型 synthetic abstract text. " * rng.randint(20, 60),
+            "reference": [{"DOI": f"10.1/ref.{rng.randint(1, 10 ** 6)}"} for _ in range(rng.randint(5, 30))],
+            "is-referenced-by-count": rng.randint(0, 500),
+        }
+        items.append(item)
+        size += len(json.dumps(item, ensure_ascii=False))
+    facets = {f"facet{i}": {"values": {f"v{j}": j for j in range(200)}} for i in range(int(megabytes * 50))}
+    payload = {"status": "ok", "message": {"total-results": len(items), "facets": facets, "items": items}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+
+
+def _rss_mb():
+    if resource is None:
+        return "-"
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1)
+
+
+def _once(mode: str, text: str, max_chars: int):
+    if mode == "before":
+        result = json.loads(text)
+        decoded = time.perf_counter()
+        out = json.dumps(result, ensure_ascii=False, indent=2)
+    else:
+        from json_payload import decode_payload, dumps
+        result = decode_payload(text, "search_works", max_chars)
+        decoded = time.perf_counter()
+        out = dumps(result)
+    return decoded, len(out)
+
+
+def run_child(mode: str, path: str, max_chars: int) -> dict:
+    """子进程：读入文本后执行解码 + 序列化"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    started = time.perf_counter()
+    decoded, output_chars = _once(mode, text, max_chars)
+    finished = time.perf_counter()
+
+    tracemalloc.start()
+    _once(mode, text, max_chars)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"decode_s": round(decoded - started, 3), "serialize_s": round(finished - decoded, 3),
+            "alloc_peak_mb": round(peak / 1e6, 1), "rss_peak_mb": _rss_mb(),
+            "output_chars": output_chars}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP 返回解码的耗时与峰值内存基准")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[2, 10, 40], help="返回大小（MB），默认 2 10 40")
+    parser.add_argument("--max-chars", type=int, default=None, help="新路径的保留上限，默认 json_payload.MAX_PAYLOAD_CHARS")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    opts = parser.parse_args()
+
+    from json_payload import JSON_BACKEND, MAX_PAYLOAD_CHARS
+    max_chars = opts.max_chars or MAX_PAYLOAD_CHARS
+    if opts.child:
+        print(json.dumps(run_child(opts.child[0], opts.child[1], max_chars)))
+        return
+
+    print(f"JSON 后端: {JSON_BACKEND}，新路径保留上限 {max_chars} 字符")
+    print(f"{'大小':>8} {'路径':>7} {'解码s':>8} {'序列化s':>8} {'分配峰值MB':>10} {'进程RSS峰值MB':>12} {'输出字符':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for megabytes in opts.sizes:
+            path = os.path.join(tmp, f"payload_{megabytes}.json")
+            make_payload(path, megabytes)
+            for mode in MODES:
+                args = [sys.executable, os.path.abspath(__file__), "--child", mode, path,
+                        "--max-chars", str(max_chars)]
+                stats = json.loads(subprocess.check_output(args, text=True).strip().splitlines()[-1])
+                print(f"{megabytes:>6}MB {mode:>7} {stats['decode_s']:>8} {stats['serialize_s']:>8} "
+                      f"{stats['alloc_peak_mb']:>10} {stats['rss_peak_mb']:>12} {stats['output_chars']:>12}")
+
+
+if __name__ == "__main__":
+    main()
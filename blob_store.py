@@ -0,0 +1,217 @@
+"""
+大工具结果的本地内容寻址存储
+作用：单次 bioc_get_article 全文等结果可达数百 KB，直接放进对话历史后每一轮都会重新发送。
+超过阈值的结果写入本地文件（按内容 SHA-256 寻址，相同内容只存一份），Claude 只收到结构摘要和句柄，
+需要时再通过 read_result 工具按路径或字符区间读取其中的一部分
+"""
+import asyncio
+import hashlib
+import os
+import re
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from json_payload import dumps as _dumps, loads
+
+# 序列化后超过这个字符数的结果转存，工具未单独配置时使用
+DEFAULT_THRESHOLD = 20_000
+# 按工具覆盖阈值；0 表示该工具的结果从不转存
+DEFAULT_THRESHOLDS = {
+    "bioc_get_article": 8_000,
+    "bioc_get_articles": 16_000,
+    "read_result": 0,
+}
+# read_result 单次最多返回的字符数
+READ_LIMIT = 8_000
+# 摘要中最多列出的分段数、展开的层数，以及字符串预览长度
+OUTLINE_ENTRIES = 40
+OUTLINE_DEPTH = 5
+PREVIEW_CHARS = 200
+
+_PATH_TOKEN = re.compile(r"\[(\d+)\]|([^.\[\]]+)")
+# 用来给分段起名字的字段，依次尝试
+_LABEL_FIELDS = ("title", "section_type", "type", "name", "uid", "id", "DOI", "arxivNo")
+
+
+def _label(value: Any) -> Optional[str]:
+    if not isinstance(value, dict):
+        return None
+    infons = value.get("infons")
+    if isinstance(infons, dict) and infons.get("section_type"):
+        return str(infons["section_type"])
+    for name in _LABEL_FIELDS:
+        field_value = value.get(name)
+        if isinstance(field_value, list) and field_value and isinstance(field_value[0], str):
+            field_value = field_value[0]
+        if isinstance(field_value, (str, int)) and str(field_value):
+            return str(field_value)[:80]
+    return None
+
+
+def outline(value: Any, min_chars: int = 500) -> List[Dict[str, Any]]:
+    """
+    按层列出结果中较大的子树：[{"path", "chars", "type", "len", "label"}]
+    path 可直接作为 read_result 的 path 参数；只展开超过 min_chars 的节点，先列浅层再列深层
+    """
+    entries: List[Dict[str, Any]] = []
+    queue = deque([(value, "", 0)])
+    while queue and len(entries) < OUTLINE_ENTRIES:
+        node, path, depth = queue.popleft()
+        if path:
+            size = len(_dumps(node))
+            if size < min_chars:
+                continue
+            entry = {"path": path, "chars": size, "type": type(node).__name__}
+            if isinstance(node, (list, dict)):
+                entry["len"] = len(node)
+            label = _label(node)
+            if label:
+                entry["label"] = label
+            entries.append(entry)
+        if depth >= OUTLINE_DEPTH:
+            continue
+        if isinstance(node, dict):
+            queue.extend((child, f"{path}.{key}" if path else str(key), depth + 1) for key, child in node.items())
+        elif isinstance(node, list):
+            queue.extend((child, f"{path}[{index}]", depth + 1) for index, child in enumerate(node))
+    return entries
+
+
+def preview(value: Any) -> Dict[str, Any]:
+    """顶层的标量字段（长字符串截断），让 Claude 不读全文也能判断是否需要展开"""
+    if not isinstance(value, dict):
+        return {}
+    out = {}
+    for key, field_value in value.items():
+        if isinstance(field_value, str):
+            out[key] = field_value if len(field_value) <= PREVIEW_CHARS else field_value[:PREVIEW_CHARS] + "…"
+        elif isinstance(field_value, (int, float, bool)) or field_value is None:
+            out[key] = field_value
+    return out
+
+
+def resolve_path(value: Any, path: Optional[str]) -> Any:
+    """按 "documents[0].passages[3].text" 形式的路径取子树；路径不存在时抛 ValueError"""
+    node = value
+    for match in _PATH_TOKEN.finditer(path or ""):
+        index, key = match.groups()
+        try:
+            if index is not None:
+                node = node[int(index)]
+            elif isinstance(node, list) and key.isdigit():
+                node = node[int(key)]
+            else:
+                node = node[key]
+        except (KeyError, IndexError, TypeError):
+            raise ValueError(f"结果中不存在路径 {path}（在 {match.group(0)} 处）")
+    return node
+
+
+class BlobStore:
+    """
+    文件系统上的内容寻址存储：root/<前两位>/<sha256>.json
+    文件内容是结果的紧凑 JSON，写入后不再修改，多个进程可共享同一目录
+    """
+
+    def __init__(self, root: str = ".cache/blobs", threshold: int = DEFAULT_THRESHOLD,
+                 threshold_per_tool: Optional[Dict[str, int]] = None):
+        """
+        :param root: 存储目录
+        :param threshold: 默认转存阈值（字符数）
+        :param threshold_per_tool: 按工具名覆盖阈值，0 表示不转存，例如 {"deep_research": 40000}
+        """
+        self.root = root
+        self.threshold = threshold
+        self.threshold_per_tool = {**DEFAULT_THRESHOLDS, **(threshold_per_tool or {})}
+        self.offloaded = 0
+        self.chars_saved = 0
+        os.makedirs(root, exist_ok=True)
+
+    def threshold_for(self, tool_name: str) -> int:
+        return self.threshold_per_tool.get(tool_name, self.threshold)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.json")
+
+    def put(self, text: str) -> str:
+        """写入一段 JSON 文本，返回句柄；相同内容只写一次"""
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再改名，并发写同一内容时读者不会看到半个文件
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return f"blob:{digest}"
+
+    def get(self, handle: str) -> Any:
+        """按句柄读取完整结果；句柄无效或文件不存在时抛 ValueError"""
+        digest = handle[len("blob:"):] if handle.startswith("blob:") else handle
+        if not re.fullmatch(r"[0-9a-f]{64}", digest):
+            raise ValueError(f"无效的结果句柄: {handle}")
+        try:
+            with open(self._path(digest), "r", encoding="utf-8") as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            raise ValueError(f"结果句柄 {handle} 对应的内容不存在（可能已被清理）")
+
+    def offload(self, tool_name: str, result: Any, text: str) -> Optional[Dict[str, Any]]:
+        """
+        结果超过该工具的阈值时转存，返回代替原结果交给 Claude 的摘要；未超过返回 None
+        :param text: 原本要返回给 Claude 的紧凑 JSON（json_payload.dumps(result)），用于判断大小并直接写入存储
+        """
+        threshold = self.threshold_for(tool_name)
+        if not threshold or len(text) <= threshold:
+            return None
+        handle = self.put(text)
+        summary = {
+            "stored_as": handle,
+            "tool": tool_name,
+            "chars": len(text),
+            "note": f"结果较大（{len(text)} 字符），已存为 {handle}。"
+                    f"下面是结构概要，用 read_result 按 path 读取需要的部分（每次最多 {READ_LIMIT} 字符）。",
+            "preview": preview(result),
+            "sections": outline(result),
+        }
+        self.offloaded += 1
+        self.chars_saved += max(0, len(text) - len(_dumps(summary)))
+        return summary
+
+    def read(self, handle: str, path: Optional[str] = None, offset: int = 0,
+             length: int = READ_LIMIT) -> Dict[str, Any]:
+        """
+        读取转存结果的一部分
+        :param path: 子树路径，不提供表示整个结果
+        :param offset: 字符偏移量（字符串按原文、其他类型按紧凑 JSON 计）
+        :param length: 读取的字符数，不超过 READ_LIMIT
+        """
+        node = resolve_path(self.get(handle), path)
+        text = node if isinstance(node, str) else _dumps(node)
+        offset = max(0, int(offset or 0))
+        length = max(1, min(int(length or READ_LIMIT), READ_LIMIT))
+        end = min(offset + length, len(text))
+        return {
+            "handle": handle,
+            "path": path or "",
+            "total_chars": len(text),
+            "offset": offset,
+            "content": text[offset:end],
+            "next_offset": end if end < len(text) else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {"offloaded": self.offloaded, "chars_saved": self.chars_saved}
+
+    # ========== 异步接口 ==========
+    async def aoffload(self, tool_name: str, result: Any, text: str) -> Optional[Dict[str, Any]]:
+        threshold = self.threshold_for(tool_name)
+        if not threshold or len(text) <= threshold:
+            return None
+        return await asyncio.to_thread(self.offload, tool_name, result, text)
+
+    async def aread(self, handle: str, path: Optional[str] = None, offset: int = 0,
+                    length: int = READ_LIMIT) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.read, handle, path, offset, length)
@@ -0,0 +1,314 @@
+"""
+Message Batches 批量模式
+作用：夜间批量生成综述时，单个 run 的延迟不重要，吞吐和成本才重要。BulkBatchRunner 让许多 run 同步推进：
+每一轮把所有进行中的 run 的模型请求合并成一个 Message Batch 提交（批量请求按标准价格的一半计费），
+轮询到批次结束后按 custom_id 把结果对应回各个 run，再把所有 run 本轮的工具调用一起执行，然后进入下一轮。
+模型路由的升级、检查点、用量统计与交互模式共用 ClaudeAcademicAgent 的同一套处理逻辑
+
+- 单个批次的请求数超过 max_requests 时拆成多个批次同时提交、一起轮询
+- 单个请求以 errored / expired / canceled 结束时，在同一轮的下一个批次中重试，超过 max_retries 次该 run 记为失败
+- 等待期间被取消（Ctrl+C）时取消已提交但未结束的批次
+
+用法：
+    python bulk_batches.py jobs.jsonl -o bulk_results.jsonl            # 任务文件格式与 batch_runner.py 相同
+    python bulk_batches.py jobs.jsonl --stand-in --poll 0.2             # 本地替身批次接口 + MCP 替身，离线自检（默认不用缓存）
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent_logging import get_logger, setup_logging
+from batch_tools import chunked
+from model_router import ModelRoute
+from run_context import RunContext
+
+logger = get_logger("bulk")
+
+# 单个批次的请求数上限（线上接口允许 100,000 个 / 256MB；长对话历史下按请求数预留余量）
+BATCH_MAX_REQUESTS = 10_000
+# 轮询批次状态的初始间隔和上限（秒），每次未结束间隔乘以 1.5
+POLL_INTERVAL = 30.0
+MAX_POLL_INTERVAL = 300.0
+# 单个请求失败后的重试次数
+MAX_RETRIES = 2
+# 同时执行工具调用的 run 数上限
+TOOL_CONCURRENCY = 32
+
+
+class BulkBatchRunner:
+    """
+    用 Message Batches 同步推进多个 run
+    :param agent: ClaudeAcademicAgent，使用它的 API 客户端、工具、路由策略、检查点和缓存
+    :param poll_interval: 轮询批次状态的初始间隔（秒）
+    :param max_requests: 单个批次的请求数上限
+    :param max_retries: 单个请求 errored / expired / canceled 后的重试次数
+    :param tool_concurrency: 同时执行工具调用的 run 数上限
+    """
+
+    def __init__(self, agent, poll_interval: float = POLL_INTERVAL, max_poll_interval: float = MAX_POLL_INTERVAL,
+                 max_requests: int = BATCH_MAX_REQUESTS, max_retries: int = MAX_RETRIES,
+                 tool_concurrency: int = TOOL_CONCURRENCY):
+        self.agent = agent
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max(poll_interval, max_poll_interval)
+        self.max_requests = max_requests
+        self.max_retries = max_retries
+        self._tool_slots = asyncio.Semaphore(tool_concurrency)
+        # run_id -> 失败原因（请求重试耗尽）
+        self.errors: Dict[str, str] = {}
+        self.counts: Dict[str, int] = {"rounds": 0, "batches": 0, "requests": 0, "retried": 0, "failed": 0}
+
+    async def run(self, contexts: List[RunContext]) -> List[Optional[str]]:
+        """
+        同步推进全部 run 直到各自结束
+        :return: 与 contexts 对应的最终回复；请求重试耗尽的 run 为 None（原因见 self.errors）
+        """
+        resumed = []
+        for ctx in contexts:
+            pending, completed = self.agent._start_run(ctx)
+            if pending:
+                # 从检查点恢复：先补齐上一轮没执行完的工具调用
+                resumed.append(self.agent._run_tool_uses(ctx, pending, completed))
+        await asyncio.gather(*resumed)
+        active = [ctx for ctx in contexts if ctx.status == "running"]
+        try:
+            while active:
+                self.counts["rounds"] += 1
+                for ctx in active:
+                    ctx.iteration += 1
+                logger.info("🔄 [批量第 %d 轮] %d 个 run", self.counts["rounds"], len(active))
+                responses = await self._model_round(active)
+
+                tool_work = []
+                for ctx in active:
+                    if ctx.run_id in responses:
+                        route, response, latency = responses[ctx.run_id]
+                        tool_uses = self.agent._apply_response(ctx, route, response, latency)
+                        if tool_uses:
+                            tool_work.append(self._run_tools(ctx, tool_uses))
+                # 所有 run 本轮的工具调用一起执行
+                await asyncio.gather(*tool_work)
+
+                still_running = []
+                for ctx in active:
+                    if (ctx.status == "stopped" or self.agent._out_of_budget(ctx)
+                            or (ctx.status == "running" and ctx.iteration >= ctx.max_iterations)):
+                        self.agent._finish_incomplete(ctx)
+                    elif ctx.status == "running":
+                        still_running.append(ctx)
+                active = still_running
+        except BaseException:
+            for ctx in active:
+                if ctx.status == "running":
+                    ctx.status = "failed"
+            raise
+        finally:
+            for ctx in contexts:
+                await self.agent._end_run(ctx)
+            logger.info("📦 [批量模式] %s", self.counts)
+        return [ctx.final_text if ctx.status != "failed" else None for ctx in contexts]
+
+    async def _run_tools(self, ctx: RunContext, tool_uses: List[Any]):
+        async with self._tool_slots:
+            await self.agent._run_tool_uses(ctx, tool_uses)
+
+    async def _model_round(self, active: List[RunContext]) -> Dict[str, Tuple[ModelRoute, Any, float]]:
+        """
+        本轮所有 run 的模型请求：合并提交、升级和失败重试都在后续批次中完成
+        :return: run_id -> (被采用的路由, 响应, 批次往返耗时)；重试耗尽的 run 不在其中，状态记为 failed
+        """
+        pending = {ctx.run_id: (ctx, self.agent.router.route(ctx)) for ctx in active}
+        failures: Dict[str, int] = {}
+        accepted: Dict[str, Tuple[ModelRoute, Any, float]] = {}
+        while pending:
+            results, latency = await self._submit(pending)
+            retry = {}
+            for run_id, (ctx, route) in pending.items():
+                result = results.get(run_id)
+                kind = getattr(result, "type", "missing")
+                if kind == "succeeded":
+                    escalated = self.agent._record_response(ctx, route, result.message, latency, batch=True)
+                    if escalated is None:
+                        accepted[run_id] = (route, result.message, latency)
+                    else:
+                        retry[run_id] = (ctx, escalated)
+                    continue
+                failures[run_id] = failures.get(run_id, 0) + 1
+                reason = _describe(result)
+                if failures[run_id] <= self.max_retries:
+                    self.counts["retried"] += 1
+                    logger.warning("⚠️ run %s 第 %d 轮请求 %s，下一批次重试", run_id, ctx.iteration, reason)
+                    retry[run_id] = (ctx, route)
+                else:
+                    self.counts["failed"] += 1
+                    logger.error("❌ run %s 第 %d 轮请求 %s，重试 %d 次后放弃", run_id, ctx.iteration, reason,
+                                 self.max_retries)
+                    ctx.status = "failed"
+                    self.errors[run_id] = reason
+            pending = retry
+        return accepted
+
+    async def _submit(self, pending: Dict[str, Tuple[RunContext, ModelRoute]]) -> Tuple[Dict[str, Any], float]:
+        """把 pending 中每个 run 的请求提交为一个或多个批次，等全部结束后返回 run_id -> 结果 和往返耗时"""
+        requests = [{"custom_id": f"{run_id}-{ctx.iteration}", "params": {
+            "model": route.model, "max_tokens": route.max_tokens, **self.agent._model_request(ctx)}}
+            for run_id, (ctx, route) in pending.items()]
+        by_custom_id = {r["custom_id"]: run_id for r, run_id in zip(requests, pending)}
+
+        started = time.perf_counter()
+        api = self.agent.client.messages.batches
+        batch_ids = []
+        try:
+            for chunk in chunked(requests, self.max_requests):
+                batch = await api.create(requests=chunk)
+                batch_ids.append(batch.id)
+            self.counts["batches"] += len(batch_ids)
+            self.counts["requests"] += len(requests)
+            logger.info("📤 已提交 %d 个批次（%d 个请求）: %s", len(batch_ids), len(requests), ", ".join(batch_ids))
+            collected = await asyncio.gather(*(self._collect(batch_id) for batch_id in batch_ids))
+        except asyncio.CancelledError:
+            # 不再等待结果：取消已提交的批次，避免继续计费
+            await asyncio.shield(self._cancel(batch_ids))
+            raise
+        results = {}
+        for entries in collected:
+            for custom_id, result in entries:
+                if custom_id in by_custom_id:
+                    results[by_custom_id[custom_id]] = result
+        return results, time.perf_counter() - started
+
+    async def _collect(self, batch_id: str) -> List[Tuple[str, Any]]:
+        """轮询直到批次结束，返回 (custom_id, 结果) 列表"""
+        api = self.agent.client.messages.batches
+        interval = self.poll_interval
+        while True:
+            batch = await api.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                break
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, self.max_poll_interval)
+        logger.info("📥 批次 %s 已结束: %s", batch_id, batch.request_counts.to_dict())
+        return [(entry.custom_id, entry.result) async for entry in await api.results(batch_id)]
+
+    async def _cancel(self, batch_ids: List[str]):
+        api = self.agent.client.messages.batches
+        for batch_id in batch_ids:
+            try:
+                await api.cancel(batch_id)
+                logger.warning("🛑 已取消批次 %s", batch_id)
+            except Exception as e:
+                logger.warning("⚠️ 取消批次 %s 失败: %s", batch_id, e)
+
+
+def _describe(result: Any) -> str:
+    if result is None:
+        return "没有返回结果"
+    error = getattr(getattr(result, "error", None), "error", None)
+    if error is not None:
+        return f"{result.type}: {getattr(error, 'type', '')} {getattr(error, 'message', '')}".strip()
+    return result.type
+
+
+async def run_bulk(input_path: str, output_path: str, poll_interval: float = POLL_INTERVAL,
+                   cache_path: Optional[str] = None, max_iterations: int = 15,
+                   model_policy: str = "strong", stand_in: bool = False, budget: str = None) -> Dict[str, Any]:
+    """
+    读取任务文件，用一个 BulkBatchRunner 推进全部未完成的任务，结果追加写入 output_path
+    :param cache_path: 工具结果缓存路径，空字符串禁用；默认 .cache/tool_results.sqlite，
+                       使用替身时默认禁用，替身数据不会进入共享缓存
+    :param budget: 每个 run 的预算，"key=value,..." 或 JSON 文件
+    :param stand_in: 使用本地替身批次接口和 MCP 替身，不访问网络
+    :return: 本次运行的统计信息
+    """
+    from batch_runner import completed_job_ids, job_status, load_jobs
+    from claude_agent import ClaudeAcademicAgent
+    from model_router import load_policy
+    from result_cache import ResultCache
+    from run_budget import BudgetGovernor, load_budget
+
+    jobs = load_jobs(input_path, max_iterations)
+    done = completed_job_ids(output_path)
+    pending = [job for job in jobs if job["id"] not in done]
+    logger.info("📋 共 %d 个任务，已完成 %d 个，本次运行 %d 个", len(jobs), len(jobs) - len(pending), len(pending))
+    stats: Dict[str, Any] = {"total": len(jobs), "skipped": len(jobs) - len(pending), "ok": 0, "incomplete": 0,
+                             "error": 0}
+    if not pending:
+        return stats
+
+    if cache_path is None:
+        cache_path = "" if stand_in else ".cache/tool_results.sqlite"
+    cache = ResultCache(cache_path) if cache_path else None
+    agent = ClaudeAcademicAgent(result_cache=cache, router=load_policy(model_policy),
+                                governor=BudgetGovernor(load_budget(budget)) if budget else None)
+    server = None
+    if stand_in:
+        from anthropic import AsyncAnthropic
+        from batch_standin import StandInBatchServer
+        from mcp_standin import StandInMCPClient
+        server = StandInBatchServer(processing_delay=0.2)
+        await agent.client.close()
+        agent.client = AsyncAnthropic(api_key="standin", base_url=await server.start())
+        for name, client in list(agent.mcp_clients.items()):
+            agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name)
+
+    runner = BulkBatchRunner(agent, poll_interval=poll_interval)
+    contexts = [agent.new_run(job["instruction"], max_iterations=int(job["max_iterations"])) for job in pending]
+    started = time.perf_counter()
+    try:
+        await runner.run(contexts)
+    finally:
+        elapsed = round(time.perf_counter() - started, 3)
+        with open(output_path, "a", encoding="utf-8") as out:
+            for job, ctx in zip(pending, contexts):
+                record: Dict[str, Any] = {"id": job["id"], "pid": os.getpid(), "mode": "message_batches",
+                                          "elapsed_s": elapsed}
+                if ctx.status == "failed":
+                    record.update(status="error", error=runner.errors.get(ctx.run_id, "批量运行中断"))
+                else:
+                    record.update(status=job_status(ctx.status), result=ctx.final_text, run_status=ctx.status)
+                record["usage"] = ctx.usage.summary.to_dict()
+                if agent.governor is not None:
+                    record["budget"] = agent.governor.report(ctx)
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                stats[record["status"]] += 1
+        await agent.aclose()
+        if server is not None:
+            await server.close()
+        if cache is not None:
+            cache.close()
+    stats.update(runner.counts, elapsed_s=elapsed, cost_usd=round(agent.usage_totals.cost_usd, 6))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用 Message Batches 批量生成综述（吞吐和成本优先）")
+    parser.add_argument("input", help="任务 JSONL 文件（格式同 batch_runner.py）")
+    parser.add_argument("-o", "--output", default="bulk_results.jsonl", help="结果 JSONL 文件（追加写入，可断点续跑）")
+    parser.add_argument("--poll", type=float, default=POLL_INTERVAL, help=f"轮询批次状态的初始间隔（秒），默认 {POLL_INTERVAL:g}")
+    parser.add_argument("--cache", help="工具结果缓存路径，传空字符串禁用；默认 .cache/tool_results.sqlite，--stand-in 时默认禁用")
+    parser.add_argument("--max-iterations", type=int, default=15, help="任务未指定时的最大迭代次数")
+    parser.add_argument("--model-policy", default="strong",
+                        help="模型路由策略：strong / fast-plan / plan-strong 或 JSON 文件路径，默认 strong")
+    parser.add_argument("--budget", metavar="SPEC", help="每个 run 的预算：key=value,... 或 JSON 文件（见 run_budget.py）")
+    parser.add_argument("--stand-in", action="store_true", help="使用本地替身批次接口和 MCP 替身，不访问网络")
+    opts = parser.parse_args()
+
+    from claude_agent import _load_env_file
+    setup_logging()
+    if not opts.stand_in:
+        _load_env_file()
+
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    stats = asyncio.run(run_bulk(opts.input, opts.output, poll_interval=opts.poll, cache_path=opts.cache,
+                                 max_iterations=opts.max_iterations, model_policy=opts.model_policy,
+                                 stand_in=opts.stand_in, budget=opts.budget))
+    logger.info("🏁 完成：%s", stats)
+
+
+if __name__ == "__main__":
+    main()
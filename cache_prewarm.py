@@ -0,0 +1,270 @@
+"""
+工具结果缓存预热
+作用：用户每天早上问的主题大致固定。预热任务读取主题列表（或具体的工具调用），在白天的 run 开始之前
+对所有相关服务执行一遍并写入持久化工具结果缓存，白天的 run 直接命中本地缓存，不再冷请求 MCP 服务
+
+- 每个主题展开为 TOPIC_TOOLS 中每个检索工具的一次调用；缓存 key 经 canonical_input 规范化，
+  与 Claude 省略返回条数时的写法落到同一条缓存
+- 只请求缓存中不存在或将在 refresh_within 秒内过期的条目，其余跳过
+- 全局并发上限 + 每个服务的匀速限流，避免把上游服务打满
+- followups > 0 时，对检索结果中的 arXiv / PMC ID 再预热若干个按 ID 查询（提取规则与推测预取相同）
+- 报告覆盖率（计划调用中缓存有效的比例）、有效条目的原始请求耗时（白天首次调用可省下的时间），
+  以及这些条目此前被命中的次数和节省的请求耗时
+
+输入文件每行一个：纯文本主题，或 JSON：{"topic": "..."}、{"tool": "deep_research", "input": {...}}；# 开头为注释
+
+用法：
+    python cache_prewarm.py topics.txt
+    python cache_prewarm.py topics.txt --tools deep_research,crossref_search --followups 3 --refresh-within 43200
+    python cache_prewarm.py topics.txt --stand-in                      # MCP 替身，离线自检（写入临时缓存）
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from agent_logging import get_logger, setup_logging
+from mcp_sdk import AsyncRateLimiter
+from metrics import CACHE_PREWARM
+from prefetch import canonical_input, extract_followups
+from result_cache import ResultCache, cache_key
+
+logger = get_logger("prewarm")
+
+# 主题展开到的检索工具：工具名 -> 主题填入的参数（其余参数取默认值）
+TOPIC_TOOLS: Dict[str, Dict[str, Any]] = {
+    "deep_research": {"searchQuery": "{topic}"},
+    "arxiv_search_by_abstract": {"key": "{topic}"},
+    "crossref_search": {"query": "{topic}"},
+    "entrez_search": {"db": "pubmed", "term": "{topic}"},
+    "openlibrary_search": {"query": "{topic}"},
+}
+# 工具名 -> 所属 MCP 服务（同一服务共享一个限流器）
+TOOL_SERVICES = {
+    "crossref_search": "crossref",
+    "bioc_get_article": "bioc",
+    "deep_research": "deep_research",
+    "arxiv_search_by_abstract": "arxiv_abstract",
+    "openlibrary_search": "openlibrary",
+    "entrez_search": "entrez",
+    "arxiv_search_by_id": "arxiv_id",
+    "arxiv_search_by_title": "arxiv_title",
+}
+# 距过期不足该秒数的条目会被刷新：默认覆盖一个工作日
+REFRESH_WITHIN = 12 * 3600
+# 同时进行的请求数上限
+CONCURRENCY = 8
+# 每个服务每秒的请求数上限
+QPS_PER_SERVICE = 2.0
+
+Call = Tuple[str, Dict[str, Any]]
+
+
+def topic_calls(topic: str, tools: Iterable[str] = TOPIC_TOOLS) -> List[Call]:
+    """把一个主题展开为各检索工具的调用"""
+    calls = []
+    for tool in tools:
+        template = TOPIC_TOOLS[tool]
+        calls.append((tool, {k: v.format(topic=topic) if isinstance(v, str) else v for k, v in template.items()}))
+    return calls
+
+
+def load_calls(path: str, tools: Iterable[str] = TOPIC_TOOLS) -> List[Call]:
+    """读取主题 / 工具调用列表"""
+    tools = list(tools)
+    calls: List[Call] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line) if line.startswith("{") else {"topic": line}
+            if "tool" in item:
+                calls.append((item["tool"], dict(item.get("input") or {})))
+            else:
+                calls.extend(topic_calls(item["topic"], tools))
+    return calls
+
+
+class CachePrewarmer:
+    """
+    把一组工具调用的结果写入缓存
+    :param cache: 持久化工具结果缓存
+    :param fetch: 实际请求函数 (tool_name, tool_input) -> 结果，一般是代理的 _call_mcp
+    :param concurrency: 同时进行的请求数上限
+    :param qps: 每个服务每秒的请求数上限，<= 0 表示不限速
+    :param refresh_within: 距过期不足该秒数的条目会被刷新
+    :param followups: 每条检索结果额外预热的按 ID 查询数
+    """
+
+    def __init__(self, cache: ResultCache, fetch: Callable[[str, Dict[str, Any]], Awaitable[Any]],
+                 concurrency: int = CONCURRENCY, qps: float = QPS_PER_SERVICE,
+                 refresh_within: float = REFRESH_WITHIN, followups: int = 0):
+        self.cache = cache
+        self.fetch = fetch
+        self.qps = qps
+        self.refresh_within = refresh_within
+        self.followups = followups
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._limiters: Dict[str, AsyncRateLimiter] = {}
+        self._seen: Set[str] = set()
+        # 工具名 -> {planned, fresh, refreshed, failed}
+        self.by_tool: Dict[str, Dict[str, int]] = {}
+        # 缓存有效的条目的原始请求耗时；此前的命中次数及其节省的请求耗时
+        self.warm_fetch_ms = 0.0
+        self.previous_hits = 0
+        self.previous_saved_ms = 0.0
+
+    async def run(self, calls: List[Call]) -> Dict[str, Any]:
+        """预热全部调用（重复的调用只执行一次），返回报告"""
+        started = time.perf_counter()
+        await asyncio.gather(*(self._warm(tool, tool_input, followups=True) for tool, tool_input in calls))
+        report = self.report()
+        report["elapsed_s"] = round(time.perf_counter() - started, 3)
+        return report
+
+    async def _warm(self, tool: str, tool_input: Dict[str, Any], followups: bool):
+        key_input = canonical_input(tool, tool_input)
+        key = cache_key(tool, key_input)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        counts = self.by_tool.setdefault(tool, {"planned": 0, "fresh": 0, "refreshed": 0, "failed": 0})
+        counts["planned"] += 1
+
+        info = await asyncio.to_thread(self.cache.info, tool, key_input)
+        if info is not None:
+            self.previous_hits += info["hits"]
+            self.previous_saved_ms += info["hits"] * info["fetch_ms"]
+        if info is not None and info["expires_at"] - time.time() > self.refresh_within:
+            counts["fresh"] += 1
+            CACHE_PREWARM.labels(tool, "fresh").inc()
+            self.warm_fetch_ms += info["fetch_ms"]
+            value = (await asyncio.to_thread(self.cache.get, tool, key_input, None, False)
+                     if followups and self.followups else None)
+        else:
+            value = await self._refresh(tool, tool_input, key_input, counts)
+        if value is not None and followups and self.followups:
+            await asyncio.gather(*(self._warm(t, i, followups=False)
+                                   for t, i in extract_followups(tool, key_input, value)[:self.followups]))
+
+    async def _refresh(self, tool: str, tool_input: Dict[str, Any], key_input: Dict[str, Any],
+                       counts: Dict[str, int]) -> Any:
+        service = TOOL_SERVICES.get(tool, tool)
+        limiter = self._limiters.setdefault(service, AsyncRateLimiter(self.qps))
+        async with self._semaphore:
+            await limiter.acquire()
+            started = time.perf_counter()
+            try:
+                value = await self.fetch(tool, tool_input)
+            except Exception as e:
+                value = None
+                logger.warning("⚠️ 预热 %s %s 失败: %s", tool, tool_input, e)
+            fetch_ms = (time.perf_counter() - started) * 1000
+        # 空结果和被截断的结果（不写入缓存）都算失败
+        if (not value or not isinstance(value, (dict, list, str))
+                or not await self.cache.aput(tool, key_input, value, fetch_ms=fetch_ms)):
+            counts["failed"] += 1
+            CACHE_PREWARM.labels(tool, "failed").inc()
+            return None
+        counts["refreshed"] += 1
+        CACHE_PREWARM.labels(tool, "refreshed").inc()
+        self.warm_fetch_ms += fetch_ms
+        logger.info("🔥 %s %s (%.0fms)", tool, key_input, fetch_ms)
+        return value
+
+    def report(self) -> Dict[str, Any]:
+        totals = {name: sum(c[name] for c in self.by_tool.values())
+                  for name in ("planned", "fresh", "refreshed", "failed")}
+        warm = totals["fresh"] + totals["refreshed"]
+        return {
+            **totals,
+            "coverage": round(warm / totals["planned"], 4) if totals["planned"] else 0.0,
+            # 白天的 run 首次调用这些条目时省下的请求耗时
+            "warm_fetch_s": round(self.warm_fetch_ms / 1000, 3),
+            # 这些条目在本次预热之前已被命中的次数和节省的请求耗时（刷新后重新计数）
+            "previous_hits": self.previous_hits,
+            "previous_saved_s": round(self.previous_saved_ms / 1000, 3),
+            "by_tool": {tool: dict(c) for tool, c in sorted(self.by_tool.items())},
+        }
+
+
+async def run_prewarm(input_path: str, cache_path: Optional[str] = None,
+                      tools: Optional[List[str]] = None, refresh_within: float = REFRESH_WITHIN,
+                      concurrency: int = CONCURRENCY, qps: float = QPS_PER_SERVICE, followups: int = 0,
+                      pool_size: int = 2, stand_in: bool = False) -> Dict[str, Any]:
+    """
+    读取主题列表并预热缓存
+    :param cache_path: 工具结果缓存路径，默认 .cache/tool_results.sqlite；
+                       使用 MCP 替身且未指定时写入临时缓存，替身数据不会进入白天 run 使用的缓存
+    :param tools: 主题展开到的检索工具，默认 TOPIC_TOOLS 全部
+    :param pool_size: 每个 MCP 服务预热的会话数，0 表示不预热
+    :param stand_in: 使用 MCP 替身，不访问网络
+    :return: 预热报告
+    """
+    from claude_agent import ClaudeAcademicAgent
+
+    unknown = set(tools or ()) - set(TOPIC_TOOLS)
+    if unknown:
+        raise ValueError(f"不支持按主题预热的工具: {', '.join(sorted(unknown))}")
+    calls = load_calls(input_path, tools or TOPIC_TOOLS)
+    logger.info("📋 共 %d 个调用", len(calls))
+
+    scratch = None
+    if cache_path is None and stand_in:
+        scratch = tempfile.TemporaryDirectory(prefix="prewarm-standin-")
+        cache_path = os.path.join(scratch.name, "tool_results.sqlite")
+        logger.info("🧪 MCP 替身模式：写入临时缓存 %s", cache_path)
+    cache = ResultCache(cache_path or ".cache/tool_results.sqlite")
+    # 只使用代理的 MCP 客户端和工具路由，不调用模型
+    agent = ClaudeAcademicAgent()
+    if stand_in:
+        from mcp_standin import StandInMCPClient
+        for name, client in list(agent.mcp_clients.items()):
+            agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name)
+    try:
+        if pool_size > 0:
+            await agent.start_mcp_pools(min(pool_size, concurrency))
+        prewarmer = CachePrewarmer(cache, agent._call_mcp, concurrency=concurrency, qps=qps,
+                                   refresh_within=refresh_within, followups=followups)
+        return await prewarmer.run(calls)
+    finally:
+        await agent.aclose()
+        cache.close()
+        if scratch is not None:
+            scratch.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按主题列表预热工具结果缓存")
+    parser.add_argument("input", help="主题列表：每行一个主题，或 JSON {\"topic\"} / {\"tool\", \"input\"}")
+    parser.add_argument("--cache", help="工具结果缓存路径，默认 .cache/tool_results.sqlite；--stand-in 时默认写入临时缓存")
+    parser.add_argument("--tools", help=f"主题展开到的检索工具（逗号分隔），默认 {','.join(TOPIC_TOOLS)}")
+    parser.add_argument("--refresh-within", type=float, default=REFRESH_WITHIN,
+                        help=f"距过期不足该秒数的条目会被刷新，默认 {REFRESH_WITHIN}")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help=f"同时进行的请求数，默认 {CONCURRENCY}")
+    parser.add_argument("--qps", type=float, default=QPS_PER_SERVICE,
+                        help=f"每个服务每秒的请求数上限，0 表示不限速，默认 {QPS_PER_SERVICE:g}")
+    parser.add_argument("--followups", type=int, default=0, help="每条检索结果额外预热的按 ID 查询数，默认 0")
+    parser.add_argument("--pool-size", type=int, default=2, help="每个 MCP 服务预热的会话数，0 表示不预热")
+    parser.add_argument("--stand-in", action="store_true", help="使用 MCP 替身，不访问网络")
+    opts = parser.parse_args()
+
+    setup_logging()
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    tools = [t.strip() for t in opts.tools.split(",") if t.strip()] if opts.tools else None
+    report = asyncio.run(run_prewarm(opts.input, opts.cache, tools, opts.refresh_within, opts.concurrency,
+                                     opts.qps, opts.followups, opts.pool_size, opts.stand_in))
+    logger.info("🏁 覆盖率 %.0f%%（跳过 %d，刷新 %d，失败 %d），白天首次调用可省 %.1fs；此前命中 %d 次，节省 %.1fs",
+                report["coverage"] * 100, report["fresh"], report["refreshed"], report["failed"],
+                report["warm_fetch_s"], report["previous_hits"], report["previous_saved_s"])
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+Crossref 引文图爬取
+作用：从种子 DOI 出发按层（BFS）扩展参考文献，得到文献地图：
+- 每个 DOI 通过 crossref 服务的 search_works（以 DOI 为检索词）取回元数据和 reference 列表
+- 前沿队列、已访问集合和进度都在 SQLite 状态文件里，内存中只有一个有界的待处理队列，
+  10 万以上节点时内存也保持平稳；中断后用同一个输出目录重新运行即从断点继续
+- 边表（edges.tsv）和节点表（nodes.tsv）边爬边追加写出，状态文件记录已提交的文件长度，
+  恢复时截掉未提交的尾部，保证不重复、不遗漏
+- 并发数、全局限速（AsyncRateLimiter）、最大层数、每层节点上限、每个节点最多展开的参考文献数均可配置
+
+施引文献（谁引用了这篇）：Crossref 公开的 works 接口只提供被引次数（is-referenced-by-count），
+不提供施引文献列表（cited-by 仅对会员开放）。需要这个方向时传入 citing 钩子
+（async (doi) -> [施引 DOI]，例如接 OpenCitations），爬虫会把返回的 DOI 作为 citation 边加入并继续扩展
+
+用法：
+    python citation_crawler.py 10.48550/arXiv.1706.03762 --max-hops 2 --per-hop 2000 -o citation_graph
+"""
+import argparse
+import asyncio
+import os
+import re
+import sqlite3
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from agent_logging import get_logger, setup_logging
+from mcp_sdk import AsyncRateLimiter, GiiispMCPClient
+from paper_records import from_crossref
+
+logger = get_logger("crawler")
+
+EDGE_HEADER = "source\ttarget\tkind\thop\n"
+NODE_HEADER = "doi\thop\tstatus\tyear\tcitations\treferences\ttitle\n"
+# 每完成这么多个节点打印一次进度
+PROGRESS_EVERY = 500
+
+_DOI_PREFIX = re.compile(r"^(?:https?://(?:dx\.)?doi\.org/|doi:\s*)", re.IGNORECASE)
+
+CitingHook = Callable[[str], Awaitable[Iterable[str]]]
+
+
+def normalize_doi(value: Any) -> Optional[str]:
+    """去掉 https://doi.org/ 或 doi: 前缀并转小写；不像 DOI 时返回 None"""
+    doi = _DOI_PREFIX.sub("", str(value or "").strip()).lower()
+    return doi if doi.startswith("10.") and "/" in doi else None
+
+
+def _cell(value: Any) -> str:
+    return "" if value is None else str(value).replace("\t", " ").replace("\n", " ").replace("\r", " ")
+
+
+class CitationCrawler:
+    """断点可恢复的有界并发 BFS 引文爬虫"""
+
+    def __init__(self, out_dir: str, client: Any = None, concurrency: int = 4, qps: float = 5.0,
+                 max_hops: int = 2, per_hop: Optional[int] = 1000, max_refs: Optional[int] = 50,
+                 citing: Optional[CitingHook] = None, max_retries: int = 2, rows: int = 3):
+        """
+        :param out_dir: 输出目录（edges.tsv、nodes.tsv、state.sqlite）；已存在时从断点继续
+        :param client: crossref 的 MCP 客户端（或替身），不提供时新建 GiiispMCPClient(6000)
+        :param concurrency: 同时进行的请求数
+        :param qps: 全局每秒请求数上限
+        :param max_hops: 从种子（第 0 层）向外扩展的层数
+        :param per_hop: 每层最多扩展的节点数，超过后该层新发现的 DOI 只记边、不再扩展
+        :param max_refs: 每个节点最多展开的参考文献数
+        :param citing: 可选的施引文献钩子
+        :param max_retries: 单个 DOI 请求失败后的重试次数
+        :param rows: 按 DOI 检索时取回的条数（在其中找 DOI 完全相同的一条）
+        """
+        self.out_dir = out_dir
+        self.client = client or GiiispMCPClient(6000, "Crossref")
+        self.concurrency = concurrency
+        self.limiter = AsyncRateLimiter(qps)
+        self.max_hops = max_hops
+        self.per_hop = per_hop
+        self.max_refs = max_refs
+        self.citing = citing
+        self.max_retries = max_retries
+        self.rows = rows
+        self.completed = 0
+        self.edges_written = 0
+        self._in_flight = 0
+        self._progress = asyncio.Event()
+        os.makedirs(out_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(out_dir, "state.sqlite"), isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS nodes (
+                id INTEGER PRIMARY KEY,
+                doi TEXT NOT NULL UNIQUE,
+                hop INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS nodes_frontier ON nodes (status, hop, id);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """
+        )
+        self._hop_counts = dict(self._conn.execute("SELECT hop, COUNT(*) FROM nodes GROUP BY hop").fetchall())
+        self._edges, self._nodes = self._open_outputs()
+
+    # ========== 输出文件 ==========
+    def _meta(self, name: str) -> Optional[int]:
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _open_outputs(self):
+        """打开边表和节点表；已有状态时截掉最后一次提交之后写入的部分"""
+        files = []
+        for name, header in (("edges", EDGE_HEADER), ("nodes", NODE_HEADER)):
+            path = os.path.join(self.out_dir, f"{name}.tsv")
+            committed = self._meta(f"{name}_bytes")
+            f = open(path, "a+b")
+            if committed is None:
+                f.truncate(0)
+                f.write(header.encode("utf-8"))
+            else:
+                f.truncate(committed)
+            f.seek(0, os.SEEK_END)
+            files.append(f)
+        self.edges_written = self._meta("edges_count") or 0
+        return files
+
+    # ========== 前沿队列 ==========
+    def _add_seeds(self, seeds: Iterable[str]):
+        rows = [(doi,) for doi in filter(None, map(normalize_doi, seeds))]
+        with self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany("INSERT OR IGNORE INTO nodes (doi, hop, status) VALUES (?, 0, 'queued')", rows)
+            added = self._conn.total_changes - before
+        self._hop_counts[0] = self._hop_counts.get(0, 0) + added
+        # 上次中断时正在处理的节点重新排队
+        self._conn.execute("UPDATE nodes SET status = 'queued' WHERE status = 'running'")
+
+    def _claim(self, limit: int) -> List[Tuple[str, int, int]]:
+        """按层号从前沿取出一批节点并标记为处理中"""
+        rows = self._conn.execute(
+            "SELECT id, doi, hop, attempts FROM nodes WHERE status = 'queued' ORDER BY hop, id LIMIT ?", (limit,)
+        ).fetchall()
+        if rows:
+            with self._conn:
+                self._conn.executemany("UPDATE nodes SET status = 'running' WHERE id = ?", [(r[0],) for r in rows])
+        return [(doi, hop, attempts) for _, doi, hop, attempts in rows]
+
+    # ========== 抓取 ==========
+    async def _fetch(self, doi: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """返回 (状态, Crossref 条目)：ok / missing（检索结果中没有该 DOI）/ error"""
+        await self.limiter.acquire()
+        data = await self.client.call_tool("search_works", {"query": doi, "rows": self.rows})
+        if not isinstance(data, dict):
+            return "error", None
+        for item in (data.get("message") or {}).get("items") or []:
+            if isinstance(item, dict) and normalize_doi(item.get("DOI")) == doi:
+                return "ok", item
+        return "missing", None
+
+    async def _expand(self, doi: str, hop: int, attempts: int):
+        status, item = await self._fetch(doi)
+        if status == "error":
+            if attempts < self.max_retries:
+                return "retry", None, []
+            return "failed", None, []
+
+        edges: List[Tuple[str, str, str]] = []
+        if item is not None:
+            references = [normalize_doi(r.get("DOI")) for r in item.get("reference") or [] if isinstance(r, dict)]
+            references = list(dict.fromkeys(r for r in references if r and r != doi))
+            edges += [(doi, ref, "reference") for ref in references[:self.max_refs]]
+        if self.citing is not None:
+            try:
+                citers = list(dict.fromkeys(filter(None, map(normalize_doi, await self.citing(doi)))))
+            except Exception as e:
+                logger.warning("⚠️ 施引文献钩子失败 %s: %s", doi, e)
+                citers = []
+            edges += [(citer, doi, "citation") for citer in citers[:self.max_refs] if citer != doi]
+        return status if status == "missing" else "done", item, edges
+
+    def _commit(self, doi: str, hop: int, attempts: int, status: str, item: Optional[Dict[str, Any]],
+                edges: List[Tuple[str, str, str]]):
+        """写出这个节点的行和边，并在同一个事务里更新前沿与已提交的文件长度"""
+        if status == "retry":
+            with self._conn:
+                self._conn.execute("UPDATE nodes SET status = 'queued', attempts = ? WHERE doi = ?",
+                                   (attempts + 1, doi))
+            return
+
+        record = from_crossref(item) if item is not None else None
+        references = sum(1 for e in edges if e[2] == "reference")
+        self._nodes.write((f"{doi}\t{hop}\t{status}\t{_cell(record and record.year)}\t"
+                           f"{_cell(record and record.citations)}\t{references}\t"
+                           f"{_cell(record and record.title)}\n").encode("utf-8"))
+        self._edges.write("".join(f"{s}\t{t}\t{k}\t{hop}\n" for s, t, k in edges).encode("utf-8"))
+        self._nodes.flush()
+        self._edges.flush()
+
+        discovered = []
+        next_hop = hop + 1
+        if next_hop <= self.max_hops:
+            for source, target, _ in edges:
+                neighbour = target if source == doi else source
+                discovered.append((neighbour, next_hop))
+        with self._conn:
+            self._conn.execute("UPDATE nodes SET status = ?, attempts = ? WHERE doi = ?", (status, attempts, doi))
+            for neighbour, neighbour_hop in discovered:
+                if self.per_hop is not None and self._hop_counts.get(neighbour_hop, 0) >= self.per_hop:
+                    break
+                cur = self._conn.execute("INSERT OR IGNORE INTO nodes (doi, hop, status) VALUES (?, ?, 'queued')",
+                                         (neighbour, neighbour_hop))
+                if cur.rowcount:
+                    self._hop_counts[neighbour_hop] = self._hop_counts.get(neighbour_hop, 0) + 1
+            self.edges_written += len(edges)
+            self._conn.executemany("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", [
+                ("edges_bytes", self._edges.tell()), ("nodes_bytes", self._nodes.tell()),
+                ("edges_count", self.edges_written)])
+        self.completed += 1
+        if self.completed % PROGRESS_EVERY == 0:
+            logger.info("   🕸️ 已完成 %d 个节点，%d 条边，各层节点数 %s", self.completed, self.edges_written,
+                        dict(sorted(self._hop_counts.items())))
+
+    # ========== 调度 ==========
+    async def crawl(self, seeds: Iterable[str] = ()) -> Dict[str, Any]:
+        """
+        从种子开始（或从断点继续）爬取，直到前沿为空
+        :return: stats()
+        """
+        started = time.perf_counter()
+        self._add_seeds(seeds)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                job = await queue.get()
+                if job is None:
+                    return
+                doi, hop, attempts = job
+                try:
+                    status, item, edges = await self._expand(doi, hop, attempts)
+                except Exception as e:
+                    logger.warning("⚠️ 处理 %s 出错: %s", doi, e)
+                    status, item, edges = ("retry" if attempts < self.max_retries else "failed"), None, []
+                self._commit(doi, hop, attempts, status, item, edges)
+                self._in_flight -= 1
+                self._progress.set()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            while True:
+                free = queue.maxsize - queue.qsize()
+                batch = self._claim(free) if free > 0 else []
+                for job in batch:
+                    self._in_flight += 1
+                    queue.put_nowait(job)
+                if not batch and self._in_flight == 0:
+                    break
+                self._progress.clear()
+                await self._progress.wait()
+            for _ in workers:
+                queue.put_nowait(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+        stats = self.stats()
+        stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        by_status = dict(self._conn.execute("SELECT status, COUNT(*) FROM nodes GROUP BY status").fetchall())
+        return {"nodes": by_status, "hops": dict(sorted(self._hop_counts.items())), "edges": self.edges_written,
+                "completed_this_run": self.completed}
+
+    def close(self):
+        self._edges.close()
+        self._nodes.close()
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从种子 DOI 出发按层爬取 Crossref 参考文献，输出边表和节点表")
+    parser.add_argument("seeds", nargs="*", help="种子 DOI；从断点继续时可省略")
+    parser.add_argument("--seeds-file", help="每行一个种子 DOI 的文件")
+    parser.add_argument("-o", "--output", default="citation_graph", help="输出目录，默认 citation_graph")
+    parser.add_argument("--max-hops", type=int, default=2, help="扩展层数，默认 2")
+    parser.add_argument("--per-hop", type=int, default=1000, help="每层最多扩展的节点数，0 表示不限，默认 1000")
+    parser.add_argument("--max-refs", type=int, default=50, help="每个节点最多展开的参考文献数，默认 50")
+    parser.add_argument("--concurrency", type=int, default=4, help="并发请求数，默认 4")
+    parser.add_argument("--qps", type=float, default=5.0, help="每秒请求数上限，默认 5")
+    parser.add_argument("--stand-in", action="store_true", help="使用本地替身服务，不访问真实 MCP")
+    opts = parser.parse_args()
+
+    setup_logging()
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    seeds = list(opts.seeds)
+    if opts.seeds_file:
+        with open(opts.seeds_file, "r", encoding="utf-8") as f:
+            seeds += [line.strip() for line in f if line.strip()]
+    client = None
+    if opts.stand_in:
+        from mcp_standin import StandInMCPClient
+        client = StandInMCPClient(6000, "Crossref", latency=0.01)
+
+    crawler = CitationCrawler(opts.output, client=client, concurrency=opts.concurrency, qps=opts.qps,
+                              max_hops=opts.max_hops, per_hop=opts.per_hop or None, max_refs=opts.max_refs)
+    try:
+        stats = asyncio.run(crawler.crawl(seeds))
+        logger.info("🏁 爬取完成: %s", stats)
+        logger.info("   边表 %s，节点表 %s", os.path.join(opts.output, "edges.tsv"), os.path.join(opts.output, "nodes.tsv"))
+    except KeyboardInterrupt:
+        logger.info("⏸️ 已中断，已完成的部分已保存；用相同的 -o 重新运行即可继续")
+    finally:
+        crawler.close()
+
+
+if __name__ == "__main__":
+    main()
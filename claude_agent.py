@@ -6,7 +6,8 @@ import asyncio
 import json
 import os
 import sys
-from typing import List, Dict, Any
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 # Windows 控制台 UTF-8，避免 emoji/中文 报错
 if sys.platform == "win32":
@@ -16,34 +17,112 @@ if sys.platform == "win32":
         import io
         if hasattr(sys.stdout, "buffer"):
             sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", errors="replace")
-from anthropic import Anthropic, AuthenticationError
-from mcp_sdk import GiiispMCPClient
+from anthropic import AsyncAnthropic, AuthenticationError
+from batch_tools import (ENTREZ_CHUNK, ENTREZ_CONCURRENCY, batch_result, chunked, gather_ordered, normalize_ids,
+                         require_esummary, split_esummary)
+from blob_store import READ_LIMIT, BlobStore
+from cpu_offload import CPUOffloader, approx_chars, default_offloader
+from json_payload import dumps
+from mcp_sdk import AsyncRateLimiter, GiiispMCPClient
+from corpus_export import CorpusWriter, query_of
+from paper_index import PaperIndex
+from paper_records import records_from_result
+from prefetch import SpeculativePrefetcher, canonical_input
+from metrics import (BUDGET_ACTIONS, MODEL_ROUTES, TOOL_CACHE, TOOL_CALLS, TOOL_IN_FLIGHT, TOOL_LATENCY, TOOL_RESULT_OFFLOADED,
+                     observe_model_response, start_metrics_server)
+from model_router import POLICIES, ModelRoute, RoutingPolicy, load_policy
+from agent_logging import LazyJSON, get_logger, setup_logging
+from result_cache import ResultCache
+from run_budget import BudgetGovernor, load_budget
+from run_checkpoint import CheckpointStore
+from run_context import RunContext
+from run_events import (IterationStarted, ModelUsage, RunEvent, RunFinished, RunStarted, TextDelta, ToolCompleted,
+                        ToolDispatched)
+from run_profiler import RunProfiler, span
+from usage_tracker import RunUsageSummary, UsageTotals
+
+logger = get_logger("agent")
+
+# _call_mcp 遇到未注册工具名时的返回标记（None 已表示“调用成功但无数据”）
+_UNKNOWN_TOOL = object()
+
+
+def _postprocess(tool_name: str, tool_input: Dict[str, Any], result: Any, with_records: bool):
+    """工具结果的 CPU 密集部分：紧凑序列化（缩进会让大结果多出几成字符，并在内存里多留一份副本）和论文记录规范化"""
+    records = records_from_result(tool_name, tool_input, result) if with_records else []
+    return dumps(result), records
+
+
+def _tool_use_fields(block: Any):
+    """兼容 SDK 内容块对象和检查点中恢复的字典，返回 (id, name, input)"""
+    if isinstance(block, dict):
+        return block["id"], block["name"], block["input"]
+    return block.id, block.name, block.input
 
 
 class ClaudeAcademicAgent:
     """基于 Claude API 的自主学术研究代理"""
 
-    def __init__(self, api_key: str = None, base_url: str = None):
+    def __init__(self, api_key: str = None, base_url: str = None, result_cache: ResultCache = None,
+                 checkpoint_store: CheckpointStore = None, warmup: bool = False,
+                 prefetcher: SpeculativePrefetcher = None, blob_store: BlobStore = None,
+                 paper_index: PaperIndex = None, local_first: bool = False,
+                 corpus_writer: CorpusWriter = None, offloader: CPUOffloader = None,
+                 router: RoutingPolicy = None, governor: BudgetGovernor = None):
         """
         初始化 Claude 代理
         :param api_key: Anthropic API Key (如果不提供，会从环境变量 ANTHROPIC_API_KEY 读取)
         :param base_url: 中转/代理 API 地址；sk- 开头的 Key 必须指定，否则用环境变量 ANTHROPIC_BASE_URL
+        :param result_cache: 可选的工具结果缓存，命中时不再请求 MCP 服务
+        :param checkpoint_store: 可选的检查点存储，每轮迭代后落盘，崩溃后可用 resume(run_id) 继续
+        :param warmup: 第一次 run 开始时在后台并行预热全部 MCP 服务，与第一次 messages.create 同时进行
+        :param prefetcher: 可选的推测预取器，根据检索结果提前请求 Claude 可能追查的论文（需要 result_cache）
+        :param blob_store: 可选的大结果存储，超过阈值的工具结果只把摘要和句柄交给 Claude，并启用 read_result 工具
+        :param paper_index: 可选的本地论文索引，收录所有工具返回的论文记录，并启用 local_search 工具
+        :param local_first: 检索类工具先查 paper_index，完全匹配的结果足够多时不再请求网络
+        :param corpus_writer: 可选的语料导出，把工具返回的论文记录写入按来源 / 日期分区的列式数据集
+        :param offloader: 大结果的解码、规范化和序列化放到线程池 / 进程池执行，默认使用进程内共享的实例
+        :param router: 模型路由策略，默认 strong（每轮都用强模型）；规划工具调用的迭代可改用快模型
+        :param governor: 可选的预算调控，按墙钟时间、token、工具调用次数和结果字节数的预算逐级收紧每个 run
         """
         key = api_key or os.environ.get("ANTHROPIC_API_KEY")
         url = base_url or os.environ.get("ANTHROPIC_BASE_URL", "https://api.580ai.net/v1")
-        self.client = Anthropic(api_key=key, base_url=url)
+        # 异步客户端：等待模型响应时不阻塞事件循环，同一进程内的多个 run 可以并发
+        self.client = AsyncAnthropic(api_key=key, base_url=url)
+        self.result_cache = result_cache
+        self.checkpoint_store = checkpoint_store
+        self.warmup = warmup
+        self.prefetcher = prefetcher
+        self.blob_store = blob_store
+        self.paper_index = paper_index
+        self.local_first = local_first
+        self.corpus_writer = corpus_writer
+        self.offloader = offloader or default_offloader()
+        self.router = router or POLICIES["strong"]
+        self.governor = governor
+        # 预热任务与结果：服务名 -> {"ok", "elapsed_s", "error"}
+        self._warmup_task: asyncio.Task = None
+        self.warmup_report: Dict[str, Dict[str, Any]] = {}
+
+        # 每次 run 的状态都在 RunContext 中；这两个属性只是最近一次结束的 run 的快照，便于交互式查看
         self.conversation_history = []
+        # Token 用量：最近一次 run 的汇总 + 跨 run 的累计计数
+        self.last_run_usage: RunUsageSummary = RunUsageSummary()
+        self.usage_totals = UsageTotals()
+
+        # NCBI E-utilities 未带 API key 时限 3 次/秒，所有 run 共享
+        self.entrez_limiter = AsyncRateLimiter(3)
 
         # 初始化所有 MCP 客户端
         self.mcp_clients = {
-            "crossref": GiiispMCPClient(6000, "Crossref"),
-            "bioc": GiiispMCPClient(6001, "BioC"),
-            "deep_research": GiiispMCPClient(6002, "DeepResearch"),
-            "arxiv_abstract": GiiispMCPClient(6003, "Arxiv Abstract"),
-            "openlibrary": GiiispMCPClient(6004, "OpenLibrary"),
-            "entrez": GiiispMCPClient(6005, "Entrez"),
-            "arxiv_id": GiiispMCPClient(6006, "Arxiv ID"),
-            "arxiv_title": GiiispMCPClient(6007, "Arxiv Title"),
+            "crossref": GiiispMCPClient(6000, "Crossref", offloader=self.offloader),
+            "bioc": GiiispMCPClient(6001, "BioC", offloader=self.offloader),
+            "deep_research": GiiispMCPClient(6002, "DeepResearch", offloader=self.offloader),
+            "arxiv_abstract": GiiispMCPClient(6003, "Arxiv Abstract", offloader=self.offloader),
+            "openlibrary": GiiispMCPClient(6004, "OpenLibrary", offloader=self.offloader),
+            "entrez": GiiispMCPClient(6005, "Entrez", offloader=self.offloader),
+            "arxiv_id": GiiispMCPClient(6006, "Arxiv ID", offloader=self.offloader),
+            "arxiv_title": GiiispMCPClient(6007, "Arxiv Title", offloader=self.offloader),
         }
 
     def get_tool_definitions(self) -> List[Dict[str, Any]]:
@@ -51,7 +130,7 @@ class ClaudeAcademicAgent:
         定义所有可用工具的规范
         这是关键：将你的 MCP 服务转换为 Claude 可以理解的工具格式
         """
-        return [
+        tools = [
             {
                 "name": "crossref_search",
                 "description": "搜索学术文献的元数据（标题、作者、DOI、引用次数等）。适合查找已发表的期刊论文和会议论文。",
@@ -193,178 +272,711 @@ class ClaudeAcademicAgent:
                     },
                     "required": ["key"]
                 }
+            },
+            {
+                "name": "arxiv_search_by_ids",
+                "description": "一次查询多篇 arXiv 论文的详细信息（最多 50 个 ID）。需要查 2 篇以上时优先用它代替多次 arxiv_search_by_id。结果按输入顺序返回，每个 ID 单独标明成功或失败原因。",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "keys": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "arXiv ID 列表，例如 ['1706.03762', '1810.04805']"
+                        }
+                    },
+                    "required": ["keys"]
+                }
+            },
+            {
+                "name": "bioc_get_articles",
+                "description": "一次获取多篇 PubMed Central 文献的详细信息（最多 50 个 PMC ID）。结果按输入顺序返回，每个 ID 单独标明成功或失败原因。",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "ids": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "PMC ID 列表，例如 ['PMC7095368', 'PMC7102662']"
+                        }
+                    },
+                    "required": ["ids"]
+                }
+            },
+            {
+                "name": "entrez_summary",
+                "description": "获取 NCBI 记录的摘要信息（标题、作者、期刊、发表日期等）。把 entrez_search 返回的 ID 列表原样传入即可（最多 500 个），db 与搜索时一致。",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "db": {
+                            "type": "string",
+                            "description": "数据库名称，与 entrez_search 时相同",
+                            "enum": ["pubmed", "pmc", "nucleotide", "protein", "gene"]
+                        },
+                        "ids": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "description": "entrez_search 返回的 idlist"
+                        }
+                    },
+                    "required": ["db", "ids"]
+                }
             }
         ]
+        if self.blob_store is not None:
+            tools.append({
+                "name": "read_result",
+                "description": f"读取之前因过大而被存为句柄（stored_as: blob:...）的工具结果的一部分。path 取 sections 中列出的路径（如 documents[0].passages[3]），内容超过 {READ_LIMIT} 字符时用返回的 next_offset 继续读取。",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "handle": {
+                            "type": "string",
+                            "description": "结果句柄，例如 blob:3f2a..."
+                        },
+                        "path": {
+                            "type": "string",
+                            "description": "要读取的子树路径，不填表示整个结果"
+                        },
+                        "offset": {
+                            "type": "integer",
+                            "description": "起始字符偏移量，默认 0",
+                            "default": 0
+                        },
+                        "length": {
+                            "type": "integer",
+                            "description": f"读取的字符数，默认也是最大 {READ_LIMIT}",
+                            "default": READ_LIMIT
+                        }
+                    },
+                    "required": ["handle"]
+                }
+            })
+        if self.paper_index is not None:
+            tools.append({
+                "name": "local_search",
+                "description": "检索本地论文索引（之前所有检索和查询返回过的论文，不联网，毫秒级）。在联网检索前先用它看看已经掌握了哪些论文；结果含标题、作者、年份、DOI/arXiv ID 和摘要片段。",
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "query": {
+                            "type": "string",
+                            "description": "检索词，例如 'transformer attention'"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "description": "返回数量，默认 10",
+                            "default": 10
+                        },
+                        "year_from": {
+                            "type": "integer",
+                            "description": "只返回该年份及之后的论文"
+                        }
+                    },
+                    "required": ["query"]
+                }
+            })
+        return tools
 
-    async def execute_tool(self, tool_name: str, tool_input: Dict[str, Any]) -> str:
+    async def execute_tool(self, tool_name: str, tool_input: Dict[str, Any], ctx: RunContext = None) -> str:
         """
         执行工具调用
         这是桥接层：将 Claude 的工具调用请求转换为实际的 MCP 调用
+        :param ctx: 所属 run，配置了预取器时用于计算该 run 的预取预算
         """
-        print(f"\n🔧 [工具执行] {tool_name}")
-        print(f"   参数: {json.dumps(tool_input, ensure_ascii=False)}")
+        logger.info("🔧 [工具执行] %s", tool_name)
+        logger.debug("   参数: %s", LazyJSON(tool_input))
 
+        in_flight = TOOL_IN_FLIGHT.labels(tool_name)
+        in_flight.inc()
+        started = time.perf_counter()
+        status = "error"
         try:
-            # 根据工具名称路由到对应的 MCP 客户端
-            if tool_name == "crossref_search":
-                result = await self.mcp_clients["crossref"].call_tool(
-                    "search_works",
-                    {"query": tool_input["query"], "rows": tool_input.get("rows", 5)}
-                )
-
-            elif tool_name == "bioc_get_article":
-                result = await self.mcp_clients["bioc"].call_tool(
-                    "get_article_info",
-                    {"id": tool_input["id"]}
-                )
-
-            elif tool_name == "deep_research":
-                result = await self.mcp_clients["deep_research"].call_tool(
-                    "DeepResearch",
-                    {"searchQuery": tool_input["searchQuery"], "count": tool_input.get("count", 10)}
-                )
-
-            elif tool_name == "arxiv_search_by_abstract":
-                result = await self.mcp_clients["arxiv_abstract"].call_tool(
-                    "searchArxivByAbstract",
-                    {"key": tool_input["key"], "pageSize": tool_input.get("pageSize", 10)}
-                )
-
-            elif tool_name == "openlibrary_search":
-                result = await self.mcp_clients["openlibrary"].call_tool(
-                    "searchBooks",
-                    {"query": tool_input["query"], "limit": tool_input.get("limit", 5)}
-                )
-
-            elif tool_name == "entrez_search":
-                result = await self.mcp_clients["entrez"].call_tool(
-                    "ESearch",
-                    {
-                        "db": tool_input["db"],
-                        "term": tool_input["term"],
-                        "retmax": tool_input.get("retmax", 10)
-                    }
-                )
-
-            elif tool_name == "arxiv_search_by_id":
-                result = await self.mcp_clients["arxiv_id"].call_tool(
-                    "SearchByArxivNo",
-                    {"key": tool_input["key"]}
-                )
-
-            elif tool_name == "arxiv_search_by_title":
-                result = await self.mcp_clients["arxiv_title"].call_tool(
-                    "searchArxivByTitle",
-                    {"key": tool_input["key"]}
-                )
-
-            else:
+            with span(f"tool:{tool_name}"):
+                result = await self._dispatch(tool_name, tool_input)
+            if result is _UNKNOWN_TOOL:
+                status = "unknown_tool"
                 return json.dumps({"error": f"未知工具: {tool_name}"}, ensure_ascii=False)
 
             # 将结果转换为字符串返回给 Claude
             if result:
-                print(f"   ✅ 成功获取数据")
-                return json.dumps(result, ensure_ascii=False, indent=2)
+                status = "ok"
+                logger.info("   ✅ 成功获取数据")
+                if self.prefetcher is not None and ctx is not None:
+                    self.prefetcher.schedule(ctx, tool_name, tool_input, result, self._call_mcp)
+                # 大结果的序列化和规范化在线程池中进行，不卡住其他并发的工具调用和模型流
+                with_records = self.paper_index is not None or self.corpus_writer is not None
+                size = approx_chars(result, self.offloader.thread_threshold or 0)
+                text, records = await self.offloader.run("postprocess", _postprocess, tool_name, tool_input,
+                                                         result, with_records, size=size)
+                if self.paper_index is not None:
+                    await self.paper_index.aadd(records)
+                if self.corpus_writer is not None:
+                    await self.corpus_writer.aadd(records, query_of(tool_input))
+                if self.blob_store is not None:
+                    summary = await self.blob_store.aoffload(tool_name, result, text)
+                    if summary is not None:
+                        TOOL_RESULT_OFFLOADED.labels(tool_name).inc()
+                        logger.info("   📦 结果 %d 字符，已转存为 %s", len(text), summary["stored_as"])
+                        return dumps(summary)
+                return text
             else:
-                print(f"   ⚠️ 未获取到数据")
+                status = "empty"
+                logger.warning("   ⚠️ 未获取到数据")
                 return json.dumps({"error": "未获取到数据"}, ensure_ascii=False)
 
         except Exception as e:
-            print(f"   ❌ 执行失败: {str(e)}")
+            logger.error("   ❌ 执行失败: %s", e)
             return json.dumps({"error": str(e)}, ensure_ascii=False)
+        finally:
+            in_flight.dec()
+            TOOL_CALLS.labels(tool_name, status).inc()
+            TOOL_LATENCY.labels(tool_name).observe(time.perf_counter() - started)
+
+    async def _dispatch(self, tool_name: str, tool_input: Dict[str, Any]) -> Any:
+        """批量工具拆成单个查询或按块查询，本地工具直接读本地存储，其余工具（local_first 时先查本地索引）走缓存调用"""
+        if tool_name == "arxiv_search_by_ids":
+            keys = normalize_ids(tool_name, tool_input.get("keys"))
+            return batch_result(await gather_ordered(
+                keys, lambda key: self._cached_call("arxiv_search_by_id", {"key": key})))
+
+        elif tool_name == "bioc_get_articles":
+            ids = normalize_ids(tool_name, tool_input.get("ids"))
+            return batch_result(await gather_ordered(
+                ids, lambda pmc: self._cached_call("bioc_get_article", {"id": pmc})))
+
+        elif tool_name == "entrez_summary":
+            return await self._entrez_summary(tool_input["db"], normalize_ids(tool_name, tool_input.get("ids")))
+
+        elif tool_name == "local_search" and self.paper_index is not None:
+            return await self.paper_index.alocal_search(tool_input["query"], int(tool_input.get("limit") or 10),
+                                                        tool_input.get("year_from"))
+
+        elif tool_name == "read_result" and self.blob_store is not None:
+            return await self.blob_store.aread(tool_input["handle"], tool_input.get("path"),
+                                               tool_input.get("offset", 0), tool_input.get("length", READ_LIMIT))
+
+        if self.local_first and self.paper_index is not None:
+            local = await self.paper_index.aprecheck(tool_name, tool_input)
+            if local is not None:
+                logger.info("   📚 本地索引已有 %d 篇匹配论文，跳过网络请求", len(local["results"]))
+                return local
+
+        return await self._cached_call(tool_name, tool_input)
 
-    async def run(self, user_instruction: str, max_iterations: int = 10) -> str:
+    async def _entrez_summary(self, db: str, ids: List[str]) -> Dict[str, Any]:
+        """
+        按块调用 ESummary（一次请求查询多个 ID），块之间有界并发并遵守 NCBI 限速
+        仓库中的 6005 服务文档只列出 ESearch，ESummary 先用 list_tools 确认存在，不存在时整体报错
+        """
+        await require_esummary(self.mcp_clients["entrez"])
+        semaphore = asyncio.Semaphore(ENTREZ_CONCURRENCY)
+        unique = list(dict.fromkeys(ids))
+
+        async def summarize_chunk(chunk: List[str]) -> Dict[str, Dict[str, Any]]:
+            async with semaphore:
+                await self.entrez_limiter.acquire()
+                try:
+                    response = await self._cached_call("entrez_esummary", {"db": db, "id": ",".join(chunk)})
+                except Exception as e:
+                    return {i: {"ok": False, "error": f"{type(e).__name__}: {e}"} for i in chunk}
+            return split_esummary(chunk, response)
+
+        outcomes: Dict[str, Dict[str, Any]] = {}
+        for part in await asyncio.gather(*(summarize_chunk(c) for c in chunked(unique, ENTREZ_CHUNK))):
+            outcomes.update(part)
+        return batch_result([{"id": i, **outcomes[i]} for i in ids])
+
+    async def _cached_call(self, tool_name: str, tool_input: Dict[str, Any]) -> Any:
+        """
+        先查工具结果缓存，未命中再调用 MCP，并把非空结果写回缓存
+        缓存 key 使用规范化后的参数（见 prefetch.canonical_input），请求 MCP 仍用原参数
+        """
+        if self.result_cache is None:
+            return await self._call_mcp(tool_name, tool_input)
+
+        key_input = canonical_input(tool_name, tool_input)
+        if self.prefetcher is not None:
+            joined = await self.prefetcher.join(tool_name, key_input)
+            if joined is not None:
+                TOOL_CACHE.labels(tool_name, "hit").inc()
+                logger.info("   🔮 命中进行中的预取")
+                return joined
+
+        cached = await self.result_cache.aget(tool_name, key_input)
+        if cached is not None:
+            TOOL_CACHE.labels(tool_name, "hit").inc()
+            if self.prefetcher is not None:
+                self.prefetcher.record_hit(tool_name, key_input)
+            logger.info("   💾 命中缓存")
+            return cached
+
+        TOOL_CACHE.labels(tool_name, "miss").inc()
+        started = time.perf_counter()
+        result = await self._call_mcp(tool_name, tool_input)
+        if result and result is not _UNKNOWN_TOOL:
+            # 被截断的结果不写入缓存（ResultCache.put 返回 False）
+            if not await self.result_cache.aput(tool_name, key_input, result,
+                                                fetch_ms=(time.perf_counter() - started) * 1000):
+                logger.info("   ✂️ 结果已截断，不写入缓存")
+        return result
+
+    async def _call_mcp(self, tool_name: str, tool_input: Dict[str, Any]) -> Any:
+        """
+        将 Claude 的工具名和参数路由到对应的 MCP 客户端
+        :return: MCP 返回的解析后数据；工具名未知时返回 _UNKNOWN_TOOL
+        """
+        # 根据工具名称路由到对应的 MCP 客户端
+        if tool_name == "crossref_search":
+            return await self.mcp_clients["crossref"].call_tool(
+                "search_works",
+                {"query": tool_input["query"], "rows": tool_input.get("rows", 5)}
+            )
+
+        elif tool_name == "bioc_get_article":
+            return await self.mcp_clients["bioc"].call_tool(
+                "get_article_info",
+                {"id": tool_input["id"]}
+            )
+
+        elif tool_name == "deep_research":
+            return await self.mcp_clients["deep_research"].call_tool(
+                "DeepResearch",
+                {"searchQuery": tool_input["searchQuery"], "count": tool_input.get("count", 10)}
+            )
+
+        elif tool_name == "arxiv_search_by_abstract":
+            return await self.mcp_clients["arxiv_abstract"].call_tool(
+                "searchArxivByAbstract",
+                {"key": tool_input["key"], "pageSize": tool_input.get("pageSize", 10)}
+            )
+
+        elif tool_name == "openlibrary_search":
+            return await self.mcp_clients["openlibrary"].call_tool(
+                "searchBooks",
+                {"query": tool_input["query"], "limit": tool_input.get("limit", 5)}
+            )
+
+        elif tool_name == "entrez_search":
+            return await self.mcp_clients["entrez"].call_tool(
+                "ESearch",
+                {
+                    "db": tool_input["db"],
+                    "term": tool_input["term"],
+                    "retmax": tool_input.get("retmax", 10)
+                }
+            )
+
+        elif tool_name == "entrez_esummary":
+            # entrez_summary 内部使用：id 为逗号分隔的一块 ID
+            return await self.mcp_clients["entrez"].call_tool(
+                "ESummary",
+                {"db": tool_input["db"], "id": tool_input["id"], "retmode": "json"}
+            )
+
+        elif tool_name == "arxiv_search_by_id":
+            return await self.mcp_clients["arxiv_id"].call_tool(
+                "SearchByArxivNo",
+                {"key": tool_input["key"]}
+            )
+
+        elif tool_name == "arxiv_search_by_title":
+            return await self.mcp_clients["arxiv_title"].call_tool(
+                "searchArxivByTitle",
+                {"key": tool_input["key"]}
+            )
+
+        return _UNKNOWN_TOOL
+
+    async def start_mcp_pools(self, size: int = 2) -> Dict[str, Dict[str, Any]]:
+        """
+        为全部 MCP 服务并行预热连接池并等待完成，之后的工具调用复用已完成握手的会话
+        适合长期运行的进程（见 agent_server.py）；某个服务连不上不影响其他服务
+        已经用 start_warmup()（--warmup，每个服务 1 个会话）预热过时，等它结束后把每个连接池扩充到 size
+        :return: 各服务的预热结果，同 self.warmup_report
+        """
+        if self._warmup_task is None:
+            return await self.start_warmup(size)
+        await asyncio.gather(self._warmup_task, return_exceptions=True)
+        return await self._warmup(size)
+
+    def start_warmup(self, pool_size: int = 1) -> asyncio.Task:
+        """
+        在后台并行连接并初始化全部 MCP 服务，不等待；重复调用返回同一个任务
+        预热失败只记录在 warmup_report 和日志中，对应服务的调用照常临时建立连接
+        """
+        if self._warmup_task is None:
+            self._warmup_task = asyncio.create_task(self._warmup(pool_size), name="mcp-warmup")
+        return self._warmup_task
+
+    async def _warmup(self, pool_size: int) -> Dict[str, Dict[str, Any]]:
+        started = time.perf_counter()
+
+        async def warm(name: str, client) -> None:
+            try:
+                ok = await client.start_pool(pool_size)
+                error = None if ok else (client.pool.last_error if client.pool else None) or "超时"
+            except Exception as e:
+                ok, error = False, f"{type(e).__name__}: {e}"
+            self.warmup_report[name] = {"ok": ok, "elapsed_s": round(time.perf_counter() - started, 3),
+                                        "error": error}
+
+        with span("mcp.warmup"):
+            await asyncio.gather(*(warm(name, client) for name, client in self.mcp_clients.items()))
+        ready = sum(1 for r in self.warmup_report.values() if r["ok"])
+        logger.info("🔥 MCP 预热完成：%d/%d 个服务就绪（每个服务 %d 个会话，耗时 %.2fs）",
+                    ready, len(self.warmup_report), pool_size, time.perf_counter() - started)
+        for name, report in self.warmup_report.items():
+            if not report["ok"]:
+                logger.warning("⚠️ MCP 服务 %s 预热失败，调用时将临时连接: %s", name, report["error"])
+        return self.warmup_report
+
+    async def aclose(self):
+        """关闭 MCP 连接池、未完成的预取和 API 客户端，并写入论文索引和语料导出中缓冲的记录"""
+        if self.paper_index is not None:
+            await self.paper_index.aflush()
+        if self.corpus_writer is not None:
+            await asyncio.to_thread(self.corpus_writer.close)
+        if self.prefetcher is not None:
+            await self.prefetcher.aclose()
+        if self._warmup_task is not None and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        await asyncio.gather(*(client.close_pool() for client in self.mcp_clients.values()))
+        await self.client.close()
+
+    def new_run(self, user_instruction: str, max_iterations: int = 10, run_id: str = None) -> RunContext:
+        """
+        创建一次 run 的上下文；run 之间不共享任何可变状态，可以在同一个代理上并发执行
+        :param run_id: 预先分配的 run ID（如守护进程提交任务时已返回给客户端），默认自动生成
+        """
+        if run_id is not None:
+            return RunContext(instruction=user_instruction, max_iterations=max_iterations, run_id=run_id)
+        return RunContext(instruction=user_instruction, max_iterations=max_iterations)
+
+    async def run(self, user_instruction: str, max_iterations: int = 10, profile: str = None) -> str:
         """
         运行 Claude 代理的主循环
         :param user_instruction: 用户指令，例如 "请综合利用所有工具，为我生成一份关于 Large Language Models 的严谨综述"
         :param max_iterations: 最大迭代次数，防止无限循环
+        :param profile: 剖析输出目录；提供时生成本次 run 的 CPU 采样和异步耗时 collapsed-stack 文件
         :return: Claude 的最终回复
         """
-        print("\n" + "="*80)
-        print("🤖 Claude 自主研究代理启动")
-        print("="*80)
-        print(f"📝 用户指令: {user_instruction}")
-        print("="*80)
+        return await self.run_context(self.new_run(user_instruction, max_iterations), profile=profile)
 
-        # 初始化对话
-        self.conversation_history = [
-            {
-                "role": "user",
-                "content": user_instruction
-            }
-        ]
+    def run_events(self, user_instruction: str, max_iterations: int = 10,
+                   stream_text: bool = True) -> AsyncIterator[RunEvent]:
+        """
+        与 run() 相同，但以异步迭代器的形式逐个产出 run_events 中定义的事件，最后一个是 RunFinished
+        用法：async for event in agent.run_events("..."): print(event.to_dict())
+        :param stream_text: 流式调用模型，文本逐段以 TextDelta 产出；False 时每轮响应结束后整块产出
+        """
+        return self.context_events(self.new_run(user_instruction, max_iterations), stream_text=stream_text)
+
+    async def resume(self, run_id: str, max_iterations: int = None, profile: str = None) -> str:
+        """
+        从检查点恢复一个中断的 run，已执行过的工具调用直接复用检查点中的结果
+        :param run_id: 中断的 run 的 ID（日志和检查点文件名中可见）
+        :param max_iterations: 覆盖原来的最大迭代次数（原 run 因达到上限而结束时需要调大）
+        :return: Claude 的最终回复
+        """
+        if self.checkpoint_store is None:
+            raise RuntimeError("未配置 checkpoint_store，无法恢复 run")
+        ctx = await self.checkpoint_store.aload(run_id)
+        if ctx.status == "completed":
+            logger.info("✅ run %s 已完成，直接返回检查点中的结果", run_id)
+            return ctx.final_text
+        if max_iterations is not None:
+            ctx.max_iterations = max_iterations
+        logger.info("♻️ 从检查点恢复 run %s（已完成 %d 轮迭代）", run_id, ctx.iteration)
+        return await self.run_context(ctx, profile=profile)
+
+    async def run_context(self, ctx: RunContext, profile: str = None) -> str:
+        """
+        执行一个已创建的 run 上下文，结束后可从 ctx 读取对话历史、用量和状态
+        :param ctx: new_run() 返回的上下文
+        :param profile: 剖析输出目录
+        :return: Claude 的最终回复
+        """
+        events = self.context_events(ctx, profile=profile)
+        try:
+            async for event in events:
+                if isinstance(event, RunFinished):
+                    return event.text
+        finally:
+            await events.aclose()
 
-        iteration = 0
+    async def context_events(self, ctx: RunContext, stream_text: bool = False,
+                             profile: str = None) -> AsyncIterator[RunEvent]:
+        """
+        执行一个已创建的 run 上下文，逐个产出事件；提前停止迭代时应调用 aclose()，run 随之结束并完成汇总
+        :param ctx: new_run() 或检查点恢复得到的上下文
+        :param stream_text: 流式调用模型，文本逐段以 TextDelta 产出
+        :param profile: 剖析输出目录
+        """
+        logger.info("=" * 80)
+        logger.info("🤖 Claude 自主研究代理启动 [run %s]", ctx.run_id)
+        logger.info("📝 用户指令: %s", ctx.instruction)
+        logger.info("=" * 80)
 
-        while iteration < max_iterations:
-            iteration += 1
-            print(f"\n🔄 [迭代 {iteration}/{max_iterations}]")
+        profiler = RunProfiler(profile, run_name=f"run_{ctx.run_id}") if profile else None
+        if profiler:
+            profiler.start()
+        try:
+            with span("run"):
+                async for event in self._run_events(ctx, stream_text):
+                    yield event
+        except BaseException:
+            ctx.status = "failed"
+            raise
+        finally:
+            await self._end_run(ctx)
+            if profiler:
+                logger.info("🔥 [剖析文件] %s", ", ".join(profiler.stop()))
+        # 汇总完成后再产出，RunFinished 中的用量与 usage_totals 一致
+        yield RunFinished(ctx.run_id, ctx.status, ctx.final_text, ctx.usage.summary.to_dict(),
+                          self.governor.report(ctx) if self.governor is not None else {})
 
-            # 调用 Claude API
-            try:
-                response = self.client.messages.create(
-                    model="claude-3-5-sonnet",  # 中转 API 通用名称
-                    max_tokens=4096,
-                    tools=self.get_tool_definitions(),
-                    messages=self.conversation_history
-                )
-            except AuthenticationError:
-                print("\n❌ 认证失败 (401 无效的令牌)")
-                print("   请检查 ANTHROPIC_API_KEY：")
-                print("   1. 在 https://console.anthropic.com 登录并复制正确的 API Key")
-                print("   2. 确认 .env 或环境变量中只包含 key，无多余空格/换行/引号")
-                print("   3. 若 key 已过期或已撤销，请重新生成后再试")
-                print("   4. 若账户余额不足，请到 Plans & Billing 充值")
-                raise
-
-            print(f"   停止原因: {response.stop_reason}")
-
-            # 处理响应
-            if response.stop_reason == "end_turn":
-                # Claude 完成了任务，返回最终结果
-                final_text = ""
-                for block in response.content:
-                    if block.type == "text":
-                        final_text += block.text
-
-                print("\n" + "="*80)
-                print("✅ Claude 已完成任务")
-                print("="*80)
-                return final_text
-
-            elif response.stop_reason == "tool_use":
-                # Claude 决定使用工具
-                assistant_message = {"role": "assistant", "content": response.content}
-                self.conversation_history.append(assistant_message)
+    async def _end_run(self, ctx: RunContext):
+        """run 结束（无论成功与否）后的汇总：检查点、索引与导出落盘、用量累计、日志"""
+        if self.checkpoint_store is not None:
+            await self.checkpoint_store.aflush()
+        # 兼容旧用法：保留最近一次结束的 run 的历史和用量
+        self.conversation_history = ctx.messages
+        self.last_run_usage = ctx.usage.summary
+        self.usage_totals.add(ctx.usage.summary)
+        logger.info("📊 [用量统计 run %s]\n%s", ctx.run_id, ctx.usage.summary.format())
+        if self.blob_store is not None:
+            logger.info("📦 [大结果转存] 累计 %s", self.blob_store.stats())
+        if self.paper_index is not None:
+            await self.paper_index.aflush()
+            logger.info("📚 [本地论文索引] %s", await asyncio.to_thread(self.paper_index.stats))
+        if self.corpus_writer is not None:
+            # 每个 run 结束时关闭当前数据文件，已采集的记录对读取方可见
+            await self.corpus_writer.afinalize()
+            logger.info("🗂️ [语料导出] %s -> %s", self.corpus_writer.stats(), self.corpus_writer.root)
+        if self.prefetcher is not None:
+            logger.info("🔮 [推测预取] 本 run 发起 %d 次，累计 %s", ctx.prefetched, self.prefetcher.stats())
+        if self.governor is not None:
+            logger.info("💰 [预算 run %s] %s", ctx.run_id, LazyJSON(self.governor.report(ctx)))
+
+    def _start_run(self, ctx: RunContext) -> Tuple[List[Any], Dict[str, str]]:
+        """
+        主循环开始前：写检查点起点、启动预热
+        :return: 从检查点恢复时上一轮没执行完的 tool_use 块，以及该轮已完成的 tool_use_id -> 结果
+        """
+        if self.checkpoint_store:
+            self.checkpoint_store.record_start(ctx)
+        if self.warmup:
+            # 与第一次 messages.create 并行握手，不阻塞本 run
+            self.start_warmup()
+        if self.governor is not None:
+            self.governor.start(ctx)
+        pending, completed = ctx.pending_tool_uses, ctx.completed_tool_results
+        ctx.pending_tool_uses, ctx.completed_tool_results = [], {}
+        return pending, completed
 
+    async def _run_events(self, ctx: RunContext, stream_text: bool) -> AsyncIterator[RunEvent]:
+        """主循环本体，所有状态都读写在 ctx 上，进展以事件产出"""
+        yield RunStarted(ctx.run_id, ctx.instruction, ctx.iteration)
+        # 从检查点恢复：先补齐上一轮没执行完的工具调用
+        pending, completed = self._start_run(ctx)
+        if pending:
+            async for event in self._iter_tool_uses(ctx, pending, completed):
+                yield event
+
+        while ctx.iteration < ctx.max_iterations:
+            if self._out_of_budget(ctx):
+                break
+            ctx.iteration += 1
+            iteration = ctx.iteration
+            logger.info("🔄 [%s 迭代 %d/%d]", ctx.run_id, iteration, ctx.max_iterations)
+
+            with span(f"iteration {iteration}"):
+                route = self.router.route(ctx)
+                logger.info("   模型: %s（%s, %s）", route.model, route.tier, route.reason)
+                yield IterationStarted(ctx.run_id, iteration, route.model, route.tier, route.reason)
+                request = self._model_request(ctx)
+                while True:
+                    # 调用 Claude API
+                    request.update(model=route.model, max_tokens=route.max_tokens)
+                    try:
+                        started = time.perf_counter()
+                        with span(f"model:{route.model}"):
+                            if stream_text:
+                                async with self.client.messages.stream(**request) as stream:
+                                    async for text in stream.text_stream:
+                                        yield TextDelta(ctx.run_id, iteration, text)
+                                    response = await stream.get_final_message()
+                            else:
+                                response = await self.client.messages.create(**request)
+                    except AuthenticationError:
+                        logger.error(
+                            "❌ 认证失败 (401 无效的令牌)\n"
+                            "   请检查 ANTHROPIC_API_KEY：\n"
+                            "   1. 在 https://console.anthropic.com 登录并复制正确的 API Key\n"
+                            "   2. 确认 .env 或环境变量中只包含 key，无多余空格/换行/引号\n"
+                            "   3. 若 key 已过期或已撤销，请重新生成后再试\n"
+                            "   4. 若账户余额不足，请到 Plans & Billing 充值"
+                        )
+                        raise
+
+                    latency = time.perf_counter() - started
+                    escalated = self._record_response(ctx, route, response, latency)
+                    if not stream_text and escalated is None:
+                        for block in response.content:
+                            if block.type == "text":
+                                yield TextDelta(ctx.run_id, iteration, block.text)
+                    yield self._usage_event(ctx)
+                    if escalated is None:
+                        break
+                    route = escalated
+
+                tool_uses = self._apply_response(ctx, route, response, latency)
+                if ctx.status != "running":
+                    break
                 # 执行所有工具调用
-                tool_results = []
-                for block in response.content:
-                    if block.type == "tool_use":
-                        print(f"\n   🎯 Claude 决定调用: {block.name}")
-
-                        # 执行工具
-                        result = await self.execute_tool(block.name, block.input)
-
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": result
-                        })
-
-                # 将工具结果返回给 Claude
-                self.conversation_history.append({
-                    "role": "user",
-                    "content": tool_results
-                })
+                async for event in self._iter_tool_uses(ctx, tool_uses):
+                    yield event
 
+        if ctx.status != "completed":
+            self._finish_incomplete(ctx)
+
+    def _model_request(self, ctx: RunContext) -> Dict[str, Any]:
+        """本轮模型请求的工具和对话历史（模型和 max_tokens 由路由决定）；配置了预算调控时按用量收紧"""
+        request = {"tools": self.get_tool_definitions(), "messages": ctx.messages}
+        if self.governor is not None:
+            request = self.governor.shape_request(ctx, request)
+        return request
+
+    def _out_of_budget(self, ctx: RunContext) -> bool:
+        """已要求过最终回答但 run 仍未结束：以 budget_exhausted 结束"""
+        if self.governor is None or not self.governor.exhausted(ctx):
+            return False
+        ctx.status = "budget_exhausted"
+        BUDGET_ACTIONS.labels("exhausted").inc()
+        return True
+
+    def _usage_event(self, ctx: RunContext) -> ModelUsage:
+        u = ctx.usage.summary.iterations[-1]
+        return ModelUsage(ctx.run_id, u.iteration, u.model, u.stop_reason, u.input_tokens, u.output_tokens,
+                          u.cache_creation_input_tokens, u.cache_read_input_tokens, round(u.latency_s, 3),
+                          round(u.cost_usd(ctx.usage.pricing), 6), u.discarded)
+
+    def _record_response(self, ctx: RunContext, route: ModelRoute, response: Any, latency: float,
+                         batch: bool = False) -> Optional[ModelRoute]:
+        """
+        记录一次模型响应的用量和指标
+        :param batch: 响应来自 Message Batches（按批量价格计费）
+        :return: 需要升级时返回强模型的路由（这次响应被丢弃），否则返回 None
+        """
+        escalated = self.router.escalate(route, response)
+        ctx.usage.record_response(ctx.iteration, route.model, response, latency,
+                                  tier=route.tier, discarded=escalated is not None, batch=batch)
+        observe_model_response(route.model, response, latency)
+        MODEL_ROUTES.labels(route.tier, route.reason).inc()
+        if escalated is not None:
+            # 快模型要写综述或超出了输出预算：这次响应不进入对话历史，用强模型重做本轮
+            logger.info("   ⤴️ %s 以 %s 结束，本轮改用 %s", route.model, response.stop_reason, escalated.model)
+        return escalated
+
+    def _apply_response(self, ctx: RunContext, route: ModelRoute, response: Any, latency: float) -> List[Any]:
+        """
+        处理本轮被采用的响应：结束任务时设置 ctx.status / final_text，需要工具时把响应追加到对话历史
+        :return: 本轮要执行的 tool_use 块（任务结束或意外停止时为空）
+        """
+        if self.checkpoint_store:
+            self.checkpoint_store.record_response(ctx, route.model, response, latency)
+        logger.info("   停止原因: %s", response.stop_reason)
+
+        if response.stop_reason == "end_turn":
+            # Claude 完成了任务，返回最终结果
+            final_text = ""
+            for block in response.content:
+                if block.type == "text":
+                    final_text += block.text
+
+            logger.info("✅ Claude 已完成任务")
+            ctx.status = "completed"
+            ctx.final_text = final_text
+            if self.checkpoint_store:
+                self.checkpoint_store.record_final(ctx)
+            return []
+
+        if response.stop_reason == "tool_use":
+            # Claude 决定使用工具
+            ctx.messages.append({"role": "assistant", "content": response.content})
+            return [b for b in response.content if b.type == "tool_use"]
+
+        # 其他停止原因（如 max_tokens）
+        logger.warning("⚠️ 意外停止: %s", response.stop_reason)
+        ctx.status = "stopped"
+        return []
+
+    def _finish_incomplete(self, ctx: RunContext) -> str:
+        """达到最大迭代次数、预算用尽或意外停止时结束 run"""
+        if ctx.status == "running":
+            ctx.status = "max_iterations"
+        if ctx.status == "budget_exhausted":
+            logger.warning("⚠️ 预算用尽，任务可能未完成")
+            ctx.final_text = "任务未完成（预算用尽）"
+        else:
+            logger.warning("⚠️ 达到最大迭代次数，任务可能未完成")
+            ctx.final_text = "任务未完成（达到最大迭代次数）"
+        if self.checkpoint_store:
+            self.checkpoint_store.record_final(ctx)
+        return ctx.final_text
+
+    async def _run_tool_uses(self, ctx: RunContext, blocks: List[Any], completed: Dict[str, str] = None):
+        """执行一轮中的所有 tool_use（不需要事件时使用）"""
+        async for _ in self._iter_tool_uses(ctx, blocks, completed):
+            pass
+
+    async def _iter_tool_uses(self, ctx: RunContext, blocks: List[Any],
+                              completed: Dict[str, str] = None) -> AsyncIterator[RunEvent]:
+        """
+        依次执行一轮中的所有 tool_use，并把结果作为一条 user 消息追加到对话历史；每个调用产出开始和结束事件
+        :param completed: 已有结果的 tool_use_id -> 内容（从检查点恢复时跳过这些调用）
+        """
+        completed = completed or {}
+        tool_results = []
+        for block in blocks:
+            block_id, name, tool_input = _tool_use_fields(block)
+            started = time.perf_counter()
+            refusal = None
+            if block_id in completed:
+                result = completed[block_id]
+                logger.info("   ♻️ 复用检查点中的结果: %s", name)
             else:
-                # 其他停止原因（如 max_tokens）
-                print(f"\n⚠️ 意外停止: {response.stop_reason}")
-                break
+                logger.info("   🎯 Claude 决定调用: %s", name)
+                if self.governor is not None:
+                    # 预算收紧时缩小返回条数，或直接拒绝（拒绝原因作为结果交给 Claude）
+                    tool_input, refusal = self.governor.admit(ctx, name, tool_input)
+                if refusal is not None:
+                    result = json.dumps({"error": refusal}, ensure_ascii=False)
+                else:
+                    yield ToolDispatched(ctx.run_id, ctx.iteration, block_id, name, tool_input)
+                    # 执行工具
+                    result = await self.execute_tool(name, tool_input, ctx)
+                    if self.governor is not None:
+                        self.governor.record_result(ctx, result)
+                ctx.usage.record_tool_result(name, result)
+                if self.checkpoint_store:
+                    self.checkpoint_store.record_tool_result(ctx, block_id, name, result)
+            yield ToolCompleted(ctx.run_id, ctx.iteration, block_id, name, round(time.perf_counter() - started, 3),
+                                len(result), block_id in completed, refusal is not None)
 
-        print("\n⚠️ 达到最大迭代次数，任务可能未完成")
-        return "任务未完成（达到最大迭代次数）"
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": block_id,
+                "content": result
+            })
+
+        # 将工具结果返回给 Claude
+        ctx.messages.append({
+            "role": "user",
+            "content": tool_results
+        })
 
 
 def _trim_api_key(value: str) -> str:
@@ -398,8 +1010,27 @@ def _load_env_file():
     print(f"🔑 [调试信息] 未找到 .env（已尝试: {tried[0]}, {tried[1]}），使用环境变量中的 ANTHROPIC_API_KEY")
 
 
-async def main():
-    """示例：让 Claude 自主完成学术综述任务"""
+async def main(profile: str = None, resume: str = None, checkpoint_dir: str = ".cache/checkpoints",
+               warmup: bool = False, blob_dir: str = None, paper_index: str = None,
+               local_first: bool = False, export_dir: str = None, model_policy: str = "strong",
+               fast_model: str = None, strong_model: str = None, budget: str = None):
+    """
+    示例：让 Claude 自主完成学术综述任务
+    :param profile: 剖析输出目录（命令行 --profile），不提供则不剖析
+    :param resume: 要恢复的 run ID（命令行 --resume），不提供则开始新的 run
+    :param checkpoint_dir: 检查点目录（命令行 --checkpoint-dir）
+    :param warmup: 第一次调用模型的同时并行预热全部 MCP 服务（命令行 --warmup）
+    :param blob_dir: 大结果存储目录（命令行 --blob-dir），不提供时大结果照常全部放进对话
+    :param paper_index: 本地论文索引路径（命令行 --paper-index），不提供则不建索引
+    :param local_first: 检索前先查本地索引（命令行 --local-first）
+    :param export_dir: 把工具返回的论文记录导出为分区数据集的目录（命令行 --export-dir），不提供则不导出
+    :param model_policy: 模型路由策略名或 JSON 文件（命令行 --model-policy），默认每轮都用强模型
+    :param fast_model: 覆盖策略中的快模型名（命令行 --fast-model）
+    :param strong_model: 覆盖策略中的强模型名（命令行 --strong-model）
+    :param budget: run 预算，"key=value,..." 或 JSON 文件（命令行 --budget），不提供则只受 max_iterations 限制
+    """
+
+    setup_logging()
 
     # 始终先加载 .env，避免系统里旧的短 Key 覆盖 .env 里的完整 Key
     _load_env_file()
@@ -445,8 +1076,20 @@ async def main():
         print("   请检查 .env：整行应为 ANTHROPIC_API_KEY=你的完整key（无换行、无引号、无空格）")
         return
 
+    # 可选：暴露 Prometheus 指标端点（设置 AGENT_METRICS_PORT 即开启）
+    metrics_port = os.environ.get("AGENT_METRICS_PORT")
+    if metrics_port:
+        start_metrics_server(int(metrics_port))
+        print(f"📈 指标端点: http://127.0.0.1:{metrics_port}/metrics")
+
     # 创建代理
-    agent = ClaudeAcademicAgent()
+    agent = ClaudeAcademicAgent(checkpoint_store=CheckpointStore(checkpoint_dir), warmup=warmup,
+                                blob_store=BlobStore(blob_dir) if blob_dir else None,
+                                paper_index=PaperIndex(paper_index) if paper_index else None,
+                                local_first=local_first,
+                                corpus_writer=CorpusWriter(export_dir) if export_dir else None,
+                                router=load_policy(model_policy, fast_model, strong_model),
+                                governor=BudgetGovernor(load_budget(budget)) if budget else None)
 
     # 给 Claude 一个高层指令，让它自主决定如何完成
     instruction = """
@@ -463,8 +1106,12 @@ async def main():
 请自主决定调用哪些工具、以什么顺序调用，以及如何整合数据。
 """
 
-    # 运行代理
-    result = await agent.run(instruction, max_iterations=15)
+    # 运行代理（中断后可用 --resume <run_id> 从检查点继续）
+    if resume:
+        result = await agent.resume(resume, profile=profile)
+    else:
+        result = await agent.run(instruction, max_iterations=15, profile=profile)
+    await agent.aclose()
 
     # 保存结果
     output_file = "LLM_Survey_by_Claude.md"
@@ -479,8 +1126,32 @@ async def main():
 
 
 if __name__ == "__main__":
+    import argparse
     import sys
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Claude 自主学术研究代理")
+    parser.add_argument("--profile", metavar="DIR", help="输出本次运行的 CPU / 异步耗时剖析文件到指定目录")
+    parser.add_argument("--resume", metavar="RUN_ID", help="从检查点恢复中断的 run")
+    parser.add_argument("--checkpoint-dir", default=".cache/checkpoints", help="检查点目录，默认 .cache/checkpoints")
+    parser.add_argument("--warmup", action="store_true", help="等待第一次模型响应的同时并行预热全部 MCP 连接")
+    parser.add_argument("--blob-dir", metavar="DIR", help="转存大工具结果的目录（如 .cache/blobs），不提供则不转存")
+    parser.add_argument("--paper-index", metavar="PATH", help="本地论文索引路径（如 .cache/papers.sqlite），不提供则不建索引")
+    parser.add_argument("--local-first", action="store_true", help="检索类工具先查本地索引，结果足够时不联网（需要 --paper-index）")
+    parser.add_argument("--export-dir", metavar="DIR", help="把工具返回的论文记录导出为按来源 / 日期分区的列式数据集")
+    parser.add_argument("--model-policy", default="strong",
+                        help=f"模型路由策略：{' / '.join(POLICIES)} 或 JSON 文件路径，默认 strong（每轮都用强模型）")
+    parser.add_argument("--fast-model", help="快模型名，默认 claude-3-5-haiku")
+    parser.add_argument("--strong-model", help="强模型名，默认 claude-3-5-sonnet")
+    parser.add_argument("--budget", metavar="SPEC",
+                        help='run 预算，例如 "wall_s=600,output_tokens=20000,tool_calls.deep_research=3" 或 JSON 文件')
+    cli_args = parser.parse_args()
+    if cli_args.local_first and not cli_args.paper_index:
+        parser.error("--local-first 需要同时指定 --paper-index")
+
+    asyncio.run(main(profile=cli_args.profile, resume=cli_args.resume, checkpoint_dir=cli_args.checkpoint_dir,
+                     warmup=cli_args.warmup, blob_dir=cli_args.blob_dir, paper_index=cli_args.paper_index,
+                     local_first=cli_args.local_first, export_dir=cli_args.export_dir,
+                     model_policy=cli_args.model_policy, fast_model=cli_args.fast_model,
+                     strong_model=cli_args.strong_model, budget=cli_args.budget))
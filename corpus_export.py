@@ -0,0 +1,428 @@
+"""
+论文语料的列式导出
+作用：把采集到的规范化论文记录（PaperRecord）流式写成便于分析的分区数据集：
+- 安装了 pyarrow 时写 Parquet（zstd 压缩，每批一个 row group），否则退回紧凑 JSONL：
+  每行是按 COLUMNS 顺序排列的数组，不重复字段名，列顺序记在根目录的 _schema.json
+- 按来源和采集日期分区（Hive 风格目录：source=crossref/date=2026-10-19/part-xxxx.parquet），
+  pyarrow.dataset / DuckDB / Spark 可以直接识别分区列
+- 写入中的文件带 .tmp 后缀，关闭时才改名，读取方永远看不到写了一半的文件
+- 读取（scan）按文件逐批进行：Parquet 以 memory_map 打开并只读取需要的列，
+  JSONL 以 mmap 逐行解析，只取需要的列，内存里只有当前一批
+
+用法：
+    with CorpusWriter("corpus") as writer:
+        writer.add(records, query="Large Language Models")
+    for batch in scan("corpus", columns=["year", "citations"], sources=["crossref"]):
+        ...
+命令行：
+    python paginate.py deep_research "Large Language Models" --max 5000 --export corpus/
+    python corpus_export.py convert corpus.jsonl -o corpus/      # 转换 paginate.py 导出的 JSONL
+    python corpus_export.py stats corpus/
+    python corpus_export.py head corpus/ --columns title,year --limit 5
+"""
+import argparse
+import asyncio
+import json
+import mmap
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from agent_logging import get_logger, setup_logging
+from json_payload import dumps, loads
+from paginate import SeenKeys, iter_records
+from paper_records import PaperRecord
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 可选依赖，未安装时导出为 JSONL
+    pa = None
+    pq = None
+
+logger = get_logger("corpus_export")
+
+DEFAULT_FORMAT = "parquet" if pa is not None else "jsonl"
+# 数据文件中的列（source 和 date 是分区列，只出现在目录名里）
+COLUMNS = ("key", "title", "authors", "year", "doi", "arxiv_id", "pmid", "pmcid", "abstract", "url",
+           "citations", "query", "harvested_at")
+PARTITION_COLUMNS = ("source", "date")
+# 每个分区攒够这么多条写一批（Parquet 的一个 row group）
+DEFAULT_BATCH = 1000
+# 单个数据文件的行数上限，超过后换新文件
+MAX_ROWS_PER_FILE = 200_000
+# 工具参数中作为检索词记录的字段
+QUERY_ARGS = ("query", "searchQuery", "key", "term", "arxivNo", "ids", "id")
+
+_EXTENSIONS = {"parquet": ".parquet", "jsonl": ".jsonl"}
+
+
+def _schema():
+    return pa.schema([
+        ("key", pa.string()), ("title", pa.string()), ("authors", pa.list_(pa.string())),
+        ("year", pa.int32()), ("doi", pa.string()), ("arxiv_id", pa.string()), ("pmid", pa.string()),
+        ("pmcid", pa.string()), ("abstract", pa.string()), ("url", pa.string()), ("citations", pa.int64()),
+        ("query", pa.string()), ("harvested_at", pa.int64()),
+    ])
+
+
+def query_of(tool_input: Dict[str, Any]) -> Optional[str]:
+    """从工具参数里取出检索词，用于记录每条论文是由哪次检索得到的"""
+    for name in QUERY_ARGS:
+        value = (tool_input or {}).get(name)
+        if value:
+            return ",".join(map(str, value)) if isinstance(value, list) else str(value)
+    return None
+
+
+def _int(value: Any) -> Optional[int]:
+    try:
+        return int(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _partition_value(value: str) -> str:
+    # 分区值出现在目录名里，去掉路径分隔符和 Hive 的 key=value 分隔符
+    cleaned = "".join(c if c.isalnum() or c in "-_." else "_" for c in (value or "unknown"))
+    return cleaned.strip(".") or "unknown"
+
+
+class _PartFile:
+    """一个分区当前正在写的数据文件"""
+
+    def __init__(self, directory: str, name: str, fmt: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, name + _EXTENSIONS[fmt])
+        self.tmp_path = self.path + ".tmp"
+        self.fmt = fmt
+        self.rows = 0
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(self.tmp_path, _schema(), compression="zstd")
+        else:
+            self._writer = open(self.tmp_path, "wb")
+
+    def write(self, rows: List[tuple]):
+        if self.fmt == "parquet":
+            columns = list(zip(*rows))
+            schema = _schema()
+            arrays = [pa.array(list(col), type=schema.field(i).type) for i, col in enumerate(columns)]
+            self._writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        else:
+            self._writer.write("".join(dumps(list(row)) + "\n" for row in rows).encode("utf-8"))
+            self._writer.flush()
+        self.rows += len(rows)
+
+    def close(self) -> str:
+        self._writer.close()
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+
+class CorpusWriter:
+    """流式写入分区语料；线程安全，async 代码用 aadd / afinalize"""
+
+    def __init__(self, root: str = "corpus", fmt: Optional[str] = None, batch_size: int = DEFAULT_BATCH,
+                 max_rows_per_file: int = MAX_ROWS_PER_FILE, dedup: bool = True):
+        """
+        :param root: 数据集根目录；可以多次写入同一个目录，每次写入生成新的数据文件
+        :param fmt: "parquet" 或 "jsonl"，默认安装了 pyarrow 时用 parquet
+        :param batch_size: 每个分区攒够多少条写一批
+        :param max_rows_per_file: 单个数据文件的行数上限
+        :param dedup: 按 PaperRecord.key() 去重（只在本次写入范围内）
+        """
+        fmt = fmt or DEFAULT_FORMAT
+        if fmt not in _EXTENSIONS:
+            raise ValueError(f"不支持的格式: {fmt}（可选 parquet / jsonl）")
+        if fmt == "parquet" and pa is None:
+            raise RuntimeError("写 Parquet 需要安装 pyarrow（pip install pyarrow），或改用 fmt='jsonl'")
+        self.root = root
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.max_rows_per_file = max_rows_per_file
+        self._seen = SeenKeys() if dedup else None
+        self._run = uuid.uuid4().hex[:8]
+        self._buffers: Dict[Tuple[str, str], List[tuple]] = {}
+        self._files: Dict[Tuple[str, str], _PartFile] = {}
+        self._file_seq = 0
+        self._lock = threading.Lock()
+        self.rows_written = 0
+        self.duplicates = 0
+        self.files_finished: List[str] = []
+        os.makedirs(root, exist_ok=True)
+        self._write_schema()
+
+    def _write_schema(self):
+        path = os.path.join(self.root, "_schema.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                existing = json.load(f)
+            if list(existing.get("columns") or []) != list(COLUMNS):
+                raise ValueError(f"{self.root} 中已有列不同的数据集: {existing.get('columns')}")
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "columns": list(COLUMNS), "partitioning": list(PARTITION_COLUMNS)}, f,
+                      ensure_ascii=False, indent=2)
+
+    # ========== 写入 ==========
+    def add(self, records: Iterable[PaperRecord], query: Optional[str] = None) -> int:
+        """加入缓冲，某个分区攒够 batch_size 条时写出；返回本次加入的条数（去重后）"""
+        now = int(time.time())
+        date = time.strftime("%Y-%m-%d", time.gmtime(now))
+        added = 0
+        with self._lock:
+            for record in records:
+                key = record.key()
+                if self._seen is not None and not self._seen.add(key):
+                    self.duplicates += 1
+                    continue
+                row = (key, record.title, list(record.authors or []), _int(record.year), record.doi,
+                       record.arxiv_id, record.pmid, record.pmcid, record.abstract, record.url,
+                       _int(record.citations), query, now)
+                partition = (_partition_value(record.source), date)
+                buffer = self._buffers.setdefault(partition, [])
+                buffer.append(row)
+                added += 1
+                if len(buffer) >= self.batch_size:
+                    self._write(partition)
+        return added
+
+    def _write(self, partition: Tuple[str, str]):
+        rows = self._buffers.pop(partition, None)
+        if not rows:
+            return
+        part = self._files.get(partition)
+        if part is None:
+            source, date = partition
+            directory = os.path.join(self.root, f"source={source}", f"date={date}")
+            self._file_seq += 1
+            part = self._files[partition] = _PartFile(directory, f"part-{self._run}-{self._file_seq:05d}", self.fmt)
+        part.write(rows)
+        self.rows_written += len(rows)
+        if part.rows >= self.max_rows_per_file:
+            self.files_finished.append(self._files.pop(partition).close())
+
+    def flush(self, finalize: bool = False):
+        """
+        写出所有缓冲
+        :param finalize: 同时关闭当前数据文件（去掉 .tmp 后缀，对读取方可见）；之后的写入进入新文件
+        """
+        with self._lock:
+            for partition in list(self._buffers):
+                self._write(partition)
+            if finalize:
+                for partition in list(self._files):
+                    self.files_finished.append(self._files.pop(partition).close())
+
+    def close(self) -> Dict[str, Any]:
+        self.flush(finalize=True)
+        if self._seen is not None:
+            self._seen.close()
+            self._seen = None
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"format": self.fmt, "rows": self.rows_written, "duplicates": self.duplicates,
+                "files": len(self.files_finished), "open_files": len(self._files)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ========== 异步接口 ==========
+    async def aadd(self, records: Iterable[PaperRecord], query: Optional[str] = None) -> int:
+        """add 可能写文件，放进线程池执行"""
+        records = list(records)
+        if not records:
+            return 0
+        return await asyncio.to_thread(self.add, records, query)
+
+    async def afinalize(self):
+        await asyncio.to_thread(self.flush, True)
+
+
+# ========== 读取 ==========
+def data_files(root: str, sources: Optional[Iterable[str]] = None, since: Optional[str] = None,
+               until: Optional[str] = None) -> List[Tuple[str, Dict[str, str]]]:
+    """按分区过滤列出数据文件，返回 [(路径, {"source": ..., "date": ...})]；日期为 YYYY-MM-DD，闭区间"""
+    wanted = {_partition_value(s) for s in sources} if sources else None
+    found = []
+    if not os.path.isdir(root):
+        return found
+    for source_dir in sorted(os.listdir(root)):
+        if not source_dir.startswith("source="):
+            continue
+        source = source_dir.split("=", 1)[1]
+        if wanted is not None and source not in wanted:
+            continue
+        for date_dir in sorted(os.listdir(os.path.join(root, source_dir))):
+            if not date_dir.startswith("date="):
+                continue
+            date = date_dir.split("=", 1)[1]
+            if (since and date < since) or (until and date > until):
+                continue
+            directory = os.path.join(root, source_dir, date_dir)
+            for name in sorted(os.listdir(directory)):
+                if name.endswith((".parquet", ".jsonl")):
+                    found.append((os.path.join(directory, name), {"source": source, "date": date}))
+    return found
+
+
+def _scan_jsonl(path: str, indices: List[int], names: List[str], batch_size: int) -> Iterator[Dict[str, list]]:
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        batch: Dict[str, list] = {name: [] for name in names}
+        size, pos, rows = len(mm), 0, 0
+        while pos < size:
+            end = mm.find(b"\n", pos)
+            end = size if end < 0 else end
+            if end > pos:
+                row = loads(mm[pos:end])
+                for name, index in zip(names, indices):
+                    batch[name].append(row[index])
+                rows += 1
+                if rows == batch_size:
+                    yield batch
+                    batch, rows = {name: [] for name in names}, 0
+            pos = end + 1
+        if rows:
+            yield batch
+
+
+def _scan_parquet(path: str, names: List[str], batch_size: int) -> Iterator[Dict[str, list]]:
+    if pq is None:
+        raise RuntimeError(f"读取 {path} 需要安装 pyarrow")
+    parquet = pq.ParquetFile(path, memory_map=True)
+    for record_batch in parquet.iter_batches(batch_size=batch_size, columns=names):
+        yield record_batch.to_pydict()
+
+
+def scan(root: str, columns: Optional[Sequence[str]] = None, sources: Optional[Iterable[str]] = None,
+         since: Optional[str] = None, until: Optional[str] = None,
+         batch_size: int = DEFAULT_BATCH) -> Iterator[Dict[str, list]]:
+    """
+    逐批读取数据集，每批是 {列名: 值列表}
+    :param columns: 需要的列（可包含分区列 source / date），默认全部
+    :param sources: 只读这些来源的分区
+    :param since: 只读采集日期不早于此日期的分区（YYYY-MM-DD）
+    """
+    columns = list(columns or COLUMNS + PARTITION_COLUMNS)
+    unknown = [c for c in columns if c not in COLUMNS and c not in PARTITION_COLUMNS]
+    if unknown:
+        raise ValueError(f"未知的列: {unknown}")
+    # 只要分区列时也读 key 列，用来确定行数
+    stored = [c for c in columns if c in COLUMNS] or ["key"]
+    indices = [COLUMNS.index(c) for c in stored]
+    for path, partition in data_files(root, sources, since, until):
+        if path.endswith(".parquet"):
+            batches = _scan_parquet(path, stored, batch_size)
+        else:
+            batches = _scan_jsonl(path, indices, stored, batch_size)
+        for batch in batches:
+            rows = len(batch[stored[0]])
+            for name in PARTITION_COLUMNS:
+                batch[name] = [partition[name]] * rows
+            yield {name: batch[name] for name in columns}
+
+
+def open_dataset(root: str):
+    """以 pyarrow.dataset 打开 Parquet 数据集（分区列 source / date 自动识别），用于列式分析"""
+    if pa is None:
+        raise RuntimeError("open_dataset 需要安装 pyarrow；未安装时请用 scan()")
+    import pyarrow.dataset as ds
+    return ds.dataset(root, format="parquet", partitioning="hive", exclude_invalid_files=True)
+
+
+def summarize(root: str) -> Dict[str, Any]:
+    """各分区的文件数、行数和大小（只读 key 列）"""
+    partitions: Dict[str, Dict[str, int]] = {}
+    for path, partition in data_files(root):
+        name = f"{partition['source']}/{partition['date']}"
+        entry = partitions.setdefault(name, {"files": 0, "rows": 0, "bytes": 0})
+        entry["files"] += 1
+        entry["bytes"] += os.path.getsize(path)
+        if path.endswith(".parquet"):
+            entry["rows"] += pq.ParquetFile(path, memory_map=True).metadata.num_rows
+        else:
+            entry["rows"] += sum(len(b["key"]) for b in _scan_jsonl(path, [0], ["key"], 10_000))
+    return {"partitions": partitions, "rows": sum(p["rows"] for p in partitions.values()),
+            "bytes": sum(p["bytes"] for p in partitions.values())}
+
+
+async def export_records(source: str, query: str, root: str, fmt: Optional[str] = None,
+                         **kwargs) -> Dict[str, Any]:
+    """把 paginate.iter_records 的分页结果逐条写入分区数据集，返回写入统计和耗时"""
+    started = time.perf_counter()
+    writer = CorpusWriter(root, fmt=fmt)
+    try:
+        batch: List[PaperRecord] = []
+        async for record in iter_records(source, query, **kwargs):
+            batch.append(record)
+            if len(batch) >= writer.batch_size:
+                await writer.aadd(batch, query)
+                batch = []
+        await writer.aadd(batch, query)
+    finally:
+        stats = await asyncio.to_thread(writer.close)
+    stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def _convert_jsonl(writer: CorpusWriter, path: str) -> int:
+    """导入 paginate.py 导出的 JSONL（每行一个 PaperRecord 字典）"""
+    fields = set(PaperRecord.__dataclass_fields__)
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                data = loads(line)
+                count += writer.add([PaperRecord(**{k: v for k, v in data.items() if k in fields})])
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="论文语料列式导出：转换、统计、预览")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="把 paginate.py 导出的 JSONL 转为分区数据集")
+    convert.add_argument("files", nargs="+")
+    convert.add_argument("-o", "--output", default="corpus", help="数据集目录，默认 corpus")
+    convert.add_argument("--format", choices=sorted(_EXTENSIONS), help=f"默认 {DEFAULT_FORMAT}")
+    stats = sub.add_parser("stats", help="各分区的文件数、行数和大小")
+    stats.add_argument("root")
+    head = sub.add_parser("head", help="按列预览数据集")
+    head.add_argument("root")
+    head.add_argument("--columns", default="source,date,year,title", help="逗号分隔的列名")
+    head.add_argument("--source", action="append", help="只看某个来源，可重复")
+    head.add_argument("--limit", type=int, default=10)
+    opts = parser.parse_args()
+
+    setup_logging()
+    if opts.command == "convert":
+        started = time.perf_counter()
+        with CorpusWriter(opts.output, fmt=opts.format) as writer:
+            for path in opts.files:
+                logger.info("📥 %s：%d 条", path, _convert_jsonl(writer, path))
+        logger.info("🏁 %s，耗时 %.2fs -> %s", writer.stats(), time.perf_counter() - started, opts.output)
+    elif opts.command == "stats":
+        started = time.perf_counter()
+        summary = summarize(opts.root)
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        logger.info("⏱️ 扫描耗时 %.2fs", time.perf_counter() - started)
+    else:
+        columns = [c.strip() for c in opts.columns.split(",") if c.strip()]
+        shown = 0
+        for batch in scan(opts.root, columns, sources=opts.source, batch_size=opts.limit):
+            for row in zip(*(batch[c] for c in columns)):
+                print("\t".join("" if v is None else str(v) for v in row))
+                shown += 1
+                if shown >= opts.limit:
+                    return
+
+
+if __name__ == "__main__":
+    main()
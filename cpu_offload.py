@@ -0,0 +1,258 @@
+"""
+CPU 密集后处理的卸载
+作用：大返回的 JSON 解码、论文记录规范化和结果序列化如果在事件循环线程上执行，
+会卡住同一进程里所有其他的工具调用和模型流。这里按数据大小选择执行位置：
+- 小于 thread_threshold：直接在循环线程执行（切换线程的开销比工作本身还大）
+- 介于两者之间，或工作只能在本进程完成（需要访问本进程的对象）：线程池。
+  逐成员解码、规范化都是 Python 字节码，解释器每 5ms 切换一次线程，循环线程的停顿被限制在毫秒级；
+  orjson / json 的整体解析是一次持有 GIL 的 C 调用，放进线程没有好处，仍在循环线程执行
+- 大于 process_threshold 的原始返回文本：进程池。文本在线程中分块编码写入共享内存交给子进程
+  （不经过管道序列化，子进程直接读共享内存），子进程解码并按 json_payload 的上限截断后只把保留下来的结果传回
+另提供 LoopLagMonitor，周期性测量事件循环的唤醒延迟，用于对比卸载前后的效果
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from agent_logging import get_logger
+from json_payload import MAX_PAYLOAD_CHARS, STREAM_THRESHOLD, decode_payload
+from metrics import CPU_OFFLOAD, EVENT_LOOP_LAG
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # 极少数平台没有共享内存，退回到经管道传递文本
+    shared_memory = None
+
+logger = get_logger("cpu_offload")
+
+# 超过这个字符数的工作放进线程池；太小的工作换线程反而因 GIL 争用让循环线程等得更久
+THREAD_THRESHOLD = 1_000_000
+# 超过这个字符数的原始返回文本放进进程池解码
+PROCESS_THRESHOLD = 2_000_000
+# 进程池大小上限
+MAX_PROCESS_WORKERS = 4
+# 写入共享内存时每次编码的字符数；一次编码整段大文本会长时间持有 GIL
+ENCODE_CHUNK = 1 << 20
+
+
+def approx_chars(value: Any, limit: int) -> int:
+    """粗略估计结果序列化后的字符数；超过 limit 即停止遍历，小结果的估计开销与结果大小成正比"""
+    total = 0
+    stack = [value]
+    while stack and total <= limit:
+        item = stack.pop()
+        if isinstance(item, str):
+            total += len(item) + 2
+        elif isinstance(item, dict):
+            total += 2
+            for key, child in item.items():
+                total += len(key) + 4 if isinstance(key, str) else 8
+                stack.append(child)
+        elif isinstance(item, (list, tuple)):
+            total += 2 + len(item)
+            stack.extend(item)
+        else:
+            total += 8
+    return total
+
+
+def _attach(name: str):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 之前没有 track 参数；spawn 出的子进程与父进程共用资源跟踪器，
+        # 重复登记同一个名字不会产生新记录，由父进程 unlink 时注销
+        return shared_memory.SharedMemory(name=name)
+
+
+def _to_shared(text: str):
+    """在线程中分块编码文本并写入新建的共享内存块，返回 (共享内存, 字节数)"""
+    chunks = [text[i:i + ENCODE_CHUNK].encode("utf-8") for i in range(0, len(text), ENCODE_CHUNK)]
+    nbytes = sum(len(chunk) for chunk in chunks)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+    pos = 0
+    while chunks:
+        chunk = chunks.pop(0)
+        shm.buf[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+    return shm, nbytes
+
+
+def _decode_shared(name: str, nbytes: int, tool_name: Optional[str], max_chars: int) -> Any:
+    """子进程：从共享内存读出返回文本并解码"""
+    shm = _attach(name)
+    try:
+        with shm.buf[:nbytes] as view:
+            text = str(view, "utf-8")
+    finally:
+        shm.close()
+    try:
+        return decode_payload(text, tool_name, max_chars)
+    except json.JSONDecodeError as e:
+        # 异常会被序列化传回父进程，不要带上整段原文
+        raise json.JSONDecodeError(e.msg, "", 0) from None
+
+
+def _noop() -> int:
+    return os.getpid()
+
+
+class CPUOffloader:
+    """按数据大小把 CPU 密集的工作放在循环线程、线程池或进程池执行"""
+
+    def __init__(self, thread_threshold: Optional[int] = THREAD_THRESHOLD,
+                 process_threshold: Optional[int] = PROCESS_THRESHOLD, max_workers: Optional[int] = None):
+        """
+        :param thread_threshold: 超过这个字符数的工作放进线程池，None 表示不用线程池
+        :param process_threshold: 超过这个字符数的原始返回文本放进进程池解码，None 表示不用进程池
+        :param max_workers: 进程池大小，默认 min(4, CPU 核数)
+        """
+        self.thread_threshold = thread_threshold
+        self.process_threshold = process_threshold
+        self.max_workers = max_workers or min(MAX_PROCESS_WORKERS, os.cpu_count() or 1)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.counts: Dict[str, int] = {"inline": 0, "thread": 0, "process": 0}
+
+    def mode_for(self, size: int, allow_process: bool = True) -> str:
+        if allow_process and self.process_threshold is not None and size > self.process_threshold:
+            return "process"
+        if self.thread_threshold is not None and size > self.thread_threshold:
+            return "thread"
+        return "inline"
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn：从已有线程（事件循环、线程池）的进程里 fork 可能继承被锁住的锁
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    async def warm(self):
+        """提前启动进程池里的全部子进程，避免第一次大返回时等待进程启动"""
+        if self.process_threshold is None:
+            return
+        loop = asyncio.get_running_loop()
+        pool = self._process_pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, _noop) for _ in range(self.max_workers)))
+
+    async def run(self, stage: str, fn: Callable, *args, size: int, allow_process: bool = False) -> Any:
+        """
+        按 size 选择执行位置运行 fn(*args)
+        :param stage: 指标中的阶段名
+        :param allow_process: fn 和参数可以序列化到子进程时才允许进程池；默认只在本进程内执行
+        """
+        mode = self.mode_for(size, allow_process)
+        started = time.perf_counter()
+        try:
+            if mode == "inline":
+                return fn(*args)
+            if mode == "thread":
+                return await asyncio.to_thread(fn, *args)
+            return await asyncio.get_running_loop().run_in_executor(self._process_pool(), fn, *args)
+        finally:
+            self.counts[mode] += 1
+            CPU_OFFLOAD.labels(stage, mode).observe(time.perf_counter() - started)
+
+    async def decode(self, text: str, tool_name: Optional[str] = None,
+                     max_chars: int = MAX_PAYLOAD_CHARS) -> Any:
+        """解码一次 MCP 返回的文本（等价于 json_payload.decode_payload），大文本交给线程池或进程池"""
+        mode = self.mode_for(len(text))
+        if mode != "process":
+            # 整体解析是一次持有 GIL 的 C 调用，放进线程也会卡住循环线程；只有逐成员解码（Python 字节码）才值得换线程
+            whole = len(text) <= STREAM_THRESHOLD and len(text) <= max_chars
+            return await self.run("decode", decode_payload, text, tool_name, max_chars, size=0 if whole else len(text))
+        started = time.perf_counter()
+        try:
+            return await self._decode_in_process(text, tool_name, max_chars)
+        except BrokenProcessPool as e:
+            # 子进程被杀等情况：丢弃进程池，本次改在线程池解码
+            logger.warning("⚠️ 解码进程池不可用，改用线程池: %s", e)
+            self._pool = None
+            return await asyncio.to_thread(decode_payload, text, tool_name, max_chars)
+        finally:
+            self.counts["process"] += 1
+            CPU_OFFLOAD.labels("decode", "process").observe(time.perf_counter() - started)
+
+    async def _decode_in_process(self, text: str, tool_name: Optional[str], max_chars: int) -> Any:
+        loop = asyncio.get_running_loop()
+        pool = self._process_pool()
+        if shared_memory is None:
+            return await loop.run_in_executor(pool, decode_payload, text, tool_name, max_chars)
+        try:
+            shm, nbytes = await asyncio.to_thread(_to_shared, text)
+        except UnicodeEncodeError:
+            # 含有孤立代理字符等无法编码为 UTF-8 的文本，直接交给线程池解码
+            return await asyncio.to_thread(decode_payload, text, tool_name, max_chars)
+        try:
+            return await loop.run_in_executor(pool, _decode_shared, shm.name, nbytes, tool_name, max_chars)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_default: Optional[CPUOffloader] = None
+
+
+def default_offloader() -> CPUOffloader:
+    """进程内共享的默认实例，所有 MCP 客户端和代理共用一个进程池"""
+    global _default
+    if _default is None:
+        _default = CPUOffloader()
+    return _default
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟探针：每 interval 秒请求一次唤醒，实际唤醒时间比预期晚多少就是循环线程被占用的时长
+    """
+
+    def __init__(self, interval: float = 0.01, keep: int = 10_000):
+        self.interval = interval
+        # 只保留最近 keep 个样本，长期运行时内存不增长
+        self.samples: deque = deque(maxlen=keep)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._probe(), name="loop-lag-monitor")
+
+    async def _probe(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            self.samples.append(lag)
+            EVENT_LOOP_LAG.observe(lag)
+
+    async def stop(self) -> Dict[str, float]:
+        if self._task is not None:
+            # 先让探针记录下最近一次阻塞结束后的唤醒，再取消
+            await asyncio.sleep(self.interval * 2)
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        return self.stats()
+
+    def stats(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {"samples": 0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+        return {"samples": len(ordered), "p50_ms": pick(0.5), "p99_ms": pick(0.99),
+                "max_ms": round(ordered[-1] * 1000, 2)}
@@ -1,12 +1,33 @@
 """
 MCP 工具演示 - 不需要 Claude API
 展示如何使用 MCP 工具获取学术数据并生成报告
+
+报告按流水线生成：三个数据源并行分页请求 -> 规范化与去重 -> 逐条写入 Markdown，
+各阶段之间是有界队列，下游写得慢时上游自动暂停请求；内存里只有队列中的几页数据，
+第一篇论文在第一页返回后就写进报告，count 很大时也不必等全部请求结束
+
+用法：
+    python demo_mcp_tools.py                          # 每个数据源 5 篇
+    python demo_mcp_tools.py --count 2000 --stand-in --measure   # 本地替身，测首条输出时间和峰值内存
 """
+import argparse
 import asyncio
-import json
 import sys
 import datetime
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
 from mcp_sdk import GiiispMCPClient
+from agent_logging import setup_logging
+from paginate import SeenKeys
+from paper_records import PaperRecord, from_crossref, from_giiisp
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不报告 RSS
+    resource = None
 
 if sys.platform == "win32":
     try:
@@ -14,7 +35,164 @@ if sys.platform == "win32":
     except:
         pass
 
-async def demo_mcp_tools():
+
+@dataclass(frozen=True)
+class DemoSource:
+    """演示用的一个数据源：怎样请求第 page 页（从 0 开始），怎样从返回中取出条目并规范化"""
+    label: str
+    port: int
+    service_name: str
+    tool: str
+    query: str
+    # (query, page, size) -> 工具参数
+    args: Callable[[str, int, int], Dict[str, Any]]
+    # 工具返回 -> 原始条目列表
+    items: Callable[[Any], List[Dict[str, Any]]]
+    # 原始条目 -> PaperRecord
+    normalize: Callable[[Dict[str, Any]], PaperRecord]
+
+
+def _giiisp_items(data: Any) -> List[Dict[str, Any]]:
+    return [p for p in (data.get("data") or {}).get("data") or [] if isinstance(p, dict)]
+
+
+def _crossref_items(data: Any) -> List[Dict[str, Any]]:
+    return [i for i in (data.get("message") or {}).get("items") or [] if isinstance(i, dict)]
+
+
+DEMO_SOURCES = [
+    DemoSource("DeepResearch (集思谱)", 6002, "DeepResearch", "DeepResearch", "Large Language Models",
+               lambda q, page, size: {"searchQuery": q, "count": size, "page": page + 1},
+               _giiisp_items, lambda item: from_giiisp(item, "deep_research")),
+    DemoSource("arXiv (预印本)", 6003, "Arxiv Abstract", "searchArxivByAbstract", "GPT",
+               lambda q, page, size: {"key": q, "pageSize": size, "pageNum": page + 1},
+               _giiisp_items, lambda item: from_giiisp(item, "arxiv")),
+    DemoSource("Crossref (元数据)", 6000, "Crossref", "search_works", "Transformer neural network",
+               lambda q, page, size: {"query": q, "rows": size, "offset": page * size},
+               _crossref_items, from_crossref),
+]
+
+# 阶段之间的队列长度：抓取 -> 规范化按页计，规范化 -> 写报告按篇计
+PAGE_QUEUE = 4
+RECORD_QUEUE = 200
+# 报告中摘要的截断长度
+ABSTRACT_CHARS = 200
+_DONE = object()
+
+
+def _render(idx: int, label: str, paper: PaperRecord) -> str:
+    lines = [f"## {idx}. {paper.title or '未知标题'}\n\n", f"- **来源**: {label}\n"]
+    if paper.authors:
+        lines.append(f"- **作者**: {', '.join(paper.authors[:3])}\n")
+    if paper.year:
+        lines.append(f"- **年份**: {paper.year}\n")
+    if paper.doi:
+        lines.append(f"- **DOI**: {paper.doi}\n")
+    if paper.arxiv_id:
+        lines.append(f"- **arXiv ID**: {paper.arxiv_id}\n")
+    url = paper.url or (f"https://arxiv.org/abs/{paper.arxiv_id}" if paper.arxiv_id else None) \
+        or (f"https://doi.org/{paper.doi}" if paper.doi else "#")
+    lines.append(f"- **链接**: [查看原文]({url})\n")
+    if paper.abstract:
+        lines.append(f"\n**摘要**:\n> {paper.abstract[:ABSTRACT_CHARS]}...\n")
+    lines.append("\n---\n\n")
+    return "".join(lines)
+
+
+async def run_pipeline(filename: str, count: int = 5, page_size: int = 50,
+                       sources: Optional[List[DemoSource]] = None,
+                       clients: Optional[Dict[int, Any]] = None,
+                       page_queue: int = PAGE_QUEUE, record_queue: int = RECORD_QUEUE) -> Dict[str, Any]:
+    """
+    并行抓取各数据源并流式写出 Markdown 报告
+    :param count: 每个数据源最多取多少篇
+    :param page_size: 每次请求的条数
+    :param clients: 端口 -> MCP 客户端（或替身），不提供时按端口新建 GiiispMCPClient
+    :param page_queue: 抓取与规范化之间的队列长度（页）
+    :param record_queue: 规范化与写报告之间的队列长度（篇）
+    :return: 各阶段计数、首条输出时间（ttfo_s）和总耗时
+    """
+    sources = sources or DEMO_SOURCES
+    clients = clients or {}
+    started = time.perf_counter()
+    pages: asyncio.Queue = asyncio.Queue(maxsize=page_queue)
+    records: asyncio.Queue = asyncio.Queue(maxsize=record_queue)
+    stats: Dict[str, Any] = {"fetched": {s.label: 0 for s in sources}, "pages": 0, "duplicates": 0,
+                             "written": 0, "ttfo_s": None}
+
+    async def fetch(source: DemoSource):
+        client = clients.get(source.port) or GiiispMCPClient(source.port, source.service_name)
+        page, fetched = 0, 0
+        while fetched < count:
+            size = min(page_size, count - fetched)
+            data = await client.call_tool(source.tool, source.args(source.query, page, size))
+            items = source.items(data) if isinstance(data, dict) else []
+            if not items:
+                break
+            fetched += len(items)
+            stats["fetched"][source.label] = fetched
+            # 队列满时在这里等待，下游消化之前不会请求下一页
+            await pages.put((source, items))
+            page += 1
+            if len(items) < size:
+                break
+        print(f"   ✅ {source.label}：{fetched} 篇（{page} 页）")
+
+    async def normalize():
+        seen = SeenKeys()
+        try:
+            while True:
+                job = await pages.get()
+                if job is _DONE:
+                    break
+                source, items = job
+                stats["pages"] += 1
+                for item in items:
+                    paper = source.normalize(item)
+                    if not seen.add(paper.key()):
+                        stats["duplicates"] += 1
+                        continue
+                    await records.put((source.label, paper))
+            await records.put(_DONE)
+        finally:
+            seen.close()
+
+    async def render(f):
+        while True:
+            job = await records.get()
+            if job is _DONE:
+                return
+            label, paper = job
+            stats["written"] += 1
+            f.write(_render(stats["written"], label, paper))
+            if stats["ttfo_s"] is None:
+                f.flush()
+                stats["ttfo_s"] = round(time.perf_counter() - started, 3)
+
+    with open(filename, "w", encoding="utf-8") as f:
+        f.write("# 📑 Large Language Models 学术调研报告\n\n")
+        f.write(f"**生成时间**: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n")
+        f.write(f"**数据来源**: {', '.join(s.label.split(' ')[0] for s in sources)}\n\n")
+        f.write("---\n\n")
+
+        async def produce():
+            await asyncio.gather(*(fetch(s) for s in sources))
+            await pages.put(_DONE)
+
+        # 任一阶段出错时 gather 立即抛出，其余阶段随之取消，不会卡在满的队列上
+        stages = [asyncio.create_task(produce()), asyncio.create_task(normalize()), asyncio.create_task(render(f))]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            for task in stages:
+                task.cancel()
+        f.write(f"**论文总数**: {stats['written']}（去重 {stats['duplicates']} 篇）\n")
+    stats["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+async def demo_mcp_tools(count: int = 5, page_size: int = 50, clients: Optional[Dict[int, Any]] = None,
+                         measure: bool = False, output: Optional[str] = None):
     """演示 MCP 工具的使用（不需要 Claude API）"""
 
     print("\n" + "="*80)
@@ -23,106 +201,33 @@ async def demo_mcp_tools():
     print("说明：此演示展示如何使用 6000-6007 端口的 MCP 服务获取学术数据")
     print("="*80)
 
-    all_papers = []
-
-    # 1. DeepResearch - 综合搜索
-    print("\n[1/3] 🔍 使用 DeepResearch 搜索 'Large Language Models'...")
-    client1 = GiiispMCPClient(6002, "DeepResearch")
-    data1 = await client1.call_tool("DeepResearch", {"searchQuery": "Large Language Models", "count": 5})
-
-    if data1:
-        papers = data1.get("data", {}).get("data", [])
-        for paper in papers:
-            if isinstance(paper, dict):
-                all_papers.append({
-                    "source": "DeepResearch (集思谱)",
-                    "title": paper.get("title", "未知标题"),
-                    "authors": paper.get("authors", "未知作者"),
-                    "year": paper.get("year", "未知年份"),
-                    "doi": paper.get("doi", ""),
-                    "abstract": paper.get("abstractText", "暂无摘要")[:200] + "...",
-                    "url": paper.get("link") or paper.get("doi") or "#"
-                })
-        print(f"   ✅ 找到 {len(papers)} 篇论文")
-
-    # 2. arXiv Abstract Search
-    print("\n[2/3] 📚 使用 arXiv 搜索 'GPT' 相关论文...")
-    client2 = GiiispMCPClient(6003, "Arxiv Abstract")
-    data2 = await client2.call_tool("searchArxivByAbstract", {"key": "GPT", "pageSize": 5})
-
-    if data2:
-        papers = data2.get("data", {}).get("data", [])
-        for paper in papers:
-            if isinstance(paper, dict):
-                arxiv_id = paper.get("arxivNo") or paper.get("arvixNo", "")
-                if "arXiv:" in str(arxiv_id):
-                    arxiv_id = arxiv_id.replace("arXiv:", "")
-
-                all_papers.append({
-                    "source": "arXiv (预印本)",
-                    "title": paper.get("title", "未知标题"),
-                    "authors": paper.get("authors", "未知作者"),
-                    "year": paper.get("year", "未知年份"),
-                    "arxiv_id": arxiv_id,
-                    "abstract": paper.get("paperAbstract", "暂无摘要")[:200] + "...",
-                    "url": f"https://arxiv.org/abs/{arxiv_id}" if arxiv_id else "#"
-                })
-        print(f"   ✅ 找到 {len(papers)} 篇论文")
-
-    # 3. Crossref - 学术文献元数据
-    print("\n[3/3] 📖 使用 Crossref 搜索 'Transformer' 相关论文...")
-    client3 = GiiispMCPClient(6000, "Crossref")
-    data3 = await client3.call_tool("search_works", {"query": "Transformer neural network", "rows": 5})
-
-    if data3:
-        items = data3.get("message", {}).get("items", [])
-        for item in items:
-            if isinstance(item, dict):
-                all_papers.append({
-                    "source": "Crossref (元数据)",
-                    "title": item.get("title", ["未知标题"])[0] if item.get("title") else "未知标题",
-                    "authors": ", ".join([f"{a.get('given', '')} {a.get('family', '')}"
-                                         for a in item.get("author", [])[:3]]),
-                    "year": item.get("published", {}).get("date-parts", [[None]])[0][0],
-                    "doi": item.get("DOI", ""),
-                    "url": item.get("URL", "#")
-                })
-        print(f"   ✅ 找到 {len(items)} 篇论文")
-
-    # 生成报告
-    print("\n" + "="*80)
-    print("📊 数据汇总")
-    print("="*80)
-    print(f"总计找到 {len(all_papers)} 篇相关论文\n")
+    print(f"\n🔍 并行检索 {len(DEMO_SOURCES)} 个数据源（每个最多 {count} 篇），边检索边写报告...")
+    for source in DEMO_SOURCES:
+        print(f"   - {source.label}: '{source.query}'")
 
-    # 保存为 Markdown
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"MCP_Demo_Report_{timestamp}.md"
+    filename = output or f"MCP_Demo_Report_{timestamp}.md"
+    if measure:
+        tracemalloc.start()
+    stats = await run_pipeline(filename, count=count, page_size=page_size, clients=clients)
+    if measure:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats["alloc_peak_mb"] = round(peak / 1e6, 1)
+        if resource is not None:
+            scale = 1 if sys.platform == "darwin" else 1024
+            stats["rss_peak_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1)
 
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("# 📑 Large Language Models 学术调研报告\n\n")
-        f.write(f"**生成时间**: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}\n\n")
-        f.write(f"**数据来源**: DeepResearch, arXiv, Crossref\n\n")
-        f.write(f"**论文总数**: {len(all_papers)}\n\n")
-        f.write("---\n\n")
+    # 汇总
+    print("\n" + "="*80)
+    print("📊 数据汇总")
+    print("="*80)
+    print(f"总计写入 {stats['written']} 篇相关论文（重复 {stats['duplicates']} 篇）")
+    print(f"首条输出 {stats['ttfo_s']}s，总耗时 {stats['elapsed_s']}s")
+    if measure:
+        print(f"峰值内存：Python 分配 {stats['alloc_peak_mb']}MB，进程 RSS {stats.get('rss_peak_mb', '-')}MB")
 
-        for idx, paper in enumerate(all_papers, 1):
-            f.write(f"## {idx}. {paper['title']}\n\n")
-            f.write(f"- **来源**: {paper['source']}\n")
-            if paper.get('authors'):
-                f.write(f"- **作者**: {paper['authors']}\n")
-            if paper.get('year'):
-                f.write(f"- **年份**: {paper['year']}\n")
-            if paper.get('doi'):
-                f.write(f"- **DOI**: {paper['doi']}\n")
-            if paper.get('arxiv_id'):
-                f.write(f"- **arXiv ID**: {paper['arxiv_id']}\n")
-            f.write(f"- **链接**: [查看原文]({paper['url']})\n")
-            if paper.get('abstract'):
-                f.write(f"\n**摘要**:\n> {paper['abstract']}\n")
-            f.write("\n---\n\n")
-
-    print(f"✅ 报告已生成: {filename}")
+    print(f"\n✅ 报告已生成: {filename}")
     print("\n" + "="*80)
     print("💡 说明")
     print("="*80)
@@ -135,9 +240,26 @@ async def demo_mcp_tools():
     print("  5. 生成更专业的综述报告")
     print("\n如果你的 API 连接问题解决后，可以运行 claude_agent.py 体验完整功能。")
     print("="*80)
+    return stats
 
 if __name__ == "__main__":
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-    asyncio.run(demo_mcp_tools())
+    parser = argparse.ArgumentParser(description="MCP 工具演示：并行检索并流式生成 Markdown 报告")
+    parser.add_argument("--count", type=int, default=5, help="每个数据源最多取多少篇，默认 5")
+    parser.add_argument("--page-size", type=int, default=50, help="每次请求的条数，默认 50")
+    parser.add_argument("-o", "--output", help="报告文件名，默认 MCP_Demo_Report_<时间>.md")
+    parser.add_argument("--measure", action="store_true", help="统计峰值内存（tracemalloc 会让运行变慢）")
+    parser.add_argument("--stand-in", action="store_true", help="使用本地替身服务，不访问真实 MCP")
+    parser.add_argument("--latency", type=float, default=0.2, help="替身的平均延迟（秒），默认 0.2")
+    cli_args = parser.parse_args()
+
+    setup_logging()
+
+    clients = None
+    if cli_args.stand_in:
+        from mcp_standin import StandInMCPClient
+        clients = {s.port: StandInMCPClient(s.port, s.service_name, latency=cli_args.latency)
+                   for s in DEMO_SOURCES}
+    asyncio.run(demo_mcp_tools(cli_args.count, cli_args.page_size, clients, cli_args.measure, cli_args.output))
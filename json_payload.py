@@ -0,0 +1,248 @@
+"""
+MCP 返回内容的 JSON 解码
+作用：
+- 安装了 orjson 时用它解析和序列化（更快、不产生中间的 ASCII 转义串），否则退回标准库 json
+- 超过 STREAM_THRESHOLD 的大返回按成员逐个解码：只沿已知路径（如 Crossref 的 message.items、
+  集思谱的 data.data）保留数据，路径外的大对象/数组解码后立即丢弃，不在内存中留下完整的树
+- 保留的内容超过字符上限时在当前位置截断，并在顶层加 "_truncated" 说明保留了多少条；
+  顶层不是对象（数组、字符串）时包成 {"items" / "value": ..., "_truncated": ...}，不是 JSON 的文本见 truncate_text()
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+# 超过这个字符数的返回走逐成员解码
+STREAM_THRESHOLD = 1_000_000
+# 单次调用保留的最大字符数（按原始 JSON 计），超过后截断
+MAX_PAYLOAD_CHARS = 4_000_000
+
+# MCP 工具名 -> 需要保留的子树路径；不在表中的工具从根开始按上限保留
+EXTRACT_PATHS: Dict[str, Tuple[str, ...]] = {
+    "search_works": ("message", "items"),
+    "DeepResearch": ("data", "data"),
+    "searchArxivByAbstract": ("data", "data"),
+    "searchArxivByTitle": ("data", "data"),
+    "SearchByArxivNo": ("data", "data"),
+    "searchBooks": ("docs",),
+    "ESearch": ("esearchresult", "idlist"),
+    "ESummary": ("result",),
+}
+
+_WS = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+def loads(text: str) -> Any:
+    """整体解析；orjson 不接受的输入（如 NaN）交给标准库再试一次"""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
+def dumps(value: Any) -> str:
+    """紧凑序列化，不缩进、不转义中文"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class _Budget:
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.used = 0
+        self.truncated_at: Optional[str] = None
+        self.dropped: List[str] = []
+
+
+def _skip(text: str, pos: int) -> int:
+    return _WS.match(text, pos).end()
+
+
+def _expect(text: str, pos: int, char: str) -> int:
+    if text[pos:pos + 1] != char:
+        raise json.JSONDecodeError(f"Expecting '{char}'", text, pos)
+    return _skip(text, pos + 1)
+
+
+def _children(text: str, pos: int):
+    """
+    逐个产出容器的子节点 (key, value_start)，数组的 key 为下标；
+    调用方通过 send(value_end) 告知子节点结束位置，生成器最终返回容器结束位置
+    """
+    opening = text[pos]
+    closing = "}" if opening == "{" else "]"
+    pos = _skip(text, pos + 1)
+    index = 0
+    if text[pos:pos + 1] == closing:
+        return pos + 1
+    while True:
+        if opening == "{":
+            key, pos = _DECODER.raw_decode(text, pos)
+            pos = _expect(text, _skip(text, pos), ":")
+        else:
+            key = index
+        end = yield key, pos
+        pos = _skip(text, end)
+        index += 1
+        if text[pos:pos + 1] == ",":
+            pos = _skip(text, pos + 1)
+            continue
+        if text[pos:pos + 1] != closing:
+            raise json.JSONDecodeError(f"Expecting ',' or '{closing}'", text, pos)
+        return pos + 1
+
+
+def _join(trail: str, key: Any) -> str:
+    return f"{trail}[{key}]" if isinstance(key, int) else (f"{trail}.{key}" if trail else key)
+
+
+def _decode_capped(text: str, pos: int, budget: _Budget, trail: str) -> Tuple[Any, Optional[int]]:
+    """
+    解码 pos 处的值，保留内容不超过剩余预算：容器逐个子节点解码，放不下的子节点再往下一层保留到预算用完
+    返回 (值, 结束位置)；截断后结束位置为 None，调用方不再解析后续内容
+    """
+    if text[pos:pos + 1] not in ("{", "["):
+        value, end = _DECODER.raw_decode(text, pos)
+        if budget.used + (end - pos) <= budget.max_chars:
+            budget.used += end - pos
+            return value, end
+        budget.truncated_at = trail
+        if isinstance(value, str):
+            keep = max(0, budget.max_chars - budget.used)
+            budget.used = budget.max_chars
+            return value[:keep] + "…", None
+        return None, None
+
+    container: Any = {} if text[pos] == "{" else []
+    children = _children(text, pos)
+    try:
+        key, child_pos = next(children)
+        while True:
+            child, child_end = _DECODER.raw_decode(text, child_pos)
+            if budget.used + (child_end - child_pos) > budget.max_chars:
+                del child
+                child, _ = _decode_capped(text, child_pos, budget, _join(trail, key))
+                if child is not None:
+                    _store(container, key, child)
+                # 子节点的成员单独计都放得下（键名和分隔符不计入预算）时，截断发生在它之后的兄弟节点
+                if budget.truncated_at is None:
+                    budget.truncated_at = _join(trail, key)
+                return container, None
+            budget.used += child_end - child_pos
+            _store(container, key, child)
+            key, child_pos = children.send(child_end)
+    except StopIteration as stop:
+        return container, stop.value
+
+
+def _store(container, key, value):
+    if isinstance(container, dict):
+        container[key] = value
+    else:
+        container.append(value)
+
+
+def _decode_path(text: str, pos: int, path: Sequence[str], budget: _Budget,
+                 trail: str) -> Tuple[Any, Optional[int]]:
+    """沿 path 下降：路径上的对象只保留标量成员和下一级路径，路径末端的子树按预算解码"""
+    if not path or text[pos:pos + 1] != "{":
+        return _decode_capped(text, pos, budget, trail)
+
+    node: Dict[str, Any] = {}
+    children = _children(text, pos)
+    try:
+        key, child_pos = next(children)
+        while True:
+            if key == path[0]:
+                child, child_end = _decode_path(text, child_pos, path[1:], budget, _join(trail, key))
+                node[key] = child
+                if child_end is None:
+                    return node, None
+            else:
+                child, child_end = _DECODER.raw_decode(text, child_pos)
+                if isinstance(child, (dict, list)):
+                    budget.dropped.append(_join(trail, key))
+                else:
+                    node[key] = child
+                del child
+            key, child_pos = children.send(child_end)
+    except StopIteration as stop:
+        return node, stop.value
+
+
+def stream_decode(text: str, path: Sequence[str] = (), max_chars: int = MAX_PAYLOAD_CHARS) -> Any:
+    """
+    逐成员解码一个大 JSON 文本
+    :param path: 需要保留的子树路径；路径外的对象和数组被丢弃（标量保留），丢弃的路径记在顶层 "_dropped"
+    :param max_chars: 保留内容的字符上限；超过时截断，并在顶层对象加 "_truncated"；
+                      顶层是数组或字符串时截断结果包成 {"items" / "value": 截断后的值, "_truncated": ...}
+    """
+    budget = _Budget(max_chars)
+    value, _ = _decode_path(text, _skip(text, 0), tuple(path), budget, "")
+    if not isinstance(value, dict):
+        if budget.truncated_at is None:
+            return value
+        info = _truncation_info(len(text), budget.used, budget.truncated_at, max_chars)
+        if isinstance(value, list):
+            info["kept_items"] = len(value)
+            return {"items": value, "_truncated": info}
+        return {"value": value, "_truncated": info}
+    if budget.dropped:
+        value["_dropped"] = budget.dropped
+    if budget.truncated_at is not None:
+        info = _truncation_info(len(text), budget.used, budget.truncated_at, max_chars)
+        kept = _resolve(value, path)
+        if path and isinstance(kept, (list, dict)):
+            info["kept_items"] = len(kept)
+        value["_truncated"] = info
+    return value
+
+
+def _truncation_info(payload_chars: int, kept_chars: int, at: str, max_chars: int) -> Dict[str, Any]:
+    return {"payload_chars": payload_chars, "kept_chars": kept_chars, "at": at,
+            "reason": f"返回超过 {max_chars} 字符上限，后续内容已截断"}
+
+
+def _resolve(value: Any, path: Sequence[str]) -> Any:
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def decode_payload(text: str, tool_name: str = None, max_chars: int = MAX_PAYLOAD_CHARS) -> Any:
+    """
+    解析一次 MCP 调用返回的文本；不是 JSON 时抛 json.JSONDecodeError
+    小返回整体解析；大返回按 EXTRACT_PATHS 中该工具的路径逐成员解码并限制大小
+    """
+    if len(text) <= STREAM_THRESHOLD and len(text) <= max_chars:
+        return loads(text)
+    return stream_decode(text, EXTRACT_PATHS.get(tool_name, ()), max_chars)
+
+
+def truncate_text(text: str, max_chars: int = MAX_PAYLOAD_CHARS) -> Any:
+    """不是 JSON 的返回文本：不超过上限时原样返回，超过时截断并包成 {"text": ..., "_truncated": ...}"""
+    if len(text) <= max_chars:
+        return text
+    return {"text": text[:max_chars] + "…", "_truncated": _truncation_info(len(text), max_chars, "", max_chars)}
+
+
+def is_truncated(value: Any) -> bool:
+    """值（或多段返回组成的列表中任意一段）带有 "_truncated" 标记"""
+    if isinstance(value, list):
+        return any(isinstance(v, dict) and "_truncated" in v for v in value)
+    return isinstance(value, dict) and "_truncated" in value
@@ -1,8 +1,17 @@
 import json
 import asyncio
+import os
+import time
 from typing import Optional, Dict, Any, List, Union
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.sse import sse_client
+from metrics import MCP_CALLS, MCP_PAYLOAD_TRUNCATED, MCP_PHASE_LATENCY, MCP_POOL_SESSIONS
+from agent_logging import get_logger
+from cpu_offload import CPUOffloader, default_offloader
+from json_payload import MAX_PAYLOAD_CHARS, is_truncated, truncate_text
+from run_profiler import span
+
+logger = get_logger("mcp")
 
 class GiiispMCPClient:
     """
@@ -10,61 +19,310 @@ class GiiispMCPClient:
     作用：封装底层连接逻辑，让上层业务（Agent）不需要关心 SSE 和 JSON 解析
     """
     
-    def __init__(self, port: int, service_name: str = "Unknown"):
+    def __init__(self, port: int, service_name: str = "Unknown", host: Optional[str] = None,
+                 max_payload_chars: int = MAX_PAYLOAD_CHARS, offloader: Optional[CPUOffloader] = None):
+        """
+        :param port: 服务端口 (6000-6007)
+        :param service_name: 日志中显示的服务名
+        :param host: 服务主机，默认读取环境变量 GIIISP_MCP_HOST，再默认 giiisp.com
+        :param max_payload_chars: 单次返回保留的最大字符数，超过时截断（见 json_payload）
+        :param offloader: 大返回的解码放到线程池 / 进程池执行，默认使用进程内共享的 default_offloader()
+        """
         self.port = port
         self.service_name = service_name
-        self.base_url = f"http://giiisp.com:{port}/sse"
+        self.host = host or os.environ.get("GIIISP_MCP_HOST", "giiisp.com")
+        self.base_url = f"http://{self.host}:{port}/sse"
+        self.max_payload_chars = max_payload_chars
+        self.offloader = offloader or default_offloader()
+        # 预热的会话池，见 start_pool()
+        self.pool: Optional["MCPSessionPool"] = None
+        # 服务端提供的工具名，第一次握手后缓存，见 list_tools()
+        self.tools: Optional[List[str]] = None
     
     async def call_tool(self, tool_name: str, args: Dict[str, Any]) -> Optional[Union[Dict, List, str]]:
         """
         连接服务并调用指定工具
+        已通过 start_pool() 预热连接池时优先复用池中的会话，否则每次新建 SSE 连接
         :param tool_name: 工具名称 (如 'DeepResearch', 'search_works')
         :param args: 参数字典 (如 {'query': 'AI'})
         :return: 解析后的数据 (字典、列表或原始文本)
         """
-        # 日志加个 emoji，调试心情好
-        print(f"\n🔌 [{self.service_name}] 正在连接: {self.base_url} ...")
-        
+        port = str(self.port)
+        outcome = {"status": "error"}
+
         try:
+            if self.pool is not None:
+                slot = await self.pool.acquire()
+                if slot is not None:
+                    try:
+                        return await self._invoke(slot.session, slot.tools, tool_name, args, outcome)
+                    except Exception as e:
+                        # 会话可能已经断开：交给持有者任务重连，本次改用临时连接重试
+                        slot.discard()
+                        logger.warning("⚠️ [%s] 池中会话失效，改用新连接重试: %s", self.service_name, e)
+                    finally:
+                        self.pool.release(slot)
+
+            # 日志加个 emoji，调试心情好
+            logger.debug("🔌 [%s] 正在连接: %s ...", self.service_name, self.base_url)
             # 建立 SSE 长连接
+            started = time.perf_counter()
             async with sse_client(self.base_url) as (read, write):
+                MCP_PHASE_LATENCY.labels(port, "connect").observe(time.perf_counter() - started)
                 async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    
-                    # 1. 验证工具是否存在 (防御性编程)
-                    tools = await session.list_tools()
-                    available_tools = [t.name for t in tools.tools]
-                    
-                    if tool_name not in available_tools:
-                        print(f"❌ [SDK错误] 工具 '{tool_name}' 不存在！")
-                        print(f"📋 该服务可用工具: {available_tools}")
-                        return None
-
-                    # 2. 执行调用
-                    print(f"🔍 [SDK调用] {tool_name} | 参数: {args}")
-                    result = await session.call_tool(name=tool_name, arguments=args)
-                    
-                    # 3. 统一结果解析逻辑
-                    # 我们遍历返回的内容，尝试提取最有用的信息
-                    final_data = []
-                    for content in result.content:
-                        if content.type == "text":
-                            try:
-                                # 尝试解析 JSON
-                                data = json.loads(content.text)
-                                final_data.append(data)
-                            except json.JSONDecodeError:
-                                # 解析不了就返回原始文本
-                                final_data.append(content.text)
-                    
-                    # 如果结果是空的
-                    if not final_data:
-                        print("⚠️ [SDK警告] 调用成功但没有返回任何数据")
-                        return None
-
-                    # 如果只有一条数据，直接返回该数据；否则返回列表
-                    return final_data[0] if len(final_data) == 1 else final_data
+                    tools = self.tools = await _handshake(session, port)
+                    return await self._invoke(session, tools, tool_name, args, outcome)
 
         except Exception as e:
-            print(f"❌ [SDK异常] 连接 {self.service_name} 失败: {str(e)}")
-            return None
\ No newline at end of file
+            logger.error("❌ [SDK异常] 连接 %s 失败: %s", self.service_name, e)
+            return None
+        finally:
+            MCP_CALLS.labels(port, outcome["status"]).inc()
+
+    async def _invoke(self, session: ClientSession, available_tools: List[str], tool_name: str,
+                      args: Dict[str, Any], outcome: Dict[str, str]) -> Optional[Union[Dict, List, str]]:
+        """在已初始化的会话上执行一次调用，outcome["status"] 记录结果状态"""
+        port = str(self.port)
+        # 1. 验证工具是否存在 (防御性编程)
+        if tool_name not in available_tools:
+            outcome["status"] = "unknown_tool"
+            logger.error("❌ [SDK错误] 工具 '%s' 不存在！", tool_name)
+            logger.error("📋 该服务可用工具: %s", available_tools)
+            return None
+
+        # 2. 执行调用
+        logger.debug("🔍 [SDK调用] %s | 参数: %s", tool_name, args)
+        started = time.perf_counter()
+        with span(f"mcp.call_tool:{tool_name}"):
+            result = await session.call_tool(name=tool_name, arguments=args)
+        MCP_PHASE_LATENCY.labels(port, "call_tool").observe(time.perf_counter() - started)
+
+        # 3. 统一结果解析逻辑
+        # 我们遍历返回的内容，尝试提取最有用的信息
+        final_data = []
+        for content in result.content:
+            if content.type == "text":
+                try:
+                    # 尝试解析 JSON；大返回只保留该工具的主要数据并限制大小，解码不占用事件循环线程
+                    with span("mcp.decode"):
+                        data = await self.offloader.decode(content.text, tool_name, self.max_payload_chars)
+                except json.JSONDecodeError:
+                    # 解析不了就返回原始文本，超过上限时同样截断并标记
+                    data = truncate_text(content.text, self.max_payload_chars)
+                if is_truncated(data):
+                    MCP_PAYLOAD_TRUNCATED.labels(port).inc()
+                    logger.warning("✂️ [%s] %s 返回 %d 字符，已截断: %s", self.service_name, tool_name,
+                                   len(content.text), data["_truncated"]["at"] or "(文本)")
+                final_data.append(data)
+
+        # 如果结果是空的
+        if not final_data:
+            outcome["status"] = "empty"
+            logger.warning("⚠️ [SDK警告] 调用成功但没有返回任何数据")
+            return None
+
+        # 如果只有一条数据，直接返回该数据；否则返回列表
+        outcome["status"] = "ok"
+        return final_data[0] if len(final_data) == 1 else final_data
+
+    async def list_tools(self) -> List[str]:
+        """
+        服务端提供的工具名（initialize + list_tools 的结果），第一次获取后缓存
+        已预热连接池时直接读取池中会话的握手结果；连接失败时抛出异常
+        """
+        if self.tools is None and self.pool is not None:
+            slot = await self.pool.acquire()
+            if slot is not None:
+                self.tools = list(slot.tools)
+                self.pool.release(slot)
+        if self.tools is None:
+            async with sse_client(self.base_url) as (read, write):
+                async with ClientSession(read, write) as session:
+                    self.tools = await _handshake(session, str(self.port))
+        return self.tools
+
+    async def start_pool(self, size: int = 2, wait: bool = True, timeout: float = 10.0) -> bool:
+        """
+        预热连接池：后台保持 size 个已完成 initialize / list_tools 的会话，供后续调用复用；
+        连接池已存在且会话数少于 size 时扩充到 size
+        :param wait: 是否等待第一个会话就绪（连接失败时不抛异常，调用会退回到每次新建连接）
+        :return: 等待时返回是否已有会话就绪，失败原因见 self.pool.last_error；不等待时返回 True
+        """
+        if self.pool is None:
+            self.pool = MCPSessionPool(self.base_url, self.port, self.service_name, size=size)
+            self.pool.start()
+        else:
+            self.pool.resize(size)
+        if wait:
+            return await self.pool.wait_ready(timeout)
+        return True
+
+    async def close_pool(self):
+        """关闭连接池中的全部会话"""
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await pool.close()
+
+
+async def _handshake(session: ClientSession, port: str) -> List[str]:
+    """initialize + list_tools，返回服务端可用的工具名"""
+    started = time.perf_counter()
+    with span("mcp.initialize"):
+        await session.initialize()
+    MCP_PHASE_LATENCY.labels(port, "initialize").observe(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with span("mcp.list_tools"):
+        tools = await session.list_tools()
+    MCP_PHASE_LATENCY.labels(port, "list_tools").observe(time.perf_counter() - started)
+    return [t.name for t in tools.tools]
+
+
+class _PooledSession:
+    """池中的一个会话；SSE 连接由持有者任务打开和关闭，调用方只借用 session"""
+
+    def __init__(self, session: ClientSession, tools: List[str]):
+        self.session = session
+        self.tools = tools
+        self.closed = asyncio.Event()
+
+    def discard(self):
+        self.closed.set()
+
+
+class MCPSessionPool:
+    """
+    单个 MCP 服务的会话池
+    sse_client / ClientSession 的上下文必须在同一个任务中进入和退出，
+    所以每个会话由一个后台持有者任务打开并一直持有，断开后自动重连；调用方通过队列借用和归还
+    """
+
+    # 第一个会话还在握手时，调用方最多等待的秒数，超时则退回到临时连接
+    WARMUP_WAIT = 2.0
+    # 重连退避的上限（秒）
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, base_url: str, port: int, service_name: str = "Unknown", size: int = 2):
+        self.base_url = base_url
+        self.port = str(port)
+        self.service_name = service_name
+        self.size = max(1, size)
+        self._idle: "asyncio.Queue[_PooledSession]" = asyncio.Queue()
+        self._holders: List[asyncio.Task] = []
+        # 第一次建连有了结果（成功或失败）
+        self._settled = asyncio.Event()
+        self._closing = False
+        self.live = 0
+        # 已完成（成功或失败）的建连次数，以及最近一次建连失败的原因
+        self.attempts = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        self._spawn(self.size)
+
+    def resize(self, size: int):
+        """把会话数扩充到 size（只增不减）；新会话在后台建立"""
+        if size > self.size:
+            self._spawn(size - self.size)
+            self.size = size
+
+    def _spawn(self, count: int):
+        for _ in range(count):
+            i = len(self._holders)
+            self._holders.append(asyncio.create_task(self._hold(), name=f"mcp-pool-{self.port}-{i}"))
+
+    async def wait_ready(self, timeout: float = 10.0) -> bool:
+        """等待第一次建连出结果；有会话就绪返回 True，失败或超时返回 False（后台仍会继续重连）"""
+        try:
+            await asyncio.wait_for(self._settled.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.last_error = self.last_error or f"握手超过 {timeout:.0f}s 未完成"
+        return self.live > 0
+
+    async def _hold(self):
+        backoff = 1.0
+        while not self._closing:
+            try:
+                started = time.perf_counter()
+                async with sse_client(self.base_url) as (read, write):
+                    MCP_PHASE_LATENCY.labels(self.port, "connect").observe(time.perf_counter() - started)
+                    async with ClientSession(read, write) as session:
+                        slot = _PooledSession(session, await _handshake(session, self.port))
+                        self.attempts += 1
+                        self.live += 1
+                        MCP_POOL_SESSIONS.labels(self.port).set(self.live)
+                        self._idle.put_nowait(slot)
+                        self._settled.set()
+                        backoff = 1.0
+                        try:
+                            await slot.closed.wait()
+                        finally:
+                            # 连接异常断开时持有者会从这里退出，标记会话失效，避免再被借出
+                            slot.discard()
+                            self.live -= 1
+                            MCP_POOL_SESSIONS.labels(self.port).set(self.live)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.attempts += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                # 首次建连失败由 wait_ready 的调用方汇报；服务长时间不可用时只在断开后第一次重连失败时告警
+                log = logger.warning if self._settled.is_set() and backoff == 1.0 else logger.debug
+                self._settled.set()
+                log("⚠️ [%s] 连接池会话建立失败，%.0fs 后重试: %s", self.service_name, backoff, e)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+
+    async def acquire(self) -> Optional[_PooledSession]:
+        """
+        借出一个空闲会话；会话都在使用中或建连失败时立即返回 None（调用方退回临时连接，不排队），
+        只有第一个会话还在握手时才短暂等待
+        """
+        started = time.perf_counter()
+        while True:
+            if self._idle.empty():
+                if self.live or self.attempts:
+                    return None
+                try:
+                    slot = await asyncio.wait_for(
+                        self._idle.get(), self.WARMUP_WAIT - (time.perf_counter() - started))
+                except asyncio.TimeoutError:
+                    return None
+            else:
+                slot = self._idle.get_nowait()
+            if not slot.closed.is_set():
+                MCP_PHASE_LATENCY.labels(self.port, "pool_wait").observe(time.perf_counter() - started)
+                return slot
+
+    def release(self, slot: _PooledSession):
+        if not slot.closed.is_set() and not self._closing:
+            self._idle.put_nowait(slot)
+
+    async def close(self):
+        self._closing = True
+        for task in self._holders:
+            task.cancel()
+        await asyncio.gather(*self._holders, return_exceptions=True)
+        self._holders.clear()
+
+
+class AsyncRateLimiter:
+    """
+    简单的匀速限流器：相邻两次放行至少间隔 1/qps 秒
+    多个协程共享同一个实例即可实现全局限速；qps <= 0 表示不限速
+    """
+
+    def __init__(self, qps: float):
+        self.interval = 1.0 / qps if qps and qps > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
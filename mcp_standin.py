@@ -0,0 +1,170 @@
+"""
+MCP 服务本地替身（stand-in）
+作用：在不访问 giiisp.com 的情况下模拟 6000-6007 端口八个服务的返回结构和延迟，
+接口与 GiiispMCPClient.call_tool 相同，用于压测、离线调试和自检脚本
+"""
+import asyncio
+import hashlib
+import random
+from typing import Any, Dict, List, Optional
+
+# 端口 -> (服务名, 工具名)，与 claude_agent.py 中的 mcp_clients 保持一致
+STANDIN_SERVICES = {
+    6000: ("Crossref", "search_works"),
+    6001: ("BioC", "get_article_info"),
+    6002: ("DeepResearch", "DeepResearch"),
+    6003: ("Arxiv Abstract", "searchArxivByAbstract"),
+    6004: ("OpenLibrary", "searchBooks"),
+    6005: ("Entrez", "ESearch"),
+    6006: ("Arxiv ID", "SearchByArxivNo"),
+    6007: ("Arxiv Title", "searchArxivByTitle"),
+}
+# 替身额外提供的工具：线上 6005 服务是否提供 ESummary 只能通过 list_tools 确认（见 entrez_summary）
+STANDIN_EXTRA_TOOLS = {6005: ("ESummary",)}
+
+
+def _seed(*parts: Any) -> int:
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+    return int(digest[:12], 16)
+
+
+def _arxiv_no(rng: random.Random) -> str:
+    return f"{rng.randint(17, 24):02d}{rng.randint(1, 12):02d}.{rng.randint(0, 99999):05d}"
+
+
+def _fake_paper(rng: random.Random, query: str, i: int) -> Dict[str, Any]:
+    return {
+        "title": f"{query} study {i + 1}",
+        "authors": ", ".join(f"Author {rng.randint(1, 999)}" for _ in range(3)),
+        "year": rng.randint(2015, 2025),
+        "doi": f"10.{rng.randint(1000, 9999)}/standin.{rng.randint(100000, 999999)}",
+        "arxivNo": f"arXiv:{_arxiv_no(rng)}",
+        "abstractText": f"Synthetic abstract about {query}. " * 4,
+        "paperAbstract": f"Synthetic abstract about {query}. " * 4,
+        "link": f"https://example.org/paper/{rng.randint(1, 10**9)}",
+    }
+
+
+def fake_response(tool_name: str, args: Dict[str, Any]) -> Any:
+    """按工具名生成与线上服务同构的假数据；相同参数返回相同结果"""
+    rng = random.Random(_seed(tool_name, sorted(args.items())))
+    if tool_name == "search_works":
+        rows = int(args.get("rows", 5))
+        offset = int(args.get("offset", 0))
+        items = []
+        for i in range(offset, offset + rows):
+            paper = _fake_paper(rng, args.get("query", ""), i)
+            items.append({
+                "DOI": paper["doi"],
+                "title": [paper["title"]],
+                "author": [{"given": "A.", "family": f"Family{rng.randint(1, 99)}"} for _ in range(2)],
+                "published": {"date-parts": [[paper["year"], 1, 1]]},
+                "URL": f"https://doi.org/{paper['doi']}",
+                "is-referenced-by-count": rng.randint(0, 500),
+                "reference": [{"DOI": f"10.{rng.randint(1000, 9999)}/ref.{rng.randint(1, 10**6)}"}
+                              for _ in range(rng.randint(0, 5))],
+            })
+        query = str(args.get("query", "")).strip().lower()
+        if query.startswith("10.") and offset == 0 and items:
+            # 以 DOI 为检索词时 Crossref 的第一条就是该文献；参考文献取自有限的 DOI 空间，不同文献之间会互相引用
+            items[0].update({"DOI": query, "URL": f"https://doi.org/{query}", "reference": [
+                {"DOI": f"10.5555/standin.ref{rng.randint(1, 200000)}", "key": f"ref{j}"}
+                for j in range(rng.randint(5, 25))]})
+        return {"status": "ok", "message": {"total-results": 10000, "items": items}}
+    if tool_name in ("DeepResearch", "searchArxivByAbstract", "searchArxivByTitle", "SearchByArxivNo"):
+        query = args.get("searchQuery") or args.get("key", "")
+        count = int(args.get("count") or args.get("pageSize") or (1 if tool_name == "SearchByArxivNo" else 5))
+        page = int(args.get("page") or args.get("pageNum") or 1)
+        papers = [_fake_paper(rng, query, (page - 1) * count + i) for i in range(count)]
+        if tool_name == "SearchByArxivNo":
+            papers[0]["arxivNo"] = f"arXiv:{query}"
+        return {"success": True, "data": {"total": 10000, "data": papers}}
+    if tool_name == "get_article_info":
+        return {
+            "success": True,
+            "id": args.get("id"),
+            "title": f"Article {args.get('id')}",
+            "abstract": "Synthetic PMC abstract. " * 20,
+            "authors": [f"Author {rng.randint(1, 999)}" for _ in range(4)],
+        }
+    if tool_name == "searchBooks":
+        limit = int(args.get("limit", 5))
+        return {"numFound": 1000, "docs": [
+            {"title": f"{args.get('query', '')} book {i + 1}",
+             "author_name": [f"Writer {rng.randint(1, 99)}"],
+             "first_publish_year": rng.randint(1990, 2024)}
+            for i in range(limit)
+        ]}
+    if tool_name == "ESearch":
+        retmax = int(args.get("retmax", 10))
+        retstart = int(args.get("retstart", 0))
+        return {"esearchresult": {
+            "count": "100000",
+            "retstart": str(retstart),
+            "idlist": [str(30000000 + _seed(args.get("term"), retstart + i) % 9000000) for i in range(retmax)],
+        }}
+    if tool_name == "ESummary":
+        ids = [i for i in str(args.get("id", "")).split(",") if i]
+        result: Dict[str, Any] = {"uids": [i for i in ids if i.isdigit()]}
+        for uid in ids:
+            if not uid.isdigit():
+                # 与 NCBI 一致：无效 ID 在对应条目中给出 error
+                result[uid] = {"uid": uid, "error": "Invalid uid"}
+                continue
+            item_rng = random.Random(_seed(args.get("db"), uid))
+            result[uid] = {
+                "uid": uid,
+                "title": f"Entrez record {uid}",
+                "pubdate": f"{item_rng.randint(2000, 2025)} Jan",
+                "source": f"Journal {item_rng.randint(1, 99)}",
+                "authors": [{"name": f"Author {item_rng.randint(1, 999)}"} for _ in range(3)],
+            }
+        return {"header": {"type": "esummary"}, "result": result}
+    return None
+
+
+class StandInMCPClient:
+    """
+    GiiispMCPClient 的本地替身
+    :param latency: 平均延迟（秒），实际延迟在 [0.5x, 1.5x] 之间均匀分布
+    :param error_rate: 模拟失败的概率，失败时与真实客户端一样返回 None
+    :param tools: 模拟服务端提供的工具名，默认为该端口的工具；调用不在其中的工具时与真实客户端一样返回 None
+    """
+
+    def __init__(self, port: int, service_name: str = "Unknown", latency: float = 0.05,
+                 error_rate: float = 0.0, seed: Optional[int] = None, tools: Optional[List[str]] = None):
+        self.port = port
+        self.service_name = service_name
+        self.base_url = f"standin://{port}"
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        if tools is None:
+            tools = [STANDIN_SERVICES[port][1], *STANDIN_EXTRA_TOOLS.get(port, ())] if port in STANDIN_SERVICES else []
+        self.tools = list(tools)
+
+    async def call_tool(self, tool_name: str, args: Dict[str, Any]) -> Optional[Any]:
+        self.calls += 1
+        await asyncio.sleep(self.latency * self._rng.uniform(0.5, 1.5))
+        if self.error_rate and self._rng.random() < self.error_rate:
+            return None
+        if self.tools and tool_name not in self.tools:
+            return None
+        return fake_response(tool_name, args)
+
+    async def list_tools(self) -> List[str]:
+        return self.tools
+
+    async def start_pool(self, size: int = 2, wait: bool = True, timeout: float = 10.0) -> bool:
+        """替身没有真实连接，预热为空操作"""
+        return True
+
+    async def close_pool(self):
+        pass
+
+
+def standin_clients(latency: float = 0.05, error_rate: float = 0.0) -> Dict[int, StandInMCPClient]:
+    """为 6000-6007 每个端口创建一个替身客户端"""
+    return {port: StandInMCPClient(port, name, latency=latency, error_rate=error_rate)
+            for port, (name, _) in STANDIN_SERVICES.items()}
@@ -0,0 +1,305 @@
+"""
+Prometheus 风格的运行时指标
+作用：在进程内维护计数器 / 直方图 / 仪表盘，并可选地通过本地 HTTP 端点以文本暴露格式输出，
+供长期运行的代理服务被 Prometheus 抓取
+
+热路径开销：标签组合 -> 子指标 的字典查找 + 一次 bisect，不加锁（CPython 下 += 在单个事件循环线程中足够），
+HTTP 端点在后台线程中渲染，渲染时先对字典做快照
+"""
+import math
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 默认延迟分桶（秒），覆盖从本地缓存命中到慢速全文检索
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        """按标签值取子指标；热路径上可以把返回值缓存起来复用"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际传入 {values}")
+            child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def children(self) -> List[Tuple[Tuple[str, ...], object]]:
+        """已创建的 (标签值, 子指标) 快照，可以在其他线程中安全遍历"""
+        return list(self._children.items())
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in self.children():
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值（如在途调用数）"""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # 每个桶只记自己区间内的次数，渲染时再做累加，observe 只需一次 bisect + 一次自增
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """固定分桶直方图"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != math.inf))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _render_child(self, key, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        counts = list(child.counts)
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            cumulative += n
+            labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表：同名指标只注册一次，重复注册返回已有实例"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics.setdefault(name, cls(name, documentation, labelnames, **kwargs))
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """生成 Prometheus 文本暴露格式 (text/plain; version=0.0.4)"""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 进程级默认注册表
+REGISTRY = MetricsRegistry()
+
+# ========== 代理与 MCP 客户端使用的指标 ==========
+TOOL_CALLS = REGISTRY.counter(
+    "agent_tool_calls_total", "按工具名和结果状态统计的工具调用次数", ("tool", "status"))
+TOOL_LATENCY = REGISTRY.histogram(
+    "agent_tool_latency_seconds", "execute_tool 端到端耗时", ("tool",))
+TOOL_IN_FLIGHT = REGISTRY.gauge(
+    "agent_tool_in_flight", "正在执行中的工具调用数", ("tool",))
+MCP_PHASE_LATENCY = REGISTRY.histogram(
+    "mcp_phase_latency_seconds", "MCP 调用各阶段耗时（connect/initialize/list_tools/call_tool）",
+    ("port", "phase"))
+MCP_POOL_SESSIONS = REGISTRY.gauge(
+    "mcp_pool_sessions", "各端口连接池中已建立的会话数", ("port",))
+MCP_PAYLOAD_TRUNCATED = REGISTRY.counter(
+    "mcp_payload_truncated_total", "返回超过大小上限被截断的 MCP 调用次数", ("port",))
+MCP_CALLS = REGISTRY.counter(
+    "mcp_calls_total", "按端口和结果状态统计的 MCP 调用次数", ("port", "status"))
+MODEL_LATENCY = REGISTRY.histogram(
+    "agent_model_latency_seconds", "messages.create 耗时", ("model",))
+MODEL_TOKENS = REGISTRY.counter(
+    "agent_model_tokens_total", "模型 token 用量（input/output/cache_creation/cache_read）", ("model", "type"))
+MODEL_ROUTES = REGISTRY.counter(
+    "agent_model_routes_total", "模型路由结果：按档位（fast/strong）和命中的规则（含 escalate:*）统计的模型调用次数",
+    ("tier", "reason"))
+BUDGET_ACTIONS = REGISTRY.counter(
+    "agent_budget_actions_total", "预算调控动作：shrink（缩小返回条数）/ refuse（拒绝工具调用）/ finalize（要求最终回答）"
+    " / exhausted（预算用尽结束 run）", ("action",))
+TOOL_CACHE = REGISTRY.counter(
+    "agent_tool_cache_total", "工具结果缓存命中 / 未命中次数", ("tool", "result"))
+TOOL_RESULT_OFFLOADED = REGISTRY.counter(
+    "agent_tool_result_offloaded_total", "超过阈值、只把摘要和句柄交给 Claude 的工具结果数", ("tool",))
+PAPER_INDEX_LATENCY = REGISTRY.histogram(
+    "agent_paper_index_latency_seconds", "本地论文索引操作耗时（search/flush）", ("op",))
+LOCAL_PRECHECK = REGISTRY.counter(
+    "agent_local_precheck_total", "检索前查本地索引的结果：hit 表示跳过了网络请求", ("tool", "result"))
+CPU_OFFLOAD = REGISTRY.histogram(
+    "agent_cpu_offload_seconds", "CPU 密集的后处理耗时，按阶段和执行位置（inline/thread/process）", ("stage", "mode"))
+EVENT_LOOP_LAG = REGISTRY.histogram(
+    "agent_event_loop_lag_seconds", "事件循环定时唤醒的延迟（越大说明循环线程被阻塞越久）",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+CACHE_PREWARM = REGISTRY.counter(
+    "agent_cache_prewarm_total", "缓存预热：fresh（仍有效，跳过）/ refreshed（已刷新）/ failed", ("tool", "result"))
+PREFETCH = REGISTRY.counter(
+    "agent_prefetch_total",
+    "推测预取结果：fetched/failed/cached/budget 为预取侧，used/joined 为被真实调用用到", ("tool", "result"))
+PROMPT_CACHE_HIT_RATIO = REGISTRY.gauge(
+    "agent_prompt_cache_hit_ratio", "累计 cache_read_input_tokens 占全部输入 token 的比例")
+SERVER_JOBS = REGISTRY.gauge(
+    "agent_server_jobs", "守护进程中处于各状态的任务数（queued/running）", ("state",))
+SERVER_REJECTED = REGISTRY.counter(
+    "agent_server_rejected_total", "因超过并发或排队上限被拒绝的任务数")
+
+
+def observe_model_response(model: str, response, latency_s: float):
+    """记录一次 messages.create 的耗时与 token 用量，并刷新 prompt 缓存命中率"""
+    MODEL_LATENCY.labels(model).observe(latency_s)
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    for kind in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"):
+        MODEL_TOKENS.labels(model, kind.replace("_input_tokens", "").replace("_tokens", "")).inc(
+            getattr(usage, kind, 0) or 0)
+    tokens = MODEL_TOKENS.children()
+    read = sum(c.value for k, c in tokens if k[1] == "cache_read")
+    total = sum(c.value for k, c in tokens if k[1] != "output")
+    PROMPT_CACHE_HIT_RATIO.set(read / total if total else 0.0)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 抓取请求很频繁，不往控制台刷日志
+        pass
+
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1",
+                         registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """
+    在后台守护线程中启动 /metrics 端点
+    :return: HTTP 服务对象，调用 shutdown() 可停止
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
@@ -0,0 +1,154 @@
+"""
+模型路由
+作用：一次 run 的大多数迭代只输出 tool_use 块（决定下一步调用哪些工具），只有最后一轮写长篇综述。
+路由策略按规则为每轮迭代选择模型：规划工具调用的迭代用更快、更便宜的模型和较小的 max_tokens，
+写综述的迭代用强模型。规则可以按迭代序号、此前的停止原因历史（连续几轮 tool_use）判断；
+预期输出由 max_tokens 表达：快模型在本轮要结束任务（end_turn）或输出超出预算（max_tokens）时，
+说明本轮要写的是综述而不是工具调用，丢弃这次响应，用强模型重做本轮（升级）
+
+内置策略（load_policy 按名字取，也可以传 JSON 文件路径）：
+- strong：每轮都用强模型（与引入路由之前的行为相同，作为对比基线）
+- fast-plan：默认快模型，最后一轮用强模型，快模型要结束或超出预算时升级
+- plan-strong：第一轮（制定检索计划）和最后一轮用强模型，其余同 fast-plan
+"""
+import json
+import os
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+# 中转 API 通用名称
+FAST_MODEL = "claude-3-5-haiku"
+STRONG_MODEL = "claude-3-5-sonnet"
+# 规划工具调用的输出通常只有一两百 token；快模型的预算越小，综述轮被升级时浪费的输出越少
+FAST_MAX_TOKENS = 512
+STRONG_MAX_TOKENS = 4096
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """一轮迭代使用的模型"""
+    model: str
+    max_tokens: int
+    # fast / strong
+    tier: str
+    # 命中的规则，写入日志和指标
+    reason: str
+
+
+@dataclass(frozen=True)
+class RouteRule:
+    """
+    一条路由规则：设置了的条件全部满足时使用 tier 对应的模型，未设置的条件不参与判断
+    :param iterations: 迭代序号（从 1 开始），负数从末尾数（-1 为最后一轮）
+    :param after_tool_turns: 此前已连续至少这么多轮以 tool_use 结束（检索做得差不多了，接下来多半要写综述）
+    :param after_stop_reasons: 上一轮的停止原因属于其中之一
+    """
+    tier: str
+    reason: str
+    iterations: Optional[Tuple[int, ...]] = None
+    after_tool_turns: Optional[int] = None
+    after_stop_reasons: Optional[Tuple[str, ...]] = None
+
+    def matches(self, iteration: int, max_iterations: int, history: List[str]) -> bool:
+        if self.iterations is not None and not any(
+                iteration == (i if i > 0 else max_iterations + 1 + i) for i in self.iterations):
+            return False
+        if self.after_tool_turns is not None and _trailing_tool_turns(history) < self.after_tool_turns:
+            return False
+        if self.after_stop_reasons is not None and (not history or history[-1] not in self.after_stop_reasons):
+            return False
+        return True
+
+
+def _trailing_tool_turns(history: List[str]) -> int:
+    count = 0
+    for stop_reason in reversed(history):
+        if stop_reason != "tool_use":
+            break
+        count += 1
+    return count
+
+
+@dataclass
+class RoutingPolicy:
+    """
+    按规则为每轮迭代选择模型；规则按顺序匹配，第一条命中的生效，都不命中时用 default_tier
+    :param escalate_on: 快模型以这些停止原因结束时丢弃本轮响应，改用强模型重做；空元组表示不升级
+    """
+    name: str
+    rules: Tuple[RouteRule, ...] = ()
+    default_tier: str = "fast"
+    fast_model: str = FAST_MODEL
+    strong_model: str = STRONG_MODEL
+    fast_max_tokens: int = FAST_MAX_TOKENS
+    strong_max_tokens: int = STRONG_MAX_TOKENS
+    escalate_on: Tuple[str, ...] = ("end_turn", "max_tokens")
+
+    def _route(self, tier: str, reason: str) -> ModelRoute:
+        if tier == "fast":
+            return ModelRoute(self.fast_model, self.fast_max_tokens, "fast", reason)
+        return ModelRoute(self.strong_model, self.strong_max_tokens, "strong", reason)
+
+    def route(self, ctx) -> ModelRoute:
+        """为 ctx 的当前迭代（ctx.iteration，已经加 1）选择模型"""
+        history = accepted_stop_reasons(ctx)
+        for rule in self.rules:
+            if rule.matches(ctx.iteration, ctx.max_iterations, history):
+                return self._route(rule.tier, rule.reason)
+        return self._route(self.default_tier, "default")
+
+    def escalate(self, route: ModelRoute, response: Any) -> Optional[ModelRoute]:
+        """快模型的响应需要重做时返回强模型的路由，否则返回 None"""
+        if route.tier != "fast" or getattr(response, "stop_reason", None) not in self.escalate_on:
+            return None
+        return self._route("strong", f"escalate:{response.stop_reason}")
+
+    def with_models(self, fast_model: str = None, strong_model: str = None) -> "RoutingPolicy":
+        return replace(self, fast_model=fast_model or self.fast_model, strong_model=strong_model or self.strong_model)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RoutingPolicy":
+        """从 JSON 配置构造，格式与字段同名；列表字段转为元组"""
+        rules = tuple(RouteRule(
+            tier=r["tier"], reason=r.get("reason", r["tier"]),
+            iterations=tuple(r["iterations"]) if r.get("iterations") is not None else None,
+            after_tool_turns=r.get("after_tool_turns"),
+            after_stop_reasons=tuple(r["after_stop_reasons"]) if r.get("after_stop_reasons") is not None else None,
+        ) for r in data.get("rules", ()))
+        fields = {k: v for k, v in data.items() if k not in ("rules", "escalate_on")}
+        if "escalate_on" in data:
+            fields["escalate_on"] = tuple(data["escalate_on"])
+        return cls(rules=rules, **fields)
+
+
+def accepted_stop_reasons(ctx) -> List[str]:
+    """ctx 中已被采用的各轮响应的停止原因（升级时被丢弃的快模型响应不计）"""
+    return [u.stop_reason for u in ctx.usage.summary.iterations if not u.discarded]
+
+
+POLICIES: Dict[str, RoutingPolicy] = {
+    "strong": RoutingPolicy("strong", default_tier="strong", escalate_on=()),
+    "fast-plan": RoutingPolicy("fast-plan", rules=(RouteRule("strong", "last_iteration", iterations=(-1,)),)),
+    "plan-strong": RoutingPolicy("plan-strong", rules=(
+        RouteRule("strong", "first_iteration", iterations=(1,)),
+        RouteRule("strong", "last_iteration", iterations=(-1,)),
+    )),
+}
+
+
+def load_policy(name_or_path: str, fast_model: str = None, strong_model: str = None) -> RoutingPolicy:
+    """
+    按名字取内置策略，或从 JSON 文件读取自定义策略
+    :param fast_model: 覆盖策略中的快模型名
+    :param strong_model: 覆盖策略中的强模型名
+    """
+    if name_or_path in POLICIES:
+        policy = POLICIES[name_or_path]
+    elif os.path.isfile(name_or_path):
+        with open(name_or_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        data.setdefault("name", os.path.splitext(os.path.basename(name_or_path))[0])
+        policy = RoutingPolicy.from_dict(data)
+    else:
+        raise ValueError(f"未知的路由策略 {name_or_path!r}，可选 {', '.join(POLICIES)} 或 JSON 文件路径")
+    return policy.with_models(fast_model, strong_model)
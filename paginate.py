@@ -0,0 +1,279 @@
+"""
+大结果集的流式分页采集
+作用：在 GiiispMCPClient 之上为 crossref_search / deep_research / arxiv_search_by_abstract / entrez_search
+提供异步生成器，逐页请求并逐条产出规范化的 PaperRecord：
+- 消费当前页的同时已在后台请求下一页
+- 跨页按 DOI / arXiv ID / PMID / 标题去重
+- 内存只保留当前页和预取的下一页；去重集合只存 8 字节摘要，超过阈值后转存到临时 SQLite 文件
+
+用法：
+    async for record in iter_records("deep_research", "Large Language Models", max_records=2000):
+        ...
+命令行（写出 JSONL 语料，或用 --export 写成按来源 / 日期分区的列式数据集，见 corpus_export.py）：
+    python paginate.py deep_research "Large Language Models" --max 2000 -o corpus.jsonl
+    python paginate.py deep_research "Large Language Models" --max 2000 --export corpus/
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from agent_logging import get_logger, setup_logging
+from batch_tools import ENTREZ_CHUNK, require_esummary, split_esummary
+from mcp_sdk import AsyncRateLimiter, GiiispMCPClient
+from paper_records import PaperRecord, from_crossref, from_esummary, from_giiisp
+
+logger = get_logger("paginate")
+
+
+class SeenKeys:
+    """
+    跨页去重集合：内存中存 64 位摘要，超过 max_in_memory 个后整体转存到临时 SQLite 文件，
+    之后内存占用不再随记录数增长
+    """
+
+    def __init__(self, max_in_memory: int = 200_000):
+        self.max_in_memory = max_in_memory
+        self._hashes = set()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._path: Optional[str] = None
+        self.count = 0
+
+    @staticmethod
+    def _digest(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+    def add(self, key: str) -> bool:
+        """加入集合；之前没见过返回 True"""
+        digest = self._digest(key)
+        if self._conn is not None:
+            new = self._conn.execute("INSERT OR IGNORE INTO seen (h) VALUES (?)", (digest,)).rowcount == 1
+        elif digest in self._hashes:
+            new = False
+        else:
+            self._hashes.add(digest)
+            new = True
+            if len(self._hashes) > self.max_in_memory:
+                self._spill()
+        self.count += new
+        return new
+
+    def _spill(self):
+        fd, self._path = tempfile.mkstemp(prefix="seen_", suffix=".sqlite")
+        os.close(fd)
+        self._conn = sqlite3.connect(self._path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE seen (h INTEGER PRIMARY KEY)")
+        self._conn.execute("BEGIN")
+        self._conn.executemany("INSERT INTO seen (h) VALUES (?)", ((h,) for h in self._hashes))
+        self._conn.execute("COMMIT")
+        self._hashes = set()
+        logger.debug("🗃️ 去重集合超过 %d 条，转存到 %s", self.max_in_memory, self._path)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            os.unlink(self._path)
+            self._conn = None
+
+
+@dataclass(frozen=True)
+class PageSource:
+    """一个可分页的数据源"""
+    port: int
+    service_name: str
+    # (client, query, page_index, page_size, options) -> 规范化后的一页记录；服务无数据返回 None
+    fetch: Callable[..., Awaitable[Optional[List[PaperRecord]]]]
+    # 服务端允许的最大偏移量（Crossref 的 offset 不能超过 10000）
+    max_offset: Optional[int] = None
+
+
+async def _crossref_page(client, query: str, page: int, size: int, options) -> Optional[List[PaperRecord]]:
+    data = await client.call_tool("search_works", {"query": query, "rows": size, "offset": page * size})
+    if not isinstance(data, dict):
+        return None
+    return [from_crossref(item) for item in (data.get("message") or {}).get("items") or []]
+
+
+def _giiisp_page(tool: str, query_arg: str, size_arg: str, page_arg: str, source: str):
+    # 集思谱服务的翻页参数（页码从 1 开始）；服务忽略翻页参数时每页都相同，由重复页检测终止
+    async def fetch(client, query: str, page: int, size: int, options) -> Optional[List[PaperRecord]]:
+        data = await client.call_tool(tool, {query_arg: query, size_arg: size, page_arg: page + 1})
+        if not isinstance(data, dict):
+            return None
+        papers = (data.get("data") or {}).get("data") or []
+        return [from_giiisp(p, source) for p in papers if isinstance(p, dict)]
+    return fetch
+
+
+async def _entrez_page(client, query: str, page: int, size: int, options) -> Optional[List[PaperRecord]]:
+    """
+    ESearch 取一页 ID，再用 ESummary 一次取回这一页的摘要信息
+    第一次拿到 ID 时确认服务端提供 ESummary，不提供时抛 RuntimeError，而不是返回空页让翻页静默结束
+    """
+    db = options.get("db", "pubmed")
+    limiter: AsyncRateLimiter = options["limiter"]
+    await limiter.acquire()
+    data = await client.call_tool("ESearch", {"db": db, "term": query, "retmax": size, "retstart": page * size})
+    if not isinstance(data, dict):
+        return None
+    ids = [str(i) for i in (data.get("esearchresult") or {}).get("idlist") or []]
+    if not ids:
+        return []
+    if not options.get("esummary_checked"):
+        await require_esummary(client)
+        options["esummary_checked"] = True
+    await limiter.acquire()
+    summary = await client.call_tool("ESummary", {"db": db, "id": ",".join(ids), "retmode": "json"})
+    outcomes = split_esummary(ids, summary)
+    return [from_esummary(outcomes[i]["data"], db) for i in ids if outcomes[i]["ok"]]
+
+
+SOURCES: Dict[str, PageSource] = {
+    "crossref_search": PageSource(6000, "Crossref", _crossref_page, max_offset=10000),
+    "deep_research": PageSource(6002, "DeepResearch",
+                                _giiisp_page("DeepResearch", "searchQuery", "count", "page", "deep_research")),
+    "arxiv_search_by_abstract": PageSource(6003, "Arxiv Abstract",
+                                           _giiisp_page("searchArxivByAbstract", "key", "pageSize", "pageNum", "arxiv")),
+    "entrez_search": PageSource(6005, "Entrez", _entrez_page),
+}
+
+
+async def iter_records(source: str, query: str, *, page_size: int = 50, max_records: int = 1000,
+                       client: Any = None, db: str = "pubmed", prefetch: bool = True,
+                       max_retries: int = 2, seen: Optional[SeenKeys] = None) -> AsyncIterator[PaperRecord]:
+    """
+    逐条产出去重后的规范化记录，直到没有更多结果或达到 max_records
+    :param source: SOURCES 中的工具名
+    :param client: 已有的 MCP 客户端（或替身），不提供时按数据源端口新建
+    :param db: entrez_search 使用的数据库
+    :param prefetch: 是否在消费当前页时预取下一页
+    :param seen: 共享的去重集合（多个查询合并成一个语料时传同一个）；不提供时内部创建并在结束时释放
+    """
+    spec = SOURCES[source]
+    client = client or GiiispMCPClient(spec.port, spec.service_name)
+    if source == "entrez_search":
+        page_size = min(page_size, ENTREZ_CHUNK)
+    options = {"db": db, "limiter": AsyncRateLimiter(3)}
+    own_seen = seen is None
+    seen = seen if seen is not None else SeenKeys()
+
+    async def load(page: int) -> Optional[List[PaperRecord]]:
+        for attempt in range(max_retries + 1):
+            records = await spec.fetch(client, query, page, page_size, options)
+            if records is not None:
+                return records
+            if attempt < max_retries:
+                await asyncio.sleep(2 ** attempt)
+        logger.warning("⚠️ [%s] 第 %d 页连续 %d 次未取到数据，停止翻页", source, page + 1, max_retries + 1)
+        return None
+
+    def has_next(page: int, fetched: int) -> bool:
+        if fetched < page_size:
+            return False
+        return spec.max_offset is None or (page + 1) * page_size < spec.max_offset
+
+    page, yielded, stale = 0, 0, 0
+    pending: Optional[asyncio.Task] = asyncio.create_task(load(0))
+    try:
+        while pending is not None:
+            records = await pending
+            pending = None
+            if not records:
+                return
+            more = has_next(page, len(records))
+            if more and prefetch:
+                # 消费这一页的同时请求下一页
+                pending = asyncio.create_task(load(page + 1))
+
+            fresh = 0
+            for record in records:
+                if not seen.add(record.key()):
+                    continue
+                fresh += 1
+                yield record
+                yielded += 1
+                if yielded >= max_records:
+                    return
+
+            # 服务不支持翻页参数时会反复返回同一页
+            stale = 0 if fresh else stale + 1
+            if stale >= 2:
+                logger.warning("⚠️ [%s] 连续 %d 页全部重复，服务可能不支持翻页，停止", source, stale)
+                return
+            page += 1
+            if more and not prefetch:
+                pending = asyncio.create_task(load(page))
+    finally:
+        if pending is not None:
+            pending.cancel()
+        if own_seen:
+            seen.close()
+
+
+async def export_jsonl(source: str, query: str, output: str, **kwargs) -> Dict[str, Any]:
+    """把分页结果逐条写入 JSONL，返回条数、首条耗时和总耗时"""
+    started = time.perf_counter()
+    first_s = None
+    count = 0
+    with open(output, "w", encoding="utf-8") as f:
+        async for record in iter_records(source, query, **kwargs):
+            if first_s is None:
+                first_s = time.perf_counter() - started
+            f.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+            count += 1
+            if count % 500 == 0:
+                logger.info("   已写出 %d 条", count)
+    return {"records": count, "first_record_s": round(first_s or 0.0, 3),
+            "elapsed_s": round(time.perf_counter() - started, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分页采集论文元数据并写出 JSONL")
+    parser.add_argument("source", choices=sorted(SOURCES), help="数据源（工具名）")
+    parser.add_argument("query", help="检索词")
+    parser.add_argument("-o", "--output", default="corpus.jsonl", help="输出 JSONL 文件")
+    parser.add_argument("--export", metavar="DIR", help="改为写入分区数据集目录（Parquet，未安装 pyarrow 时为 JSONL）")
+    parser.add_argument("--format", choices=["parquet", "jsonl"], help="--export 的文件格式")
+    parser.add_argument("--max", type=int, default=1000, help="最多采集的记录数，默认 1000")
+    parser.add_argument("--page-size", type=int, default=50, help="每页条数，默认 50")
+    parser.add_argument("--db", default="pubmed", help="entrez_search 使用的数据库，默认 pubmed")
+    parser.add_argument("--no-prefetch", action="store_true", help="不预取下一页（用于对比）")
+    parser.add_argument("--stand-in", action="store_true", help="使用本地替身服务，不访问真实 MCP")
+    opts = parser.parse_args()
+
+    setup_logging()
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    client = None
+    if opts.stand_in:
+        from mcp_standin import StandInMCPClient
+        spec = SOURCES[opts.source]
+        client = StandInMCPClient(spec.port, spec.service_name)
+
+    options = dict(page_size=opts.page_size, max_records=opts.max, client=client, db=opts.db,
+                   prefetch=not opts.no_prefetch)
+    if opts.export:
+        from corpus_export import export_records
+        stats = asyncio.run(export_records(opts.source, opts.query, opts.export, opts.format, **options))
+        logger.info("🏁 %s -> %s", stats, opts.export)
+        return
+    stats = asyncio.run(export_jsonl(opts.source, opts.query, opts.output, **options))
+    logger.info("🏁 共 %d 条，首条 %.2fs，总耗时 %.2fs -> %s",
+                stats["records"], stats["first_record_s"], stats["elapsed_s"], opts.output)
+
+
+if __name__ == "__main__":
+    main()
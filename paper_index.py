@@ -0,0 +1,342 @@
+"""
+本地论文全文索引
+作用：把各工具返回的论文记录（规范化为 PaperRecord）持续写入本地 SQLite FTS5 索引，
+为 Claude 提供 local_search 工具；开启 local_first 时，检索类工具先查本地索引，
+完全匹配的结果足够多就不再请求网络
+
+写入是增量、批量的：记录先进入内存缓冲，攒够 batch_size 条或 run 结束时在一个事务里写入；
+同一篇论文（PaperRecord.key() 相同）再次出现时只补全缺失字段
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+from agent_logging import get_logger, setup_logging
+from metrics import LOCAL_PRECHECK, PAPER_INDEX_LATENCY
+from paper_records import PaperRecord
+
+logger = get_logger("paper_index")
+
+# 缓冲中的记录达到这个数量时写入
+DEFAULT_BATCH = 200
+# 本地完全匹配的结果至少有这么多条（且不少于本次请求的条数）才跳过网络
+MIN_HITS = 5
+# 返回给 Claude 的摘要长度
+ABSTRACT_CHARS = 500
+# 可以用本地索引预先回答的检索工具：工具名 -> (检索词参数, 条数参数, 默认条数)
+PRECHECK_TOOLS = {
+    "crossref_search": ("query", "rows", 5),
+    "deep_research": ("searchQuery", "count", 10),
+    "arxiv_search_by_abstract": ("key", "pageSize", 10),
+    "arxiv_search_by_title": ("key", None, 1),
+}
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = {"a", "an", "and", "the", "of", "in", "on", "for", "to", "with", "by", "or", "at", "from"}
+_FIELDS = ("source", "title", "authors", "year", "doi", "arxiv_id", "pmid", "pmcid", "abstract", "url", "citations")
+
+
+def fts_query(text: str, match_all: bool = True) -> Optional[str]:
+    """把自由文本转成 FTS5 查询：每个词加引号（避免语法字符），match_all 时要求全部出现，否则任一出现"""
+    terms = [t for t in _TERM.findall(text.lower()) if t not in _STOPWORDS]
+    if not terms:
+        return None
+    return (" " if match_all else " OR ").join(f'"{t}"' for t in dict.fromkeys(terms))
+
+
+class PaperIndex:
+    """
+    基于 SQLite FTS5 的论文索引
+    与 ResultCache 一样，同步方法直接访问数据库；在事件循环里请使用 a 开头的方法
+    """
+
+    def __init__(self, path: str = ".cache/papers.sqlite", batch_size: int = DEFAULT_BATCH,
+                 min_hits: int = MIN_HITS):
+        """
+        :param path: 索引文件路径
+        :param batch_size: 缓冲多少条记录后写入一次
+        :param min_hits: local_first 预查时，完全匹配的结果至少要有几条才跳过网络
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.min_hits = min_hits
+        self._pending: List[PaperRecord] = []
+        self._lock = threading.Lock()
+        self.ingested = 0
+        self.flushes = 0
+        self.flush_ms = 0.0
+        self.precheck_hits = 0
+        self.precheck_misses = 0
+        self._query_ms: deque = deque(maxlen=1000)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS papers (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                source TEXT NOT NULL,
+                title TEXT NOT NULL,
+                authors TEXT NOT NULL DEFAULT '',
+                year INTEGER,
+                doi TEXT,
+                arxiv_id TEXT,
+                pmid TEXT,
+                pmcid TEXT,
+                abstract TEXT,
+                url TEXT,
+                citations INTEGER,
+                sources TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+                title, authors, abstract, content='papers', content_rowid='id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS papers_ai AFTER INSERT ON papers BEGIN
+                INSERT INTO papers_fts (rowid, title, authors, abstract)
+                VALUES (new.id, new.title, new.authors, COALESCE(new.abstract, ''));
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_ad AFTER DELETE ON papers BEGIN
+                INSERT INTO papers_fts (papers_fts, rowid, title, authors, abstract)
+                VALUES ('delete', old.id, old.title, old.authors, COALESCE(old.abstract, ''));
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_au AFTER UPDATE ON papers BEGIN
+                INSERT INTO papers_fts (papers_fts, rowid, title, authors, abstract)
+                VALUES ('delete', old.id, old.title, old.authors, COALESCE(old.abstract, ''));
+                INSERT INTO papers_fts (rowid, title, authors, abstract)
+                VALUES (new.id, new.title, new.authors, COALESCE(new.abstract, ''));
+            END;
+            """
+        )
+
+    # ========== 写入 ==========
+    def add(self, records: Iterable[PaperRecord]) -> int:
+        """加入写入缓冲，返回缓冲中的记录数；同一篇论文的多条记录写入时依次合并"""
+        with self._lock:
+            self._pending.extend(records)
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """把缓冲中的记录在一个事务里写入索引，返回写入条数"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            records, self._pending = self._pending, []
+            started = time.perf_counter()
+            now = time.time()
+            rows = [(r.key(), r.source, r.title, "; ".join(r.authors), r.year, r.doi, r.arxiv_id, r.pmid,
+                     r.pmcid, r.abstract, r.url, r.citations, r.source, now, now) for r in records]
+            self._conn.execute("BEGIN")
+            try:
+                # 已有的论文只补全缺失字段，摘要保留较长的一份，来源追加到 sources
+                self._conn.executemany(
+                    """
+                    INSERT INTO papers (key, source, title, authors, year, doi, arxiv_id, pmid, pmcid,
+                                        abstract, url, citations, sources, first_seen, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        authors = CASE WHEN papers.authors = '' THEN excluded.authors ELSE papers.authors END,
+                        year = COALESCE(papers.year, excluded.year),
+                        doi = COALESCE(papers.doi, excluded.doi),
+                        arxiv_id = COALESCE(papers.arxiv_id, excluded.arxiv_id),
+                        pmid = COALESCE(papers.pmid, excluded.pmid),
+                        pmcid = COALESCE(papers.pmcid, excluded.pmcid),
+                        abstract = CASE WHEN LENGTH(COALESCE(excluded.abstract, '')) > LENGTH(COALESCE(papers.abstract, ''))
+                                        THEN excluded.abstract ELSE papers.abstract END,
+                        url = COALESCE(papers.url, excluded.url),
+                        citations = COALESCE(excluded.citations, papers.citations),
+                        sources = CASE WHEN INSTR(',' || papers.sources || ',', ',' || excluded.source || ',') > 0
+                                       THEN papers.sources ELSE papers.sources || ',' || excluded.source END,
+                        updated_at = excluded.updated_at
+                    """,
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            elapsed = time.perf_counter() - started
+        self.ingested += len(records)
+        self.flushes += 1
+        self.flush_ms += elapsed * 1000
+        PAPER_INDEX_LATENCY.labels("flush").observe(elapsed)
+        logger.debug("📚 索引写入 %d 条，耗时 %.1fms", len(records), elapsed * 1000)
+        return len(records)
+
+    # ========== 查询 ==========
+    def search(self, query: str, limit: int = 10, year_from: Optional[int] = None,
+               match_all: bool = True) -> List[Dict[str, Any]]:
+        """按相关度（bm25，标题权重最高）返回匹配的论文"""
+        expression = fts_query(query, match_all)
+        if expression is None:
+            return []
+        started = time.perf_counter()
+        sql = (
+            "SELECT p.key, p.title, p.authors, p.year, p.doi, p.arxiv_id, p.pmid, p.pmcid, p.abstract, p.url, "
+            "p.citations, p.sources, bm25(papers_fts, 10.0, 2.0, 1.0) AS rank "
+            "FROM papers_fts JOIN papers p ON p.id = papers_fts.rowid WHERE papers_fts MATCH ?"
+        )
+        params: List[Any] = [expression]
+        if year_from:
+            sql += " AND p.year >= ?"
+            params.append(year_from)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - started
+        self._query_ms.append(elapsed * 1000)
+        PAPER_INDEX_LATENCY.labels("search").observe(elapsed)
+
+        results = []
+        for key, title, authors, year, doi, arxiv_id, pmid, pmcid, abstract, url, citations, sources, rank in rows:
+            item = {"key": key, "title": title, "authors": authors.split("; ") if authors else [], "year": year,
+                    "doi": doi, "arxiv_id": arxiv_id, "pmid": pmid, "pmcid": pmcid, "url": url,
+                    "citations": citations, "sources": sources.split(","), "score": round(-rank, 3)}
+            if abstract:
+                item["abstract"] = abstract if len(abstract) <= ABSTRACT_CHARS else abstract[:ABSTRACT_CHARS] + "…"
+            results.append({k: v for k, v in item.items() if v is not None})
+        return results
+
+    def local_search(self, query: str, limit: int = 10, year_from: Optional[int] = None) -> Dict[str, Any]:
+        """local_search 工具：先要求全部检索词出现，不够 limit 条时用任一词匹配补足"""
+        self.flush()
+        results = self.search(query, limit, year_from, match_all=True)
+        if len(results) < limit:
+            seen = {r["key"] for r in results}
+            results += [r for r in self.search(query, limit, year_from, match_all=False)
+                        if r["key"] not in seen][:limit - len(results)]
+        return {"query": query, "indexed": self.count(), "returned": len(results), "results": results}
+
+    def precheck(self, tool_name: str, tool_input: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        local_first 预查：检索词全部出现的本地结果不少于 max(min_hits, 请求条数) 时返回这些结果，
+        否则返回 None，照常请求网络
+        """
+        spec = PRECHECK_TOOLS.get(tool_name)
+        query = tool_input.get(spec[0]) if spec else None
+        if not isinstance(query, str):
+            return None
+        self.flush()
+        wanted = int(tool_input.get(spec[1]) or spec[2]) if spec[1] else spec[2]
+        needed = max(self.min_hits, wanted)
+        hits = self.search(query, needed, match_all=True)
+        if len(hits) < needed:
+            self.precheck_misses += 1
+            LOCAL_PRECHECK.labels(tool_name, "miss").inc()
+            return None
+        self.precheck_hits += 1
+        LOCAL_PRECHECK.labels(tool_name, "hit").inc()
+        return {
+            "source": "local_index",
+            "query": query,
+            "note": f"本地索引中已有 {len(hits)} 篇包含全部检索词的论文，本次未联网；"
+                    "需要更多或更新的结果时请换用其他检索词或数据源",
+            "results": hits[:wanted],
+        }
+
+    # ========== 统计 ==========
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        size = sum(os.path.getsize(self.path + suffix) for suffix in ("", "-wal")
+                   if os.path.exists(self.path + suffix))
+        latencies = sorted(self._query_ms)
+        checks = self.precheck_hits + self.precheck_misses
+        return {
+            "papers": self.count(),
+            "file_bytes": size,
+            "ingested": self.ingested,
+            "flushes": self.flushes,
+            "avg_flush_ms": round(self.flush_ms / self.flushes, 2) if self.flushes else 0.0,
+            "queries": len(latencies),
+            "p50_query_ms": round(latencies[len(latencies) // 2], 2) if latencies else 0.0,
+            "p95_query_ms": round(latencies[int(len(latencies) * 0.95)], 2) if latencies else 0.0,
+            "precheck_hit_rate": round(self.precheck_hits / checks, 4) if checks else 0.0,
+        }
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    # ========== 异步接口 ==========
+    async def aadd(self, records: Iterable[PaperRecord]):
+        """加入缓冲；攒够 batch_size 条时在线程池中写入"""
+        if self.add(records) >= self.batch_size:
+            await asyncio.to_thread(self.flush)
+
+    async def aflush(self) -> int:
+        return await asyncio.to_thread(self.flush)
+
+    async def alocal_search(self, query: str, limit: int = 10, year_from: Optional[int] = None) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.local_search, query, limit, year_from)
+
+    async def aprecheck(self, tool_name: str, tool_input: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if tool_name not in PRECHECK_TOOLS:
+            return None
+        return await asyncio.to_thread(self.precheck, tool_name, tool_input)
+
+
+def _ingest_jsonl(index: PaperIndex, path: str) -> int:
+    """导入 paginate.py 导出的 JSONL 语料"""
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                index.add([PaperRecord(**{k: data.get(k) for k in _FIELDS if k in data})])
+                count += 1
+                if count % index.batch_size == 0:
+                    index.flush()
+    index.flush()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地论文索引：导入、检索、统计")
+    parser.add_argument("--index", default=".cache/papers.sqlite", help="索引文件路径")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="导入 paginate.py 导出的 JSONL 语料")
+    ingest.add_argument("files", nargs="+")
+    search = sub.add_parser("search", help="检索本地索引")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=10)
+    search.add_argument("--year-from", type=int)
+    sub.add_parser("stats", help="索引大小与查询耗时")
+    opts = parser.parse_args()
+
+    setup_logging()
+    index = PaperIndex(opts.index)
+    try:
+        if opts.command == "ingest":
+            for path in opts.files:
+                started = time.perf_counter()
+                count = _ingest_jsonl(index, path)
+                logger.info("📥 %s：%d 条，耗时 %.2fs", path, count, time.perf_counter() - started)
+            logger.info("📊 %s", index.stats())
+        elif opts.command == "search":
+            result = index.local_search(opts.query, opts.limit, opts.year_from)
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+            logger.info("⏱️ 查询耗时 %.2fms", index._query_ms[-1] if index._query_ms else 0.0)
+        else:
+            print(json.dumps(index.stats(), ensure_ascii=False, indent=2))
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
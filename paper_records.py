@@ -0,0 +1,177 @@
+"""
+论文记录规范化
+作用：把各 MCP 服务形状各异的返回（Crossref 的 message.items、集思谱/arXiv 的 data.data、
+Entrez ESummary 的 result）统一成同一种 PaperRecord，供分页采集、导出和本地索引使用
+"""
+import re
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+_YEAR = re.compile(r"(19|20)\d{2}")
+
+
+@dataclass
+class PaperRecord:
+    """一篇论文的规范化元数据；缺失的字段为 None / 空列表"""
+    source: str
+    title: str
+    authors: List[str] = field(default_factory=list)
+    year: Optional[int] = None
+    doi: Optional[str] = None
+    arxiv_id: Optional[str] = None
+    pmid: Optional[str] = None
+    pmcid: Optional[str] = None
+    abstract: Optional[str] = None
+    url: Optional[str] = None
+    citations: Optional[int] = None
+
+    def key(self) -> str:
+        """去重用的标识：DOI > arXiv ID > PMID/PMCID > 规范化标题"""
+        if self.doi:
+            return "doi:" + self.doi.lower()
+        if self.arxiv_id:
+            return "arxiv:" + re.sub(r"v\d+$", "", self.arxiv_id)
+        if self.pmid:
+            return "pmid:" + self.pmid
+        if self.pmcid:
+            return "pmc:" + self.pmcid.upper()
+        return "title:" + re.sub(r"\W+", " ", self.title.lower()).strip()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _year(value: Any) -> Optional[int]:
+    if isinstance(value, int):
+        return value
+    match = _YEAR.search(str(value or ""))
+    return int(match.group(0)) if match else None
+
+
+def _authors(value: Any) -> List[str]:
+    """兼容 "A, B, C" 字符串、字符串列表和 [{"name"}] / [{"given", "family"}] 列表"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [a.strip() for a in value.split(",") if a.strip()]
+    names = []
+    for author in value:
+        if isinstance(author, dict):
+            name = author.get("name") or " ".join(
+                p for p in (author.get("given"), author.get("family")) if p)
+        else:
+            name = str(author)
+        if name:
+            names.append(name.strip())
+    return names
+
+
+def _strip_arxiv(value: Any) -> Optional[str]:
+    if not value:
+        return None
+    return str(value).strip().replace("arXiv:", "").replace("arxiv:", "") or None
+
+
+def from_crossref(item: Dict[str, Any]) -> PaperRecord:
+    """Crossref search_works 返回的 message.items 中的一项"""
+    title = item.get("title") or [""]
+    date = (item.get("published") or item.get("issued") or {}).get("date-parts") or [[None]]
+    return PaperRecord(
+        source="crossref",
+        title=(title[0] if isinstance(title, list) and title else str(title or "")).strip(),
+        authors=_authors(item.get("author")),
+        year=_year(date[0][0] if date and date[0] else None),
+        doi=item.get("DOI"),
+        abstract=item.get("abstract"),
+        url=item.get("URL"),
+        citations=item.get("is-referenced-by-count"),
+    )
+
+
+def from_giiisp(item: Dict[str, Any], source: str) -> PaperRecord:
+    """集思谱 DeepResearch / arXiv 系列服务返回的 data.data 中的一项"""
+    return PaperRecord(
+        source=source,
+        title=str(item.get("title") or "").strip(),
+        authors=_authors(item.get("authors")),
+        year=_year(item.get("year")),
+        doi=item.get("doi") or None,
+        # 个别服务拼成了 arvixNo
+        arxiv_id=_strip_arxiv(item.get("arxivNo") or item.get("arvixNo")),
+        abstract=item.get("abstractText") or item.get("paperAbstract"),
+        url=item.get("link") or None,
+        citations=item.get("citationCount"),
+    )
+
+
+def from_esummary(entry: Dict[str, Any], db: str) -> PaperRecord:
+    """Entrez ESummary 返回的 result[uid]"""
+    uid = str(entry.get("uid", ""))
+    doi = next((a.get("value") for a in entry.get("articleids") or []
+                if isinstance(a, dict) and a.get("idtype") == "doi"), None)
+    is_pmc = db == "pmc"
+    return PaperRecord(
+        source=f"entrez:{db}",
+        title=str(entry.get("title") or "").strip(),
+        authors=_authors(entry.get("authors")),
+        year=_year(entry.get("pubdate") or entry.get("sortpubdate")),
+        doi=doi,
+        pmid=None if is_pmc else uid,
+        pmcid=f"PMC{uid}" if is_pmc else None,
+        url=f"https://www.ncbi.nlm.nih.gov/{'pmc/articles/PMC' if is_pmc else 'pubmed/'}{uid}" if uid else None,
+    )
+
+
+def from_bioc(item: Dict[str, Any]) -> PaperRecord:
+    """BioC get_article_info 的返回：平铺的 title/abstract/authors，或 BioC documents[].passages[]"""
+    title = item.get("title")
+    abstract = item.get("abstract")
+    documents = [d for d in item.get("documents") or [] if isinstance(d, dict)]
+    for document in documents:
+        for passage in document.get("passages") or []:
+            section = ((passage.get("infons") or {}).get("section_type") or "").upper()
+            if section == "TITLE" and not title:
+                title = passage.get("text")
+            elif section == "ABSTRACT" and not abstract:
+                abstract = passage.get("text")
+    pmcid = str(item.get("id") or "").strip().upper() or None
+    if pmcid and not pmcid.startswith("PMC"):
+        pmcid = f"PMC{pmcid}"
+    return PaperRecord(
+        source="bioc",
+        title=str(title or "").strip(),
+        authors=_authors(item.get("authors")),
+        year=_year(item.get("year") or item.get("date")),
+        doi=item.get("doi") or None,
+        pmcid=pmcid,
+        abstract=abstract,
+        url=f"https://www.ncbi.nlm.nih.gov/pmc/articles/{pmcid}" if pmcid else None,
+    )
+
+
+_GIIISP_SOURCES = {"deep_research": "deep_research", "arxiv_search_by_abstract": "arxiv",
+                   "arxiv_search_by_title": "arxiv", "arxiv_search_by_id": "arxiv"}
+
+
+def records_from_result(tool_name: str, tool_input: Dict[str, Any], result: Any) -> List[PaperRecord]:
+    """从一次工具结果（Claude 工具名）中取出全部论文记录；不认识的形状返回空列表，没有标题的记录丢弃"""
+    if not isinstance(result, dict):
+        return []
+    records: List[PaperRecord] = []
+    if tool_name == "crossref_search":
+        records = [from_crossref(i) for i in (result.get("message") or {}).get("items") or [] if isinstance(i, dict)]
+    elif tool_name in _GIIISP_SOURCES:
+        papers = (result.get("data") or {}).get("data") or []
+        records = [from_giiisp(p, _GIIISP_SOURCES[tool_name]) for p in papers if isinstance(p, dict)]
+    elif tool_name == "bioc_get_article":
+        records = [from_bioc(result)]
+    elif tool_name in ("arxiv_search_by_ids", "bioc_get_articles", "entrez_summary"):
+        single = {"arxiv_search_by_ids": "arxiv_search_by_id", "bioc_get_articles": "bioc_get_article"}
+        for item in result.get("results") or []:
+            if not item.get("ok"):
+                continue
+            if tool_name == "entrez_summary":
+                records.append(from_esummary(item["data"], tool_input.get("db", "pubmed")))
+            else:
+                records.extend(records_from_result(single[tool_name], {}, item["data"]))
+    return [r for r in records if r.title]
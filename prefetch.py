@@ -0,0 +1,230 @@
+"""
+工具结果推测预取
+作用：Claude 拿到 deep_research / arxiv_search_by_abstract 等检索结果后，下一轮常常会对其中的
+arXiv ID 调 arxiv_search_by_id、对 PMC ID 调 bioc_get_article。预取器在检索结果返回时就从中提取
+这些 ID / DOI，在后台把“可能的下一次调用”提前请求好并写入工具结果缓存，
+下一轮真正调用时直接命中缓存（或等待正在进行的预取），省掉一次冷调用
+
+预取受三层限制：全局并发数、每个 run 的预取预算、每条结果最多展开的候选数
+命中率看 agent_prefetch_total{result="used"|"joined"} 与 {result="fetched"} 的比值，或 stats()
+"""
+import asyncio
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from agent_logging import get_logger
+from metrics import PREFETCH
+from result_cache import ResultCache, cache_key
+
+logger = get_logger("prefetch")
+
+# 只对检索类工具的结果做预取；按 ID 精确查找的工具本身就是预取目标
+FOLLOWUP_SOURCES = {"deep_research", "arxiv_search_by_abstract", "arxiv_search_by_title",
+                    "crossref_search", "entrez_search"}
+
+_ARXIV_IN_TEXT = re.compile(r"arXiv:\s*(\d{4}\.\d{4,5}(?:v\d+)?)", re.IGNORECASE)
+_ARXIV_ID = re.compile(r"^(?:arXiv:\s*)?(\d{4}\.\d{4,5}(?:v\d+)?)$", re.IGNORECASE)
+_PMC_IN_TEXT = re.compile(r"\bPMC\d{4,9}\b")
+_DOI = re.compile(r"^10\.\d{4,9}/\S+$")
+
+_ARXIV_KEYS = {"arxivNo", "arxivId", "arxiv_id", "arxiv"}
+_PMC_KEYS = {"pmcid", "pmcId", "PMCID", "pmc", "pmc_id"}
+_DOI_KEYS = {"doi", "DOI"}
+# 参考文献列表里的 DOI 不是“本次检索的结果”，Claude 很少逐条追查
+_SKIP_KEYS = {"reference", "references"}
+
+# 检索类工具控制返回条数的参数及其默认值（与 claude_agent.py 中的工具定义一致）
+PAGE_PARAMS: Dict[str, Tuple[str, int]] = {
+    "crossref_search": ("rows", 5),
+    "deep_research": ("count", 10),
+    "arxiv_search_by_abstract": ("pageSize", 10),
+    "openlibrary_search": ("limit", 5),
+    "entrez_search": ("retmax", 10),
+    "local_search": ("limit", 10),
+}
+
+Followup = Tuple[str, Dict[str, Any]]
+
+
+def canonical_input(tool_name: str, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    规范化工具参数，让“同一个请求”的不同写法落到同一个缓存 key：
+    arXiv ID 去掉 arXiv: 前缀，PMC ID 补全前缀，检索类工具补上默认的返回条数
+    """
+    if tool_name == "arxiv_search_by_id" and isinstance(tool_input.get("key"), str):
+        match = _ARXIV_ID.match(tool_input["key"].strip())
+        if match:
+            return {**tool_input, "key": match.group(1)}
+    elif tool_name == "bioc_get_article" and isinstance(tool_input.get("id"), str):
+        pmc = tool_input["id"].strip().upper()
+        return {**tool_input, "id": pmc if pmc.startswith("PMC") else f"PMC{pmc}"}
+    elif tool_name in PAGE_PARAMS and PAGE_PARAMS[tool_name][0] not in tool_input:
+        param, default = PAGE_PARAMS[tool_name]
+        return {**tool_input, param: default}
+    return tool_input
+
+
+def extract_followups(tool_name: str, tool_input: Dict[str, Any], result: Any) -> List[Followup]:
+    """
+    从一次工具结果中按出现顺序提取可能的后续调用，去重
+    arXiv / PMC 在前（Claude 追查最多的两类），DOI 在后
+    """
+    if tool_name not in FOLLOWUP_SOURCES:
+        return []
+    arxiv: Dict[str, None] = {}
+    pmc: Dict[str, None] = {}
+    dois: Dict[str, None] = {}
+
+    if tool_name == "entrez_search" and tool_input.get("db") == "pmc" and isinstance(result, dict):
+        # PMC 库的 ESearch 返回不带前缀的数字 ID
+        for pmc_id in (result.get("esearchresult") or {}).get("idlist") or []:
+            pmc[f"PMC{pmc_id}"] = None
+
+    def walk(node: Any):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in _SKIP_KEYS:
+                    continue
+                if isinstance(value, str):
+                    value = value.strip()
+                    if key in _ARXIV_KEYS:
+                        match = _ARXIV_ID.match(value)
+                        if match:
+                            arxiv[match.group(1)] = None
+                            continue
+                    elif key in _PMC_KEYS and value:
+                        pmc[value.upper() if value.upper().startswith("PMC") else f"PMC{value}"] = None
+                        continue
+                    elif key in _DOI_KEYS and _DOI.match(value):
+                        dois[value] = None
+                        continue
+                walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+        elif isinstance(node, str):
+            for match in _ARXIV_IN_TEXT.finditer(node):
+                arxiv[match.group(1)] = None
+            for match in _PMC_IN_TEXT.finditer(node):
+                pmc[match.group(0)] = None
+
+    walk(result)
+    followups: List[Followup] = [("arxiv_search_by_id", {"key": a}) for a in arxiv]
+    followups += [("bioc_get_article", {"id": p}) for p in pmc]
+    if tool_name != "crossref_search":
+        # crossref 结果里已经有这些 DOI 的完整元数据
+        followups += [("crossref_search", {"query": d, "rows": 5}) for d in dois]
+    return followups
+
+
+class SpeculativePrefetcher:
+    """
+    :param cache: 预取结果写入的工具结果缓存（必需）
+    :param concurrency: 全局同时进行的预取请求数
+    :param budget_per_run: 每个 run 最多发起的预取请求数
+    :param per_result: 每条工具结果最多展开的候选数（按结果中的排序取前几个）
+    """
+
+    # 记录“由预取写入、尚未被真实调用用到”的 key 数量上限，防止常驻进程中无限增长
+    MAX_TRACKED = 10000
+
+    def __init__(self, cache: ResultCache, concurrency: int = 4, budget_per_run: int = 20, per_result: int = 5):
+        if cache is None:
+            raise ValueError("推测预取需要工具结果缓存（result_cache）")
+        self.cache = cache
+        self.budget_per_run = budget_per_run
+        self.per_result = per_result
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # 正在进行的预取：缓存 key -> 任务，真实调用到来时可以直接等待它
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        # 预取写入的 key -> 请求耗时（毫秒），第一次被真实调用用到时移除
+        self._prefetched: "OrderedDict[str, float]" = OrderedDict()
+        self.counts = {"scheduled": 0, "fetched": 0, "failed": 0, "cached": 0, "budget": 0,
+                       "used": 0, "joined": 0}
+        self.saved_ms = 0.0
+
+    def schedule(self, ctx, tool_name: str, tool_input: Dict[str, Any], result: Any,
+                 fetch: Callable[[str, Dict[str, Any]], Awaitable[Any]]):
+        """
+        根据一次工具结果安排后台预取，不等待
+        :param ctx: 当前 run 的 RunContext，预算记在 ctx.prefetched 上
+        :param fetch: 实际请求函数 (tool_name, tool_input) -> 结果，一般是代理的 _call_mcp
+        """
+        for followup_tool, followup_input in extract_followups(tool_name, tool_input, result)[:self.per_result]:
+            key = cache_key(followup_tool, followup_input)
+            if key in self._in_flight or key in self._prefetched:
+                continue
+            if ctx.prefetched >= self.budget_per_run:
+                self.counts["budget"] += 1
+                PREFETCH.labels(followup_tool, "budget").inc()
+                continue
+            ctx.prefetched += 1
+            self.counts["scheduled"] += 1
+            task = asyncio.create_task(self._prefetch(key, followup_tool, followup_input, fetch),
+                                       name=f"prefetch:{followup_tool}")
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _, key=key: self._in_flight.pop(key, None))
+
+    async def _prefetch(self, key: str, tool_name: str, tool_input: Dict[str, Any], fetch) -> Any:
+        async with self._semaphore:
+            expires_at = await asyncio.to_thread(self.cache.expires_at, tool_name, tool_input)
+            if expires_at is not None and expires_at > time.time():
+                self.counts["cached"] += 1
+                PREFETCH.labels(tool_name, "cached").inc()
+                return None
+            started = time.perf_counter()
+            try:
+                value = await fetch(tool_name, tool_input)
+            except Exception as e:
+                value = None
+                logger.debug("🔮 预取 %s %s 失败: %s", tool_name, tool_input, e)
+            fetch_ms = (time.perf_counter() - started) * 1000
+            # 空结果和被截断的结果（不写入缓存）都算失败
+            if (not value or not isinstance(value, (dict, list, str))
+                    or not await self.cache.aput(tool_name, tool_input, value, fetch_ms=fetch_ms)):
+                self.counts["failed"] += 1
+                PREFETCH.labels(tool_name, "failed").inc()
+                return None
+            self._prefetched[key] = fetch_ms
+            while len(self._prefetched) > self.MAX_TRACKED:
+                self._prefetched.popitem(last=False)
+            self.counts["fetched"] += 1
+            PREFETCH.labels(tool_name, "fetched").inc()
+            logger.debug("🔮 已预取 %s %s (%.0fms)", tool_name, tool_input, fetch_ms)
+            return value
+
+    async def join(self, tool_name: str, tool_input: Dict[str, Any]) -> Optional[Any]:
+        """真实调用到来时若同一请求正在预取，等待并返回其结果；否则返回 None"""
+        key = cache_key(tool_name, tool_input)
+        task = self._in_flight.get(key)
+        if task is None:
+            return None
+        value = await asyncio.shield(task)
+        if value is not None:
+            self._prefetched.pop(key, None)
+            self.counts["joined"] += 1
+            PREFETCH.labels(tool_name, "joined").inc()
+        return value
+
+    def record_hit(self, tool_name: str, tool_input: Dict[str, Any]):
+        """真实调用命中缓存时调用：若该条目是预取写入的，计入命中"""
+        fetch_ms = self._prefetched.pop(cache_key(tool_name, tool_input), None)
+        if fetch_ms is not None:
+            self.counts["used"] += 1
+            self.saved_ms += fetch_ms
+            PREFETCH.labels(tool_name, "used").inc()
+
+    def stats(self) -> Dict[str, Any]:
+        fetched = self.counts["fetched"]
+        useful = self.counts["used"] + self.counts["joined"]
+        return {**self.counts, "hit_rate": round(useful / fetched, 4) if fetched else 0.0,
+                "saved_ms": round(self.saved_ms, 1)}
+
+    async def aclose(self):
+        """取消所有尚未完成的预取"""
+        tasks = list(self._in_flight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -4,6 +4,7 @@
 import asyncio
 import sys
 from mcp_sdk import GiiispMCPClient
+from agent_logging import setup_logging
 
 if sys.platform == "win32":
     try:
@@ -27,4 +28,6 @@ if __name__ == "__main__":
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
+    setup_logging()
+
     asyncio.run(quick_test())
@@ -0,0 +1,167 @@
+"""
+工具结果持久化缓存
+作用：把 MCP 工具的返回数据按（工具名 + 参数）存入本地 SQLite 文件，
+同一台机器上的多个进程可共享同一个缓存文件（WAL 模式），避免重复请求相同的论文数据
+被 max_payload_chars 截断的返回（见 json_payload）不写入缓存，否则之后上限更大的调用也会拿到部分结果
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from json_payload import is_truncated
+
+# 默认缓存一天；学术检索结果变化很慢
+DEFAULT_TTL = 24 * 3600
+
+
+def cache_key(tool_name: str, tool_input: Dict[str, Any]) -> str:
+    """参数按键排序后做哈希，保证同样的调用得到同样的 key"""
+    payload = json.dumps([tool_name, tool_input], ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    基于 SQLite 的工具结果缓存
+    同步方法直接访问数据库（单次读写在毫秒级）；在事件循环里请使用 aget / aput，
+    它们把数据库访问放到线程池，避免多进程写锁竞争时卡住事件循环
+    """
+
+    def __init__(self, path: str = ".cache/tool_results.sqlite", ttl: float = DEFAULT_TTL,
+                 ttl_per_tool: Optional[Dict[str, float]] = None):
+        """
+        :param path: 缓存文件路径
+        :param ttl: 默认有效期（秒）
+        :param ttl_per_tool: 按工具名覆盖有效期，例如 {"deep_research": 3600}
+        """
+        self.path = path
+        self.ttl = ttl
+        self.ttl_per_tool = ttl_per_tool or {}
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tool_results (
+                key TEXT PRIMARY KEY,
+                tool TEXT NOT NULL,
+                args TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                fetch_ms REAL NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+
+    # ========== 同步接口 ==========
+    def get(self, tool_name: str, tool_input: Dict[str, Any], default: Any = None, touch: bool = True) -> Any:
+        """
+        读取未过期的缓存数据，未命中返回 default
+        :param touch: 计入命中次数；维护任务（如预热）读取时传 False，不影响命中统计
+        """
+        key = cache_key(tool_name, tool_input)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM tool_results WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+            if row is not None and touch:
+                self._conn.execute("UPDATE tool_results SET hits = hits + 1 WHERE key = ?", (key,))
+        if not touch:
+            return default if row is None else json.loads(row[0])
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, tool_name: str, tool_input: Dict[str, Any], value: Any,
+            fetch_ms: float = 0.0, ttl: Optional[float] = None) -> bool:
+        """
+        写入缓存
+        :param fetch_ms: 实际请求耗时，用于估算缓存节省的时间
+        :param ttl: 覆盖本条记录的有效期
+        :return: 是否写入；被截断的结果不写入
+        """
+        if is_truncated(value):
+            return False
+        now = time.time()
+        ttl = ttl if ttl is not None else self.ttl_per_tool.get(tool_name, self.ttl)
+        row = (
+            cache_key(tool_name, tool_input),
+            tool_name,
+            json.dumps(tool_input, ensure_ascii=False, sort_keys=True),
+            json.dumps(value, ensure_ascii=False, separators=(",", ":")),
+            now,
+            now + ttl,
+            fetch_ms,
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tool_results (key, tool, args, value, created_at, expires_at, fetch_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+        return True
+
+    def expires_at(self, tool_name: str, tool_input: Dict[str, Any]) -> Optional[float]:
+        """返回缓存条目的过期时间戳，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at FROM tool_results WHERE key = ?", (cache_key(tool_name, tool_input),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def info(self, tool_name: str, tool_input: Dict[str, Any]) -> Optional[Dict[str, float]]:
+        """返回缓存条目的写入时间、过期时间、请求耗时和命中次数（含已过期的条目），不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, expires_at, fetch_ms, hits FROM tool_results WHERE key = ?",
+                (cache_key(tool_name, tool_input),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"created_at": row[0], "expires_at": row[1], "fetch_ms": row[2], "hits": row[3]}
+
+    def purge_expired(self) -> int:
+        """删除过期条目，返回删除数量"""
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM tool_results WHERE expires_at <= ?", (time.time(),))
+        return cur.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM tool_results"
+            ).fetchone()
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "value_bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # ========== 异步接口 ==========
+    async def aget(self, tool_name: str, tool_input: Dict[str, Any], default: Any = None) -> Any:
+        return await asyncio.to_thread(self.get, tool_name, tool_input, default)
+
+    async def aput(self, tool_name: str, tool_input: Dict[str, Any], value: Any,
+                   fetch_ms: float = 0.0, ttl: Optional[float] = None) -> bool:
+        return await asyncio.to_thread(self.put, tool_name, tool_input, value, fetch_ms, ttl)
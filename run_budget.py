@@ -0,0 +1,233 @@
+"""
+run 预算调控
+作用：max_iterations 只限制轮数，不反映一次 run 实际花了多少。RunBudget 为一次 run 设定墙钟时间、
+输入 / 输出 token、每个工具的调用次数和工具结果字节数的上限；BudgetGovernor 随 run 的进展按已用比例逐级收紧：
+
+- 达到 shrink_at：检索类工具请求的返回条数（rows / count / pageSize / limit / retmax）按剩余比例缩小
+- 达到 restrict_at：停用 deep_research 等昂贵工具（不再提供给模型，已发出的调用直接拒绝）
+- 达到 finalize_at：要求模型不再调用工具、直接写出最终回答（tool_choice=none，并在对话中追加说明）
+- 最终回答轮之后 run 仍未结束：以 budget_exhausted 结束
+
+单个工具达到调用次数上限时只停用该工具。输入 token 的已用比例按“已用 + 上一次请求的输入”计算，
+即预估下一轮请求之后的用量，避免最后一轮超出预算。run 结束时 report() 给出各项预算的用量和调控次数
+
+用法：
+    agent = ClaudeAcademicAgent(governor=BudgetGovernor(RunBudget(wall_s=600, tool_calls={"deep_research": 3})))
+    python claude_agent.py --budget "wall_s=600,output_tokens=20000,tool_calls.deep_research=3"
+    python claude_agent.py --budget budget.json
+"""
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from agent_logging import get_logger
+from metrics import BUDGET_ACTIONS
+from prefetch import PAGE_PARAMS
+
+logger = get_logger("budget")
+
+# 达到 restrict_at 后停用的工具：单次调用耗时最长、返回最大
+EXPENSIVE_TOOLS = ("deep_research",)
+# 缩小返回条数时的下限
+MIN_PAGE_SIZE = 3
+# 最终回答轮追加到对话中的说明
+FINAL_NOTE = "（预算即将用尽：请不要再调用任何工具，直接根据已获得的信息写出最终报告。）"
+
+_LIMITS = ("wall_s", "input_tokens", "output_tokens", "result_bytes")
+
+
+@dataclass(frozen=True)
+class RunBudget:
+    """
+    一次 run 的预算，None 表示不限制
+    :param wall_s: 墙钟时间（秒），从 run 开始或从检查点恢复时计（其余各项的用量随检查点累计）
+    :param input_tokens: 全部模型请求的输入 token（含缓存读写部分和被升级丢弃的请求）
+    :param output_tokens: 全部模型请求的输出 token
+    :param tool_calls: 工具名 -> 调用次数上限
+    :param result_bytes: 工具结果的总字节数（UTF-8）
+    :param shrink_at: 已用比例达到该值时缩小返回条数
+    :param restrict_at: 已用比例达到该值时停用 expensive_tools
+    :param finalize_at: 已用比例达到该值时要求最终回答
+    """
+    wall_s: Optional[float] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    tool_calls: Dict[str, int] = field(default_factory=dict)
+    result_bytes: Optional[int] = None
+    shrink_at: float = 0.5
+    restrict_at: float = 0.75
+    finalize_at: float = 0.9
+    expensive_tools: Tuple[str, ...] = EXPENSIVE_TOOLS
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunBudget":
+        unknown = set(data) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"未知的预算项: {', '.join(sorted(unknown))}")
+        data = dict(data)
+        if "tool_calls" in data:
+            data["tool_calls"] = {name: int(n) for name, n in data["tool_calls"].items()}
+        if "expensive_tools" in data:
+            data["expensive_tools"] = tuple(data["expensive_tools"])
+        return cls(**data)
+
+
+def load_budget(spec: str) -> RunBudget:
+    """
+    按 JSON 文件路径或 "key=value,..." 加载预算；工具调用次数写作 tool_calls.<工具名>=N
+    例如 "wall_s=600,output_tokens=20000,tool_calls.deep_research=3"
+    """
+    if os.path.isfile(spec):
+        with open(spec, "r", encoding="utf-8") as f:
+            return RunBudget.from_dict(json.load(f))
+    data: Dict[str, Any] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"预算项应为 key=value 或 JSON 文件路径: {item}")
+        key = key.strip()
+        if key.startswith("tool_calls."):
+            data.setdefault("tool_calls", {})[key[len("tool_calls."):]] = int(value)
+        elif key == "expensive_tools":
+            data[key] = [name.strip() for name in value.split("+") if name.strip()]
+        else:
+            data[key] = float(value) if key in ("wall_s", "shrink_at", "restrict_at", "finalize_at") else int(value)
+    return RunBudget.from_dict(data)
+
+
+@dataclass
+class BudgetState:
+    """一次 run 的预算消耗，保存在 RunContext.budget 上；token 用量直接读 ctx.usage"""
+    # time.monotonic()，run 开始时记录
+    started: Optional[float] = None
+    # 工具名 -> 已放行的调用次数
+    tool_calls: Dict[str, int] = field(default_factory=dict)
+    result_bytes: int = 0
+    # 被缩小返回条数 / 被拒绝的工具调用次数
+    shrunk: int = 0
+    refused: int = 0
+    # 要求最终回答的那一轮
+    final_iteration: Optional[int] = None
+
+
+class BudgetGovernor:
+    """
+    按 RunBudget 调控 run：塑造每次模型请求（可用工具、是否要求最终回答），放行 / 调整 / 拒绝每个工具调用
+    本身不保存状态，可被多个并发 run 共享
+    """
+
+    def __init__(self, budget: RunBudget):
+        self.budget = budget
+
+    def start(self, ctx):
+        if ctx.budget.started is None:
+            ctx.budget.started = time.monotonic()
+
+    def used(self, ctx) -> Dict[str, float]:
+        """各项全局预算的已用量"""
+        iterations = ctx.usage.summary.iterations
+        started = ctx.budget.started
+        return {
+            "wall_s": time.monotonic() - started if started is not None else 0.0,
+            "input_tokens": sum(u.prompt_tokens for u in iterations),
+            "output_tokens": sum(u.output_tokens for u in iterations),
+            "result_bytes": ctx.budget.result_bytes,
+        }
+
+    def pressure(self, ctx) -> float:
+        """各项全局预算中最高的已用比例（输入 token 含下一轮请求的预估）"""
+        used = self.used(ctx)
+        iterations = ctx.usage.summary.iterations
+        if iterations:
+            used["input_tokens"] += iterations[-1].prompt_tokens
+        fractions = [used[name] / limit for name in _LIMITS
+                     for limit in (getattr(self.budget, name),) if limit]
+        return max(fractions, default=0.0)
+
+    def _tool_exhausted(self, ctx, name: str) -> bool:
+        limit = self.budget.tool_calls.get(name)
+        return limit is not None and ctx.budget.tool_calls.get(name, 0) >= limit
+
+    def shape_request(self, ctx, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按当前用量调整一次模型请求：去掉已停用的工具；进入最终回答轮时加 tool_choice=none 并追加说明
+        :param request: 含 tools 和 messages 的请求参数
+        """
+        pressure = self.pressure(ctx)
+        tools = [t for t in request["tools"] if not self._tool_exhausted(ctx, t["name"])
+                 and not (pressure >= self.budget.restrict_at and t["name"] in self.budget.expensive_tools)]
+        # 对话中已有 tool_use 时请求必须带工具定义
+        request = {**request, "tools": tools or request["tools"]}
+        state = ctx.budget
+        if state.final_iteration is None and pressure >= self.budget.finalize_at:
+            state.final_iteration = ctx.iteration
+            BUDGET_ACTIONS.labels("finalize").inc()
+            logger.warning("💰 [预算] run %s 已用 %.0f%%，第 %d 轮要求最终回答", ctx.run_id, pressure * 100,
+                           ctx.iteration)
+            _append_note(ctx.messages, FINAL_NOTE)
+        if state.final_iteration is not None:
+            request["tool_choice"] = {"type": "none"}
+        return request
+
+    def admit(self, ctx, name: str, tool_input: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        放行一个工具调用
+        :return: (可能缩小了返回条数的参数, 拒绝原因)；拒绝原因不为 None 时不执行该调用，原因作为结果交给模型
+        """
+        state = ctx.budget
+        pressure = self.pressure(ctx)
+        refusal = None
+        if self._tool_exhausted(ctx, name):
+            refusal = f"{name} 已达到本次任务的调用次数上限 {self.budget.tool_calls[name]}，请改用其他工具或直接写出回答"
+        elif state.final_iteration is not None or pressure >= self.budget.finalize_at:
+            refusal = "本次任务的预算即将用尽，请不要再调用工具，直接写出最终回答"
+        elif pressure >= self.budget.restrict_at and name in self.budget.expensive_tools:
+            refusal = f"预算已用 {pressure:.0%}，{name} 已停用，请改用其他工具或直接写出回答"
+        if refusal is not None:
+            state.refused += 1
+            BUDGET_ACTIONS.labels("refuse").inc()
+            logger.warning("💰 [预算] 拒绝 %s: %s", name, refusal)
+            return tool_input, refusal
+
+        if pressure >= self.budget.shrink_at and name in PAGE_PARAMS:
+            param, default = PAGE_PARAMS[name]
+            requested = int(tool_input.get(param) or default)
+            size = max(MIN_PAGE_SIZE, round(requested * (1 - pressure)))
+            if size < requested:
+                tool_input = {**tool_input, param: size}
+                state.shrunk += 1
+                BUDGET_ACTIONS.labels("shrink").inc()
+                logger.info("💰 [预算] 已用 %.0f%%，%s 的 %s %d -> %d", pressure * 100, name, param, requested, size)
+        state.tool_calls[name] = state.tool_calls.get(name, 0) + 1
+        return tool_input, None
+
+    def record_result(self, ctx, result: str):
+        ctx.budget.result_bytes += len(result.encode("utf-8"))
+
+    def exhausted(self, ctx) -> bool:
+        """已经给过最终回答的机会，run 仍未结束"""
+        final = ctx.budget.final_iteration
+        return final is not None and ctx.iteration >= final
+
+    def report(self, ctx) -> Dict[str, Any]:
+        """各项预算的用量（used / limit）和调控次数"""
+        used = self.used(ctx)
+        state = ctx.budget
+        report: Dict[str, Any] = {}
+        for name in _LIMITS:
+            value = round(used[name], 3) if name == "wall_s" else used[name]
+            report[name] = {"used": value, "limit": getattr(self.budget, name)}
+        report["tool_calls"] = {name: {"used": state.tool_calls.get(name, 0), "limit": self.budget.tool_calls.get(name)}
+                                for name in sorted(set(state.tool_calls) | set(self.budget.tool_calls))}
+        report.update(shrunk=state.shrunk, refused=state.refused, final_iteration=state.final_iteration)
+        return report
+
+
+def _append_note(messages, note: str):
+    """把说明追加到最后一条 user 消息（通常是上一轮的 tool_result），保持 user / assistant 交替"""
+    last = messages[-1]
+    if isinstance(last["content"], str):
+        last["content"] = [{"type": "text", "text": last["content"]}]
+    last["content"].append({"type": "text", "text": note})
@@ -0,0 +1,226 @@
+"""
+run 检查点存储
+作用：每轮迭代把模型响应和工具结果追加写入本地检查点文件，进程崩溃、API 报错或被 kill 之后，
+可以通过 resume(run_id) 从最后完成的位置继续，已经执行过的工具调用不会重复执行
+
+存储格式：每个 run 一个 <run_id>.jsonl.gz，追加写入，每次写入是一个独立的 gzip 成员；
+崩溃时最后一个成员可能不完整，读取时自动丢弃
+
+压缩、写入和 fsync 由一个专用的写入线程按提交顺序完成，不阻塞事件循环中其他并发 run 的工具调用和模型流；
+record_* 只负责生成事件并排队，需要确认已落盘时调用 flush()（读取前会自动 flush）
+"""
+import asyncio
+import gzip
+import json
+import os
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from agent_logging import get_logger
+from run_budget import BudgetState
+from run_context import RunContext
+
+logger = get_logger("checkpoint")
+
+# 达到 max_tokens 等被截断的 run 恢复时，追加这句话让 Claude 接着写
+CONTINUE_PROMPT = "请从上次中断的地方继续。"
+# 被截断的回复末尾没有执行的 tool_use，恢复时用这条错误结果补齐
+UNFINISHED_TOOL_USE = "回复被截断，这个工具调用没有执行；需要时请重新调用。"
+
+
+def block_to_dict(block: Any) -> Dict[str, Any]:
+    """把 SDK 返回的内容块转换为可序列化、也可直接回传给 API 的字典"""
+    if isinstance(block, dict):
+        return block
+    if block.type == "text":
+        return {"type": "text", "text": block.text}
+    if block.type == "tool_use":
+        return {"type": "tool_use", "id": block.id, "name": block.name, "input": block.input}
+    if hasattr(block, "model_dump"):
+        return block.model_dump(exclude_none=True)
+    return dict(vars(block))
+
+
+class CheckpointStore:
+    """基于目录的检查点存储"""
+
+    def __init__(self, directory: str = ".cache/checkpoints"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # 单线程：同一文件的写入保持提交顺序
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._last: Optional[Future] = None
+        # 已排队写入起点、可能尚未落盘的 run
+        self._started = set()
+
+    def path(self, run_id: str) -> str:
+        return os.path.join(self.directory, f"{run_id}.jsonl.gz")
+
+    def exists(self, run_id: str) -> bool:
+        return run_id in self._started or os.path.isfile(self.path(run_id))
+
+    def _append(self, run_id: str, events: List[Dict[str, Any]]):
+        """把事件交给写入线程，不等待落盘"""
+        self._last = self._writer.submit(self._write, run_id, events)
+
+    def _write(self, run_id: str, events: List[Dict[str, Any]]):
+        try:
+            payload = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n" for e in events)
+            with open(self.path(run_id), "ab") as f:
+                f.write(gzip.compress(payload.encode("utf-8")))
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logger.error("❌ 写入检查点 %s 失败: %s", run_id, e)
+
+    def flush(self):
+        """等待已排队的写入全部落盘"""
+        if self._last is not None:
+            self._last.result()
+
+    async def aflush(self):
+        await asyncio.to_thread(self.flush)
+
+    # ========== 写入 ==========
+    def record_start(self, ctx: RunContext):
+        if self.exists(ctx.run_id):
+            return
+        self._started.add(ctx.run_id)
+        self._append(ctx.run_id, [{"type": "start", "run_id": ctx.run_id,
+                                   "instruction": ctx.instruction, "max_iterations": ctx.max_iterations}])
+
+    def record_response(self, ctx: RunContext, model: str, response: Any, latency_s: float):
+        usage = getattr(response, "usage", None)
+        self._append(ctx.run_id, [{
+            "type": "response",
+            "iteration": ctx.iteration,
+            "model": model,
+            "stop_reason": response.stop_reason,
+            "content": [block_to_dict(b) for b in response.content],
+            "latency_s": latency_s,
+            "usage": {k: getattr(usage, k, 0) or 0 for k in (
+                "input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")},
+            **_budget_snapshot(ctx),
+        }])
+
+    def record_tool_result(self, ctx: RunContext, tool_use_id: str, tool_name: str, content: str):
+        self._append(ctx.run_id, [{"type": "tool_result", "iteration": ctx.iteration,
+                                   "tool_use_id": tool_use_id, "name": tool_name, "content": content,
+                                   **_budget_snapshot(ctx)}])
+
+    def record_final(self, ctx: RunContext):
+        self._append(ctx.run_id, [{"type": "final", "status": ctx.status, "text": ctx.final_text}])
+
+    # ========== 读取 ==========
+    def events(self, run_id: str) -> List[Dict[str, Any]]:
+        """按顺序读取全部完整事件"""
+        self.flush()
+        events = []
+        with open(self.path(run_id), "rb") as f:
+            data = f.read()
+        while data:
+            decomp = zlib.decompressobj(wbits=31)
+            try:
+                chunk = decomp.decompress(data)
+            except zlib.error:
+                break
+            if not decomp.eof:
+                # 最后一次写入没有写完
+                break
+            for line in chunk.decode("utf-8").splitlines():
+                if line:
+                    events.append(json.loads(line))
+            data = decomp.unused_data
+        return events
+
+    def load(self, run_id: str) -> RunContext:
+        """
+        根据检查点重建 RunContext
+        若最后一轮的工具调用只完成了一部分，未完成的 tool_use 记录在 ctx.pending_tool_uses 中，
+        已完成的结果记录在 ctx.completed_tool_results 中，恢复运行时只补齐缺失的部分；
+        配置了预算调控的 run 同时恢复最后记录的预算消耗（ctx.budget）
+        """
+        events = self.events(run_id)
+        if not events or events[0]["type"] != "start":
+            raise ValueError(f"检查点 {run_id} 不完整或已损坏")
+        start = events[0]
+        ctx = RunContext(instruction=start["instruction"], max_iterations=start["max_iterations"], run_id=run_id)
+
+        last_response: Optional[Dict[str, Any]] = None
+        results: Dict[str, str] = {}
+        for event in events[1:]:
+            if "budget" in event:
+                ctx.budget = BudgetState(**event["budget"])
+            if event["type"] == "response":
+                _close_round(ctx, last_response, results)
+                last_response, results = event, {}
+                ctx.iteration = event["iteration"]
+                ctx.usage.record_response(
+                    event["iteration"], event["model"],
+                    SimpleNamespace(usage=SimpleNamespace(**event["usage"]), stop_reason=event["stop_reason"]),
+                    event.get("latency_s", 0.0),
+                )
+            elif event["type"] == "tool_result":
+                results[event["tool_use_id"]] = event["content"]
+                ctx.usage.record_tool_result(event["name"], event["content"])
+            elif event["type"] == "final":
+                ctx.status = event["status"]
+                ctx.final_text = event["text"]
+
+        if last_response is not None and ctx.final_text is None:
+            if last_response["stop_reason"] == "tool_use":
+                # 最后一轮的工具调用可能没跑完
+                ctx.messages.append({"role": "assistant", "content": last_response["content"]})
+                ctx.pending_tool_uses = [b for b in last_response["content"] if b["type"] == "tool_use"]
+                ctx.completed_tool_results = results
+            elif last_response["stop_reason"] == "end_turn":
+                # 已拿到最终回复，只是没来得及写 final
+                _close_round(ctx, last_response, results)
+                ctx.status = "completed"
+                ctx.final_text = "".join(b.get("text", "") for b in last_response["content"] if b["type"] == "text")
+            else:
+                _close_round(ctx, last_response, results)
+        elif ctx.status in ("stopped", "max_iterations", "budget_exhausted") and last_response is not None:
+            # 被截断、达到迭代上限或预算用尽的 run：把最后的回复放回历史，恢复后继续
+            _close_round(ctx, last_response, results)
+            if ctx.status == "budget_exhausted":
+                # 恢复时按（可能调大的）预算重新判断是否进入最终回答轮；已用的调用次数和字节数照常累计
+                ctx.budget.final_iteration = None
+            ctx.status, ctx.final_text = "running", None
+        return ctx
+
+    async def aload(self, run_id: str) -> RunContext:
+        """load() 的异步版本：读取和解压放到线程中执行，不阻塞事件循环"""
+        return await asyncio.to_thread(self.load, run_id)
+
+
+def _budget_snapshot(ctx: RunContext) -> Dict[str, Any]:
+    """配置了预算调控的 run（budget.started 已设置）在事件中附带当前的预算消耗；开始时间不保存，恢复后重新计时"""
+    if ctx.budget.started is None:
+        return {}
+    state = asdict(ctx.budget)
+    del state["started"]
+    return {"budget": state}
+
+
+def _close_round(ctx: RunContext, response: Optional[Dict[str, Any]], results: Dict[str, str]):
+    """把一轮已经结束的响应及其工具结果写回对话历史"""
+    if response is None:
+        return
+    ctx.messages.append({"role": "assistant", "content": response["content"]})
+    if response["stop_reason"] == "tool_use":
+        ctx.messages.append({"role": "user", "content": [
+            {"type": "tool_result", "tool_use_id": b["id"], "content": results.get(b["id"], "")}
+            for b in response["content"] if b["type"] == "tool_use"
+        ]})
+    elif response["stop_reason"] != "end_turn":
+        # max_tokens 截断的回复可能以不完整的 tool_use 结尾；API 要求每个 tool_use 都有对应的 tool_result
+        unfinished = [{"type": "tool_result", "tool_use_id": b["id"], "content": UNFINISHED_TOOL_USE, "is_error": True}
+                      for b in response["content"] if b["type"] == "tool_use"]
+        if unfinished:
+            ctx.messages.append({"role": "user", "content": unfinished + [{"type": "text", "text": CONTINUE_PROMPT}]})
+        else:
+            ctx.messages.append({"role": "user", "content": CONTINUE_PROMPT})
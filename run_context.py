@@ -0,0 +1,42 @@
+"""
+单次 run 的运行上下文
+作用：把对话历史、迭代计数、用量记录等“每次 run 独有”的状态从 ClaudeAcademicAgent 上剥离出来，
+这样同一个代理实例（连同它的 API 客户端、MCP 客户端和缓存）可以安全地并发服务多个 run
+"""
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from run_budget import BudgetState
+from usage_tracker import RunUsageRecorder
+
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+@dataclass
+class RunContext:
+    """一次 run 的全部可变状态"""
+    instruction: str
+    max_iterations: int = 10
+    run_id: str = field(default_factory=new_run_id)
+    # 发送给 messages.create 的对话历史
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    usage: RunUsageRecorder = field(default_factory=RunUsageRecorder)
+    # 已完成的迭代数
+    iteration: int = 0
+    # running / completed / max_iterations / stopped / budget_exhausted / failed
+    status: str = "running"
+    final_text: Optional[str] = None
+    # 从检查点恢复时：最后一轮中尚未执行的 tool_use 块，以及该轮已完成的 tool_use_id -> 结果
+    pending_tool_uses: List[Dict[str, Any]] = field(default_factory=list)
+    completed_tool_results: Dict[str, str] = field(default_factory=dict)
+    # 本 run 已发起的推测预取次数（受 SpeculativePrefetcher.budget_per_run 限制）
+    prefetched: int = 0
+    # 预算消耗（配置了 BudgetGovernor 时使用）
+    budget: BudgetState = field(default_factory=BudgetState)
+
+    def __post_init__(self):
+        if not self.messages:
+            self.messages.append({"role": "user", "content": self.instruction})
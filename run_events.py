@@ -0,0 +1,106 @@
+"""
+run 的事件流
+作用：ClaudeAcademicAgent.run_events / context_events 在 run 进行过程中逐个产出下面这些带类型的事件，
+Web UI、守护进程、批量运行器可以低延迟地展示进度，不必解析日志输出；run() 只是取最后一个 RunFinished 的文本。
+每个事件都带 run_id，to_dict() 得到可直接 JSON 序列化的字典（type 字段为事件类型名）
+
+事件顺序：
+    RunStarted
+    (IterationStarted  TextDelta*  ModelUsage  ([ToolDispatched] ToolCompleted)*)*
+    RunFinished
+复用检查点结果或被预算调控拒绝的工具调用没有 ToolDispatched，只有 reused / refused 为 True 的 ToolCompleted。
+一轮内快模型的响应被升级丢弃时，会先出现一个 discarded=True 的 ModelUsage，之后是强模型的 TextDelta 和 ModelUsage；
+收到 discarded=True 时应丢弃本轮此前收到的 TextDelta
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Any, ClassVar, Dict, Optional
+
+
+@dataclass
+class RunEvent:
+    run_id: str
+    type: ClassVar[str] = "event"
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["type"] = self.type
+        return data
+
+
+@dataclass
+class RunStarted(RunEvent):
+    """run 开始（或从检查点恢复后继续）"""
+    instruction: str
+    # 从检查点恢复时为已完成的迭代数
+    iteration: int = 0
+    type: ClassVar[str] = "run_started"
+
+
+@dataclass
+class IterationStarted(RunEvent):
+    """一轮迭代开始，即将调用模型"""
+    iteration: int
+    model: str
+    tier: str
+    reason: str
+    type: ClassVar[str] = "iteration_started"
+
+
+@dataclass
+class TextDelta(RunEvent):
+    """模型输出的一段文本；流式调用时逐段产出，非流式调用时每个 text 块产出一次"""
+    iteration: int
+    text: str
+    type: ClassVar[str] = "text_delta"
+
+
+@dataclass
+class ModelUsage(RunEvent):
+    """一次模型调用结束：停止原因、token 用量、耗时和成本"""
+    iteration: int
+    model: str
+    stop_reason: Optional[str]
+    input_tokens: int
+    output_tokens: int
+    cache_creation_input_tokens: int
+    cache_read_input_tokens: int
+    latency_s: float
+    cost_usd: float
+    # 快模型的响应被升级丢弃，本轮改用强模型重做
+    discarded: bool = False
+    type: ClassVar[str] = "model_usage"
+
+
+@dataclass
+class ToolDispatched(RunEvent):
+    """开始执行一个工具调用"""
+    iteration: int
+    tool_use_id: str
+    name: str
+    input: Dict[str, Any] = field(default_factory=dict)
+    type: ClassVar[str] = "tool_dispatched"
+
+
+@dataclass
+class ToolCompleted(RunEvent):
+    """工具调用结束：耗时和交给 Claude 的结果字符数"""
+    iteration: int
+    tool_use_id: str
+    name: str
+    elapsed_s: float
+    chars: int
+    # 结果来自检查点（恢复 run 时），没有真正执行
+    reused: bool = False
+    # 被预算调控拒绝，结果是拒绝原因
+    refused: bool = False
+    type: ClassVar[str] = "tool_completed"
+
+
+@dataclass
+class RunFinished(RunEvent):
+    """run 结束：最终状态、回复文本、本 run 的用量汇总和预算用量（配置了预算调控时）"""
+    status: str
+    text: Optional[str]
+    usage: Dict[str, Any] = field(default_factory=dict)
+    budget: Dict[str, Any] = field(default_factory=dict)
+    type: ClassVar[str] = "run_finished"
@@ -0,0 +1,137 @@
+"""
+代理运行剖析（profiling）
+作用：对单次 run 同时采集两类数据，并各自输出为 collapsed-stack 文件（可直接拖进 speedscope 或用 flamegraph.pl 渲染）：
+  1. CPU 采样：后台线程定时抓取事件循环线程的调用栈，栈底附上当前任务所在的迭代 / 工具标签
+  2. 异步耗时：run / 迭代 / 模型调用 / 工具调用等 span 的墙钟时间（自身耗时，微秒），显示哪些 await 占了大头
+
+未启用时 span() 只做一次 ContextVar 读取并返回共享的空上下文，几乎零开销
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# 当前任务所属的剖析器（随 asyncio 任务的 context 自动传递给子任务）
+_ACTIVE: contextvars.ContextVar[Optional["RunProfiler"]] = contextvars.ContextVar("run_profiler", default=None)
+# 当前任务的 span 栈：((标签, 帧记录), ...)
+_SPAN_STACK: contextvars.ContextVar[Tuple] = contextvars.ContextVar("run_profiler_spans", default=())
+
+_NULL_SPAN = contextlib.nullcontext()
+
+# 这些函数位于栈顶时说明事件循环在 select/epoll 中空等
+_IDLE_FUNCS = {"select", "poll", "_poll"}
+
+
+def span(label: str):
+    """
+    标记一段异步代码，用法：with span("tool:crossref_search"): ...
+    没有激活的剖析器时返回空上下文
+    """
+    profiler = _ACTIVE.get()
+    if profiler is None:
+        return _NULL_SPAN
+    return profiler.span(label)
+
+
+class RunProfiler:
+    """单次 run 的剖析器"""
+
+    def __init__(self, output_dir: str, run_name: Optional[str] = None, interval: float = 0.005):
+        """
+        :param output_dir: 输出目录，每次 run 生成 <run_name>.cpu.collapsed 和 <run_name>.wall.collapsed
+        :param run_name: 文件名前缀，默认使用时间戳
+        :param interval: CPU 采样间隔（秒）
+        """
+        self.output_dir = output_dir
+        self.run_name = run_name or time.strftime("run_%Y%m%d_%H%M%S")
+        self.interval = interval
+        self.cpu_samples: Counter = Counter()
+        self.wall_us: Counter = Counter()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._task_stacks: Dict[asyncio.Task, Tuple[str, ...]] = {}
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._token = None
+
+    # ========== 生命周期 ==========
+    def start(self):
+        """在事件循环线程中调用：激活剖析器并启动采样线程"""
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._token = _ACTIVE.set(self)
+        self._sampler = threading.Thread(target=self._sample_loop, name="run-profiler", daemon=True)
+        self._sampler.start()
+
+    def stop(self) -> List[str]:
+        """停止采样并写出文件，返回生成的文件路径"""
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        if self._token is not None:
+            _ACTIVE.reset(self._token)
+            self._token = None
+        return self.write()
+
+    def write(self) -> List[str]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        paths = []
+        for suffix, counter in (("cpu", self.cpu_samples), ("wall", self.wall_us)):
+            path = os.path.join(self.output_dir, f"{self.run_name}.{suffix}.collapsed")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, weight in counter.most_common():
+                    if weight > 0:
+                        f.write(f"{stack} {int(weight)}\n")
+            paths.append(path)
+        return paths
+
+    # ========== 异步耗时 ==========
+    @contextlib.contextmanager
+    def span(self, label: str):
+        parent = _SPAN_STACK.get()
+        frame = [time.perf_counter(), 0.0]  # [开始时间, 子 span 累计耗时]
+        stack = parent + ((label, frame),)
+        token = _SPAN_STACK.set(stack)
+        labels = tuple(name for name, _ in stack)
+        task = asyncio.current_task()
+        previous = self._task_stacks.get(task)
+        self._task_stacks[task] = labels
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - frame[0]
+            # 并发子任务的耗时可能互相重叠，自身耗时最少记为 0
+            self.wall_us[";".join(labels)] += max(0.0, elapsed - frame[1]) * 1_000_000
+            if parent:
+                parent[-1][1][1] += elapsed
+            _SPAN_STACK.reset(token)
+            if previous is None:
+                self._task_stacks.pop(task, None)
+            else:
+                self._task_stacks[task] = previous
+
+    # ========== CPU 采样 ==========
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            names.reverse()
+            top = names[-1].split(" ", 1)[0] if names else ""
+            if top in _IDLE_FUNCS:
+                self.cpu_samples["(idle)"] += 1
+                continue
+            # current_task 只是一次字典读取，在采样线程中读取是安全的
+            task = asyncio.current_task(self._loop)
+            labels = self._task_stacks.get(task, ())
+            self.cpu_samples[";".join(labels + tuple(names))] += 1
@@ -0,0 +1,99 @@
+"""
+代理并发隔离测试
+用途：不访问 Claude API 和 MCP 服务，用假的模型客户端和 MCP 替身，
+验证同一个 ClaudeAcademicAgent 实例同时运行大量 run 时，各 run 的对话历史、结果和用量互不串扰
+
+运行：python test_agent_concurrency.py  或  python -m pytest test_agent_concurrency.py
+"""
+import asyncio
+import json
+import random
+import sys
+from types import SimpleNamespace
+
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+
+RUNS = 300
+
+
+class FakeMessages:
+    """
+    模拟 messages.create：根据对话历史里的指令决定本 run 要调用几次工具，
+    每次工具调用都带上 run 的标记；最后把历史中看到的所有工具结果拼进最终回复
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, model, max_tokens, tools, messages):
+        self.calls += 1
+        # 随机让出事件循环，制造 run 之间的交错
+        await asyncio.sleep(random.uniform(0, 0.01))
+        marker = messages[0]["content"]
+        rounds = int(marker.split(":")[1])
+        done = sum(1 for m in messages if m["role"] == "assistant")
+        usage = SimpleNamespace(input_tokens=100 + done, output_tokens=10,
+                                cache_creation_input_tokens=0, cache_read_input_tokens=0)
+
+        if done < rounds:
+            blocks = [
+                SimpleNamespace(type="tool_use", name="arxiv_search_by_id",
+                                input={"key": f"{marker}#{done}.{i}"}, id=f"{marker}-{done}-{i}")
+                for i in range(2)
+            ]
+            return SimpleNamespace(stop_reason="tool_use", content=blocks, usage=usage)
+
+        seen = []
+        for m in messages:
+            if m["role"] == "user" and isinstance(m["content"], list):
+                for block in m["content"]:
+                    seen.append(json.loads(block["content"])["data"]["data"][0]["arxivNo"])
+        text = json.dumps({"marker": marker, "seen": seen})
+        return SimpleNamespace(stop_reason="end_turn", content=[SimpleNamespace(type="text", text=text)], usage=usage)
+
+
+def _make_agent() -> ClaudeAcademicAgent:
+    agent = ClaudeAcademicAgent(api_key="test-key")
+    agent.client = SimpleNamespace(messages=FakeMessages())
+    for name, client in list(agent.mcp_clients.items()):
+        agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name, latency=0.002)
+    return agent
+
+
+async def _run_many(agent: ClaudeAcademicAgent, runs: int):
+    contexts = [agent.new_run(f"run-{i}:{i % 4}", max_iterations=10) for i in range(runs)]
+    results = await asyncio.gather(*(agent.run_context(ctx) for ctx in contexts))
+    return contexts, results
+
+
+def test_concurrent_runs_are_isolated():
+    agent = _make_agent()
+    contexts, results = asyncio.run(_run_many(agent, RUNS))
+
+    for ctx, result in zip(contexts, results):
+        rounds = int(ctx.instruction.split(":")[1])
+        payload = json.loads(result)
+        # 最终回复只属于本 run
+        assert payload["marker"] == ctx.instruction
+        # 本 run 看到的工具结果恰好是自己发出的那些，顺序一致，没有混入其他 run 的
+        expected = [f"arXiv:{ctx.instruction}#{r}.{i}" for r in range(rounds) for i in range(2)]
+        assert payload["seen"] == expected
+        # 历史结构：指令 + 每轮(assistant, tool_result)
+        assert len(ctx.messages) == 1 + 2 * rounds
+        assert ctx.status == "completed"
+        # 用量只记录本 run 的迭代
+        assert len(ctx.usage.summary.iterations) == rounds + 1
+        assert ctx.usage.summary.tool_calls.get("arxiv_search_by_id", 0) == 2 * rounds
+
+    # 累计计数器覆盖所有 run
+    assert agent.usage_totals.runs == RUNS
+    assert agent.usage_totals.iterations == sum(int(c.instruction.split(":")[1]) + 1 for c in contexts)
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    test_concurrent_runs_are_isolated()
+    print(f"✅ {RUNS} 个并发 run 相互隔离")
@@ -0,0 +1,103 @@
+"""
+日志管道测试
+用途：验证级别过滤在入队前完成（被过滤的日志不会序列化参数）、参数都是标量时消息在监听线程中拼接、
+两种输出格式，参数中有可变对象时日志反映调用时的状态（入队后再修改不影响输出，也不会在监听线程中报错），
+以及 LazyJSON 序列化失败时退回 repr
+
+运行：python test_agent_logging.py  或  python -m pytest test_agent_logging.py
+"""
+import io
+import logging
+import queue
+import threading
+
+from agent_logging import ROOT_LOGGER_NAME, LazyJSON, _DeferredQueueHandler, get_logger, setup_logging, shutdown_logging
+
+
+def _with_pipeline(level: str, human: bool, scenario) -> str:
+    """在临时的日志管道上运行 scenario，返回写出的全部文本；结束后恢复 giiisp logger 的初始状态"""
+    stream = io.StringIO()
+    setup_logging(level, human=human, stream=stream)
+    try:
+        scenario(get_logger("test"))
+    finally:
+        shutdown_logging()
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.setLevel(logging.NOTSET)
+        root.propagate = True
+    return stream.getvalue()
+
+
+class _Traced(str):
+    """记录自己在哪个线程被格式化"""
+    threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        return str.__str__(self)
+
+
+class _Counted:
+    calls = 0
+
+    def __str__(self):
+        _Counted.calls += 1
+        return "counted"
+
+
+def test_level_filter_and_deferred_formatting():
+    def scenario(logger):
+        logger.debug("不输出 %s", LazyJSON({"big": _Counted()}))
+        logger.info("不输出 %s", _Counted())
+        logger.warning("⚠️ 工具 %s 第 %d 次重试", _Traced("deep_research"), 2)
+
+    _Counted.calls, _Traced.threads = 0, []
+    output = _with_pipeline("WARNING", False, scenario)
+    assert _Counted.calls == 0
+    assert _Traced.threads and threading.main_thread().name not in _Traced.threads
+    line, = output.splitlines()
+    assert line.endswith("WARNING giiisp.test | ⚠️ 工具 deep_research 第 2 次重试")
+
+    output = _with_pipeline("INFO", True, lambda logger: logger.info("🔄 [迭代 %d/%d]", 1, 10))
+    assert output == "🔄 [迭代 1/10]\n"
+
+
+def _record(msg, *args) -> logging.LogRecord:
+    return logging.LogRecord("giiisp.test", logging.INFO, __file__, 1, msg, args, None)
+
+
+def test_mutable_args_are_captured_at_call_time():
+    log_queue = queue.SimpleQueue()
+    handler = _DeferredQueueHandler(log_queue)
+    tool_input = {"query": "LLM"}
+    handler.handle(_record("参数: %s", LazyJSON(tool_input)))
+    handler.handle(_record("参数: %s", tool_input))
+    # 调用方在监听线程格式化之前修改了参数
+    tool_input["query"] = "RAG"
+    tool_input.update({f"k{i}": i for i in range(10)})
+    assert [log_queue.get_nowait().getMessage() for _ in range(2)] == [
+        '参数: {"query": "LLM"}', "参数: {'query': 'LLM'}"]
+
+
+class _Changing:
+    """序列化时模拟另一个线程正在修改其中的字典"""
+
+    def __str__(self):
+        raise RuntimeError("dictionary changed size during iteration")
+
+    def __repr__(self):
+        return "_Changing()"
+
+
+def test_lazy_json_falls_back_to_repr():
+    assert str(LazyJSON({"a": [1, "中文"]})) == '{"a": [1, "中文"]}'
+    assert str(LazyJSON({"inner": _Changing()})) == "{'inner': _Changing()}"
+
+
+if __name__ == "__main__":
+    test_level_filter_and_deferred_formatting()
+    test_mutable_args_are_captured_at_call_time()
+    test_lazy_json_falls_back_to_repr()
+    print("✅ 日志管道：入队前过滤级别、监听线程拼接消息、输出格式、可变参数按调用时的状态输出、LazyJSON 出错时退回 repr")
@@ -0,0 +1,195 @@
+"""
+研究代理守护进程测试
+用途：不访问 Claude API 和网络，在本地端口上启动 AgentServer，验证提交任务时即返回 run_id、
+事件流按顺序推送且任务结束后合并 text_delta、非法 max_iterations 和 Content-Length 返回 400、
+同一个 run 正在运行时再次恢复返回 409
+
+运行：python test_agent_server.py  或  python -m pytest test_agent_server.py
+"""
+import asyncio
+import json
+import tempfile
+from types import SimpleNamespace
+
+from agent_server import AgentServer
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from run_checkpoint import CheckpointStore
+
+
+def _usage() -> SimpleNamespace:
+    return SimpleNamespace(input_tokens=1000, output_tokens=100,
+                           cache_creation_input_tokens=0, cache_read_input_tokens=0)
+
+
+class FakeStream:
+    def __init__(self, message):
+        self.message = message
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        for block in self.message.content:
+            if block.type == "text":
+                for i in range(0, len(block.text), 2):
+                    yield block.text[i:i + 2]
+
+    async def get_final_message(self):
+        return self.message
+
+
+class GatedMessages:
+    """第一轮查一篇论文，之后写综述；gate 未打开时模型调用一直等待"""
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    def stream(self, model, max_tokens, tools, messages):
+        return _GatedStream(self, messages)
+
+    async def create(self, model, max_tokens, tools, messages):
+        async with self.stream(model, max_tokens, tools, messages) as stream:
+            return await stream.get_final_message()
+
+
+class _GatedStream(FakeStream):
+    def __init__(self, owner: GatedMessages, messages):
+        self.owner = owner
+        if not any(m["role"] == "assistant" for m in messages):
+            message = SimpleNamespace(stop_reason="tool_use", usage=_usage(), content=[
+                SimpleNamespace(type="text", text="先查一下这篇论文。"),
+                SimpleNamespace(type="tool_use", name="arxiv_search_by_id", id="t0", input={"key": "2401.00001"})])
+        else:
+            message = SimpleNamespace(stop_reason="end_turn", usage=_usage(),
+                                      content=[SimpleNamespace(type="text", text="这是一份关于 LLM 的综述。")])
+        super().__init__(message)
+
+    async def __aenter__(self):
+        await self.owner.gate.wait()
+        return self
+
+
+async def _request(port: int, method: str, path: str, payload=None, content_length=None):
+    """发一个 HTTP 请求，读到连接关闭为止，返回 (状态码, 响应体)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    length = len(body) if content_length is None else content_length
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: x\r\nContent-Length: {length}\r\n\r\n".encode() + body)
+    await writer.drain()
+    data = await reader.read()
+    writer.close()
+    head, _, body = data.partition(b"\r\n\r\n")
+    return int(head.split(b" ", 2)[1]), body.decode("utf-8")
+
+
+async def _with_server(tmp: str, scenario):
+    agent = ClaudeAcademicAgent(api_key="test-key", checkpoint_store=CheckpointStore(tmp))
+    messages = GatedMessages()
+    agent.client = SimpleNamespace(messages=messages)
+    agent.mcp_clients["arxiv_id"] = StandInMCPClient(6006, "Arxiv ID", latency=0.001, seed=1)
+    app = AgentServer(agent, max_in_flight=2, max_queue=4)
+    app.start()
+    server = await asyncio.start_server(app.handle, "127.0.0.1", 0)
+    try:
+        return await scenario(app, messages, server.sockets[0].getsockname()[1])
+    finally:
+        server.close()
+        await server.wait_closed()
+        await app.stop()
+
+
+def test_submit_returns_run_id_and_compacts_events():
+    async def scenario(app, messages, port):
+        messages.gate.clear()
+        status, body = await _request(port, "POST", "/jobs", {"instruction": "LLM 综述", "max_iterations": 5})
+        submitted = json.loads(body)
+        assert status == 202 and submitted["run_id"]
+
+        # 在任务运行期间建立流式连接，再放行模型调用
+        streaming = asyncio.create_task(_request(port, "GET", f"/jobs/{submitted['job_id']}/events"))
+        await asyncio.sleep(0.05)
+        messages.gate.set()
+        status, body = await streaming
+        streamed = [json.loads(line) for line in body.splitlines()]
+        assert status == 200 and streamed[-1]["type"] == "final" and streamed[-1]["status"] == "completed"
+        assert {e["run_id"] for e in streamed if "run_id" in e} == {submitted["run_id"]}
+        # 文本增量逐段推送
+        deltas = [e for e in streamed if e["type"] == "text_delta"]
+        assert len(deltas) > 2 and all(len(e["text"]) <= 2 for e in deltas)
+
+        status, body = await _request(port, "GET", f"/jobs/{submitted['job_id']}")
+        job = json.loads(body)
+        assert (job["run_id"], job["run_status"], job["result"]) == (
+            submitted["run_id"], "completed", "这是一份关于 LLM 的综述。")
+        assert app.agent.checkpoint_store.exists(submitted["run_id"])
+
+        # 任务结束后：同一轮的文本增量合并为一条，其余事件不变
+        status, body = await _request(port, "GET", f"/jobs/{submitted['job_id']}/events")
+        compact = [json.loads(line) for line in body.splitlines()]
+        assert [e["text"] for e in compact if e["type"] == "text_delta"] == [
+            "先查一下这篇论文。", "这是一份关于 LLM 的综述。"]
+        assert [e for e in compact if e["type"] != "text_delta"] == [e for e in streamed if e["type"] != "text_delta"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_with_server(tmp, scenario))
+
+
+def test_rejects_bad_max_iterations():
+    async def scenario(app, messages, port):
+        for bad in ("abc", 0, -3, 2.5, True, None):
+            status, body = await _request(port, "POST", "/jobs", {"instruction": "LLM 综述", "max_iterations": bad})
+            assert status == 400 and "max_iterations" in json.loads(body)["error"]
+        assert app.jobs == {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_with_server(tmp, scenario))
+
+
+def test_rejects_bad_content_length():
+    async def scenario(app, messages, port):
+        for bad in ("abc", "-5"):
+            status, body = await _request(port, "POST", "/jobs", {"instruction": "LLM 综述"}, content_length=bad)
+            assert status == 400 and "Content-Length" in json.loads(body)["error"]
+        assert app.jobs == {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_with_server(tmp, scenario))
+
+
+def test_refuses_concurrent_resume():
+    async def scenario(app, messages, port):
+        # 先得到一个因达到迭代上限而中断的 run
+        ctx = app.agent.new_run("LLM 综述", max_iterations=1)
+        await app.agent.run_context(ctx)
+        assert ctx.status == "max_iterations"
+
+        messages.gate.clear()
+        status, body = await _request(port, "POST", "/jobs", {"resume": ctx.run_id, "max_iterations": 3})
+        first = json.loads(body)
+        assert status == 202 and first["run_id"] == ctx.run_id
+        status, body = await _request(port, "POST", "/jobs", {"resume": ctx.run_id})
+        assert status == 409 and ctx.run_id in json.loads(body)["error"]
+
+        messages.gate.set()
+        status, body = await _request(port, "GET", f"/jobs/{first['job_id']}/events")
+        assert json.loads(body.splitlines()[-1])["run_status"] == "completed"
+        # 恢复结束后可以再次提交（已完成的 run 直接返回检查点中的结果）
+        status, _ = await _request(port, "POST", "/jobs", {"resume": ctx.run_id})
+        assert status == 202
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(_with_server(tmp, scenario))
+
+
+if __name__ == "__main__":
+    test_submit_returns_run_id_and_compacts_events()
+    test_rejects_bad_max_iterations()
+    test_rejects_bad_content_length()
+    test_refuses_concurrent_resume()
+    print("✅ 守护进程：提交即返回 run_id、事件流与合并、参数与请求头校验、拒绝并发恢复同一个 run")
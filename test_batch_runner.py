@@ -0,0 +1,73 @@
+"""
+批量任务运行器测试
+用途：不访问 Claude API 和网络，验证任务文件中无效的行被跳过、其余任务照常读取，
+单个任务出错（包括任务本身不合法）时记为 error 而不是让工作进程退出，
+以及断点续跑只跳过输出文件中以 completed 结束的任务
+
+运行：python test_batch_runner.py  或  python -m pytest test_batch_runner.py
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+from batch_runner import _run_job, completed_job_ids, load_jobs, run_batch
+from claude_agent import ClaudeAcademicAgent
+
+
+def test_load_jobs_skips_invalid_lines():
+    lines = [
+        json.dumps({"id": "a", "instruction": "LLM 综述"}),
+        json.dumps({"id": "b"}),
+        "{不是 JSON",
+        json.dumps(["LLM 综述"]),
+        json.dumps({"instruction": "  "}),
+        json.dumps({"instruction": "RAG 综述", "max_iterations": 0}),
+        json.dumps({"instruction": "RAG 综述", "max_iterations": "5"}),
+        json.dumps({"id": 7, "instruction": "CRISPR 综述", "max_iterations": 3}),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n\n")
+        jobs = load_jobs(path, 15)
+    assert [(job["id"], job["max_iterations"]) for job in jobs] == [("a", 15), ("7", 5), ("7", 3)]
+
+
+def test_bad_job_is_recorded_as_error():
+    agent = ClaudeAcademicAgent(api_key="test-key")
+    record = asyncio.run(_run_job(agent, {"id": "b", "max_iterations": 3}))
+    assert record["id"] == "b" and record["status"] == "error" and record["error"].startswith("KeyError")
+    assert "usage" not in record
+
+
+def test_resume_skips_completed_ids():
+    records = [
+        {"id": "a", "status": "ok", "run_status": "completed"},
+        {"id": "b", "status": "ok"},  # 旧版本写出的记录没有 run_status
+        {"id": "c", "status": "incomplete", "run_status": "max_iterations"},
+        {"id": "d", "status": "error", "error": "KeyError: 'instruction'"},
+        {"id": "e", "status": "ok", "run_status": "stopped"},
+        {"id": 7, "status": "ok", "run_status": "completed"},
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "results.jsonl")
+        assert completed_job_ids(output) == set()
+        with open(output, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in records) + '{"id": "f", "sta')  # 上次被强制中断留下的半行
+        assert completed_job_ids(output) == {"a", "b", "7"}
+
+        # 全部任务都已完成时直接返回，不启动工作进程
+        jobs = os.path.join(tmp, "jobs.jsonl")
+        with open(jobs, "w", encoding="utf-8") as f:
+            for job_id in ("a", "b", "7"):
+                f.write(json.dumps({"id": job_id, "instruction": "LLM 综述"}) + "\n")
+        stats = run_batch(jobs, output, cache_path="")
+        assert (stats["total"], stats["skipped"], stats["ok"], stats["elapsed_s"]) == (3, 3, 0, 0.0)
+
+
+if __name__ == "__main__":
+    test_load_jobs_skips_invalid_lines()
+    test_bad_job_is_recorded_as_error()
+    test_resume_skips_completed_ids()
+    print("✅ 批量任务：跳过无效的任务行、出错的任务记为 error、续跑只跳过已完成的任务")
@@ -0,0 +1,102 @@
+"""
+批量查询工具测试
+用途：不访问 MCP 服务，用替身验证 arxiv_search_by_ids / bioc_get_articles / entrez_summary
+按输入顺序返回、重复 ID 只查一次、单个 ID 失败不影响其余 ID、ESummary 按块调用，
+以及 Entrez 服务不提供 ESummary 时 entrez_summary 明确报错
+
+运行：python test_batch_tools.py  或  python -m pytest test_batch_tools.py
+"""
+import asyncio
+import json
+import sys
+
+from batch_tools import ENTREZ_CHUNK
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+
+
+class FlakyStandIn(StandInMCPClient):
+    """对指定参数值返回 None（与真实客户端失败时一致），并记录每次调用的参数"""
+
+    def __init__(self, *args, fail_on=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_on = set(fail_on)
+        self.seen = []
+
+    async def call_tool(self, tool_name, args):
+        self.seen.append(args)
+        if set(map(str, args.values())) & self.fail_on:
+            self.calls += 1
+            return None
+        return await super().call_tool(tool_name, args)
+
+
+def _make_agent() -> ClaudeAcademicAgent:
+    agent = ClaudeAcademicAgent(api_key="test-key")
+    for name, client in list(agent.mcp_clients.items()):
+        agent.mcp_clients[name] = FlakyStandIn(client.port, client.service_name, latency=0.01,
+                                               fail_on={"9999.99999", "PMC404"})
+    return agent
+
+
+async def _call(agent, tool_name, tool_input):
+    return json.loads(await agent.execute_tool(tool_name, tool_input))
+
+
+def test_arxiv_batch_order_dedup_and_errors():
+    agent = _make_agent()
+    keys = ["1810.04805", "9999.99999", "1706.03762", "1810.04805"]
+    result = asyncio.run(_call(agent, "arxiv_search_by_ids", {"keys": keys}))
+
+    assert [r["id"] for r in result["results"]] == keys
+    assert [r["ok"] for r in result["results"]] == [True, False, True, True]
+    assert result["results"][1]["error"] == "未获取到数据"
+    assert result["succeeded"] == 3 and result["failed"] == 1
+    # 重复 ID 只查一次
+    assert agent.mcp_clients["arxiv_id"].calls == 3
+    assert result["results"][2]["data"]["data"]["data"][0]["arxivNo"] == "arXiv:1706.03762"
+
+
+def test_bioc_batch_accepts_comma_string():
+    agent = _make_agent()
+    result = asyncio.run(_call(agent, "bioc_get_articles", {"ids": "PMC7095368, PMC404"}))
+    assert [(r["id"], r["ok"]) for r in result["results"]] == [("PMC7095368", True), ("PMC404", False)]
+
+
+def test_entrez_summary_chunks_and_per_id_errors():
+    agent = _make_agent()
+    ids = [str(30000000 + i) for i in range(2 * ENTREZ_CHUNK + 10)] + ["bad-id"]
+    result = asyncio.run(_call(agent, "entrez_summary", {"db": "pubmed", "ids": ids}))
+
+    assert [r["id"] for r in result["results"]] == ids
+    assert result["failed"] == 1 and result["results"][-1]["error"] == "Invalid uid"
+    assert result["results"][0]["data"]["title"] == f"Entrez record {ids[0]}"
+    # 211 个 ID -> 3 次 ESummary 调用
+    assert agent.mcp_clients["entrez"].calls == 3
+    assert all(len(args["id"].split(",")) <= ENTREZ_CHUNK for args in agent.mcp_clients["entrez"].seen)
+
+
+def test_entrez_summary_requires_esummary_tool():
+    agent = _make_agent()
+    agent.mcp_clients["entrez"] = FlakyStandIn(6005, "Entrez", latency=0.01, tools=["ESearch"])
+    result = asyncio.run(_call(agent, "entrez_summary", {"db": "pubmed", "ids": ["30000001", "30000002"]}))
+    assert "不提供 ESummary" in result["error"] and "ESearch" in result["error"]
+    assert agent.mcp_clients["entrez"].seen == []
+
+
+def test_batch_limit_is_reported():
+    agent = _make_agent()
+    result = asyncio.run(_call(agent, "arxiv_search_by_ids", {"keys": [f"2101.{i:05d}" for i in range(51)]}))
+    assert "最多 50 个" in result["error"]
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    test_arxiv_batch_order_dedup_and_errors()
+    test_bioc_batch_accepts_comma_string()
+    test_entrez_summary_chunks_and_per_id_errors()
+    test_entrez_summary_requires_esummary_tool()
+    test_batch_limit_is_reported()
+    print("✅ 批量查询工具按序返回、逐个报错、按块调用")
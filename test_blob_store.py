@@ -0,0 +1,113 @@
+"""
+大结果转存测试
+用途：不访问 MCP 服务，用返回 BioC 全文的替身验证超过阈值的结果只把摘要和句柄交给 Claude、
+read_result 能按路径和字符区间取回原文、相同内容只存一份、转存时直接写入已序列化的文本，
+小结果和关闭转存的工具不受影响
+
+运行：python test_blob_store.py  或  python -m pytest test_blob_store.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+from blob_store import BlobStore
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+
+
+class FullTextStandIn(StandInMCPClient):
+    """bioc 返回 BioC 形式的全文：一个 document，每个 passage 带 section_type"""
+
+    async def call_tool(self, tool_name, args):
+        if tool_name != "get_article_info":
+            return await super().call_tool(tool_name, args)
+        self.calls += 1
+        sections = ["TITLE", "ABSTRACT", "INTRO", "METHODS", "RESULTS", "DISCUSS", "REF"]
+        passages = [{"infons": {"section_type": name}, "offset": i * 10000,
+                     "text": f"{name} of {args['id']}. " + "Lorem ipsum dolor sit amet. " * 300}
+                    for i, name in enumerate(sections)]
+        return {"source": "PMC", "documents": [{"id": args["id"], "passages": passages}]}
+
+
+def _make_agent(root: str, **kwargs) -> ClaudeAcademicAgent:
+    agent = ClaudeAcademicAgent(api_key="test-key", blob_store=BlobStore(root, **kwargs))
+    for name, client in list(agent.mcp_clients.items()):
+        agent.mcp_clients[name] = FullTextStandIn(client.port, client.service_name, latency=0.001, seed=1)
+    return agent
+
+
+async def _call(agent, tool_name, tool_input):
+    return json.loads(await agent.execute_tool(tool_name, tool_input))
+
+
+def test_large_result_offloaded_and_readable():
+    async def scenario(root):
+        agent = _make_agent(root)
+        summary = await _call(agent, "bioc_get_article", {"id": "PMC7095368"})
+        handle = summary["stored_as"]
+        assert handle.startswith("blob:") and summary["chars"] > 50_000
+        sections = {s["path"]: s for s in summary["sections"]}
+        assert sections["documents[0].passages[3]"]["label"] == "METHODS"
+
+        # 按路径读取一个段落的正文，分页拼回完整原文
+        path = "documents[0].passages[3].text"
+        parts, offset = [], 0
+        while offset is not None:
+            page = await _call(agent, "read_result", {"handle": handle, "path": path, "offset": offset})
+            parts.append(page["content"])
+            offset = page["next_offset"]
+        assert "".join(parts).startswith("METHODS of PMC7095368. ")
+        assert len("".join(parts)) == page["total_chars"] and len(parts) > 1
+
+        # 相同内容只存一份；不存在的句柄和路径给出错误
+        again = await _call(agent, "bioc_get_article", {"id": "PMC7095368"})
+        assert again["stored_as"] == handle
+        assert sum(len(files) for _, _, files in os.walk(root)) == 1
+        missing = await _call(agent, "read_result", {"handle": "blob:" + "0" * 64})
+        assert "不存在" in missing["error"]
+        bad_path = await _call(agent, "read_result", {"handle": handle, "path": "documents[5]"})
+        assert "documents[5]" in bad_path["error"]
+
+        # 小结果原样返回
+        small = await _call(agent, "deep_research", {"searchQuery": "llm", "count": 3})
+        assert "stored_as" not in small and len(small["data"]["data"]) == 3
+
+    with tempfile.TemporaryDirectory() as root:
+        asyncio.run(scenario(root))
+
+
+def test_offload_stores_given_text():
+    result = {"title": "综述", "passages": ["段落" * 50] * 10}
+    # 用与 _dumps 不同的写法（中文转义）确认存入的是传入的文本本身，而不是重新序列化的结果
+    text = json.dumps(result)
+    with tempfile.TemporaryDirectory() as root:
+        store = BlobStore(root, threshold=100)
+        summary = store.offload("deep_research", result, text)
+        digest = summary["stored_as"][len("blob:"):]
+        with open(os.path.join(root, digest[:2], f"{digest}.json"), encoding="utf-8") as f:
+            assert f.read() == text
+        assert store.get(summary["stored_as"]) == result
+
+
+def test_per_tool_threshold_can_disable_offload():
+    async def scenario(root):
+        agent = _make_agent(root, threshold_per_tool={"bioc_get_article": 0})
+        result = await _call(agent, "bioc_get_article", {"id": "PMC7102662"})
+        assert "stored_as" not in result and len(result["documents"][0]["passages"]) == 7
+        assert "read_result" in [t["name"] for t in agent.get_tool_definitions()]
+
+    with tempfile.TemporaryDirectory() as root:
+        asyncio.run(scenario(root))
+    assert "read_result" not in [t["name"] for t in ClaudeAcademicAgent(api_key="test-key").get_tool_definitions()]
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    test_large_result_offloaded_and_readable()
+    test_offload_stores_given_text()
+    test_per_tool_threshold_can_disable_offload()
+    print("✅ 大结果转存：摘要 + 句柄、按路径分页读取、内容寻址去重、直接写入序列化文本、按工具阈值")
@@ -0,0 +1,94 @@
+"""
+Message Batches 批量模式测试
+用途：不访问网络，用真实的 AsyncAnthropic 客户端对接本地替身批次接口、用 MCP 替身执行工具，
+验证多个 run 同步推进（每轮一个批次）、结果按 custom_id 对应回各 run、工具调用在两轮之间一起执行、
+按批量价格计费；以及请求失败重试、快模型升级在同一轮的后续批次中完成、超过上限时拆成多个批次、重试耗尽时 run 记为失败，
+--stand-in 自检默认不写共享的工具结果缓存
+
+运行：python test_bulk_batches.py  或  python -m pytest test_bulk_batches.py
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+from anthropic import AsyncAnthropic
+
+from batch_standin import StandInBatchServer
+from bulk_batches import BulkBatchRunner, run_bulk
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from model_router import POLICIES
+
+
+async def _bulk(runs: int, server: StandInBatchServer, router=None, **runner_kwargs):
+    agent = ClaudeAcademicAgent(api_key="test-key", router=router)
+    await agent.client.close()
+    agent.client = AsyncAnthropic(api_key="standin", base_url=await server.start())
+    for name, client in list(agent.mcp_clients.items()):
+        agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name, latency=0.001, seed=1)
+    runner = BulkBatchRunner(agent, poll_interval=0.01, **runner_kwargs)
+    contexts = [agent.new_run(f"topic {i}", max_iterations=6) for i in range(runs)]
+    try:
+        results = await runner.run(contexts)
+    finally:
+        await agent.aclose()
+        await server.close()
+    return agent, runner, contexts, results
+
+
+def test_runs_advance_in_lockstep_one_batch_per_round():
+    server = StandInBatchServer(processing_delay=0.02, seed=1)
+    agent, runner, contexts, results = asyncio.run(_bulk(20, server))
+
+    # 三轮（检索、追查、写综述），每轮所有 run 的请求合并成一个批次
+    assert server.batch_sizes == [20, 20, 20] and runner.counts["rounds"] == 3
+    for ctx, result in zip(contexts, results):
+        assert ctx.status == "completed" and result.startswith(f"# {ctx.instruction} 综述")
+        # 结果对应回了自己的 run：综述里只有本 run 检索到的论文
+        assert f"{ctx.instruction} study 1" in result and result.count("study") == 5
+        assert [m["role"] for m in ctx.messages] == ["user", "assistant", "user", "assistant", "user"]
+    calls = {name: c.calls for name, c in agent.mcp_clients.items()}
+    assert calls["deep_research"] == 20 and calls["arxiv_id"] == 40
+
+    iterations = [u for ctx in contexts for u in ctx.usage.summary.iterations]
+    assert all(u.batch for u in iterations)
+    # 批量请求按标准价格（sonnet 输入 $3 / 输出 $15 每百万 token）的一半计费
+    assert abs(agent.usage_totals.cost_usd * 2 - sum(
+        (u.input_tokens * 3.0 + u.output_tokens * 15.0) / 1e6 for u in iterations)) < 1e-9
+
+
+def test_retries_escalation_chunking_and_failure():
+    server = StandInBatchServer(processing_delay=0.01, error_rate=0.2, seed=3)
+    agent, runner, contexts, results = asyncio.run(_bulk(15, server, router=POLICIES["fast-plan"], max_requests=6))
+    assert all(ctx.status == "completed" for ctx in contexts) and runner.counts["retried"] > 0
+    # 快模型在综述轮超出输出预算，每个 run 升级一次，强模型的请求在同一轮的下一个批次里
+    assert sum(ctx.usage.summary.escalations for ctx in contexts) == 15
+    assert all(r.endswith("\n") and "综述" in r for r in results)
+    assert max(server.batch_sizes) <= 6 and sum(server.batch_sizes) == runner.counts["requests"]
+
+    server = StandInBatchServer(processing_delay=0.01, error_rate=1.0, seed=1)
+    agent, runner, contexts, results = asyncio.run(_bulk(3, server, max_retries=1))
+    assert results == [None, None, None] and all(ctx.status == "failed" for ctx in contexts)
+    assert runner.counts == {"rounds": 1, "batches": 2, "requests": 6, "retried": 3, "failed": 3}
+    assert all(reason.startswith("errored: overloaded_error") for reason in runner.errors.values())
+
+
+def test_stand_in_does_not_touch_shared_cache():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "jobs.jsonl"), "w", encoding="utf-8") as f:
+            f.write(json.dumps({"id": "a", "instruction": "LLM 综述", "max_iterations": 3}) + "\n")
+        os.chdir(tmp)
+        try:
+            stats = asyncio.run(run_bulk("jobs.jsonl", "out.jsonl", poll_interval=0.01, stand_in=True))
+        finally:
+            os.chdir(cwd)
+        assert stats["ok"] == 1 and not os.path.exists(os.path.join(tmp, ".cache"))
+
+
+if __name__ == "__main__":
+    test_runs_advance_in_lockstep_one_batch_per_round()
+    test_retries_escalation_chunking_and_failure()
+    test_stand_in_does_not_touch_shared_cache()
+    print("✅ 批量模式：每轮一个批次、结果按 custom_id 对应、重试、升级、拆分批次、替身不写共享缓存")
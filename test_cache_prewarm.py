@@ -0,0 +1,118 @@
+"""
+缓存预热测试
+用途：不访问网络，用 MCP 替身验证主题列表的解析和展开、并发上限与每个服务的限流、
+只刷新不存在或临近过期的条目、按 ID 的后续调用预热、预热后代理的工具调用直接命中缓存，
+以及报告中的覆盖率和节省时间；--stand-in 自检默认写入临时缓存
+
+运行：python test_cache_prewarm.py  或  python -m pytest test_cache_prewarm.py
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from cache_prewarm import CachePrewarmer, load_calls, run_prewarm
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from prefetch import canonical_input
+from result_cache import ResultCache
+
+
+def test_load_calls():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "topics.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('LLM\n\n# 注释\n{"topic": "CRISPR"}\n{"tool": "arxiv_search_by_id", "input": {"key": "1706.03762"}}\n')
+        calls = load_calls(path, ["deep_research", "entrez_search"])
+    assert calls == [("deep_research", {"searchQuery": "LLM"}), ("entrez_search", {"db": "pubmed", "term": "LLM"}),
+                     ("deep_research", {"searchQuery": "CRISPR"}),
+                     ("entrez_search", {"db": "pubmed", "term": "CRISPR"}),
+                     ("arxiv_search_by_id", {"key": "1706.03762"})]
+
+
+class CountingFetch:
+    """包装代理的 _call_mcp，记录请求次数、最大并发数和每个服务的请求时间"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, tool, tool_input):
+        self.calls.append((tool, time.monotonic()))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await self.agent._call_mcp(tool, tool_input)
+        finally:
+            self.in_flight -= 1
+
+
+def _agent(cache: ResultCache) -> ClaudeAcademicAgent:
+    agent = ClaudeAcademicAgent(api_key="test-key", result_cache=cache)
+    for name, client in list(agent.mcp_clients.items()):
+        agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name, latency=0.01, seed=1)
+    return agent
+
+
+def test_prewarm_refreshes_only_stale_entries_and_serves_agent():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(os.path.join(tmp, "cache.sqlite"), ttl=24 * 3600)
+        agent = _agent(cache)
+        calls = [(tool, args) for topic in ("LLM", "RAG", "CRISPR")
+                 for tool, args in [("deep_research", {"searchQuery": topic}),
+                                    ("arxiv_search_by_abstract", {"key": topic})]]
+        calls.append(("deep_research", {"searchQuery": "LLM", "count": 10}))  # 与第一条是同一个缓存条目
+
+        fetch = CountingFetch(agent)
+        prewarmer = CachePrewarmer(cache, fetch, concurrency=2, qps=50, followups=2)
+        report = asyncio.run(prewarmer.run(calls))
+        # 6 个检索 + 每条结果 2 个按 ID 查询；重复的调用只请求一次
+        assert report["planned"] == report["refreshed"] == 18 and report["coverage"] == 1.0
+        assert report["by_tool"]["arxiv_search_by_id"]["refreshed"] == 12
+        assert len(fetch.calls) == 18 and fetch.max_in_flight <= 2
+        # 每个服务每秒最多 50 个请求：相邻请求至少间隔约 20ms
+        times = sorted(t for tool, t in fetch.calls if tool == "deep_research")
+        assert all(b - a >= 0.018 for a, b in zip(times, times[1:]))
+        assert report["warm_fetch_s"] > 0 and report["previous_hits"] == 0
+
+        # 白天的 run：省略 count 的写法也命中预热的条目
+        assert asyncio.run(agent._cached_call("deep_research", {"searchQuery": "LLM"})) is not None
+        assert cache.hits == 1 and cache.misses == 0
+
+        # 第二次预热：全部仍然有效，不发请求；报告此前的命中
+        fetch = CountingFetch(agent)
+        report = asyncio.run(CachePrewarmer(cache, fetch, qps=0, followups=2).run(calls))
+        assert fetch.calls == [] and report["fresh"] == 18 and report["coverage"] == 1.0
+        assert report["previous_hits"] == 1 and report["previous_saved_s"] > 0
+
+        # 临近过期的条目被刷新，其余跳过
+        cache.put("deep_research", canonical_input("deep_research", {"searchQuery": "RAG"}), {"data": []}, ttl=60)
+        fetch = CountingFetch(agent)
+        report = asyncio.run(CachePrewarmer(cache, fetch, qps=0, refresh_within=3600).run(calls))
+        assert [tool for tool, _ in fetch.calls] == ["deep_research"]
+        assert (report["planned"], report["fresh"], report["refreshed"]) == (6, 5, 1)
+        assert cache.expires_at("deep_research", {"searchQuery": "RAG", "count": 10}) > time.time() + 3600
+        cache.close()
+
+
+def test_stand_in_uses_scratch_cache():
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, "topics.txt"), "w", encoding="utf-8") as f:
+            f.write("LLM\n")
+        os.chdir(tmp)
+        try:
+            report = asyncio.run(run_prewarm("topics.txt", tools=["deep_research"], qps=0, pool_size=0,
+                                             stand_in=True))
+        finally:
+            os.chdir(cwd)
+        assert report["refreshed"] == 1 and not os.path.exists(os.path.join(tmp, ".cache"))
+
+
+if __name__ == "__main__":
+    test_load_calls()
+    test_prewarm_refreshes_only_stale_entries_and_serves_agent()
+    test_stand_in_uses_scratch_cache()
+    print("✅ 缓存预热：主题展开、并发与限流、只刷新临近过期的条目、后续调用、代理命中缓存、覆盖率报告、替身用临时缓存")
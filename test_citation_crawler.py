@@ -0,0 +1,109 @@
+"""
+引文图爬取测试
+用途：不访问 MCP 服务，用一个确定的小引文图替身验证 BFS 按层扩展、已访问去重、
+每层节点上限和层数上限、失败重试，以及中途取消后用同一目录重新运行得到与一次跑完完全相同的边表
+
+运行：python test_citation_crawler.py  或  python -m pytest test_citation_crawler.py
+"""
+import asyncio
+import os
+import tempfile
+
+from citation_crawler import CitationCrawler, normalize_doi
+
+
+def _refs(i: int):
+    # 节点 i 引用 2i+1、2i+2 和 i//3（形成回边和重复发现）
+    return [n for n in (2 * i + 1, 2 * i + 2, i // 3) if n != i]
+
+
+class GraphStandIn:
+    """按 DOI 检索时返回 10.1/n 及其参考文献；fail_first 中的 DOI 第一次请求返回 None"""
+
+    def __init__(self, latency: float = 0.001, fail_first=()):
+        self.latency = latency
+        self.fail_first = set(fail_first)
+        self.calls = 0
+        self.queries = []
+
+    async def call_tool(self, tool_name, args):
+        self.calls += 1
+        query = args["query"]
+        self.queries.append(query)
+        await asyncio.sleep(self.latency)
+        if query in self.fail_first:
+            self.fail_first.discard(query)
+            return None
+        i = int(query.split("/")[1])
+        item = {"DOI": query.upper(), "title": [f"Paper {i}"], "issued": {"date-parts": [[2000 + i % 20]]},
+                "reference": [{"DOI": f"10.1/{n}"} for n in _refs(i)] + [{"key": "no-doi"}]}
+        decoy = {"DOI": f"10.9/{i}", "title": ["Similar title"]}
+        return {"status": "ok", "message": {"items": [decoy, item]}}
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def _crawl(out_dir, client, **kwargs):
+    crawler = CitationCrawler(out_dir, client=client, concurrency=3, qps=0, **kwargs)
+    try:
+        return asyncio.run(crawler.crawl(["https://doi.org/10.1/0"]))
+    finally:
+        crawler.close()
+
+
+def test_bfs_dedup_and_limits():
+    assert normalize_doi("doi: 10.1/ABC") == "10.1/abc" and normalize_doi("not a doi") is None
+    with tempfile.TemporaryDirectory() as tmp:
+        client = GraphStandIn(fail_first={"10.1/2"})
+        stats = _crawl(tmp, client, max_hops=3, per_hop=6)
+        assert stats["hops"] == {0: 1, 1: 2, 2: 4, 3: 6}
+        assert stats["nodes"] == {"done": 13} and stats["edges"] == 13 * 3 - 1
+        # 每个 DOI 只请求一次（失败重试的一次除外）
+        assert client.calls == 14 and len(set(client.queries)) == 13
+
+        edges = _read(os.path.join(tmp, "edges.tsv"))
+        nodes = _read(os.path.join(tmp, "nodes.tsv"))
+        assert edges[0].startswith("source") and len(edges) == 1 + stats["edges"]
+        assert len(nodes) == 14 and nodes[1].split("\t")[:3] == ["10.1/0", "0", "done"]
+        assert "10.1/0\t10.1/1\treference\t0" in edges
+        assert all("Paper" in row for row in nodes[1:])
+
+
+def test_resume_after_cancel_matches_full_run():
+    with tempfile.TemporaryDirectory() as tmp:
+        full, resumed = os.path.join(tmp, "full"), os.path.join(tmp, "resumed")
+        _crawl(full, GraphStandIn(), max_hops=4, per_hop=None)
+
+        async def interrupted():
+            crawler = CitationCrawler(resumed, client=GraphStandIn(latency=0.005), concurrency=3, qps=0,
+                                      max_hops=4, per_hop=None)
+            task = asyncio.create_task(crawler.crawl(["10.1/0"]))
+            while crawler.completed < 8:
+                await asyncio.sleep(0.001)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            crawler.close()
+
+        asyncio.run(interrupted())
+        partial = _read(os.path.join(resumed, "edges.tsv"))
+        client = GraphStandIn()
+        stats = _crawl(resumed, client, max_hops=4, per_hop=None)
+        assert client.calls == stats["completed_this_run"] and stats["completed_this_run"] < 31
+        assert len(partial) - 1 < stats["edges"]
+
+        full_edges, resumed_edges = _read(os.path.join(full, "edges.tsv")), _read(os.path.join(resumed, "edges.tsv"))
+        assert len(resumed_edges) == len(set(resumed_edges))
+        assert sorted(resumed_edges) == sorted(full_edges)
+        assert sorted(_read(os.path.join(resumed, "nodes.tsv"))) == sorted(_read(os.path.join(full, "nodes.tsv")))
+
+
+if __name__ == "__main__":
+    test_bfs_dedup_and_limits()
+    test_resume_after_cancel_matches_full_run()
+    print("✅ 引文图爬取：按层去重扩展、每层上限、中断后续爬结果一致")
@@ -0,0 +1,88 @@
+"""
+语料列式导出测试
+用途：不访问 MCP 服务，验证论文记录按来源 / 日期分区写出、去重、写入中的文件对读取方不可见、
+按列和分区扫描只返回需要的列，以及代理的工具结果和分页采集都能导出
+（JSONL 格式总会测试；安装了 pyarrow 时同样测试 Parquet）
+
+运行：python test_corpus_export.py  或  python -m pytest test_corpus_export.py
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+import corpus_export
+from claude_agent import ClaudeAcademicAgent
+from corpus_export import CorpusWriter, data_files, export_records, scan, summarize
+from mcp_standin import StandInMCPClient
+from paper_records import PaperRecord
+
+FORMATS = ["jsonl"] + (["parquet"] if corpus_export.pa is not None else [])
+
+
+def _records(source: str, n: int):
+    return [PaperRecord(source=source, title=f"{source} paper {i}", authors=[f"A{i}", "B"], year=2000 + i % 25,
+                        doi=f"10.1/{source}.{i}", citations=str(i) if i % 2 else None) for i in range(n)]
+
+
+def test_partitions_dedup_and_column_scan():
+    today = time.strftime("%Y-%m-%d", time.gmtime())
+    for fmt in FORMATS:
+        with tempfile.TemporaryDirectory() as root:
+            writer = CorpusWriter(root, fmt=fmt, batch_size=10, max_rows_per_file=25)
+            assert writer.add(_records("crossref", 55), query="llm") == 55
+            # 第一个文件写满 3 批（30 行）后关闭可见；第二个文件（.tmp）和缓冲中的记录读取方还看不到
+            assert summarize(root)["rows"] == 30
+            assert writer.add(_records("crossref", 5) + _records("arxiv", 7)) == 7
+            stats = writer.close()
+            assert stats["rows"] == 62 and stats["duplicates"] == 5 and stats["open_files"] == 0
+
+            summary = summarize(root)
+            assert summary["rows"] == 62
+            crossref = summary["partitions"][f"crossref/{today}"]
+            assert crossref["files"] == 2 and crossref["rows"] == 55
+            assert not any(name.endswith(".tmp") for _, _, files in os.walk(root) for name in files)
+
+            batches = list(scan(root, columns=["year", "citations", "source"], sources=["crossref"], batch_size=16))
+            assert all(set(b) == {"year", "citations", "source"} for b in batches)
+            years = [y for b in batches for y in b["year"]]
+            citations = [c for b in batches for c in b["citations"]]
+            assert sorted(years) == sorted(2000 + i % 25 for i in range(55))
+            assert sum(c for c in citations if c) == sum(range(1, 55, 2)) and citations.count(None) == 28
+            assert {s for b in batches for s in b["source"]} == {"crossref"}
+
+            row = next(scan(root, sources=["arxiv"]))
+            assert row["authors"][0] == ["A0", "B"] and row["query"][0] is None and row["date"][0] == today
+            assert list(scan(root, since="2999-01-01")) == []
+            assert len(data_files(root, sources=["arxiv"])) == 1
+
+
+def test_agent_and_paginate_export():
+    with tempfile.TemporaryDirectory() as tmp:
+        agent = ClaudeAcademicAgent(api_key="test-key", corpus_writer=CorpusWriter(os.path.join(tmp, "agent"),
+                                                                                   fmt="jsonl"))
+        for name, client in list(agent.mcp_clients.items()):
+            agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name, latency=0.001, seed=1)
+
+        async def run_tools():
+            await agent.execute_tool("crossref_search", {"query": "transformer", "rows": 5})
+            await agent.execute_tool("deep_research", {"searchQuery": "transformer", "count": 10})
+            await agent.corpus_writer.afinalize()
+            return await export_records("deep_research", "LLM", os.path.join(tmp, "pages"), "jsonl",
+                                        client=StandInMCPClient(6002, "DeepResearch", latency=0.001, seed=1),
+                                        page_size=20, max_records=100)
+
+        stats = asyncio.run(run_tools())
+        assert stats["rows"] == 100
+        batch = {}
+        for part in scan(os.path.join(tmp, "agent"), columns=["source", "query", "title"]):
+            for source, query in zip(part["source"], part["query"]):
+                batch.setdefault(source, set()).add(query)
+        assert batch == {"crossref": {"transformer"}, "deep_research": {"transformer"}}
+        assert summarize(os.path.join(tmp, "pages"))["rows"] == 100
+
+
+if __name__ == "__main__":
+    test_partitions_dedup_and_column_scan()
+    test_agent_and_paginate_export()
+    print(f"✅ 语料导出（{', '.join(FORMATS)}）：分区写出、去重、按列扫描")
@@ -0,0 +1,100 @@
+"""
+CPU 卸载测试
+用途：验证按大小选择执行位置、进程池经共享内存解码的结果与本地解码一致（包括截断与解析失败）、
+共享内存块用后释放、CPU 密集的 Python 代码放进线程池后事件循环延迟明显下降，
+以及代理在卸载后返回给 Claude 的文本不变
+
+运行：python test_cpu_offload.py  或  python -m pytest test_cpu_offload.py
+"""
+import asyncio
+import json
+import os
+import time
+
+from claude_agent import ClaudeAcademicAgent
+from cpu_offload import CPUOffloader, LoopLagMonitor, approx_chars
+from json_payload import decode_payload, dumps
+from mcp_standin import StandInMCPClient
+
+
+def _payload(n: int) -> str:
+    return json.dumps({"status": "ok", "message": {"facets": {"a": list(range(50))}, "items": [
+        {"DOI": f"10.1/{i}", "title": [f"论文 {i}"], "abstract": "x" * 300} for i in range(n)]}}, ensure_ascii=False)
+
+
+def _shm_blocks():
+    return {n for n in os.listdir("/dev/shm") if n.startswith("psm_")} if os.path.isdir("/dev/shm") else set()
+
+
+def test_mode_selection_and_process_decode():
+    offloader = CPUOffloader(thread_threshold=1_000, process_threshold=20_000, max_workers=1)
+    assert [offloader.mode_for(n) for n in (10, 5_000, 50_000)] == ["inline", "thread", "process"]
+    assert offloader.mode_for(50_000, allow_process=False) == "thread"
+    big = {"items": [{"t": "y" * 100} for _ in range(10_000)]}
+    assert approx_chars(big, 1_000) > 1_000 and approx_chars({"a": "bc"}, 1_000) < 20
+
+    text = _payload(200)
+    before = _shm_blocks()
+
+    async def main():
+        try:
+            full = await offloader.decode(text, "search_works")
+            capped = await offloader.decode(text, "search_works", max_chars=30_000)
+            try:
+                await offloader.decode(text[:-5], "search_works")
+                raise AssertionError("应当抛出 JSONDecodeError")
+            except json.JSONDecodeError:
+                pass
+            small = await offloader.decode('{"ok": true}', "search_works")
+            return full, capped, small
+        finally:
+            offloader.shutdown()
+
+    full, capped, small = asyncio.run(main())
+    assert full == decode_payload(text, "search_works") and len(full["message"]["items"]) == 200
+    assert capped == decode_payload(text, "search_works", 30_000) and "_truncated" in capped
+    assert small == {"ok": True}
+    assert offloader.stats() == {"inline": 1, "thread": 0, "process": 3}
+    assert _shm_blocks() <= before
+
+
+def _spin(seconds: float) -> int:
+    deadline, n = time.perf_counter() + seconds, 0
+    while time.perf_counter() < deadline:
+        n += 1
+    return n
+
+
+def test_thread_offload_reduces_loop_lag():
+    async def measure(size: int):
+        offloader = CPUOffloader(thread_threshold=1_000, process_threshold=None)
+        monitor = LoopLagMonitor(interval=0.005)
+        monitor.start()
+        await asyncio.sleep(0.02)
+        await offloader.run("test", _spin, 0.3, size=size)
+        return (await monitor.stop())["max_ms"]
+
+    inline_lag = asyncio.run(measure(10))
+    thread_lag = asyncio.run(measure(10_000))
+    assert inline_lag >= 250 and thread_lag < 150, (inline_lag, thread_lag)
+
+
+def test_agent_postprocess_offloaded_output_unchanged():
+    offloader = CPUOffloader(thread_threshold=100, process_threshold=None)
+    agent = ClaudeAcademicAgent(api_key="test-key", offloader=offloader)
+    client = StandInMCPClient(6000, "Crossref", latency=0.001, seed=1)
+    agent.mcp_clients["crossref"] = client
+
+    async def call():
+        return await agent.execute_tool("crossref_search", {"query": "transformer", "rows": 20})
+
+    text = asyncio.run(call())
+    assert text == dumps(json.loads(text)) and len(json.loads(text)["message"]["items"]) == 20
+    assert offloader.stats()["thread"] == 1
+
+
+if __name__ == "__main__":
+    test_mode_selection_and_process_decode()
+    test_thread_offload_reduces_loop_lag()
+    test_agent_postprocess_offloaded_output_unchanged()
+    print("✅ CPU 卸载：按大小选择执行位置、共享内存解码一致、循环延迟下降")
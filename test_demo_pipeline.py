@@ -0,0 +1,64 @@
+"""
+演示报告流水线测试
+用途：不访问 MCP 服务，用替身验证三个数据源并行抓取、跨数据源去重、报告逐条写出（首条输出早于结束），
+以及规范化阶段变慢时有界队列让抓取暂停，已请求但未处理的数据不超过队列容量
+
+运行：python test_demo_pipeline.py  或  python -m pytest test_demo_pipeline.py
+"""
+import asyncio
+import dataclasses
+import os
+import tempfile
+import time
+
+from demo_mcp_tools import DEMO_SOURCES, run_pipeline
+from mcp_standin import StandInMCPClient
+
+
+def _clients(latency: float):
+    return {s.port: StandInMCPClient(s.port, s.service_name, latency=latency, seed=1) for s in DEMO_SOURCES}
+
+
+def test_parallel_fetch_dedup_and_incremental_report():
+    # 第四个数据源与第一个完全相同，结果应全部被去重
+    sources = DEMO_SOURCES + [dataclasses.replace(DEMO_SOURCES[0], label="DeepResearch (重复)")]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "report.md")
+        stats = asyncio.run(run_pipeline(path, count=120, page_size=25, sources=sources, clients=_clients(0.01)))
+        assert stats["written"] == 360 and stats["duplicates"] == 120 and stats["pages"] == 4 * 5
+        # 第一页返回就开始写报告，不等其余页
+        assert stats["ttfo_s"] < stats["elapsed_s"] / 2
+        with open(path, "r", encoding="utf-8") as f:
+            report = f.read()
+        assert report.count("\n## ") == 360 and "## 360. " in report
+        assert "arXiv ID" in report and "DOI" in report
+        assert report.rstrip().endswith("**论文总数**: 360（去重 120 篇）")
+
+
+def test_backpressure_bounds_fetched_but_unprocessed():
+    client = StandInMCPClient(6002, "DeepResearch", latency=0.0, seed=1)
+    page_size, page_queue = 10, 2
+    backlog = []
+    processed = [0]
+
+    def slow_normalize(item):
+        # 规范化阶段很慢（阻塞事件循环），抓取只能在队列有空位时继续
+        processed[0] += 1
+        backlog.append(client.calls * page_size - processed[0])
+        time.sleep(0.0002)
+        return DEMO_SOURCES[0].normalize(item)
+
+    source = dataclasses.replace(DEMO_SOURCES[0], normalize=slow_normalize)
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = asyncio.run(run_pipeline(os.path.join(tmp, "report.md"), count=2000, page_size=page_size,
+                                         sources=[source], clients={6002: client}, page_queue=page_queue,
+                                         record_queue=5))
+    assert stats["written"] == 2000 and client.calls == 200
+    # 队列中的页 + 规范化正在处理的一页 + 抓取方手里等待入队的一页
+    assert max(backlog) <= (page_queue + 2) * page_size
+
+
+if __name__ == "__main__":
+    test_parallel_fetch_dedup_and_incremental_report()
+    test_backpressure_bounds_fetched_but_unprocessed()
+    print("✅ 演示报告流水线：并行抓取、去重、流式写出、背压")
@@ -0,0 +1,145 @@
+"""
+MCP 返回解码测试
+用途：验证小返回与 json.loads 结果一致、大返回只保留工具的主要数据路径、
+超过上限时在条目边界或字符串中间截断并给出 _truncated 说明，格式化（带缩进）的 JSON 也能逐成员解码，
+顶层是数组、字符串或不是 JSON 的文本被截断时同样带标记，以及被截断的结果不写入工具结果缓存
+
+运行：python test_json_payload.py  或  python -m pytest test_json_payload.py
+"""
+import asyncio
+import json
+import os
+import tempfile
+
+import json_payload
+from claude_agent import ClaudeAcademicAgent
+from json_payload import EXTRACT_PATHS, decode_payload, dumps, is_truncated, loads, stream_decode
+from mcp_sdk import GiiispMCPClient
+from metrics import MCP_PAYLOAD_TRUNCATED
+from result_cache import ResultCache
+
+
+def _crossref(n: int, abstract_len: int = 200):
+    return {
+        "status": "ok",
+        "message-type": "work-list",
+        "message": {
+            "total-results": n,
+            "facets": {"type": {"values": {"journal-article": n}}},
+            "items": [{"DOI": f"10.1/{i}", "title": [f"论文 {i}"], "abstract": "x" * abstract_len} for i in range(n)],
+        },
+    }
+
+
+def test_small_payload_matches_json_loads():
+    payload = _crossref(5)
+    text = json.dumps(payload, ensure_ascii=False)
+    assert decode_payload(text, "search_works") == payload == loads(text)
+    assert loads(dumps(payload)) == payload
+    assert "论文" in dumps(payload)
+
+
+def test_large_payload_keeps_only_extract_path():
+    payload = _crossref(50)
+    for text in (json.dumps(payload), json.dumps(payload, indent=2)):
+        result = stream_decode(text, EXTRACT_PATHS["search_works"])
+        assert result["message"]["items"] == payload["message"]["items"]
+        assert result["message"]["total-results"] == 50 and result["status"] == "ok"
+        assert "facets" not in result["message"] and result["_dropped"] == ["message.facets"]
+        assert not is_truncated(result)
+
+
+def test_truncates_at_cap_with_marker():
+    payload = _crossref(100, abstract_len=500)
+    text = json.dumps(payload)
+    result = stream_decode(text, ("message", "items"), max_chars=6000)
+    items = result["message"]["items"]
+    info = result["_truncated"]
+    assert 5 <= len(items) <= 12 and info["kept_items"] == len(items)
+    assert info["payload_chars"] == len(text) and info["kept_chars"] <= 6000
+    assert items[:-1] == payload["message"]["items"][:len(items) - 1]
+    assert info["at"].startswith(f"message.items[{len(items) - 1}]")
+
+
+def test_truncates_inside_single_large_document():
+    # 没有登记路径的工具（如 BioC 全文）：从根开始保留到上限，超长字符串截断
+    article = {"id": "PMC1", "documents": [{"passages": [{"text": "y" * 5000} for _ in range(10)]}]}
+    result = decode_payload(json.dumps(article), "get_article_info", max_chars=12000)
+    passages = result["documents"][0]["passages"]
+    assert result["id"] == "PMC1" and len(passages) == 3
+    assert passages[2]["text"].endswith("…") and len(passages[2]["text"]) < 5000
+    assert result["_truncated"]["at"] == "documents[0].passages[2].text"
+
+
+def test_truncated_top_level_array_and_text_are_marked():
+    items = [{"id": i, "title": f"论文 {i}"} for i in range(100)]
+    result = stream_decode(json.dumps(items), max_chars=1000)
+    assert is_truncated(result) and result["_truncated"]["kept_items"] == len(result["items"]) < 100
+    assert result["items"] == items[:len(result["items"])]
+
+    result = decode_payload(json.dumps("z" * 5000), "SomeTool", max_chars=1000)
+    assert is_truncated(result) and result["value"].endswith("…") and len(result["value"]) <= 1001
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(os.path.join(tmp, "cache.sqlite"))
+        assert cache.put("crossref_search", {"query": "x"}, result) is False
+        assert cache.put("crossref_search", {"query": "x"}, items) is True
+        cache.close()
+
+
+class PlainTextSession:
+    async def call_tool(self, name, arguments):
+        return type("Result", (), {"content": [type("Content", (), {"type": "text", "text": "纯文本" * 1000})()]})()
+
+
+def test_non_json_text_is_marked_when_cut():
+    client = GiiispMCPClient(6002, "Test", max_payload_chars=1000)
+    before = MCP_PAYLOAD_TRUNCATED.labels("6002").value
+    result = asyncio.run(client._invoke(PlainTextSession(), ["Echo"], "Echo", {}, {}))
+    assert is_truncated(result) and result["text"] == "纯文本" * 333 + "纯…"
+    assert result["_truncated"]["payload_chars"] == 3000
+    assert MCP_PAYLOAD_TRUNCATED.labels("6002").value == before + 1
+
+    client.max_payload_chars = 10 ** 6
+    assert asyncio.run(client._invoke(PlainTextSession(), ["Echo"], "Echo", {}, {})) == "纯文本" * 1000
+
+
+class CappedClient:
+    """按 max_chars 解码一个大 Crossref 返回，与 GiiispMCPClient 设置了较小 max_payload_chars 时一致"""
+
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.calls = 0
+
+    async def call_tool(self, tool_name, args):
+        self.calls += 1
+        return decode_payload(json.dumps(_crossref(100, abstract_len=500)), tool_name, self.max_chars)
+
+
+def test_truncated_results_are_not_cached():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(os.path.join(tmp, "cache.sqlite"))
+        agent = ClaudeAcademicAgent(api_key="test-key", result_cache=cache)
+        agent.mcp_clients["crossref"] = CappedClient(6000)
+        first = asyncio.run(agent._cached_call("crossref_search", {"query": "LLM"}))
+        assert is_truncated(first) and cache.stats()["entries"] == 0
+
+        # 上限调大后的调用拿到完整结果，并且只有完整结果被缓存
+        agent.mcp_clients["crossref"] = CappedClient(10 ** 6)
+        full = asyncio.run(agent._cached_call("crossref_search", {"query": "LLM"}))
+        assert not is_truncated(full) and len(full["message"]["items"]) == 100
+        assert asyncio.run(agent._cached_call("crossref_search", {"query": "LLM"})) == full
+        assert agent.mcp_clients["crossref"].calls == 1 and cache.stats()["entries"] == 1
+        assert cache.put("crossref_search", {"query": "x"}, [full, first]) is False
+        cache.close()
+
+
+if __name__ == "__main__":
+    test_small_payload_matches_json_loads()
+    test_large_payload_keeps_only_extract_path()
+    test_truncates_at_cap_with_marker()
+    test_truncates_inside_single_large_document()
+    test_truncated_top_level_array_and_text_are_marked()
+    test_non_json_text_is_marked_when_cut()
+    test_truncated_results_are_not_cached()
+    print(f"✅ 返回解码（{json_payload.JSON_BACKEND}）：按路径保留、按上限截断、截断结果不缓存")
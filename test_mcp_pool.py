@@ -0,0 +1,67 @@
+"""
+MCP 连接池测试
+用途：不访问网络，把建连换成立即就绪的假会话，验证连接池只增不减地扩充，
+以及 --warmup 预热（每个服务 1 个会话）之后 start_mcp_pools(size) 仍把每个服务的连接池扩充到 size
+
+运行：python test_mcp_pool.py  或  python -m pytest test_mcp_pool.py
+"""
+import asyncio
+
+from claude_agent import ClaudeAcademicAgent
+from mcp_sdk import MCPSessionPool
+
+
+async def _fake_hold(self):
+    """代替真实建连：立即算作一个就绪的会话，直到被取消"""
+    self.live += 1
+    self._settled.set()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        self.live -= 1
+
+
+def _with_fake_hold(coro_fn):
+    hold = MCPSessionPool._hold
+    MCPSessionPool._hold = _fake_hold
+    try:
+        return asyncio.run(coro_fn())
+    finally:
+        MCPSessionPool._hold = hold
+
+
+def test_pool_resize_only_grows():
+    async def scenario():
+        pool = MCPSessionPool("http://127.0.0.1:1/sse", 1, size=1)
+        pool.start()
+        assert await pool.wait_ready(1.0)
+        pool.resize(3)
+        pool.resize(2)
+        await asyncio.sleep(0)
+        assert (pool.size, len(pool._holders), pool.live) == (3, 3, 3)
+        assert [t.get_name() for t in pool._holders] == ["mcp-pool-1-0", "mcp-pool-1-1", "mcp-pool-1-2"]
+        await pool.close()
+        assert pool.live == 0
+
+    _with_fake_hold(scenario)
+
+
+def test_start_mcp_pools_after_warmup_resizes():
+    async def scenario():
+        agent = ClaudeAcademicAgent(api_key="test-key")
+        await agent.start_warmup()
+        assert all(client.pool.size == 1 for client in agent.mcp_clients.values())
+
+        report = await agent.start_mcp_pools(3)
+        assert all(r["ok"] for r in report.values()) and len(report) == len(agent.mcp_clients)
+        await asyncio.sleep(0)
+        assert all((client.pool.size, client.pool.live) == (3, 3) for client in agent.mcp_clients.values())
+        await agent.aclose()
+
+    _with_fake_hold(scenario)
+
+
+if __name__ == "__main__":
+    test_pool_resize_only_grows()
+    test_start_mcp_pools_after_warmup_resizes()
+    print("✅ MCP 连接池：只增不减地扩充、--warmup 之后 start_mcp_pools 扩充到指定大小")
@@ -3,8 +3,16 @@ MCP 工具连接测试脚本
 用途：在没有 Claude API Key 的情况下，测试 6000-6007 端口的 MCP 服务是否正常工作
 """
 import asyncio
+import datetime
+import json
+import math
+import random
 import sys
-from mcp_sdk import GiiispMCPClient
+import time
+from typing import Dict, List, Optional
+from mcp_sdk import AsyncRateLimiter, GiiispMCPClient
+from mcp_standin import StandInMCPClient
+from agent_logging import setup_logging
 
 # Windows 控制台 UTF-8
 if sys.platform == "win32":
@@ -16,6 +24,67 @@ if sys.platform == "win32":
             sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", errors="replace")
 
 
+# 每个端口的标准测试用例（连通性测试和压测共用）
+TEST_CASES = [
+    {
+        "port": 6000,
+        "name": "Crossref",
+        "tool": "search_works",
+        "args": {"query": "Machine Learning", "rows": 1},
+        "description": "搜索学术文献元数据"
+    },
+    {
+        "port": 6001,
+        "name": "BioC",
+        "tool": "get_article_info",
+        "args": {"id": "PMC7095368"},
+        "description": "获取 PubMed Central 文献"
+    },
+    {
+        "port": 6002,
+        "name": "DeepResearch",
+        "tool": "DeepResearch",
+        "args": {"searchQuery": "LLM", "count": 1},
+        "description": "集思谱深度研究引擎"
+    },
+    {
+        "port": 6003,
+        "name": "Arxiv Abstract",
+        "tool": "searchArxivByAbstract",
+        "args": {"key": "GPT", "pageSize": 1},
+        "description": "通过摘要搜索 arXiv"
+    },
+    {
+        "port": 6004,
+        "name": "OpenLibrary",
+        "tool": "searchBooks",
+        "args": {"query": "Deep Learning", "limit": 1},
+        "description": "搜索图书信息"
+    },
+    {
+        "port": 6005,
+        "name": "Entrez",
+        "tool": "ESearch",
+        "args": {"db": "pubmed", "term": "covid", "retmax": 1},
+        "description": "搜索 NCBI 数据库"
+    },
+    {
+        "port": 6006,
+        "name": "Arxiv ID",
+        "tool": "SearchByArxivNo",
+        "args": {"key": "1706.03762"},
+        "description": "通过 ID 查找 arXiv 论文"
+    },
+    {
+        "port": 6007,
+        "name": "Arxiv Title",
+        "tool": "searchArxivByTitle",
+        "args": {"key": "Attention Is All You Need"},
+        "description": "通过标题搜索 arXiv"
+    }
+]
+
+
 async def test_mcp_services():
     """测试所有 MCP 服务的连通性"""
 
@@ -24,65 +93,7 @@ async def test_mcp_services():
     print("="*80)
     print("说明：此测试不需要 Claude API Key，仅测试 MCP 服务是否正常运行\n")
 
-    # 定义测试用例
-    test_cases = [
-        {
-            "port": 6000,
-            "name": "Crossref",
-            "tool": "search_works",
-            "args": {"query": "Machine Learning", "rows": 1},
-            "description": "搜索学术文献元数据"
-        },
-        {
-            "port": 6001,
-            "name": "BioC",
-            "tool": "get_article_info",
-            "args": {"id": "PMC7095368"},
-            "description": "获取 PubMed Central 文献"
-        },
-        {
-            "port": 6002,
-            "name": "DeepResearch",
-            "tool": "DeepResearch",
-            "args": {"searchQuery": "LLM", "count": 1},
-            "description": "集思谱深度研究引擎"
-        },
-        {
-            "port": 6003,
-            "name": "Arxiv Abstract",
-            "tool": "searchArxivByAbstract",
-            "args": {"key": "GPT", "pageSize": 1},
-            "description": "通过摘要搜索 arXiv"
-        },
-        {
-            "port": 6004,
-            "name": "OpenLibrary",
-            "tool": "searchBooks",
-            "args": {"query": "Deep Learning", "limit": 1},
-            "description": "搜索图书信息"
-        },
-        {
-            "port": 6005,
-            "name": "Entrez",
-            "tool": "ESearch",
-            "args": {"db": "pubmed", "term": "covid", "retmax": 1},
-            "description": "搜索 NCBI 数据库"
-        },
-        {
-            "port": 6006,
-            "name": "Arxiv ID",
-            "tool": "SearchByArxivNo",
-            "args": {"key": "1706.03762"},
-            "description": "通过 ID 查找 arXiv 论文"
-        },
-        {
-            "port": 6007,
-            "name": "Arxiv Title",
-            "tool": "searchArxivByTitle",
-            "args": {"key": "Attention Is All You Need"},
-            "description": "通过标题搜索 arXiv"
-        }
-    ]
+    test_cases = TEST_CASES
 
     results = []
 
@@ -167,18 +178,208 @@ async def test_single_service(port: int):
         print("\n❌ 未获取到数据")
 
 
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """最近秩法求百分位数（输入需已排序）"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _parse_mix(mix: Optional[str]) -> Dict[int, float]:
+    """
+    解析工具配比，例如 "6000=3,6002=1"；不提供时八个服务等权重
+    :raises ValueError: 格式错误、端口不在 TEST_CASES 中、权重为负数或没有正权重
+    """
+    if not mix:
+        return {test["port"]: 1.0 for test in TEST_CASES}
+    known = {test["port"] for test in TEST_CASES}
+    weights = {}
+    for part in filter(None, (p.strip() for p in mix.split(","))):
+        port, _, weight = part.partition("=")
+        try:
+            port, weight = int(port), float(weight or 1)
+        except ValueError:
+            raise ValueError(f"--mix 格式应为 端口=权重，逗号分隔: {part}") from None
+        if port not in known:
+            raise ValueError(f"--mix 中的端口 {port} 不是已知服务（可选 {min(known)}-{max(known)}）")
+        if weight < 0:
+            raise ValueError(f"--mix 中的权重不能为负数: {part}")
+        weights[port] = weight
+    if not any(w > 0 for w in weights.values()):
+        raise ValueError(f"--mix 没有任何权重为正的服务: {mix}")
+    return weights
+
+
+async def run_load_test(users: int = 10, duration: float = 30.0, qps: float = 0.0,
+                        mix: Optional[str] = None, stand_in: bool = False,
+                        stand_in_latency: float = 0.05, stand_in_error_rate: float = 0.0) -> Dict:
+    """
+    并发压测：users 个虚拟用户在 duration 秒内按配比循环调用各服务
+    :param qps: 全局目标 QPS，0 表示不限速（每个用户收到响应后立即发下一次请求）
+    :param mix: 工具配比，端口=权重，逗号分隔
+    :param stand_in: 使用本地替身代替真实服务
+    :return: 每个服务的吞吐、错误率和延迟分位数
+    """
+    weights = _parse_mix(mix)
+    cases = {test["port"]: test for test in TEST_CASES if test["port"] in weights}
+    ports = list(cases)
+    port_weights = [weights[p] for p in ports]
+
+    if stand_in:
+        clients = {p: StandInMCPClient(p, cases[p]["name"], latency=stand_in_latency,
+                                       error_rate=stand_in_error_rate) for p in ports}
+    else:
+        clients = {p: GiiispMCPClient(p, cases[p]["name"]) for p in ports}
+
+    latencies: Dict[int, List[float]] = {p: [] for p in ports}
+    errors: Dict[int, int] = {p: 0 for p in ports}
+    limiter = AsyncRateLimiter(qps)
+    deadline = time.monotonic() + duration
+
+    async def virtual_user(seed: int):
+        rng = random.Random(seed)
+        while True:
+            await limiter.acquire()
+            if time.monotonic() >= deadline:
+                return
+            port = rng.choices(ports, weights=port_weights)[0]
+            case = cases[port]
+            started = time.perf_counter()
+            try:
+                data = await clients[port].call_tool(case["tool"], case["args"])
+            except Exception:
+                data = None
+            latencies[port].append(time.perf_counter() - started)
+            if not data:
+                errors[port] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+
+    services = {}
+    for port in ports:
+        values = sorted(latencies[port])
+        total = len(values)
+        services[str(port)] = {
+            "name": cases[port]["name"],
+            "requests": total,
+            "errors": errors[port],
+            "error_rate": round(errors[port] / total, 4) if total else 0.0,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(_percentile(values, 50) * 1000, 1),
+            "p90_ms": round(_percentile(values, 90) * 1000, 1),
+            "p95_ms": round(_percentile(values, 95) * 1000, 1),
+            "p99_ms": round(_percentile(values, 99) * 1000, 1),
+            "max_ms": round(values[-1] * 1000, 1) if values else 0.0,
+        }
+
+    return {
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {"users": users, "duration": duration, "qps": qps, "mix": weights,
+                   "target": "stand-in" if stand_in else "remote"},
+        "elapsed_s": round(elapsed, 2),
+        "services": services,
+    }
+
+
+def print_load_report(report: Dict, baseline: Optional[Dict] = None):
+    """打印压测结果表；提供 baseline 时追加与上次报告的 p50/p99/吞吐对比"""
+    print("\n" + "="*80)
+    print(f"📊 压测结果 ({report['config']['target']}, {report['config']['users']} 并发, "
+          f"{report['elapsed_s']}s)")
+    print("="*80)
+    header = f"  {'端口':>4s} | {'服务':16s} | {'请求':>6s} | {'错误率':>6s} | {'吞吐/s':>7s} | " \
+             f"{'p50ms':>7s} | {'p90ms':>7s} | {'p99ms':>7s} | {'maxms':>7s}"
+    if baseline:
+        header += f" | {'Δp50':>7s} | {'Δp99':>7s} | {'Δ吞吐':>7s}"
+    print(header)
+    print("-" * len(header))
+    for port, row in report["services"].items():
+        line = (f"  {port:>4s} | {row['name']:16s} | {row['requests']:6d} | {row['error_rate']:6.1%} | "
+                f"{row['throughput_rps']:7.2f} | {row['p50_ms']:7.1f} | {row['p90_ms']:7.1f} | "
+                f"{row['p99_ms']:7.1f} | {row['max_ms']:7.1f}")
+        old = (baseline or {}).get("services", {}).get(port)
+        if old:
+            line += (f" | {row['p50_ms'] - old['p50_ms']:+7.1f} | {row['p99_ms'] - old['p99_ms']:+7.1f} | "
+                     f"{row['throughput_rps'] - old['throughput_rps']:+7.2f}")
+        print(line)
+    print("="*80 + "\n")
+
+
+def test_percentile_boundary_ranks():
+    """最近秩法的边界：rank = ceil(pct/100 * n)，至少为 1"""
+    values = [float(i) for i in range(1, 11)]
+    assert _percentile([], 50) == 0.0
+    assert _percentile(values, 0) == 1.0 and _percentile(values, 5) == 1.0
+    assert _percentile(values, 10) == 1.0 and _percentile(values, 11) == 2.0
+    assert _percentile(values, 50) == 5.0 and _percentile(values, 99) == 10.0 and _percentile(values, 100) == 10.0
+    assert _percentile([3.0], 50) == 3.0 and _percentile([3.0], 100) == 3.0
+
+
+def test_parse_mix_rejects_bad_weights():
+    assert _parse_mix("6000=3, 6002") == {6000: 3.0, 6002: 1.0}
+    assert _parse_mix("6000=0,6001=2") == {6000: 0.0, 6001: 2.0}
+    for mix in ("6000=3,6001=-1", "6000=-1", "6000=0", "9999=1", "6000=abc"):
+        try:
+            _parse_mix(mix)
+        except ValueError:
+            continue
+        raise AssertionError(f"--mix {mix} 应被拒绝")
+
+
 if __name__ == "__main__":
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
+    setup_logging()
+
     # 检查命令行参数
-    if len(sys.argv) > 1:
+    if "--load" in sys.argv:
+        import argparse
+
+        parser = argparse.ArgumentParser(description="MCP 服务并发压测")
+        parser.add_argument("--load", action="store_true", help="启用压测模式")
+        parser.add_argument("--users", type=int, default=10, help="并发虚拟用户数，默认 10")
+        parser.add_argument("--duration", type=float, default=30.0, help="压测时长（秒），默认 30")
+        parser.add_argument("--qps", type=float, default=0.0, help="全局目标 QPS，默认不限速")
+        parser.add_argument("--mix", help="工具配比，例如 6000=3,6002=1；默认八个服务等权重")
+        parser.add_argument("--stand-in", action="store_true", help="使用本地替身代替真实服务")
+        parser.add_argument("--stand-in-latency", type=float, default=0.05, help="替身平均延迟（秒）")
+        parser.add_argument("--stand-in-error-rate", type=float, default=0.0, help="替身失败概率")
+        parser.add_argument("--report", help="JSON 报告输出路径，默认 load_test_report_<时间>.json")
+        parser.add_argument("--compare", help="与之前的 JSON 报告对比")
+        opts = parser.parse_args()
+        try:
+            _parse_mix(opts.mix)
+        except ValueError as e:
+            parser.error(str(e))
+
+        setup_logging("WARNING")
+        report = asyncio.run(run_load_test(
+            users=opts.users, duration=opts.duration, qps=opts.qps, mix=opts.mix,
+            stand_in=opts.stand_in, stand_in_latency=opts.stand_in_latency,
+            stand_in_error_rate=opts.stand_in_error_rate,
+        ))
+        baseline = None
+        if opts.compare:
+            with open(opts.compare, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        print_load_report(report, baseline)
+
+        report_path = opts.report or f"load_test_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📄 JSON 报告已保存到: {report_path}")
+    elif len(sys.argv) > 1:
         try:
             port = int(sys.argv[1])
             asyncio.run(test_single_service(port))
         except ValueError:
             print("❌ 错误: 端口号必须是数字")
             print("用法: python test_mcp_tools.py [端口号]")
+            print("      python test_mcp_tools.py --load [--users N] [--duration S] [--qps Q] [--mix 6000=3,6002=1] [--stand-in]")
             print("示例: python test_mcp_tools.py 6002")
     else:
         # 运行完整测试
@@ -0,0 +1,85 @@
+"""
+运行时指标测试
+用途：验证直方图分桶的 le 语义（等于上界的值计入该桶）和累加渲染、计数器 / 仪表盘的文本暴露格式与标签转义、
+标签数量不符时报错、prompt 缓存命中率按全部模型的 token 计数计算，以及 /metrics 端点
+
+运行：python test_metrics.py  或  python -m pytest test_metrics.py
+"""
+import urllib.request
+from types import SimpleNamespace
+
+from metrics import (MODEL_TOKENS, PROMPT_CACHE_HIT_RATIO, MetricsRegistry, observe_model_response,
+                     start_metrics_server)
+
+
+def test_histogram_buckets_use_le_semantics():
+    registry = MetricsRegistry()
+    latency = registry.histogram("tool_latency_seconds", "耗时", ("tool",), buckets=(1.0, 0.1, 0.5, float("inf")))
+    assert latency.buckets == (0.1, 0.5, 1.0)
+    for value in (0.1, 0.3, 0.5, 0.05, 2.0):
+        latency.labels("deep_research").observe(value)
+    lines = latency.render()
+    assert lines[:2] == ["# HELP tool_latency_seconds 耗时", "# TYPE tool_latency_seconds histogram"]
+    assert lines[2:] == [
+        'tool_latency_seconds_bucket{tool="deep_research",le="0.1"} 2',
+        'tool_latency_seconds_bucket{tool="deep_research",le="0.5"} 4',
+        'tool_latency_seconds_bucket{tool="deep_research",le="1"} 4',
+        'tool_latency_seconds_bucket{tool="deep_research",le="+Inf"} 5',
+        'tool_latency_seconds_sum{tool="deep_research"} 2.95',
+        'tool_latency_seconds_count{tool="deep_research"} 5',
+    ]
+
+
+def test_counter_gauge_rendering_and_labels():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "调用次数", ("tool", "status"))
+    assert registry.counter("calls_total", "重复注册", ("tool", "status")) is calls
+    calls.labels("deep_research", "ok").inc()
+    calls.labels("deep_research", "ok").inc(2)
+    calls.labels('a"b\\c\nd', "error").inc()
+    in_flight = registry.gauge("in_flight", "在途调用数")
+    in_flight.inc(3)
+    in_flight.dec()
+    try:
+        calls.labels("deep_research")
+    except ValueError as e:
+        assert "calls_total" in str(e)
+    else:
+        raise AssertionError("标签数量不符时应当报错")
+
+    assert [key for key, _ in calls.children()] == [("deep_research", "ok"), ('a"b\\c\nd', "error")]
+    assert registry.render().splitlines() == [
+        "# HELP calls_total 调用次数", "# TYPE calls_total counter",
+        'calls_total{tool="deep_research",status="ok"} 3',
+        'calls_total{tool="a\\"b\\\\c\\nd",status="error"} 1',
+        "# HELP in_flight 在途调用数", "# TYPE in_flight gauge",
+        "in_flight 2",
+    ]
+
+
+def test_prompt_cache_hit_ratio_and_endpoint():
+    usage = SimpleNamespace(input_tokens=100, output_tokens=50, cache_creation_input_tokens=200,
+                            cache_read_input_tokens=700)
+    observe_model_response("test-metrics-model", SimpleNamespace(usage=usage), 0.2)
+    tokens = {key: child.value for key, child in MODEL_TOKENS.children()}
+    assert tokens[("test-metrics-model", "cache_read")] == 700 and tokens[("test-metrics-model", "output")] == 50
+    read = sum(v for (_, kind), v in tokens.items() if kind == "cache_read")
+    total = sum(v for (_, kind), v in tokens.items() if kind != "output")
+    assert PROMPT_CACHE_HIT_RATIO.labels().value == read / total
+
+    server = start_metrics_server(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode("utf-8")
+        assert 'agent_model_tokens_total{model="test-metrics-model",type="cache_read"} 700' in body
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    test_histogram_buckets_use_le_semantics()
+    test_counter_gauge_rendering_and_labels()
+    test_prompt_cache_hit_ratio_and_endpoint()
+    print("✅ 指标：直方图 le 语义与累加、文本格式与转义、标签校验、缓存命中率、/metrics 端点")
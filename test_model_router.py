@@ -0,0 +1,124 @@
+"""
+模型路由测试
+用途：不访问 Claude API，验证路由规则（迭代序号、倒数迭代、连续 tool_use 轮数、上一轮停止原因）、
+JSON 策略文件的加载，以及代理在检索轮使用快模型、快模型要写综述时丢弃其响应并由强模型重做本轮，
+被丢弃的响应计入用量但不进入对话历史和检查点；默认策略与引入路由之前一样每轮用强模型
+
+运行：python test_model_router.py  或  python -m pytest test_model_router.py
+"""
+import asyncio
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from model_router import FAST_MAX_TOKENS, POLICIES, RouteRule, RoutingPolicy, load_policy
+from run_checkpoint import CheckpointStore
+from run_context import RunContext
+
+
+def _ctx(iteration: int, stop_reasons, max_iterations: int = 10) -> RunContext:
+    ctx = RunContext(instruction="t", max_iterations=max_iterations)
+    for i, stop_reason in enumerate(stop_reasons, 1):
+        ctx.usage.record_response(i, "m", SimpleNamespace(stop_reason=stop_reason))
+    ctx.iteration = iteration
+    return ctx
+
+
+def test_rules_and_policy_file():
+    policy = RoutingPolicy("t", rules=(
+        RouteRule("strong", "first", iterations=(1,)),
+        RouteRule("strong", "after_tools", after_tool_turns=3),
+        RouteRule("strong", "after_max_tokens", after_stop_reasons=("max_tokens",)),
+        RouteRule("strong", "last", iterations=(-1,)),
+    ))
+    assert policy.route(_ctx(1, [])).reason == "first"
+    assert policy.route(_ctx(3, ["tool_use", "tool_use"])).tier == "fast"
+    assert policy.route(_ctx(4, ["tool_use"] * 3)).reason == "after_tools"
+    assert policy.route(_ctx(3, ["tool_use", "max_tokens"])).reason == "after_max_tokens"
+    assert policy.route(_ctx(5, ["tool_use"] * 2, max_iterations=5)).reason == "last"
+
+    fast = policy.route(_ctx(2, ["tool_use"]))
+    assert (fast.model, fast.max_tokens) == ("claude-3-5-haiku", FAST_MAX_TOKENS)
+    assert policy.escalate(fast, SimpleNamespace(stop_reason="tool_use")) is None
+    assert policy.escalate(fast, SimpleNamespace(stop_reason="max_tokens")).reason == "escalate:max_tokens"
+    strong = POLICIES["strong"].route(_ctx(2, ["tool_use"]))
+    assert (strong.model, strong.max_tokens) == ("claude-3-5-sonnet", 4096)
+    assert POLICIES["strong"].escalate(strong, SimpleNamespace(stop_reason="end_turn")) is None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "after2.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"rules": [{"tier": "strong", "after_tool_turns": 2}], "fast_max_tokens": 300,
+                       "escalate_on": ["max_tokens"]}, f)
+        loaded = load_policy(path, fast_model="my-fast")
+    assert loaded.name == "after2" and loaded.escalate_on == ("max_tokens",)
+    assert loaded.route(_ctx(3, ["tool_use"] * 2)).tier == "strong"
+    assert loaded.route(_ctx(2, ["tool_use"])).model == "my-fast"
+    try:
+        load_policy("no-such-policy")
+        raise AssertionError("应当抛出 ValueError")
+    except ValueError:
+        pass
+
+
+class RoutedMessages:
+    """前两轮输出 tool_use；之后写 2000 token 的综述，max_tokens 不够时以 max_tokens 停止"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, model, max_tokens, tools, messages):
+        self.calls.append((model, max_tokens))
+        done = sum(1 for m in messages if m["role"] == "assistant")
+        wanted = 2000 if done >= 2 else 100
+        usage = SimpleNamespace(input_tokens=1000 + 100 * done, output_tokens=min(wanted, max_tokens),
+                                cache_creation_input_tokens=0, cache_read_input_tokens=0)
+        if done < 2:
+            return SimpleNamespace(stop_reason="tool_use", usage=usage, content=[SimpleNamespace(
+                type="tool_use", name="arxiv_search_by_id", id=f"t{done}", input={"key": f"2401.0000{done}"})])
+        stop_reason = "end_turn" if max_tokens >= wanted else "max_tokens"
+        return SimpleNamespace(stop_reason=stop_reason, usage=usage,
+                               content=[SimpleNamespace(type="text", text=f"综述 by {model}")])
+
+
+def test_agent_routes_planning_to_fast_and_escalates_synthesis():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(tmp)
+        agent = ClaudeAcademicAgent(api_key="test-key", checkpoint_store=store, router=POLICIES["fast-plan"])
+        agent.client = SimpleNamespace(messages=RoutedMessages())
+        agent.mcp_clients["arxiv_id"] = StandInMCPClient(6006, "Arxiv ID", latency=0.001, seed=1)
+        ctx = agent.new_run("LLM 综述", max_iterations=10)
+        result = asyncio.run(agent.run_context(ctx))
+
+        assert result == "综述 by claude-3-5-sonnet" and ctx.status == "completed"
+        assert agent.client.messages.calls == [("claude-3-5-haiku", FAST_MAX_TOKENS)] * 3 + [("claude-3-5-sonnet", 4096)]
+        # 被丢弃的快模型响应不进入对话历史：用户指令 + 两轮（tool_use, tool_result）
+        assert [m["role"] for m in ctx.messages] == ["user", "assistant", "user", "assistant", "user"]
+        summary = ctx.usage.summary
+        assert summary.escalations == 1 and [u.iteration for u in summary.iterations] == [1, 2, 3, 3]
+        by_model = summary.to_dict()["by_model"]
+        assert by_model["claude-3-5-haiku"]["calls"] == 3 and by_model["claude-3-5-haiku"]["discarded"] == 1
+        assert by_model["claude-3-5-sonnet"]["output_tokens"] == 2000
+        assert agent.usage_totals.to_dict()["escalations"] == 1
+
+        # 检查点只记录被采用的响应，恢复后直接得到强模型写的综述
+        responses = [e for e in store.events(ctx.run_id) if e["type"] == "response"]
+        assert [e["model"] for e in responses] == ["claude-3-5-haiku", "claude-3-5-haiku", "claude-3-5-sonnet"]
+        assert store.load(ctx.run_id).final_text == result
+
+    # 默认策略：每轮都用强模型和完整的输出预算
+    agent = ClaudeAcademicAgent(api_key="test-key")
+    agent.client = SimpleNamespace(messages=RoutedMessages())
+    agent.mcp_clients["arxiv_id"] = StandInMCPClient(6006, "Arxiv ID", latency=0.001, seed=1)
+    asyncio.run(agent.run("LLM 综述"))
+    assert agent.client.messages.calls == [("claude-3-5-sonnet", 4096)] * 3
+    assert agent.last_run_usage.escalations == 0
+
+
+if __name__ == "__main__":
+    test_rules_and_policy_file()
+    test_agent_routes_planning_to_fast_and_escalates_synthesis()
+    print("✅ 模型路由：规则匹配、策略文件、检索轮用快模型、综述轮升级到强模型")
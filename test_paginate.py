@@ -0,0 +1,98 @@
+"""
+分页采集测试
+用途：用 MCP 替身验证 iter_records 跨页去重、达到上限即停、服务不支持翻页时自动终止、
+慢消费者下预取下一页能缩短总耗时，去重集合转存到磁盘后结果不变，
+以及 Entrez 服务不提供 ESummary 时明确报错而不是静默返回空结果
+
+运行：python test_paginate.py  或  python -m pytest test_paginate.py
+"""
+import asyncio
+import sys
+import time
+
+from mcp_standin import StandInMCPClient
+from paginate import SeenKeys, iter_records
+
+
+class OverlappingStandIn(StandInMCPClient):
+    """每页与上一页重叠一半（模拟翻页期间结果集有新增），或完全忽略翻页参数；第 i 条结果的 DOI 固定为 10.1/i"""
+
+    def __init__(self, *args, ignore_paging=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ignore_paging = ignore_paging
+
+    async def call_tool(self, tool_name, args):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        start = 0 if self.ignore_paging else args["offset"] // 2
+        return {"message": {"items": [{"DOI": f"10.1/{i}", "title": [f"Paper {i}"]}
+                                      for i in range(start, start + args["rows"])]}}
+
+
+async def _collect(source, client, **kwargs):
+    return [r async for r in iter_records(source, "transformers", client=client, **kwargs)]
+
+
+def test_dedup_across_overlapping_pages():
+    client = OverlappingStandIn(6000, "Crossref", latency=0.001, seed=1)
+    records = asyncio.run(_collect("crossref_search", client, page_size=20, max_records=100, prefetch=False))
+    assert [r.doi for r in records] == [f"10.1/{i}" for i in range(100)]
+    # 第 1 页 20 条全新，之后每页只有 10 条是新的：100 条需要 9 页
+    assert client.calls == 9
+
+
+def test_stops_when_service_ignores_paging():
+    client = OverlappingStandIn(6000, "Crossref", latency=0.001, ignore_paging=True)
+    records = asyncio.run(_collect("crossref_search", client, page_size=20, max_records=1000))
+    assert len(records) == 20
+    # 第 1 页 + 两页全重复
+    assert client.calls == 3
+
+
+def test_prefetch_overlaps_slow_consumer():
+    async def consume(prefetch):
+        client = StandInMCPClient(6002, "DeepResearch", latency=0.1, seed=1)
+        started = time.perf_counter()
+        async for _ in iter_records("deep_research", "llm", client=client, page_size=10,
+                                    max_records=50, prefetch=prefetch):
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - started
+
+    sequential = asyncio.run(consume(False))
+    overlapped = asyncio.run(consume(True))
+    # 5 页：顺序时每页都要等一次请求；预取时后 4 页的请求与消费重叠
+    assert overlapped < sequential - 0.2
+
+
+def test_seen_keys_spill_to_disk():
+    seen = SeenKeys(max_in_memory=100)
+    assert all(seen.add(f"doi:10.1/{i}") for i in range(300))
+    assert not any(seen.add(f"doi:10.1/{i}") for i in range(0, 300, 7))
+    assert len(seen) == 300 and not seen._hashes
+    seen.close()
+
+
+def test_entrez_requires_esummary():
+    client = StandInMCPClient(6005, "Entrez", latency=0.001, seed=1)
+    records = asyncio.run(_collect("entrez_search", client, page_size=20, max_records=30))
+    assert len(records) == 30 and all(r.pmid for r in records)
+
+    client = StandInMCPClient(6005, "Entrez", latency=0.001, seed=1, tools=["ESearch"])
+    try:
+        asyncio.run(_collect("entrez_search", client, page_size=20, max_records=30))
+    except RuntimeError as e:
+        assert "不提供 ESummary" in str(e) and "ESearch" in str(e)
+    else:
+        raise AssertionError("缺少 ESummary 时应当报错")
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    test_dedup_across_overlapping_pages()
+    test_stops_when_service_ignores_paging()
+    test_prefetch_overlaps_slow_consumer()
+    test_seen_keys_spill_to_disk()
+    test_entrez_requires_esummary()
+    print("✅ 分页采集：跨页去重、重复页终止、预取重叠、去重集合转存、缺少 ESummary 时报错")
@@ -0,0 +1,99 @@
+"""
+本地论文索引测试
+用途：不访问 MCP 服务，用替身验证工具结果中的论文记录会被批量写入 FTS5 索引、
+同一篇论文从不同来源再次出现时合并字段、local_search 按相关度返回，
+以及 local_first 时本地完全匹配足够多就跳过网络请求、不够时照常联网
+
+运行：python test_paper_index.py  或  python -m pytest test_paper_index.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from paper_index import PaperIndex
+from paper_records import PaperRecord
+
+
+def _make_agent(path: str, local_first: bool = False) -> ClaudeAcademicAgent:
+    agent = ClaudeAcademicAgent(api_key="test-key", paper_index=PaperIndex(path, batch_size=8),
+                                local_first=local_first)
+    for name, client in list(agent.mcp_clients.items()):
+        agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name, latency=0.001, seed=1)
+    return agent
+
+
+async def _call(agent, tool_name, tool_input):
+    return json.loads(await agent.execute_tool(tool_name, tool_input))
+
+
+def test_ingest_merge_and_local_search():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = PaperIndex(os.path.join(tmp, "papers.sqlite"), batch_size=100)
+        index.add([PaperRecord(source="crossref", title="Attention Is All You Need", doi="10.1/attn", year=2017)])
+        index.add([PaperRecord(source="arxiv", title="Attention is all you need", doi="10.1/ATTN",
+                               arxiv_id="1706.03762", abstract="The dominant sequence transduction models...")])
+        index.add([PaperRecord(source="arxiv", title="BERT: Pre-training of Deep Bidirectional Transformers",
+                               arxiv_id="1810.04805v2", year=2018)])
+        # 缓冲未满时不写入；local_search 前会先写入
+        assert index.count() == 0
+        result = index.local_search("attention models", limit=5)
+        assert result["indexed"] == 2 and index.flushes == 1
+
+        # 两条 DOI 大小写不同的记录合并成一篇：标题用先到的，缺失字段由后到的补全
+        [top] = result["results"]
+        assert top["title"] == "Attention Is All You Need"
+        assert top["arxiv_id"] == "1706.03762" and top["year"] == 2017
+        assert top["sources"] == ["crossref", "arxiv"] and top["abstract"].startswith("The dominant")
+        # 没有同时包含全部检索词的论文时，用任一词匹配补足
+        mixed = index.local_search("attention transformers", limit=5)
+        assert {r["arxiv_id"] for r in mixed["results"]} == {"1706.03762", "1810.04805v2"}
+        assert index.local_search("diffusion")["results"] == []
+        assert index.stats()["p95_query_ms"] >= 0 and index.stats()["file_bytes"] > 0
+        index.close()
+
+
+def test_agent_ingests_and_prechecks():
+    async def scenario(path):
+        agent = _make_agent(path, local_first=True)
+        # 本地为空：照常联网，结果写入索引
+        first = await _call(agent, "deep_research", {"searchQuery": "graph neural networks", "count": 10})
+        assert len(first["data"]["data"]) == 10
+        assert agent.mcp_clients["deep_research"].calls == 1
+
+        # 同样的检索再来一次：本地已有 10 篇完全匹配，不再联网
+        second = await _call(agent, "deep_research", {"searchQuery": "graph neural networks", "count": 10})
+        assert second["source"] == "local_index" and len(second["results"]) == 10
+        assert agent.mcp_clients["deep_research"].calls == 1
+
+        # 要求的条数超过本地已有的数量：照常联网
+        await _call(agent, "deep_research", {"searchQuery": "graph neural networks", "count": 20})
+        assert agent.mcp_clients["deep_research"].calls == 2
+
+        # 不相关的检索词不会被本地结果“回答”
+        await _call(agent, "crossref_search", {"query": "protein folding", "rows": 5})
+        assert agent.mcp_clients["crossref"].calls == 1
+
+        found = await _call(agent, "local_search", {"query": "protein folding", "limit": 3})
+        assert found["returned"] == 3 and all("protein folding" in r["title"] for r in found["results"])
+        assert "local_search" in [t["name"] for t in agent.get_tool_definitions()]
+        await agent.aclose()
+        stats = agent.paper_index.stats()
+        # 替身的 DOI 随参数变化：count=20 的 20 篇与前 10 篇是不同的记录
+        assert stats["papers"] == 35 and stats["precheck_hit_rate"] == 0.25
+        agent.paper_index.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(scenario(os.path.join(tmp, "papers.sqlite")))
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    test_ingest_merge_and_local_search()
+    test_agent_ingests_and_prechecks()
+    print("✅ 本地论文索引：批量写入、跨来源合并、本地检索、联网前预查")
@@ -0,0 +1,117 @@
+"""
+推测预取测试
+用途：不访问 Claude API 和 MCP 服务，用假的模型客户端和 MCP 替身模拟
+“deep_research -> 对结果中的 arXiv ID 逐个 arxiv_search_by_id”的典型追查模式，
+验证预取器能提前把追查请求写入缓存、不超出每个 run 的预算，并对比开启前后的耗时
+
+运行：python test_prefetch.py  或  python -m pytest test_prefetch.py
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from prefetch import SpeculativePrefetcher, canonical_input, extract_followups
+from result_cache import ResultCache
+
+# 模拟的模型响应耗时和 MCP 调用耗时（秒）
+MODEL_LATENCY = 0.3
+TOOL_LATENCY = 0.2
+FOLLOWUPS = 3
+
+
+class FollowUpMessages:
+    """第一轮调用 deep_research，第二轮追查结果中前 FOLLOWUPS 篇的 arXiv ID，第三轮结束"""
+
+    async def create(self, model, max_tokens, tools, messages):
+        await asyncio.sleep(MODEL_LATENCY)
+        usage = SimpleNamespace(input_tokens=100, output_tokens=10,
+                                cache_creation_input_tokens=0, cache_read_input_tokens=0)
+        rounds = sum(1 for m in messages if m["role"] == "assistant")
+        if rounds == 0:
+            blocks = [SimpleNamespace(type="tool_use", name="deep_research", id="dr",
+                                      input={"searchQuery": messages[0]["content"], "count": 10})]
+        elif rounds == 1:
+            papers = json.loads(messages[-1]["content"][0]["content"])["data"]["data"]
+            # Claude 常把 ID 原样带着 arXiv: 前缀传过来
+            blocks = [SimpleNamespace(type="tool_use", name="arxiv_search_by_id", id=f"id{i}",
+                                      input={"key": p["arxivNo"]})
+                      for i, p in enumerate(papers[:FOLLOWUPS])]
+        else:
+            return SimpleNamespace(stop_reason="end_turn", usage=usage,
+                                   content=[SimpleNamespace(type="text", text="done")])
+        return SimpleNamespace(stop_reason="tool_use", content=blocks, usage=usage)
+
+
+def _make_agent(cache_path: str, prefetcher: bool) -> ClaudeAcademicAgent:
+    cache = ResultCache(cache_path)
+    prefetch = SpeculativePrefetcher(cache, budget_per_run=5, per_result=8) if prefetcher else None
+    agent = ClaudeAcademicAgent(api_key="test-key", result_cache=cache, prefetcher=prefetch)
+    agent.client = SimpleNamespace(messages=FollowUpMessages())
+    for name, client in list(agent.mcp_clients.items()):
+        agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name, latency=TOOL_LATENCY, seed=1)
+    return agent
+
+
+async def _timed_run(agent: ClaudeAcademicAgent, topic: str):
+    ctx = agent.new_run(topic, max_iterations=5)
+    started = time.perf_counter()
+    await agent.run_context(ctx)
+    return ctx, time.perf_counter() - started
+
+
+def test_extract_and_canonicalize():
+    result = {"success": True, "data": {"data": [
+        {"arxivNo": "arXiv:1706.03762", "doi": "10.1000/abc", "abstractText": "see PMC123456"},
+        {"arxivNo": "arXiv:1706.03762", "doi": "10.1000/def", "reference": [{"DOI": "10.1/skip"}]},
+    ]}}
+    followups = extract_followups("deep_research", {"searchQuery": "x"}, result)
+    assert followups == [
+        ("arxiv_search_by_id", {"key": "1706.03762"}),
+        ("bioc_get_article", {"id": "PMC123456"}),
+        ("crossref_search", {"query": "10.1000/abc", "rows": 5}),
+        ("crossref_search", {"query": "10.1000/def", "rows": 5}),
+    ]
+    assert extract_followups("arxiv_search_by_id", {"key": "1706.03762"}, result) == []
+    assert canonical_input("arxiv_search_by_id", {"key": " arXiv:1706.03762 "}) == {"key": "1706.03762"}
+    assert canonical_input("bioc_get_article", {"id": "7095368"}) == {"id": "PMC7095368"}
+
+
+def _compare():
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = _make_agent(os.path.join(tmp, "a.sqlite"), prefetcher=False)
+        _, cold_s = asyncio.run(_timed_run(baseline, "diffusion"))
+        baseline.result_cache.close()
+
+        agent = _make_agent(os.path.join(tmp, "b.sqlite"), prefetcher=True)
+        ctx, warm_s = asyncio.run(_timed_run(agent, "diffusion"))
+        stats = agent.prefetcher.stats()
+        agent.result_cache.close()
+    return agent, ctx, stats, cold_s, warm_s
+
+
+def test_prefetch_warms_followups():
+    agent, ctx, stats, cold_s, warm_s = _compare()
+    # 每条结果展开 8 个候选、预算 5：只预取前 5 个 arXiv ID，其余计入 budget
+    assert ctx.prefetched == 5
+    assert stats["scheduled"] == 5 and stats["budget"] > 0
+    # 三次追查全部由预取满足（缓存命中或等待进行中的预取）
+    assert stats["used"] + stats["joined"] == FOLLOWUPS
+    assert agent.mcp_clients["arxiv_id"].calls == 5
+    # 追查那一轮不再等待冷调用
+    assert warm_s < cold_s - TOOL_LATENCY
+
+
+if __name__ == "__main__":
+    if sys.platform == 'win32':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+    test_extract_and_canonicalize()
+    test_prefetch_warms_followups()
+    _, _, prefetch_stats, cold, warm = _compare()
+    print(f"✅ 推测预取: 关闭 {cold:.2f}s -> 开启 {warm:.2f}s | {prefetch_stats}")
@@ -0,0 +1,196 @@
+"""
+run 预算调控测试
+用途：不访问 Claude API，验证预算的解析（key=value 与 JSON 文件）、按已用比例逐级收紧
+（缩小返回条数、停用 deep_research、要求最终回答）、单个工具的调用次数上限，
+模型在最终回答轮仍调用工具时 run 以 budget_exhausted 结束，run 结束时的预算用量报告，
+以及从检查点恢复时预算消耗随之恢复、以 budget_exhausted 结束的 run 可以继续
+
+运行：python test_run_budget.py  或  python -m pytest test_run_budget.py
+"""
+import asyncio
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from run_budget import FINAL_NOTE, BudgetGovernor, RunBudget, load_budget
+from run_checkpoint import CheckpointStore
+from run_events import RunFinished, ToolCompleted, ToolDispatched
+
+
+def test_load_budget():
+    budget = load_budget("wall_s=90, output_tokens=20000,tool_calls.deep_research=3,finalize_at=0.8")
+    assert (budget.wall_s, budget.output_tokens, budget.finalize_at) == (90.0, 20000, 0.8)
+    assert budget.tool_calls == {"deep_research": 3} and budget.input_tokens is None
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "budget.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"result_bytes": 500000, "expensive_tools": ["deep_research", "crossref_search"]}, f)
+        loaded = load_budget(path)
+    assert loaded.result_bytes == 500000 and loaded.expensive_tools == ("deep_research", "crossref_search")
+    for bad in ("wall_s", "tokens=5"):
+        try:
+            load_budget(bad)
+            raise AssertionError("应当抛出 ValueError")
+        except ValueError:
+            pass
+
+
+class ToolHungryMessages:
+    """
+    每轮输出 100 个 token 并调用 deep_research（不可用时改用 arxiv_search_by_abstract）；
+    请求带 tool_choice=none 时写综述，ignore_tool_choice=True 时仍然调用工具
+    """
+
+    def __init__(self, ignore_tool_choice: bool = False):
+        self.ignore_tool_choice = ignore_tool_choice
+        self.calls = []
+
+    async def create(self, model, max_tokens, tools, messages, tool_choice=None):
+        names = [t["name"] for t in tools]
+        self.calls.append((names, tool_choice))
+        usage = SimpleNamespace(input_tokens=1000, output_tokens=100,
+                                cache_creation_input_tokens=0, cache_read_input_tokens=0)
+        if tool_choice == {"type": "none"} and not self.ignore_tool_choice:
+            return SimpleNamespace(stop_reason="end_turn", usage=usage, content=[SimpleNamespace(type="text", text="综述")])
+        name = "deep_research" if "deep_research" in names else "arxiv_search_by_abstract"
+        key = "searchQuery" if name == "deep_research" else "key"
+        block = SimpleNamespace(type="tool_use", name=name, id=f"t{len(self.calls)}",
+                                input={key: "LLM", "count" if name == "deep_research" else "pageSize": 10})
+        return SimpleNamespace(stop_reason="tool_use", usage=usage, content=[block])
+
+
+def _agent(messages, budget: RunBudget, checkpoint_store: CheckpointStore = None) -> ClaudeAcademicAgent:
+    agent = ClaudeAcademicAgent(api_key="test-key", checkpoint_store=checkpoint_store,
+                                governor=BudgetGovernor(budget) if budget is not None else None)
+    agent.client = SimpleNamespace(messages=messages)
+    for name, client in list(agent.mcp_clients.items()):
+        agent.mcp_clients[name] = StandInMCPClient(client.port, client.service_name, latency=0.001, seed=1)
+    return agent
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def test_governor_tightens_then_forces_final_answer():
+    # 输出 token 预算 1000：每轮 100，第 k 轮结束时已用 k/10
+    messages = ToolHungryMessages()
+    agent = _agent(messages, RunBudget(output_tokens=1000))
+    ctx = agent.new_run("LLM 综述", max_iterations=15)
+    events = asyncio.run(_collect(agent.context_events(ctx)))
+
+    dispatched = [e for e in events if isinstance(e, ToolDispatched)]
+    counts = [(e.iteration, e.name, e.input.get("count", e.input.get("pageSize"))) for e in dispatched]
+    # 已用 50% 起按剩余比例缩小返回条数（下限 3）；75% 起 deep_research 被拒绝并不再提供；90% 起拒绝所有工具
+    assert counts[:4] == [(1, "deep_research", 10), (2, "deep_research", 10), (3, "deep_research", 10),
+                          (4, "deep_research", 10)]
+    assert counts[4:7] == [(5, "deep_research", 5), (6, "deep_research", 4), (7, "deep_research", 3)]
+    refused = [e for e in events if isinstance(e, ToolCompleted) and e.refused]
+    assert [(e.iteration, e.name) for e in refused] == [(8, "deep_research"), (9, "arxiv_search_by_abstract")]
+    assert len(counts) == 7
+    assert "deep_research" in messages.calls[7][0] and "deep_research" not in messages.calls[8][0]
+    # 已用 90%：第 10 轮要求最终回答
+    assert [c[1] for c in messages.calls] == [None] * 9 + [{"type": "none"}]
+    assert ctx.messages[-1]["content"][-1] == {"type": "text", "text": FINAL_NOTE}
+    assert ctx.status == "completed" and ctx.final_text == "综述"
+
+    report = events[-1].budget
+    assert isinstance(events[-1], RunFinished)
+    assert {k: v for k, v in report.items() if k != "wall_s"} == {
+        k: v for k, v in agent.governor.report(ctx).items() if k != "wall_s"}
+    assert report["output_tokens"] == {"used": 1000, "limit": 1000}
+    assert (report["shrunk"], report["refused"], report["final_iteration"]) == (3, 2, 10)
+    assert report["tool_calls"]["deep_research"]["used"] == 7
+    assert report["result_bytes"]["used"] > 0 and report["wall_s"]["limit"] is None
+
+
+def test_tool_limit_and_budget_exhausted():
+    # 单个工具的调用次数上限：用完后不再提供该工具，模型改用其他工具
+    messages = ToolHungryMessages()
+    agent = _agent(messages, RunBudget(tool_calls={"deep_research": 2}))
+    ctx = agent.new_run("LLM 综述", max_iterations=4)
+    asyncio.run(agent.run_context(ctx))
+    assert [("deep_research" in names) for names, _ in messages.calls] == [True, True, False, False]
+    assert ctx.status == "max_iterations" and ctx.budget.refused == 0
+    assert agent.governor.report(ctx)["tool_calls"]["deep_research"] == {"used": 2, "limit": 2}
+
+    # 最终回答轮仍然调用工具：工具被拒绝，run 以 budget_exhausted 结束
+    messages = ToolHungryMessages(ignore_tool_choice=True)
+    agent = _agent(messages, RunBudget(input_tokens=5000, finalize_at=0.8))
+    ctx = agent.new_run("LLM 综述", max_iterations=15)
+    result = asyncio.run(agent.run_context(ctx))
+    # 输入按“已用 + 下一轮预估”计：第 3 轮结束后 (3000 + 1000) / 5000 = 80%，第 3、4 轮的工具调用被拒绝
+    assert len(messages.calls) == 4 and messages.calls[-1][1] == {"type": "none"}
+    assert ctx.status == "budget_exhausted" and result == "任务未完成（预算用尽）"
+    assert ctx.budget.refused == 2
+
+
+def _assert_tool_results_paired(messages):
+    for assistant, user in zip(messages[1::2], messages[2::2]):
+        uses = [b["id"] if isinstance(b, dict) else b.id for b in assistant["content"]
+                if (b["type"] if isinstance(b, dict) else b.type) == "tool_use"]
+        assert [r["tool_use_id"] for r in user["content"] if r["type"] == "tool_result"] == uses
+
+
+def _final_answer(create):
+    """不论请求如何都写综述"""
+    async def wrapped(model, max_tokens, tools, messages, tool_choice=None):
+        return await create(model, max_tokens, tools, messages, tool_choice={"type": "none"})
+    return wrapped
+
+
+def test_resume_restores_budget_state():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(tmp)
+        # 单工具上限跨恢复累计：第一段用掉 1 次 deep_research，恢复后只剩 1 次
+        agent = _agent(ToolHungryMessages(), RunBudget(tool_calls={"deep_research": 2}), store)
+        ctx = agent.new_run("LLM 综述", max_iterations=1)
+        asyncio.run(agent.run_context(ctx))
+        assert ctx.status == "max_iterations"
+        loaded = store.load(ctx.run_id)
+        assert loaded.budget.tool_calls == {"deep_research": 1} and loaded.budget.result_bytes == ctx.budget.result_bytes
+
+        messages = ToolHungryMessages()
+        agent = _agent(messages, RunBudget(tool_calls={"deep_research": 2}), store)
+        asyncio.run(agent.resume(ctx.run_id, max_iterations=3))
+        assert [("deep_research" in names) for names, _ in messages.calls] == [True, False]
+        loaded = store.load(ctx.run_id)
+        assert loaded.budget.tool_calls == {"deep_research": 2, "arxiv_search_by_abstract": 1}
+        assert loaded.budget.result_bytes > ctx.budget.result_bytes
+
+        # 以 budget_exhausted 结束的 run：最后一轮（被拒绝的工具调用）回到对话历史，不带预算恢复时正常继续
+        agent = _agent(ToolHungryMessages(ignore_tool_choice=True), RunBudget(input_tokens=5000, finalize_at=0.8), store)
+        ctx = agent.new_run("LLM 综述", max_iterations=15)
+        asyncio.run(agent.run_context(ctx))
+        assert ctx.status == "budget_exhausted"
+        loaded = store.load(ctx.run_id)
+        assert (loaded.status, loaded.final_text, len(loaded.messages)) == ("running", None, 9)
+        assert (loaded.budget.refused, loaded.budget.final_iteration) == (2, None)
+        _assert_tool_results_paired(loaded.messages)
+
+        messages = ToolHungryMessages()
+        messages.create = _final_answer(messages.create)
+        agent = _agent(messages, None, store)
+        assert asyncio.run(agent.resume(ctx.run_id, max_iterations=30)) == "综述"
+        assert len(messages.calls) == 1
+
+        # 带同样的预算恢复：再给一次最终回答轮
+        agent = _agent(ToolHungryMessages(ignore_tool_choice=True), RunBudget(input_tokens=5000, finalize_at=0.8), store)
+        ctx = agent.new_run("LLM 综述", max_iterations=15)
+        asyncio.run(agent.run_context(ctx))
+        messages = ToolHungryMessages()
+        agent = _agent(messages, RunBudget(input_tokens=5000, finalize_at=0.8), store)
+        assert asyncio.run(agent.resume(ctx.run_id)) == "综述"
+        assert [c[1] for c in messages.calls] == [{"type": "none"}]
+        assert agent.governor.report(store.load(ctx.run_id))["final_iteration"] == 5
+
+
+if __name__ == "__main__":
+    test_load_budget()
+    test_governor_tightens_then_forces_final_answer()
+    test_tool_limit_and_budget_exhausted()
+    test_resume_restores_budget_state()
+    print("✅ 预算调控：解析、逐级收紧、最终回答轮、单工具上限、预算用尽、用量报告、检查点恢复")
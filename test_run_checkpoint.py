@@ -0,0 +1,219 @@
+"""
+run 检查点测试
+用途：不访问 Claude API 和网络，验证检查点的各条恢复路径：最后一次写入不完整时丢弃、
+工具调用只完成一部分时只补齐缺失的调用、拿到最终回复但没来得及写 final 时直接返回、
+被截断（stopped）或达到迭代上限（max_iterations）的 run 恢复后继续，截断在 tool_use 中间时补上错误结果；
+以及写入不阻塞事件循环
+
+运行：python test_run_checkpoint.py  或  python -m pytest test_run_checkpoint.py
+"""
+import asyncio
+import tempfile
+import threading
+from types import SimpleNamespace
+
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from run_checkpoint import CONTINUE_PROMPT, UNFINISHED_TOOL_USE, CheckpointStore
+from run_context import RunContext
+
+
+def _usage() -> SimpleNamespace:
+    return SimpleNamespace(input_tokens=1000, output_tokens=100,
+                           cache_creation_input_tokens=0, cache_read_input_tokens=0)
+
+
+def _tool_response(*keys: str) -> SimpleNamespace:
+    return SimpleNamespace(stop_reason="tool_use", usage=_usage(), content=[
+        SimpleNamespace(type="tool_use", name="arxiv_search_by_id", id=f"t{i}", input={"key": key})
+        for i, key in enumerate(keys)])
+
+
+def _text_response(text: str, stop_reason: str = "end_turn") -> SimpleNamespace:
+    return SimpleNamespace(stop_reason=stop_reason, usage=_usage(), content=[SimpleNamespace(type="text", text=text)])
+
+
+class ScriptedMessages:
+    """按顺序返回预先给定的响应，并记录每次请求的对话历史"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def create(self, model, max_tokens, tools, messages):
+        self.requests.append([dict(m) for m in messages])
+        return self.responses.pop(0)
+
+
+def _agent(store: CheckpointStore, messages: ScriptedMessages):
+    agent = ClaudeAcademicAgent(api_key="test-key", checkpoint_store=store)
+    agent.client = SimpleNamespace(messages=messages)
+    agent.mcp_clients["arxiv_id"] = StandInMCPClient(6006, "Arxiv ID", latency=0.001, seed=1)
+    calls = []
+    call_mcp = agent._call_mcp
+
+    async def counting(tool_name, tool_input):
+        calls.append(tool_input.get("key"))
+        return await call_mcp(tool_name, tool_input)
+
+    agent._call_mcp = counting
+    return agent, calls
+
+
+def _assert_well_formed(messages):
+    """user / assistant 交替，每个 tool_use 紧跟着对应的 tool_result"""
+    assert [m["role"] for m in messages] == ["user", "assistant"] * (len(messages) // 2) + ["user"] * (len(messages) % 2)
+    for assistant, user in zip(messages[1::2], messages[2::2]):
+        uses = [b["id"] if isinstance(b, dict) else b.id for b in assistant["content"]
+                if (b["type"] if isinstance(b, dict) else b.type) == "tool_use"]
+        if uses:
+            assert [r["tool_use_id"] for r in user["content"] if r["type"] == "tool_result"] == uses
+
+
+def test_truncated_tail_is_dropped():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(tmp)
+        ctx = RunContext(instruction="LLM 综述")
+        store.record_start(ctx)
+        ctx.iteration = 1
+        store.record_response(ctx, "claude-3-5-sonnet", _tool_response("2401.00001"), 0.5)
+        store.flush()
+        with open(store.path(ctx.run_id), "rb") as f:
+            complete = f.read()
+        # 模拟写入 tool_result 时进程被 kill：最后一个 gzip 成员只写了一半
+        store.record_tool_result(ctx, "t0", "arxiv_search_by_id", "x" * 1000)
+        store.flush()
+        with open(store.path(ctx.run_id), "rb") as f:
+            data = f.read()
+        with open(store.path(ctx.run_id), "wb") as f:
+            f.write(data[:len(complete) + (len(data) - len(complete)) // 2])
+
+        assert [e["type"] for e in store.events(ctx.run_id)] == ["start", "response"]
+        loaded = store.load(ctx.run_id)
+        assert loaded.status == "running" and loaded.iteration == 1
+        assert [b["id"] for b in loaded.pending_tool_uses] == ["t0"] and loaded.completed_tool_results == {}
+
+
+def test_resume_partial_tool_round():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(tmp)
+        ctx = RunContext(instruction="LLM 综述")
+        store.record_start(ctx)
+        ctx.iteration = 1
+        store.record_response(ctx, "claude-3-5-sonnet", _tool_response("2401.00001", "2401.00002", "2401.00003"), 0.5)
+        # 崩溃前只完成了第二个调用
+        store.record_tool_result(ctx, "t1", "arxiv_search_by_id", '{"cached": true}')
+
+        messages = ScriptedMessages(_text_response("综述"))
+        agent, calls = _agent(store, messages)
+        assert asyncio.run(agent.resume(ctx.run_id)) == "综述"
+        assert calls == ["2401.00001", "2401.00003"]
+        results = messages.requests[0][-1]["content"]
+        assert [r["tool_use_id"] for r in results] == ["t0", "t1", "t2"] and results[1]["content"] == '{"cached": true}'
+        _assert_well_formed(messages.requests[0])
+
+        # 已完成的 run 再次恢复：直接返回检查点中的结果
+        loaded = store.load(ctx.run_id)
+        assert (loaded.status, loaded.final_text, loaded.iteration) == ("completed", "综述", 2)
+        assert asyncio.run(agent.resume(ctx.run_id)) == "综述" and len(messages.requests) == 1
+
+
+def test_end_turn_without_final():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(tmp)
+        ctx = RunContext(instruction="LLM 综述")
+        store.record_start(ctx)
+        ctx.iteration = 1
+        store.record_response(ctx, "claude-3-5-sonnet", _text_response("综述 A"), 0.5)
+
+        loaded = store.load(ctx.run_id)
+        assert (loaded.status, loaded.final_text) == ("completed", "综述 A")
+        messages = ScriptedMessages()
+        agent, _ = _agent(store, messages)
+        assert asyncio.run(agent.resume(ctx.run_id)) == "综述 A" and messages.requests == []
+
+
+def test_continue_stopped_and_max_iterations_runs():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(tmp)
+        # 第一轮被 max_tokens 截断：run 以 stopped 结束
+        messages = ScriptedMessages(_text_response("综述前半", "max_tokens"))
+        agent, _ = _agent(store, messages)
+        ctx = agent.new_run("LLM 综述")
+        asyncio.run(agent.run_context(ctx))
+        assert ctx.status == "stopped"
+
+        loaded = store.load(ctx.run_id)
+        assert (loaded.status, loaded.final_text) == ("running", None)
+        assert loaded.messages[-1] == {"role": "user", "content": CONTINUE_PROMPT}
+        agent, _ = _agent(store, ScriptedMessages(_text_response("综述后半")))
+        assert asyncio.run(agent.resume(ctx.run_id)) == "综述后半"
+
+        # 达到迭代上限：调大 max_iterations 后继续，最后一轮的工具结果回到对话历史
+        messages = ScriptedMessages(_tool_response("2401.00001"))
+        agent, calls = _agent(store, messages)
+        ctx = agent.new_run("LLM 综述", max_iterations=1)
+        asyncio.run(agent.run_context(ctx))
+        assert ctx.status == "max_iterations" and calls == ["2401.00001"]
+
+        messages = ScriptedMessages(_tool_response("2401.00002"), _text_response("综述"))
+        agent, calls = _agent(store, messages)
+        assert asyncio.run(agent.resume(ctx.run_id, max_iterations=3)) == "综述"
+        assert calls == ["2401.00002"]
+        assert len(messages.requests[0]) == 3 and len(messages.requests[1]) == 5
+        _assert_well_formed(messages.requests[1])
+        assert store.load(ctx.run_id).status == "completed"
+
+
+def test_stopped_inside_tool_use():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(tmp)
+        cut = SimpleNamespace(stop_reason="max_tokens", usage=_usage(), content=[
+            SimpleNamespace(type="text", text="先查一下"),
+            SimpleNamespace(type="tool_use", name="arxiv_search_by_id", id="t0", input={})])
+        agent, calls = _agent(store, ScriptedMessages(cut))
+        ctx = agent.new_run("LLM 综述")
+        asyncio.run(agent.run_context(ctx))
+        assert ctx.status == "stopped" and calls == []
+
+        # 没执行的 tool_use 得到错误结果，和继续的提示放在同一条 user 消息里
+        messages = ScriptedMessages(_text_response("综述"))
+        agent, calls = _agent(store, messages)
+        assert asyncio.run(agent.resume(ctx.run_id)) == "综述" and calls == []
+        request = messages.requests[0]
+        assert request[-1]["content"] == [
+            {"type": "tool_result", "tool_use_id": "t0", "content": UNFINISHED_TOOL_USE, "is_error": True},
+            {"type": "text", "text": CONTINUE_PROMPT}]
+        _assert_well_formed(request)
+
+
+def test_writes_leave_event_loop():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(tmp)
+        writers = []
+        write = store._write
+
+        def recording(run_id, events):
+            writers.append(threading.current_thread().name)
+            write(run_id, events)
+
+        store._write = recording
+        agent, _ = _agent(store, ScriptedMessages(_tool_response("2401.00001"), _text_response("综述")))
+        ctx = agent.new_run("LLM 综述")
+        asyncio.run(agent.run_context(ctx))
+        # start、2 次 response、1 次 tool_result、final 都在写入线程完成，run 结束时已全部落盘
+        assert len(writers) == 5 and all(name.startswith("checkpoint") for name in writers)
+        assert store._last.done()
+        assert [e["type"] for e in store.events(ctx.run_id)] == ["start", "response", "tool_result", "response",
+                                                                  "final"]
+
+
+if __name__ == "__main__":
+    test_truncated_tail_is_dropped()
+    test_resume_partial_tool_round()
+    test_end_turn_without_final()
+    test_continue_stopped_and_max_iterations_runs()
+    test_stopped_inside_tool_use()
+    test_writes_leave_event_loop()
+    print("✅ 检查点：截断的尾部、补齐部分完成的工具轮、缺 final 的 end_turn、继续 stopped / max_iterations、"
+          "截断在 tool_use 中间、写入线程")
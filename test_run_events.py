@@ -0,0 +1,152 @@
+"""
+运行事件流测试
+用途：不访问 Claude API，验证 run_events / context_events 按顺序产出带类型的事件
+（run 开始、迭代开始、模型文本增量、用量、工具开始/结束、run 结束），流式调用时文本逐段产出，
+快模型被升级时产出 discarded=True 的用量事件，提前停止迭代时 run 正常收尾；run() 的返回值与之前一致
+
+运行：python test_run_events.py  或  python -m pytest test_run_events.py
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+
+from claude_agent import ClaudeAcademicAgent
+from mcp_standin import StandInMCPClient
+from model_router import POLICIES
+from run_events import (IterationStarted, ModelUsage, RunFinished, RunStarted, TextDelta, ToolCompleted,
+                        ToolDispatched)
+
+
+def _usage(output_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(input_tokens=1000, output_tokens=output_tokens,
+                           cache_creation_input_tokens=0, cache_read_input_tokens=0)
+
+
+def _respond(model, max_tokens, messages) -> SimpleNamespace:
+    """第一轮按 ID 查两篇论文，之后写 300 token 的综述，max_tokens 不够时以 max_tokens 停止"""
+    if not any(m["role"] == "assistant" for m in messages):
+        return SimpleNamespace(stop_reason="tool_use", usage=_usage(80), content=[
+            SimpleNamespace(type="text", text="先查论文。"),
+            SimpleNamespace(type="tool_use", name="arxiv_search_by_id", id="t0", input={"key": "2401.00001"}),
+            SimpleNamespace(type="tool_use", name="arxiv_search_by_id", id="t1", input={"key": "2401.00002"})])
+    stop_reason = "end_turn" if max_tokens >= 300 else "max_tokens"
+    return SimpleNamespace(stop_reason=stop_reason, usage=_usage(min(300, max_tokens)),
+                           content=[SimpleNamespace(type="text", text=f"综述 by {model}")])
+
+
+class FakeMessages:
+    """只实现 messages.create"""
+
+    async def create(self, model, max_tokens, tools, messages):
+        return _respond(model, max_tokens, messages)
+
+
+class FakeStream:
+    def __init__(self, message):
+        self.message = message
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    async def text_stream(self):
+        for block in self.message.content:
+            if block.type == "text":
+                # 每 2 个字符一段，模拟流式输出
+                for i in range(0, len(block.text), 2):
+                    yield block.text[i:i + 2]
+
+    async def get_final_message(self):
+        return self.message
+
+
+class StreamingMessages(FakeMessages):
+    """同时实现 messages.stream"""
+
+    def __init__(self):
+        self.streamed = 0
+
+    def stream(self, model, max_tokens, tools, messages):
+        self.streamed += 1
+        return FakeStream(_respond(model, max_tokens, messages))
+
+
+def _agent(messages, **kwargs) -> ClaudeAcademicAgent:
+    agent = ClaudeAcademicAgent(api_key="test-key", **kwargs)
+    agent.client = SimpleNamespace(messages=messages)
+    agent.mcp_clients["arxiv_id"] = StandInMCPClient(6006, "Arxiv ID", latency=0.001, seed=1)
+    return agent
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def test_event_order_and_run_result():
+    agent = _agent(FakeMessages())
+    events = asyncio.run(_collect(agent.run_events("LLM 综述", stream_text=False)))
+    assert [type(e) for e in events] == [
+        RunStarted, IterationStarted, TextDelta, ModelUsage,
+        ToolDispatched, ToolCompleted, ToolDispatched, ToolCompleted,
+        IterationStarted, TextDelta, ModelUsage, RunFinished]
+    run_id = events[0].run_id
+    assert all(e.run_id == run_id for e in events)
+    usage = events[3]
+    assert (usage.iteration, usage.stop_reason, usage.output_tokens) == (1, "tool_use", 80) and usage.cost_usd > 0
+    done = events[5]
+    assert (done.name, done.tool_use_id, done.reused) == ("arxiv_search_by_id", "t0", False)
+    assert done.chars > 0 and done.elapsed_s >= 0
+    final = events[-1]
+    assert (final.status, final.text) == ("completed", "综述 by claude-3-5-sonnet")
+    assert final.usage["iterations"] == agent.last_run_usage.to_dict()["iterations"]
+    # 所有事件都可以直接 JSON 序列化
+    assert json.loads(json.dumps([e.to_dict() for e in events], ensure_ascii=False))[2] == {
+        "type": "text_delta", "run_id": run_id, "iteration": 1, "text": "先查论文。"}
+
+    # run() 只取最终文本，行为不变
+    assert asyncio.run(agent.run("LLM 综述")) == final.text
+    assert agent.usage_totals.runs == 2
+
+
+def test_streamed_text_and_escalation():
+    messages = StreamingMessages()
+    agent = _agent(messages, router=POLICIES["fast-plan"])
+    events = asyncio.run(_collect(agent.run_events("LLM 综述")))
+    # 两轮，第二轮快模型被升级：共 3 次流式调用
+    assert messages.streamed == 3
+    second = [e for e in events if getattr(e, "iteration", 0) == 2 and isinstance(e, (TextDelta, ModelUsage))]
+    usages = [e for e in second if isinstance(e, ModelUsage)]
+    assert [(u.model, u.discarded) for u in usages] == [("claude-3-5-haiku", True), ("claude-3-5-sonnet", False)]
+    # 被丢弃的响应之后的文本增量拼起来就是最终回复
+    after = second[second.index(usages[0]) + 1:]
+    text = "".join(e.text for e in after if isinstance(e, TextDelta))
+    assert text == events[-1].text == "综述 by claude-3-5-sonnet"
+    assert all(len(e.text) <= 2 for e in second if isinstance(e, TextDelta))
+
+
+def test_early_close_finishes_run():
+    agent = _agent(FakeMessages())
+    ctx = agent.new_run("LLM 综述")
+
+    async def first_tool():
+        events = agent.context_events(ctx)
+        try:
+            async for event in events:
+                if isinstance(event, ToolCompleted):
+                    return event
+        finally:
+            await events.aclose()
+
+    assert asyncio.run(first_tool()).tool_use_id == "t0"
+    # 提前停止：run 记为失败，用量照常汇总
+    assert ctx.status == "failed" and agent.usage_totals.runs == 1
+
+
+if __name__ == "__main__":
+    test_event_order_and_run_result()
+    test_streamed_text_and_escalation()
+    test_early_close_finishes_run()
+    print("✅ 运行事件流：事件顺序、流式文本增量、升级丢弃、提前停止")
@@ -0,0 +1,78 @@
+"""
+运行剖析测试
+用途：验证未启用剖析时 span() 是共享的空上下文、wall 文件按 span 栈记录自身耗时（子 span 的时间不重复计入父 span，
+并发子任务继承父 span 栈）、cpu 文件的栈底带有所在 span 的标签、空等记为 (idle)，以及 collapsed-stack 的文件格式
+
+运行：python test_run_profiler.py  或  python -m pytest test_run_profiler.py
+"""
+import asyncio
+import os
+import re
+import tempfile
+import time
+
+from run_profiler import _NULL_SPAN, RunProfiler, span
+
+
+def _burn(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def _read(path: str):
+    stacks = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            assert re.fullmatch(r".+ \d+\n", line)
+            stack, weight = line.rsplit(" ", 1)
+            stacks[stack] = int(weight)
+    return stacks
+
+
+async def _profiled_run(output_dir: str):
+    profiler = RunProfiler(output_dir, "t", interval=0.002)
+    profiler.start()
+    try:
+        with span("run"):
+            with span("iteration 1"):
+                async def tool(name: str, seconds: float):
+                    with span(f"tool:{name}"):
+                        await asyncio.sleep(seconds)
+
+                await asyncio.gather(tool("crossref_search", 0.1), tool("deep_research", 0.05))
+            with span("tool:busy"):
+                _burn(0.15)
+    finally:
+        paths = profiler.stop()
+    return paths
+
+
+def test_span_is_free_without_profiler():
+    assert span("tool:x") is _NULL_SPAN
+
+
+def test_wall_and_cpu_collapsed_stacks():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = asyncio.run(_profiled_run(tmp))
+        assert [os.path.basename(p) for p in paths] == ["t.cpu.collapsed", "t.wall.collapsed"]
+        wall, cpu = _read(paths[1]), _read(paths[0])
+
+    # 子任务继承父 span 栈；父 span 只记自身耗时（两个工具并发，重叠部分不会让它变成负数）
+    assert 90_000 <= wall["run;iteration 1;tool:crossref_search"] < 300_000
+    assert 40_000 <= wall["run;iteration 1;tool:deep_research"] < 300_000
+    assert "run;iteration 1" not in wall  # 子 span 合计 0.15s 超过自身的 0.1s，自身耗时记为 0，不写出
+    assert 140_000 <= wall["run;tool:busy"] < 500_000
+    assert wall.get("run", 0) < 50_000
+
+    # CPU 采样：忙循环的栈以 span 标签开头，落在 _burn 中；等待 sleep 时记为空闲
+    busy = sum(n for stack, n in cpu.items()
+               if stack.startswith("run;tool:busy;") and "_burn (test_run_profiler.py:" in stack)
+    assert busy >= 10
+    assert cpu.get("(idle)", 0) >= 5
+
+
+if __name__ == "__main__":
+    test_span_is_free_without_profiler()
+    test_wall_and_cpu_collapsed_stacks()
+    print("✅ 运行剖析：未启用时零开销、span 自身耗时、CPU 采样带 span 标签、collapsed-stack 格式")
@@ -0,0 +1,83 @@
+"""
+用量统计测试
+用途：验证下一轮输入 token 的增长按 tool_result 字符数比例分摊到工具上、被升级丢弃的响应计入成本
+但不重复归因、输入没有增长时不归因、批量请求按折扣计费，以及多次 run 的累计
+
+运行：python test_usage_tracker.py  或  python -m pytest test_usage_tracker.py
+"""
+from types import SimpleNamespace
+
+from usage_tracker import RunUsageRecorder, UsageTotals
+
+
+def _response(input_tokens: int, output_tokens: int, stop_reason: str = "tool_use", cache_read: int = 0):
+    return SimpleNamespace(stop_reason=stop_reason, usage=SimpleNamespace(
+        input_tokens=input_tokens, output_tokens=output_tokens,
+        cache_creation_input_tokens=0, cache_read_input_tokens=cache_read))
+
+
+def test_growth_is_split_by_tool_result_chars():
+    recorder = RunUsageRecorder()
+    recorder.record_response(1, "claude-3-5-sonnet", _response(1000, 100))
+    recorder.record_tool_result("deep_research", "x" * 3000)
+    recorder.record_tool_result("arxiv_search_by_id", "y" * 1000)
+    # 第 2 轮输入 = 1000（上一轮输入）+ 100（上一轮输出）+ 400（工具结果），其中一部分走缓存读取
+    recorder.record_response(2, "claude-3-5-sonnet", _response(300, 50, cache_read=1200))
+    recorder.record_tool_result("deep_research", "z" * 500)
+    # 第 3 轮输入反而变少（如历史被压缩）：不归因
+    recorder.record_response(3, "claude-3-5-sonnet", _response(1000, 80, "end_turn"))
+
+    summary = recorder.summary
+    assert summary.tool_input_tokens == {"deep_research": 300, "arxiv_search_by_id": 100}
+    assert summary.tool_calls == {"deep_research": 2, "arxiv_search_by_id": 1}
+    assert summary.iterations[0].tool_result_chars == {"deep_research": 3000, "arxiv_search_by_id": 1000}
+    assert (summary.input_tokens, summary.cache_read_input_tokens, summary.output_tokens) == (2300, 1200, 230)
+    expected = (2300 * 3.00 + 230 * 15.00 + 1200 * 0.30) / 1_000_000
+    assert abs(summary.cost_usd - expected) < 1e-9
+
+
+def test_discarded_response_costs_but_is_attributed_once():
+    recorder = RunUsageRecorder()
+    recorder.record_response(1, "claude-3-5-haiku", _response(1000, 100), tier="fast")
+    recorder.record_tool_result("bioc_get_article", "x" * 2000)
+    # 第 2 轮：快模型想直接结束，被升级丢弃；强模型用同样的对话历史重做
+    recorder.record_response(2, "claude-3-5-haiku", _response(1600, 40, "end_turn"), tier="fast", discarded=True)
+    recorder.record_response(2, "claude-3-5-sonnet", _response(1600, 900, "end_turn"), tier="strong")
+
+    summary = recorder.summary
+    assert summary.tool_input_tokens == {"bioc_get_article": 500}
+    assert summary.escalations == 1
+    models = summary.by_model()
+    assert models["claude-3-5-haiku"]["calls"] == 2 and models["claude-3-5-haiku"]["discarded"] == 1
+    assert models["claude-3-5-sonnet"]["calls"] == 1
+    haiku = (2600 * 0.80 + 140 * 4.00) / 1_000_000
+    sonnet = (1600 * 3.00 + 900 * 15.00) / 1_000_000
+    assert abs(summary.cost_usd - (haiku + sonnet)) < 1e-9
+    assert "(已升级，丢弃)" in summary.format()
+
+
+def test_batch_discount_and_totals():
+    standard, batched = RunUsageRecorder(), RunUsageRecorder()
+    standard.record_response(1, "claude-3-5-sonnet", _response(10_000, 1000, "end_turn"))
+    batched.record_response(1, "claude-3-5-sonnet", _response(10_000, 1000, "end_turn"), batch=True)
+    assert abs(batched.summary.cost_usd - standard.summary.cost_usd / 2) < 1e-12
+
+    # 未知模型不计费
+    unknown = RunUsageRecorder()
+    unknown.record_response(1, "some-proxy-model", _response(10_000, 1000, "end_turn"))
+    assert unknown.summary.cost_usd == 0.0
+
+    totals = UsageTotals()
+    for recorder in (standard, batched, unknown):
+        totals.add(recorder.summary)
+    data = totals.to_dict()
+    assert (data["runs"], data["iterations"], data["input_tokens"], data["output_tokens"]) == (3, 3, 30_000, 3000)
+    assert data["by_model"]["claude-3-5-sonnet"]["calls"] == 2
+    assert abs(data["cost_usd"] - 1.5 * standard.summary.cost_usd) < 1e-6
+
+
+if __name__ == "__main__":
+    test_growth_is_split_by_tool_result_chars()
+    test_discarded_response_costs_but_is_attributed_once()
+    test_batch_discount_and_totals()
+    print("✅ 用量统计：按字符数分摊输入增长、丢弃的响应计费但不重复归因、批量折扣、跨 run 累计")
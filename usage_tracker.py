@@ -0,0 +1,288 @@
+"""
+Token 用量与成本统计
+作用：按迭代记录 response.usage，把输入 token 的增长归因到引起它的 tool_result（按工具名），
+并在多次 run 之间累计，为调优结果裁剪和历史压缩提供数据
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+# Message Batches 的请求按标准价格的一半计费
+BATCH_DISCOUNT = 0.5
+
+# 每百万 token 的美元价格：(输入, 输出, 缓存写入, 缓存读取)
+# 中转 API 的模型名与官方不同，按前缀匹配；未知模型不计费（成本记为 0）
+DEFAULT_PRICING: Dict[str, Tuple[float, float, float, float]] = {
+    "claude-3-5-haiku": (0.80, 4.00, 1.00, 0.08),
+    "claude-3-5-sonnet": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-7-sonnet": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-opus": (15.00, 75.00, 18.75, 1.50),
+}
+
+
+def _price_for(model: str, pricing: Dict[str, Tuple[float, float, float, float]]):
+    """按最长前缀匹配模型价格"""
+    best = None
+    for prefix, price in pricing.items():
+        if model.startswith(prefix) and (best is None or len(prefix) > len(best[0])):
+            best = (prefix, price)
+    return best[1] if best else None
+
+
+@dataclass
+class IterationUsage:
+    """单次 messages.create 的用量"""
+    iteration: int
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cache_creation_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    latency_s: float = 0.0
+    stop_reason: Optional[str] = None
+    # 模型路由的档位（fast / strong），未启用路由时为 None
+    tier: Optional[str] = None
+    # 快模型的响应被升级丢弃、本轮改用强模型重做；计入成本，但不进入对话历史
+    discarded: bool = False
+    # 通过 Message Batches 提交（按 BATCH_DISCOUNT 计费）
+    batch: bool = False
+    # 本轮产生的 tool_result 字符数（按工具名），下一轮的输入增长按它分摊
+    tool_result_chars: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def prompt_tokens(self) -> int:
+        """本轮请求实际发送的全部输入 token（含缓存读写部分）"""
+        return self.input_tokens + self.cache_creation_input_tokens + self.cache_read_input_tokens
+
+    def cost_usd(self, pricing: Dict[str, Tuple[float, float, float, float]]) -> float:
+        price = _price_for(self.model, pricing)
+        if price is None:
+            return 0.0
+        p_in, p_out, p_cw, p_cr = price
+        cost = (self.input_tokens * p_in
+                + self.output_tokens * p_out
+                + self.cache_creation_input_tokens * p_cw
+                + self.cache_read_input_tokens * p_cr) / 1_000_000
+        return cost * BATCH_DISCOUNT if self.batch else cost
+
+
+@dataclass
+class RunUsageSummary:
+    """一次 run 的用量汇总"""
+    iterations: List[IterationUsage] = field(default_factory=list)
+    # 工具名 -> 该工具的 tool_result 引起的输入 token 增长
+    tool_input_tokens: Dict[str, int] = field(default_factory=dict)
+    # 工具名 -> 调用次数
+    tool_calls: Dict[str, int] = field(default_factory=dict)
+    cost_usd: float = 0.0
+
+    @property
+    def input_tokens(self) -> int:
+        return sum(u.input_tokens for u in self.iterations)
+
+    @property
+    def output_tokens(self) -> int:
+        return sum(u.output_tokens for u in self.iterations)
+
+    @property
+    def cache_creation_input_tokens(self) -> int:
+        return sum(u.cache_creation_input_tokens for u in self.iterations)
+
+    @property
+    def cache_read_input_tokens(self) -> int:
+        return sum(u.cache_read_input_tokens for u in self.iterations)
+
+    @property
+    def model_latency_s(self) -> float:
+        return sum(u.latency_s for u in self.iterations)
+
+    @property
+    def escalations(self) -> int:
+        return sum(1 for u in self.iterations if u.discarded)
+
+    def by_model(self, pricing: Optional[Dict[str, Tuple[float, float, float, float]]] = None
+                 ) -> Dict[str, Dict[str, Any]]:
+        """按模型汇总调用次数、token、耗时和成本，用于对比路由策略"""
+        pricing = pricing or DEFAULT_PRICING
+        result: Dict[str, Dict[str, Any]] = {}
+        for u in self.iterations:
+            row = result.setdefault(u.model, {"calls": 0, "discarded": 0, "input_tokens": 0, "output_tokens": 0,
+                                              "latency_s": 0.0, "cost_usd": 0.0})
+            row["calls"] += 1
+            row["discarded"] += int(u.discarded)
+            row["input_tokens"] += u.prompt_tokens
+            row["output_tokens"] += u.output_tokens
+            row["latency_s"] += u.latency_s
+            row["cost_usd"] += u.cost_usd(pricing)
+        for row in result.values():
+            row["latency_s"] = round(row["latency_s"], 3)
+            row["cost_usd"] = round(row["cost_usd"], 6)
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "iterations": [
+                {
+                    "iteration": u.iteration,
+                    "model": u.model,
+                    "input_tokens": u.input_tokens,
+                    "output_tokens": u.output_tokens,
+                    "cache_creation_input_tokens": u.cache_creation_input_tokens,
+                    "cache_read_input_tokens": u.cache_read_input_tokens,
+                    "latency_s": round(u.latency_s, 3),
+                    "stop_reason": u.stop_reason,
+                    "tier": u.tier,
+                    "discarded": u.discarded,
+                    "batch": u.batch,
+                    "tool_result_chars": dict(u.tool_result_chars),
+                }
+                for u in self.iterations
+            ],
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_creation_input_tokens": self.cache_creation_input_tokens,
+            "cache_read_input_tokens": self.cache_read_input_tokens,
+            "model_latency_s": round(self.model_latency_s, 3),
+            "tool_input_tokens": dict(self.tool_input_tokens),
+            "tool_calls": dict(self.tool_calls),
+            "cost_usd": round(self.cost_usd, 6),
+            "escalations": self.escalations,
+            "by_model": self.by_model(),
+        }
+
+    def format(self) -> str:
+        """生成便于阅读的多行文本"""
+        lines = [
+            f"迭代次数: {len(self.iterations)} | 模型耗时: {self.model_latency_s:.2f}s | 成本: ${self.cost_usd:.4f}",
+            f"输入: {self.input_tokens} | 输出: {self.output_tokens} | "
+            f"缓存写入: {self.cache_creation_input_tokens} | 缓存读取: {self.cache_read_input_tokens}",
+        ]
+        for u in self.iterations:
+            lines.append(
+                f"  [迭代 {u.iteration}] {u.model} in={u.prompt_tokens} out={u.output_tokens} "
+                f"{u.latency_s:.2f}s stop={u.stop_reason}" + (" [批量]" if u.batch else "")
+                + (" (已升级，丢弃)" if u.discarded else "")
+            )
+        models = self.by_model()
+        if len(models) > 1:
+            lines.append("按模型:")
+            for model, row in models.items():
+                lines.append(f"  {model:28s} {row['calls']:3d} 次 in={row['input_tokens']} out={row['output_tokens']} "
+                             f"{row['latency_s']:.2f}s ${row['cost_usd']:.4f}")
+        if self.tool_input_tokens:
+            lines.append("工具结果引起的输入增长:")
+            for name, tokens in sorted(self.tool_input_tokens.items(), key=lambda kv: -kv[1]):
+                lines.append(f"  {name:28s} {tokens:8d} tokens ({self.tool_calls.get(name, 0)} 次调用)")
+        return "\n".join(lines)
+
+
+class RunUsageRecorder:
+    """
+    单次 run 的用量记录器
+    归因方法：第 i+1 轮的输入 token 减去第 i 轮的输入和输出 token，剩余部分就是第 i 轮追加的
+    tool_result 带来的增长，再按各工具结果的字符数比例分摊到工具名上
+    """
+
+    def __init__(self, pricing: Optional[Dict[str, Tuple[float, float, float, float]]] = None):
+        self.pricing = pricing or DEFAULT_PRICING
+        self.summary = RunUsageSummary()
+
+    def record_response(self, iteration: int, model: str, response: Any, latency_s: float = 0.0,
+                        tier: Optional[str] = None, discarded: bool = False, batch: bool = False) -> IterationUsage:
+        """
+        记录一次 messages.create 的响应用量
+        :param tier: 模型路由的档位
+        :param discarded: 这次响应被升级丢弃，本轮还会再记录一次强模型的响应
+        :param batch: 响应来自 Message Batches
+        """
+        usage = getattr(response, "usage", None)
+        record = IterationUsage(
+            iteration=iteration,
+            model=model,
+            input_tokens=getattr(usage, "input_tokens", 0) or 0,
+            output_tokens=getattr(usage, "output_tokens", 0) or 0,
+            cache_creation_input_tokens=getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            cache_read_input_tokens=getattr(usage, "cache_read_input_tokens", 0) or 0,
+            latency_s=latency_s,
+            stop_reason=getattr(response, "stop_reason", None),
+            tier=tier,
+            discarded=discarded,
+            batch=batch,
+        )
+        iterations = self.summary.iterations
+        if iterations:
+            self._attribute(iterations[-1], record)
+        iterations.append(record)
+        self.summary.cost_usd += record.cost_usd(self.pricing)
+        return record
+
+    def record_tool_result(self, tool_name: str, content: str):
+        """记录当前迭代追加到对话历史中的一条 tool_result"""
+        if not self.summary.iterations:
+            return
+        chars = self.summary.iterations[-1].tool_result_chars
+        chars[tool_name] = chars.get(tool_name, 0) + len(content)
+        self.summary.tool_calls[tool_name] = self.summary.tool_calls.get(tool_name, 0) + 1
+
+    def _attribute(self, prev: IterationUsage, cur: IterationUsage):
+        total_chars = sum(prev.tool_result_chars.values())
+        if not total_chars:
+            return
+        growth = cur.prompt_tokens - prev.prompt_tokens - prev.output_tokens
+        if growth <= 0:
+            return
+        for name, chars in prev.tool_result_chars.items():
+            share = round(growth * chars / total_chars)
+            self.summary.tool_input_tokens[name] = self.summary.tool_input_tokens.get(name, 0) + share
+
+
+class UsageTotals:
+    """跨多次 run 的累计计数器"""
+
+    def __init__(self):
+        self.runs = 0
+        self.iterations = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.model_latency_s = 0.0
+        self.cost_usd = 0.0
+        self.tool_input_tokens: Dict[str, int] = {}
+        self.tool_calls: Dict[str, int] = {}
+        self.escalations = 0
+        self.by_model: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, summary: RunUsageSummary):
+        self.runs += 1
+        self.iterations += len(summary.iterations)
+        self.input_tokens += summary.input_tokens
+        self.output_tokens += summary.output_tokens
+        self.cache_creation_input_tokens += summary.cache_creation_input_tokens
+        self.cache_read_input_tokens += summary.cache_read_input_tokens
+        self.model_latency_s += summary.model_latency_s
+        self.cost_usd += summary.cost_usd
+        for name, tokens in summary.tool_input_tokens.items():
+            self.tool_input_tokens[name] = self.tool_input_tokens.get(name, 0) + tokens
+        for name, count in summary.tool_calls.items():
+            self.tool_calls[name] = self.tool_calls.get(name, 0) + count
+        self.escalations += summary.escalations
+        for model, row in summary.by_model().items():
+            total = self.by_model.setdefault(model, dict.fromkeys(row, 0))
+            for key, value in row.items():
+                total[key] = round(total[key] + value, 6)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "iterations": self.iterations,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_creation_input_tokens": self.cache_creation_input_tokens,
+            "cache_read_input_tokens": self.cache_read_input_tokens,
+            "model_latency_s": round(self.model_latency_s, 3),
+            "cost_usd": round(self.cost_usd, 6),
+            "tool_input_tokens": dict(self.tool_input_tokens),
+            "tool_calls": dict(self.tool_calls),
+            "escalations": self.escalations,
+            "by_model": {model: dict(row) for model, row in self.by_model.items()},
+        }